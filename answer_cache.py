@@ -0,0 +1,270 @@
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+from collections import OrderedDict
+import numpy as np
+import unicodedata
+import threading
+import time
+import re
+
+
+class CachedAnswer(NamedTuple):
+    """
+    An answer stored in the AnswerCache.
+
+    Attributes
+    ----------
+    answer : str
+        The generated answer.
+    context : List[Document]
+        The documents the answer was generated from.
+    latency : float
+        The time in seconds it took to generate the answer, i.e. the time saved by each cache hit.
+    created_at : float
+        The monotonic time at which the answer was cached.
+    vector : Optional[np.ndarray]
+        The normalized embedding of the question, when the similarity tier is enabled.
+    entities : FrozenSet[str]
+        The numbers and proper nouns of the question, see `AnswerCache.entities`.
+    """
+    answer: str
+    context: List[Document]
+    latency: float
+    created_at: float
+    vector: Optional[np.ndarray] = None
+    entities: FrozenSet[str] = frozenset()
+
+
+class AnswerCache:
+    """
+    A bounded cache of RAG answers, keyed by normalized question with an optional embedding-similarity tier.
+
+    Questions are normalized (case, accents, punctuation and whitespace) before the exact lookup. When an
+    embedding function and a similarity threshold are given, a question that misses the exact tier is answered
+    from the cached question with the highest cosine similarity, if it is at least the threshold and both
+    questions name the same numbers and proper nouns: "Quantos desalojados em Canoas?" and "Quantos desalojados
+    em Eldorado do Sul?" embed almost alike but must not share an answer. Entries expire after `ttl` seconds and
+    the least recently used entry is evicted once `capacity` is reached.
+
+    Methods
+    -------
+    get(question: str) -> Optional[CachedAnswer]
+        Returns the cached answer for a question, if any.
+    put(question: str, answer: str, context: List[Document], latency: float, generation: Optional[int] = None) -> None
+        Caches the answer to a question.
+    invalidate() -> None
+        Removes every cached answer, e.g. after the corpus changed.
+    stats() -> Dict[str, float]
+        Returns hit, miss and saved latency metrics.
+    normalize(question: str) -> str
+        Normalizes a question for exact matching.
+    entities(question: str) -> FrozenSet[str]
+        Returns the numbers and proper nouns of a question, which a similar question must share.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 256,
+            ttl: Optional[float] = 3600.0,
+            embeddings: Optional[Embeddings] = None,
+            similarity_threshold: Optional[float] = None
+        ) -> None:
+        """
+        Initializes the cache.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            The maximum number of cached answers (default is 256).
+        ttl : Optional[float], optional
+            The number of seconds an answer stays valid, None keeps answers until evicted (default is 3600.0).
+        embeddings : Optional[Embeddings], optional
+            The embedding function used by the similarity tier. RAG fills it in with the embedding function of its
+            database when it is left as None (default is None).
+        similarity_threshold : Optional[float], optional
+            The minimum cosine similarity for a similarity hit, None disables the similarity tier (default is None).
+        """
+        self.capacity: int = capacity
+        self.ttl: Optional[float] = ttl
+        self.embeddings: Optional[Embeddings] = embeddings
+        self.similarity_threshold: Optional[float] = similarity_threshold
+        self.exact_hits: int = 0
+        self.similar_hits: int = 0
+        self.misses: int = 0
+        self.saved_latency: float = 0.0
+        self.generation: int = 0
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def similarity_enabled(self) -> bool:
+        return self.embeddings is not None and self.similarity_threshold is not None
+
+    def get(self, question: str) -> Optional[CachedAnswer]:
+        """
+        Returns the cached answer for a question, if any.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+
+        Returns
+        -------
+        Optional[CachedAnswer]
+            The cached answer, or None on a miss.
+        """
+        key = AnswerCache.normalize(question)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_latency += entry.latency
+                return entry
+            if not self.similarity_enabled or not self._entries:
+                self.misses += 1
+                return None
+
+        vector, entities = self._embed(question), AnswerCache.entities(question)
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items() if entry.vector is not None and entry.entities == entities
+            ]
+            if candidates:
+                similarities = np.stack([entry.vector for _, entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.similar_hits += 1
+                    self.saved_latency += entry.latency
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, context: List[Document], latency: float, generation: Optional[int] = None) -> None:
+        """
+        Caches the answer to a question.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+        answer : str
+            The generated answer.
+        context : List[Document]
+            The documents the answer was generated from.
+        latency : float
+            The time in seconds it took to generate the answer.
+        generation : Optional[int], optional
+            The value of `generation` read before the answer was generated. If the cache was invalidated since then,
+            the answer may be stale and is not cached (default is None, meaning no check).
+        """
+        vector = self._embed(question) if self.similarity_enabled else None
+        entry = CachedAnswer(
+            answer=answer, 
+            context=context, 
+            latency=latency, 
+            created_at=time.monotonic(), 
+            vector=vector, 
+            entities=AnswerCache.entities(question)
+        )
+        key = AnswerCache.normalize(question)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """
+        Removes every cached answer, e.g. after the corpus changed.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit, miss and saved latency metrics.
+
+        Returns
+        -------
+        Dict[str, float]
+            The number of "exact_hits", "similar_hits" and "misses", the "hit_rate", the total
+            "saved_latency_seconds" and the current "size" of the cache.
+        """
+        hits = self.exact_hits + self.similar_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "saved_latency_seconds": self.saved_latency,
+            "size": len(self._entries),
+        }
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """
+        Normalizes a question for exact matching.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+
+        Returns
+        -------
+        str
+            The question in lower case, without accents, punctuation or repeated whitespace.
+        """
+        decomposed = unicodedata.normalize("NFKD", question.casefold())
+        without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+        return " ".join(re.sub(r"[^\w\s]", " ", without_accents).split())
+
+    @staticmethod
+    def entities(question: str) -> FrozenSet[str]:
+        """
+        Returns the numbers and proper nouns of a question, which a similar question must share.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+
+        Returns
+        -------
+        FrozenSet[str]
+            The normalized words containing a digit or starting with a capital letter, except the first word of
+            each sentence.
+        """
+        entities = set()
+        for sentence in re.split(r"[.?!]+", question):
+            for position, word in enumerate(re.findall(r"\w+", sentence)):
+                if any(char.isdigit() for char in word) or (position and word[0].isupper()):
+                    entities.add(AnswerCache.normalize(word))
+        return frozenset(entities)
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        deadline = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry.created_at < deadline]:
+            del self._entries[key]
@@ -1,58 +1,176 @@
+from tracing import JsonLinesSink, Tracer
+from ingestion_queue import IngestionQueue
+from answer_cache import AnswerCache
+from sources import SEED_URLS
+from snapshot import Snapshot
+from serve import WorkerPool
 import gradio as gr
 from rag import RAG
+import threading
+import asyncio
+import uuid
+import os
 
-list_urls = [
-    "https://g1.globo.com/rs/rio-grande-do-sul/noticia/2024/05/15/levantamento-enchente-porto-alegre-bairros-e-moradores.ghtml",
-    "https://www.cnnbrasil.com.br/nacional/enchente-em-porto-alegre-veja-imagens-da-cidade-apos-queda-no-nivel-da-agua/",
-    "https://www.bbc.com/portuguese/articles/cw00d51k5rlo",
-    "https://gauchazh.clicrbs.com.br/ultimas-noticias/tag/alagamentos/",
-    "https://www.poder360.com.br/infraestrutura/especialistas-listam-medidas-para-evitar-enchentes-em-porto-alegre/",
-    "https://www.camarapoa.rs.gov.br/noticias/cece-discute-sobre-obras-nas-escolas-atingidas-pelas-enchentes",
-    "https://www.metropoles.com/brasil/sobe-para-179-o-numero-de-mortos-em-razao-das-enchentes-no-rs",
-    "https://gauchazh.clicrbs.com.br/economia/conteudo-de-marca/2024/06/pequenos-negocios-podem-receber-ate-15-mil-reais-para-custos-com-alagamentos-clxdskw6i01420144abiw0pvv.html",
-    "https://agenciabrasil.ebc.com.br/geral/noticia/2024-05/inundacao-em-porto-alegre-foi-falta-de-manutencao-dizem-especialistas",
-    "https://www.observatoriodasmetropoles.net.br/nucleo-porto-alegre-analisa-os-impactos-das-enchentes-na-populacao-pobre-e-negra-do-rio-grande-do-sul/",
-    "https://gauchazh.clicrbs.com.br/porto-alegre/noticia/2024/05/numero-de-abrigos-para-atingidos-pela-enchente-cai-em-porto-alegre-clwdpjnrp00vg0148idb5123y.html",
-    "https://gauchazh.clicrbs.com.br/porto-alegre/noticia/2024/05/diversos-bairros-de-porto-alegre-registram-inundacao-dmae-fala-em-chuva-alem-do-que-os-modelos-previam-clwjbt6rh00b1014xqkk45ji9.html#:~:text=Entre%20os%20registros%20de%20aumento,São%20Geraldo%2C%20Restinga%20e%20Floresta.",
-    "https://g1.globo.com/rs/rio-grande-do-sul/noticia/2024/05/29/um-mes-de-enchentes-no-rs-veja-cronologia-do-desastre.ghtml",
-    "https://g1.globo.com/rs/rio-grande-do-sul/noticia/2024/07/02/enchentes-no-rs-total-de-mortos-e-desaparecidos.ghtml",
-    "https://g1.globo.com/rs/rio-grande-do-sul/noticia/2024/07/04/governo-do-rs-inaugura-primeira-cidade-provisoria-para-receber-desabrigados-por-enchentes.ghtml",
-    "https://pt.wikipedia.org/wiki/Enchentes_no_Rio_Grande_do_Sul_em_2024",
-    "https://www.cnnbrasil.com.br/nacional/chuvas-no-rs-quase-80-das-cidades-gauchas-foram-afetadas-veja-lista/",
-    "https://www.infomoney.com.br/economia/producao-industrial-cai-09-em-maio-com-influencia-de-enchentes-no-sul-diz-ibge/",
-    "https://www1.folha.uol.com.br/mercado/2024/07/enchentes-no-rs-afetaram-ate-92-dos-empregos-em-cidades-mais-destruidas-diz-ipea.shtml",
-    "https://cbn.globo.com/podcasts/cbn-especial/noticia/2024/07/04/porto-alegre-tem-mais-de-45-mil-desempregados-apos-as-chuvas.ghtml"
-    
-]
+SNAPSHOT_ROOT = os.environ.get("RAG_SNAPSHOT_ROOT", "./snapshots")
+DEFAULT_COMPLETION_MODEL = "gpt-3.5-turbo"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+BATCH_WINDOW = float(os.environ.get("RAG_BATCH_WINDOW", "0")) or None
+MAX_BATCH = int(os.environ.get("RAG_MAX_BATCH", "32"))
+DEBUG_PANEL = os.environ.get("RAG_DEBUG_PANEL", "0") == "1"
+TRACE_FILE = os.environ.get("RAG_TRACE_FILE")
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "chroma")
+VECTOR_QUANTIZATION = os.environ.get("RAG_VECTOR_QUANTIZATION") or None
+SEARCH_DIMENSIONS = int(os.environ["RAG_SEARCH_DIMENSIONS"]) if os.environ.get("RAG_SEARCH_DIMENSIONS") else None
+REFRESH_INTERVAL = float(os.environ.get("RAG_REFRESH_INTERVAL", "0")) or None
+SERVE_WORKERS = int(os.environ.get("RAG_SERVE_WORKERS", "0"))
+ANSWER_SIMILARITY = float(os.environ.get("RAG_ANSWER_SIMILARITY", "0")) or None
+ANSWER_CACHE_OPTIONS = {"capacity": 1024, "ttl": 3600, "similarity_threshold": ANSWER_SIMILARITY}
+
+tracer = Tracer(
+    enabled=os.environ.get("RAG_TRACING", "1") == "1", 
+    sinks=[JsonLinesSink(TRACE_FILE)] if TRACE_FILE else None
+)
 
 rag = None
+ingestion = None
+pool = None
+# held while the models are initialized, so concurrent first requests initialize them once
+init_lock = threading.RLock()
 
-def initialize_rag(completion_model, embedding_model):
-    global rag
-    rag = RAG(completion_model=completion_model, embedding_model=embedding_model)
-    rag.add_documents(list_urls)
-    return "Models initialized with completion_model: {} and embedding_model: {}".format(completion_model, embedding_model)
+def format_summary(summary):
+    return "Chunks added: {added}, updated: {updated}, skipped: {skipped}, deleted: {deleted}".format(**summary)
 
-def add_documents(links):
-    if rag is None:
+def format_job(job):
+    line = f"{job.job_id[:8]} {job.status:<9} {len(job.urls)} URL(s){' (refresh)' if job.refresh else ''}"
+    if job.status == "running" and job.progress:
+        line += " - pages: {pages}/{total}, unchanged: {unchanged_pages}, failed: {failed_pages}, chunks: {chunks}, embedded: {embedded}, written: {written}".format(
+            total=len(job.urls), **job.progress
+        )
+    elif job.summary is not None:
+        line += f" - {format_summary(job.summary)}"
+    elif job.error is not None:
+        line += f" - {job.error}"
+    return line
+
+def queue_urls(urls, on_done=None):
+    job = ingestion.submit(urls, on_done=on_done)
+    if job is None:
+        return "Every link is already queued for ingestion."
+    duplicates = f", {len(job.duplicates)} already queued" if job.duplicates else ""
+    return f"Queued {len(job.urls)} link(s) for ingestion as job {job.job_id[:8]}{duplicates}. Queries use the current index until it finishes."
+
+def refresh_sources():
+    if ingestion is None:
         return "Please initialize the models first."
-    urls = [url.strip() for url in links.split(",")]
-    rag.add_documents(urls)
-    return f"Added {len(urls)} document(s) to the RAG."
+    job = ingestion.submit(rag.sources(), refresh=True)
+    if job is None:
+        return "Every source is already queued."
+    return f"Queued a refresh of {len(job.urls)} source(s) as job {job.job_id[:8]}. Only pages that changed are re-indexed."
+
+def initialize_rag(completion_model, embedding_model):
+    with init_lock:
+        return _initialize_rag(completion_model, embedding_model)
 
-def get_response(question):
+def _initialize_rag(completion_model, embedding_model):
+    global rag, ingestion, pool
+    completion_model = completion_model or DEFAULT_COMPLETION_MODEL
+    embedding_model = embedding_model or DEFAULT_EMBEDDING_MODEL
+    previous = rag
+    answer_cache = AnswerCache(**ANSWER_CACHE_OPTIONS)
+    snapshot = Snapshot.latest(SNAPSHOT_ROOT, embedding_model=embedding_model)
+    if snapshot is not None:
+        rag = snapshot.open_rag(completion_model=completion_model, answer_cache=answer_cache, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, tracer=tracer)
+        missing = snapshot.missing_urls(SEED_URLS)
+        on_done = lambda job, rag=rag: snapshot.record_urls(rag, job.urls) if job.status == "done" else None
+        source = f"Loaded snapshot {snapshot.manifest.version}"
+    else:
+        rag = RAG(
+            completion_model=completion_model, 
+            embedding_model=embedding_model, 
+            answer_cache=answer_cache, 
+            batch_window=BATCH_WINDOW, 
+            max_batch=MAX_BATCH, 
+            tracer=tracer,
+            vector_backend=VECTOR_BACKEND,
+            vector_quantization=VECTOR_QUANTIZATION,
+            search_dimensions=SEARCH_DIMENSIONS
+        )
+        missing, on_done = SEED_URLS, None
+        source = "No snapshot found, ingesting the seed URLs (build one with `python snapshot.py`)"
+    if ingestion is not None:
+        ingestion.close(wait=False)
+    ingestion = IngestionQueue(rag)
+    if REFRESH_INTERVAL:
+        ingestion.schedule_refresh(REFRESH_INTERVAL)
+    if pool is not None:
+        pool.close()
+        pool = None
+    if previous is not None:
+        # closed once the queries running on it are done; an ingest job still running on it finishes in the
+        # background and its version is closed instead of swapped in
+        previous.close()
+    if SERVE_WORKERS and rag.vector_backend != "numpy":
+        # a snapshot keeps the backend it was built with, so this is only known once the RAG is open
+        source += f"\nRAG_SERVE_WORKERS needs the numpy vector backend, not {rag.vector_backend!r}: serving queries in this process"
+    elif SERVE_WORKERS:
+        # this process stays the single writer; the workers answer queries on the versions it publishes
+        pool = WorkerPool.from_rag(rag, workers=SERVE_WORKERS, answer_cache_options=ANSWER_CACHE_OPTIONS)
+        source += f"\nServing queries from {SERVE_WORKERS} worker processes"
+    return "Models initialized with completion_model: {} and embedding_model: {}\n{}\n{}".format(
+        completion_model, embedding_model, source, queue_urls(missing, on_done) if missing else "No missing URLs."
+    )
+
+def get_rag():
     if rag is None:
+        with init_lock:
+            if rag is None:
+                initialize_rag(DEFAULT_COMPLETION_MODEL, DEFAULT_EMBEDDING_MODEL)
+    return rag
+
+def add_documents(links):
+    get_rag()
+    return queue_urls(links.split(","))
+
+def ingestion_status():
+    if ingestion is None:
         return "Please initialize the models first."
-    response = rag.query(question)
-    return response
+    jobs = ingestion.jobs()
+    return "\n".join(format_job(job) for job in reversed(jobs)) if jobs else "No ingestion jobs."
+
+async def get_response(question, retrieval_mode):
+    # initializing opens the index and may start worker processes: keep it off the event loop
+    rag = await asyncio.to_thread(get_rag)
+    if pool is not None:
+        served = await pool.aquery(question, mode=retrieval_mode)
+        yield served.answer, served.request_id
+        return
+    if rag.rag_chain is None:
+        yield "The index is still being built, check the ingestion jobs and try again shortly.", None
+        return
+    request_id = uuid.uuid4().hex
+    response = ""
+    async for token in rag.astream(question, request_id=request_id, mode=retrieval_mode):
+        response += token
+        yield response, request_id
 
-def get_context(question):
+def get_context(request_id):
     if rag is None:
         return "Please initialize the models first."
-    documents = rag.retrieved_contexts.get(question, [])
+    if request_id is None:
+        return "No context found."
+    documents = (pool or rag).get_context(request_id)
     context_content = "\n\n".join([doc.page_content for doc in documents])
     return context_content if context_content else "No context found."
 
+def get_debug(request_id):
+    trace = tracer.trace(request_id) if request_id is not None else None
+    if trace is None:
+        return "No trace found.", tracer.prometheus()
+    lines = [f"Request {trace['request_id']} ({', '.join(f'{k}={v}' for k, v in trace['attributes'].items())}): {trace['duration_ms']:.1f} ms"]
+    lines += [f"  {span['offset_ms']:>8.1f} ms  {span['stage']:<22} {span['duration_ms']:>8.1f} ms" for span in trace["spans"]]
+    lines += [f"  {name}: {value:g}" for name, value in sorted(trace["counters"].items())]
+    return "\n".join(lines), tracer.prometheus()
+
 with gr.Blocks() as ui:
     gr.Markdown("# RAG sobre as enchentes no Rio Grande do Sul")
     
@@ -60,49 +178,73 @@ with gr.Blocks() as ui:
         with gr.Column(scale=1):
             completion_model_dropdown = gr.Dropdown(
                 choices=["gpt-3.5-turbo", "gpt-4o"], 
+                value=DEFAULT_COMPLETION_MODEL, 
                 label="Select Completion Model"
             )
             embedding_model_dropdown = gr.Dropdown(
                 choices=["text-embedding-3-small", "text-embedding-3-large"], 
+                value=DEFAULT_EMBEDDING_MODEL, 
                 label="Select Embedding Model"
             )
             initialize_button = gr.Button("Initialize Models")
             initialize_output = gr.Textbox(label="Initialization Status", lines=2, interactive=False)
-            
-            initialize_button.click(
-                fn=initialize_rag, 
-                inputs=[completion_model_dropdown, embedding_model_dropdown], 
-                outputs=initialize_output
-            )
         
         with gr.Column(scale=1):
             add_links_input = gr.Textbox(label="Add document links (comma separated)", lines=2)
             add_links_button = gr.Button("Add Documents")
             add_links_output = gr.Textbox(label="Add Links Status", lines=2, interactive=False)
             
+            refresh_sources_button = gr.Button("Refresh Sources")
+            ingestion_button = gr.Button("Refresh Ingestion Jobs")
+            ingestion_output = gr.Textbox(label="Ingestion Jobs", lines=4, interactive=False)
+            
             add_links_button.click(
                 fn=add_documents, 
                 inputs=add_links_input, 
                 outputs=add_links_output
-            )
+            ).then(fn=ingestion_status, outputs=ingestion_output)
+            refresh_sources_button.click(fn=refresh_sources, outputs=add_links_output).then(fn=ingestion_status, outputs=ingestion_output)
+            ingestion_button.click(fn=ingestion_status, outputs=ingestion_output)
+    
+    initialize_button.click(
+        fn=initialize_rag, 
+        inputs=[completion_model_dropdown, embedding_model_dropdown], 
+        outputs=initialize_output
+    ).then(fn=ingestion_status, outputs=ingestion_output)
     
     question_input = gr.Textbox(label="Type your question here", lines=2)
+    retrieval_mode_dropdown = gr.Dropdown(
+        choices=["multi_query", "auto", "similarity", "mmr"], 
+        value="multi_query", 
+        label="Retrieval Mode"
+    )
     response_button = gr.Button("Get Response")
     response_output = gr.Textbox(label="Response", lines=10, interactive=False)
     
     context_button = gr.Button("Check Context")
     context_output = gr.Textbox(label="Context", lines=10, interactive=False)
+    request_id_state = gr.State(None)
     
-    response_button.click(fn=get_response, inputs=question_input, outputs=response_output)
-    context_button.click(fn=get_context, inputs=question_input, outputs=context_output)
+    response_button.click(fn=get_response, inputs=[question_input, retrieval_mode_dropdown], outputs=[response_output, request_id_state], concurrency_limit=None)
+    context_button.click(fn=get_context, inputs=request_id_state, outputs=context_output)
+
+    with gr.Column(visible=DEBUG_PANEL) as debug_column:
+        debug_button = gr.Button("Show Timings")
+        debug_output = gr.Textbox(label="Stage Breakdown", lines=10, interactive=False)
+        with gr.Accordion("Metrics", open=False):
+            metrics_output = gr.Textbox(label="Prometheus Metrics", lines=10, interactive=False)
+    debug_button.click(fn=get_debug, inputs=request_id_state, outputs=[debug_output, metrics_output])
 
     with gr.Row():
         with gr.Column():
             question_input
+            retrieval_mode_dropdown
             response_button
             response_output
         with gr.Column():
             context_button
             context_output
+        debug_column
 
-ui.launch()
+if __name__ == "__main__":
+    ui.launch()
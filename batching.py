@@ -0,0 +1,290 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from langchain_core.documents.base import Document
+from langchain_core.vectorstores import VectorStore
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+from embedding_cache import embed_queries
+import threading
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """
+    A micro-batching scheduler for vector searches.
+
+    Searches submitted within `window` seconds of each other are collected into one batch: their queries are
+    embedded together with `embed_queries` (one request for OpenAI models), bypassing the embedding cache, and
+    searched with a single multi-query request (one Chroma query, or one matrix product in a `NumpyVectorStore`). Identical
+    searches (same query and k) that are pending or in flight are coalesced into one execution whose result every
+    caller receives. A batch is dispatched as soon as it holds `max_batch` searches, without waiting for the window.
+
+    Methods
+    -------
+    submit(query: str, k: int) -> Future
+        Schedules a search and returns a future of its documents.
+    search(query: str, k: int) -> List[Document]
+        Searches and waits for the documents.
+    asearch(query: str, k: int) -> List[Document]
+        Searches without blocking the event loop.
+    stats() -> Dict[str, float]
+        Returns the number of searches, executed searches, batches and the mean batch size.
+    close() -> None
+        Stops the scheduler once the pending searches are done.
+    """
+
+    def __init__(self, vectorstore: VectorStore, window: float = 0.005, max_batch: int = 32, max_concurrency: int = 4) -> None:
+        """
+        Initializes the scheduler.
+
+        Parameters
+        ----------
+        vectorstore : VectorStore
+            The vector store to search, implementing `vector_store.VectorIndex` (a `NumpyVectorStore` or a
+            `ChromaVectorStore`). Its embedding function embeds the queries.
+        window : float, optional
+            The number of seconds a batch waits for more searches after its first one arrives (default is 0.005).
+        max_batch : int, optional
+            The maximum number of distinct searches in a batch (default is 32).
+        max_concurrency : int, optional
+            The maximum number of batches executed at the same time (default is 4).
+        """
+        self.vectorstore: VectorStore = vectorstore
+        self.window: float = window
+        self.max_batch: int = max(1, max_batch)
+        self.searches: int = 0
+        self.executed: int = 0
+        self.batches: int = 0
+        self._pending: List[Tuple[str, int]] = []
+        self._in_flight: Dict[Tuple[str, int], Future] = {}
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="query-batch")
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name="query-batcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, query: str, k: int) -> Future:
+        """
+        Schedules a search and returns a future of its documents.
+
+        Parameters
+        ----------
+        query : str
+            The search query.
+        k : int
+            The number of documents to return.
+
+        Returns
+        -------
+        Future
+            A future resolving to the k most similar documents, best first. Callers of an identical in-flight
+            search share the same future.
+        """
+        key = (query, k)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("QueryBatcher is closed")
+            self.searches += 1
+            future = self._in_flight.get(key)
+            if future is None:
+                future = Future()
+                self._in_flight[key] = future
+                self._pending.append(key)
+                self._condition.notify()
+            return future
+
+    def search(self, query: str, k: int) -> List[Document]:
+        """
+        Searches and waits for the documents.
+
+        Parameters
+        ----------
+        query : str
+            The search query.
+        k : int
+            The number of documents to return.
+
+        Returns
+        -------
+        List[Document]
+            The k most similar documents, best first.
+        """
+        return self.submit(query, k).result()
+
+    async def asearch(self, query: str, k: int) -> List[Document]:
+        """
+        Searches without blocking the event loop.
+
+        Parameters
+        ----------
+        query : str
+            The search query.
+        k : int
+            The number of documents to return.
+
+        Returns
+        -------
+        List[Document]
+            The k most similar documents, best first.
+        """
+        return await asyncio.wrap_future(self.submit(query, k))
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the number of searches, executed searches, batches and the mean batch size.
+
+        Returns
+        -------
+        Dict[str, float]
+            The "searches" submitted, the distinct searches "executed" after coalescing, the number of "batches"
+            and the "mean_batch_size".
+        """
+        with self._condition:
+            return {
+                "searches": self.searches,
+                "executed": self.executed,
+                "batches": self.batches,
+                "mean_batch_size": self.executed / self.batches if self.batches else 0.0,
+            }
+
+    def close(self) -> None:
+        """
+        Stops the scheduler once the pending searches are done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self.batches += 1
+                self.executed += len(batch)
+
+            self._executor.submit(self._execute, batch)
+
+    def _execute(self, batch: List[Tuple[str, int]]) -> None:
+        try:
+            vectors = embed_queries(self.vectorstore.embeddings, [query for query, _ in batch])
+            results = self.vectorstore.search_by_vectors(vectors, max(k for _, k in batch))
+            outcomes: List[Any] = [documents[:k] for (_, k), documents in zip(batch, results)]
+        except Exception as error:
+            logger.warning("Batched search of %d queries failed: %s", len(batch), error)
+            outcomes = [error] * len(batch)
+
+        with self._condition:
+            futures = [self._in_flight.pop(key) for key in batch]
+        for future, outcome in zip(futures, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+
+class Coalescer:
+    """
+    Runs identical concurrent calls once and shares the result with every caller.
+
+    Methods
+    -------
+    run(key: Hashable, function: Callable[[], Any]) -> Any
+        Calls the function, or waits for the identical call already in flight.
+    arun(key: Hashable, function: Callable[[], Any]) -> Any
+        Awaits the coroutine returned by the function, or the identical call already in flight.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced: int = 0
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Calls the function, or waits for the identical call already in flight.
+
+        Parameters
+        ----------
+        key : Hashable
+            The identity of the call.
+        function : Callable[[], Any]
+            The call to make.
+
+        Returns
+        -------
+        Any
+            The result of the call, shared by every caller with the same key.
+        """
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        return self._settle(key, future, function)
+
+    async def arun(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Awaits the coroutine returned by the function, or the identical call already in flight.
+
+        Parameters
+        ----------
+        key : Hashable
+            The identity of the call.
+        function : Callable[[], Any]
+            A function returning the coroutine to await.
+
+        Returns
+        -------
+        Any
+            The result of the call, shared by every caller with the same key.
+        """
+        future, owner = self._claim(key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await function()
+        except BaseException as error:
+            self._release(key)
+            future.set_exception(error)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _claim(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            if key in self._in_flight:
+                self.coalesced += 1
+                return self._in_flight[key], False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _settle(self, key: Hashable, future: Future, function: Callable[[], Any]) -> Any:
+        try:
+            result = function()
+        except BaseException as error:
+            self._release(key)
+            future.set_exception(error)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
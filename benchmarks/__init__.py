@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the RAG pipeline.
+
+Each benchmark is a module that can be run from the repository root, e.g. ``python -m benchmarks.bench_fetch``.
+"""
@@ -0,0 +1,67 @@
+"""
+Load test of the synchronous, asynchronous and streaming query paths with a local fake chat model.
+
+Reports the wall time of answering N concurrent questions with RAG.query (one after another, as a single Gradio
+worker would) and with RAG.aquery (concurrently on one event loop), and the time to first token of RAG.astream
+versus the full latency of RAG.aquery.
+
+Usage: python -m benchmarks.bench_async_query [--concurrency 20] [--first-token-delay 0.2] [--token-delay 0.01]
+"""
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from benchmarks.fakes import FakeChatModel
+from langchain_chroma import Chroma
+from statistics import median
+from rag import RAG
+import argparse
+import asyncio
+import time
+
+
+def build_rag(args: argparse.Namespace) -> RAG:
+    db = Chroma(collection_name="bench_async_query", embedding_function=DeterministicFakeEmbedding(size=256))
+    db.add_texts([f"Trecho {i} sobre as enchentes em Porto Alegre e a cheia do Guaíba." for i in range(500)])
+    llm = FakeChatModel(first_token_delay=args.first_token_delay, token_delay=args.token_delay)
+    return RAG(db=db, llm=llm, embedding_cache_path=None, hybrid=False)
+
+
+async def time_to_first_token(rag: RAG, question: str) -> float:
+    start = time.perf_counter()
+    async for _ in rag.astream(question):
+        return time.perf_counter() - start
+
+
+async def full_latency(rag: RAG, question: str) -> float:
+    start = time.perf_counter()
+    await rag.aquery(question)
+    return time.perf_counter() - start
+
+
+async def run_async(rag: RAG, questions: list) -> None:
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(full_latency(rag, question) for question in questions))
+    print(f"aquery   x{len(questions)} concurrent: {time.perf_counter() - start:6.2f}s total, p50 {median(latencies):.2f}s")
+
+    first_tokens = await asyncio.gather(*(time_to_first_token(rag, question) for question in questions))
+    print(f"astream  x{len(questions)} concurrent: time to first token p50 {median(first_tokens):.2f}s (vs full answer {median(latencies):.2f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rag = build_rag(args)
+    questions = [f"Quais bairros alagaram? ({i})" for i in range(args.concurrency)]
+
+    start = time.perf_counter()
+    for question in questions:
+        rag.query(question)
+    print(f"query    x{len(questions)} sequential: {time.perf_counter() - start:6.2f}s total")
+
+    asyncio.run(run_async(rag, questions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Load test of query batching: p50/p99 latency and throughput of concurrent RAG.aquery calls with and without the
+QueryBatcher, against a local stand-in of the embedding endpoint and a fake chat model.
+
+Every unbatched query embeds its question in its own HTTP request and runs its own Chroma search; batched queries
+arriving within the window share one embedding request and one multi-query search. A share of the questions are
+repeated to exercise the coalescing of identical in-flight questions.
+
+Usage: python -m benchmarks.bench_batching [--queries 200] [--concurrency 50] [--window 0.005] [--max-batch 32] [--duplicates 0.2]
+"""
+from benchmarks.fakes import FakeChatModel, openai_routes
+from benchmarks.server import FixtureServer
+from langchain_openai import OpenAIEmbeddings
+from chroma_store import ChromaVectorStore
+from typing import List, Optional
+from statistics import quantiles
+from rag import RAG
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+
+def build_rag(server: FixtureServer, batch_window: Optional[float], max_batch: int) -> RAG:
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", base_url=server.url("/v1"), api_key="stand-in", max_retries=0)
+    db = ChromaVectorStore(collection_name=f"bench_batching_{uuid.uuid4().hex}", embedding_function=embeddings)
+    db.add_texts([f"Trecho {i} sobre as enchentes em Porto Alegre e a cheia do Guaíba." for i in range(500)])
+    return RAG(
+        db=db,
+        llm=FakeChatModel(first_token_delay=0.01, token_delay=0.0),
+        embedding_cache_path=None,
+        retrieval_mode="similarity",
+        hybrid=False,
+        batch_window=batch_window,
+        max_batch=max_batch
+    )
+
+
+async def run(rag: RAG, questions: List[str], concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(question: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await rag.aquery(question)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(question) for question in questions))
+    return latencies
+
+
+def measure(name: str, rag: RAG, questions: List[str], concurrency: int) -> None:
+    start = time.perf_counter()
+    latencies = asyncio.run(run(rag, questions, concurrency))
+    elapsed = time.perf_counter() - start
+    percentiles = quantiles(latencies, n=100)
+    print(
+        f"{name:>10} {len(questions) / elapsed:>9.1f} {percentiles[49] * 1000:>8.1f} {percentiles[98] * 1000:>8.1f}"
+        f" {elapsed:>8.2f}"
+    )
+    if rag.batcher is not None:
+        print(f"{'':>10} {rag.batcher.stats()}, {rag._coalescer.coalesced} coalesced question(s)")
+    rag.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--window", type=float, default=0.005)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    random.seed(0)
+    distinct = [f"Quais bairros alagaram? ({i})" for i in range(args.queries)]
+    questions = [
+        random.choice(distinct[:max(1, i)]) if random.random() < args.duplicates else distinct[i]
+        for i in range(args.queries)
+    ]
+
+    with FixtureServer({}, latency=args.latency, routes=openai_routes()) as server:
+        print(f"{'path':>10} {'queries/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'seconds':>8}")
+        measure("unbatched", build_rag(server, None, args.max_batch), questions, args.concurrency)
+        measure("batched", build_rag(server, args.window, args.max_batch), questions, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
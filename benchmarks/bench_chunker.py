@@ -0,0 +1,82 @@
+"""
+Compares chunking throughput (chunks/sec, MB/sec) of the Chunker engines on a local corpus.
+
+The "legacy" row reproduces the original Chunker.chunk, which resolved the tiktoken encoding on every length call.
+
+Usage: python -m benchmarks.bench_chunker [--corpus DIR] [--documents 200] [--processes 4]
+"""
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents.base import Document
+from typing import Callable, List
+from loader import Chunker
+import argparse
+import tiktoken
+import random
+import time
+import os
+
+WORDS = (
+    "enchente chuva Guaíba Porto Alegre bairro abrigo Defesa Civil DMAE nível água cota inundação moradores "
+    "Restinga São Geraldo Floresta Sarandi diques bombas casas de bombas desalojados mortos desaparecidos "
+    "governo estadual prefeitura reconstrução economia empregos indústria"
+).split()
+
+
+def synthetic_corpus(documents: int, paragraphs: int = 60, seed: int = 0) -> List[Document]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(documents):
+        text = "\n\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))) + "." for _ in range(paragraphs))
+        corpus.append(Document(page_content=text, metadata={"source": f"https://example.org/{i}"}))
+    return corpus
+
+
+def directory_corpus(path: str) -> List[Document]:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), encoding="utf-8", errors="ignore") as f:
+            corpus.append(Document(page_content=f.read(), metadata={"source": name}))
+    return corpus
+
+
+def legacy_chunk(documents: List[Document], model_name: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=lambda text: len(tiktoken.encoding_for_model(model_name).encode(text)),
+        add_start_index=True
+    )
+    return text_splitter.split_documents(documents)
+
+
+def measure(name: str, run: Callable[[], List[Document]], megabytes: float) -> None:
+    start = time.perf_counter()
+    chunks = run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {len(chunks):>7} {elapsed:>8.2f} {len(chunks) / elapsed:>10.1f} {megabytes / elapsed:>8.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="A directory of text files; a synthetic corpus is generated when omitted.")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    corpus = directory_corpus(args.corpus) if args.corpus else synthetic_corpus(args.documents)
+    megabytes = sum(len(document.page_content.encode("utf-8")) for document in corpus) / 1e6
+    settings = dict(model_name=args.model, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    print(f"{len(corpus)} documents, {megabytes:.2f} MB")
+    print(f"{'engine':<22} {'chunks':>7} {'seconds':>8} {'chunks/s':>10} {'MB/s':>8}")
+
+    measure("legacy", lambda: legacy_chunk(corpus, **settings), megabytes)
+    measure("recursive", lambda: Chunker.chunk(corpus, engine="recursive", **settings), megabytes)
+    measure("token", lambda: Chunker.chunk(corpus, engine="token", **settings), megabytes)
+    measure(f"token x{args.processes} processes", lambda: Chunker.chunk(corpus, engine="token", processes=args.processes, **settings), megabytes)
+
+
+if __name__ == "__main__":
+    main()
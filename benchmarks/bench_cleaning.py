@@ -0,0 +1,98 @@
+"""
+Measures what boilerplate stripping and near-duplicate elimination save at ingest: chunks, embedded tokens and
+index size on disk, for the raw page text, the main content only, and the main content without near-duplicates.
+
+Pages are the fixture articles wrapped in the chrome of a news site plus tag pages listing overlapping teasers,
+or HTML files saved from the real sites (`--pages-dir`), served by a local fixture server. Chunks are embedded
+offline by the local hashing model into a NumPy index.
+
+Usage: python -m benchmarks.bench_cleaning [--paragraphs 30] [--tag-pages 6] [--pages-dir DIR] [--threshold 0.8]
+"""
+from benchmarks.corpus import make_corpus, make_tag_pages
+from local_embeddings import LOCAL_EMBEDDING_MODEL
+from benchmarks.server import FixtureServer
+from pipeline import IngestionPipeline
+from typing import Dict, Optional
+from sources import SEED_URLS
+from tracing import Tracer
+from indexer import Indexer
+import argparse
+import tempfile
+import time
+import os
+
+CONFIGURATIONS = [("raw", False, False), ("clean", True, False), ("clean+dedup", True, True)]
+
+
+def load_pages(directory: str) -> Dict[str, str]:
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), encoding="utf-8", errors="replace") as f:
+                pages[f"/{name}"] = f.read()
+    return pages
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def measure(name: str, clean: bool, deduplicate: bool, urls: list, args: argparse.Namespace, baseline: Optional[dict]) -> dict:
+    tracer = Tracer(max_traces=1)
+    with tempfile.TemporaryDirectory() as directory:
+        db = Indexer.load_db(directory, embedding_model=LOCAL_EMBEDDING_MODEL, backend="numpy")
+        pipeline = IngestionPipeline(
+            db,
+            requests_per_second_per_host=None,
+            embedding_model=LOCAL_EMBEDDING_MODEL,
+            clean=clean,
+            deduplicate=deduplicate,
+            duplicate_threshold=args.threshold,
+            tracer=tracer
+        )
+        start = time.perf_counter()
+        pipeline.run(urls)
+        elapsed = time.perf_counter() - start
+        result = {
+            "chunks": pipeline.stats["written"],
+            "tokens": int(tracer.counters().get("tokens.embedding", 0)),
+            "bytes": directory_bytes(directory),
+        }
+
+    saved = "" if baseline is None else " ".join(
+        f"{1 - result[key] / baseline[key]:>7.1%}" if baseline[key] else f"{'-':>7}" for key in ("chunks", "tokens", "bytes")
+    )
+    print(
+        f"{name:<12} {elapsed:>8.2f} {result['chunks']:>7} {result['tokens']:>8} {result['bytes'] / 1e6:>9.2f} "
+        f"{pipeline.stats['boilerplate_chars']:>11} {pipeline.stats['duplicate_chunks']:>11} {saved}"
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--tag-pages", type=int, default=6)
+    parser.add_argument("--pages-dir", default=None, help="a directory of saved .html pages to ingest instead of the fixtures")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    if args.pages_dir:
+        pages = load_pages(args.pages_dir)
+    else:
+        pages = {**make_corpus(SEED_URLS, paragraphs=args.paragraphs, boilerplate=True), **make_tag_pages(args.tag_pages)}
+    with FixtureServer(pages) as server:
+        urls = [server.url(path) for path in pages]
+        print(f"{len(urls)} pages")
+        print(
+            f"{'text':<12} {'seconds':>8} {'chunks':>7} {'tokens':>8} {'index MB':>9} {'boilerplate':>11} "
+            f"{'duplicates':>11} {'saved (chunks, tokens, bytes)'}"
+        )
+        baseline = None
+        for name, clean, deduplicate in CONFIGURATIONS:
+            result = measure(name, clean, deduplicate, urls, args, baseline)
+            baseline = baseline or result
+
+
+if __name__ == "__main__":
+    main()
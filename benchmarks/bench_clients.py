@@ -0,0 +1,95 @@
+"""
+Measures per-query connection setup and per-ingest overhead of shared versus per-call model clients, against a
+local stand-in of the OpenAI API.
+
+The first part answers N questions with a ChatOpenAI built per call (the previous behaviour of the retriever and
+chain factories) and with the shared client of a ClientRegistry, reporting the TCP connections each opened. The
+second part ingests small batches into a RAG, comparing the ingest itself with the cost of rebuilding the
+retriever and chain on fresh clients after every ingest, and checks that the chain built once sees new chunks.
+
+Usage: python -m benchmarks.bench_clients [--queries 50] [--ingests 20] [--latency 0.005]
+"""
+from langchain_core.documents.base import Document
+from benchmarks.fakes import openai_routes
+from benchmarks.server import FixtureServer
+from langchain_openai import ChatOpenAI
+from clients import ClientRegistry
+from statistics import mean
+from rag import RAG
+import argparse
+import tempfile
+import time
+
+API_KEY = "stand-in"
+
+
+def per_query(server: FixtureServer, queries: int) -> None:
+    print(f"{'clients':>8} {'queries':>8} {'seconds':>8} {'conns':>6}")
+
+    server.connections = 0
+    start = time.perf_counter()
+    for i in range(queries):
+        ChatOpenAI(model="gpt-3.5-turbo", base_url=server.url("/v1"), api_key=API_KEY).invoke(f"Pergunta {i}?")
+    print(f"{'per-call':>8} {queries:>8} {time.perf_counter() - start:>8.2f} {server.connections:>6}")
+
+    registry = ClientRegistry(base_url=server.url("/v1"), api_key=API_KEY)
+    server.connections = 0
+    start = time.perf_counter()
+    for i in range(queries):
+        registry.chat_model("gpt-3.5-turbo").invoke(f"Pergunta {i}?")
+    print(f"{'shared':>8} {queries:>8} {time.perf_counter() - start:>8.2f} {server.connections:>6}")
+    registry.close()
+
+
+def make_batch(i: int) -> list:
+    return [
+        Document(
+            page_content=f"Boletim {i}.{j}: o bairro {i * 10 + j} registrou alagamento e o DMAE acionou as bombas.",
+            metadata={"source": f"https://example.org/boletim-{i}", "start_index": j * 100},
+        )
+        for j in range(5)
+    ]
+
+
+def per_ingest(server: FixtureServer, ingests: int) -> None:
+    registry = ClientRegistry(base_url=server.url("/v1"), api_key=API_KEY)
+    with tempfile.TemporaryDirectory() as directory:
+        rag = RAG(embedding_cache_path=None, persist_directory=directory, retrieval_mode="similarity", clients=registry)
+        rag._add_documents_to_db(make_batch(0))
+        chain = rag.rag_chain
+
+        ingest_times, rebuild_times = [], []
+        for i in range(1, ingests + 1):
+            batch = make_batch(i)
+            start = time.perf_counter()
+            rag._add_documents_to_db(batch)
+            ingest_times.append(time.perf_counter() - start)
+
+            retrieved = rag.retriever.invoke(batch[0].page_content)
+            assert any(document.page_content == batch[0].page_content for document in retrieved), "new chunk not visible"
+
+            start = time.perf_counter()
+            fresh_clients = ClientRegistry(base_url=server.url("/v1"), api_key=API_KEY)
+            RAG(embedding_cache_path=None, db=rag.db, retrieval_mode="similarity", hybrid=False, clients=fresh_clients)
+            rebuild_times.append(time.perf_counter() - start)
+
+        assert rag.rag_chain is chain, "chain was rebuilt"
+        print(f"ingest of 5 chunks, shared clients, no rebuild: {mean(ingest_times) * 1000:7.1f} ms")
+        print(f"rebuilding retriever and chain on fresh clients:  {mean(rebuild_times) * 1000:7.1f} ms per ingest")
+    registry.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--ingests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    with FixtureServer({}, latency=args.latency, routes=openai_routes()) as server:
+        per_query(server, args.queries)
+        per_ingest(server, args.ingests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Soak test of RAG.retrieved_contexts: runs many queries against a stubbed chain and reports RSS over time.
+
+With the bounded ContextStore the RSS should stay flat once the store is full. Pass --unbounded to compare
+against keeping every context (the previous behaviour).
+
+Usage: python -m benchmarks.bench_context_soak [--queries 100000] [--top-k 10] [--unbounded]
+"""
+from langchain_core.documents.base import Document
+from context_store import ContextStore
+from typing import Dict, List
+from rag import RAG
+import argparse
+import random
+import time
+import os
+
+
+def rss_megabytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+class StubDB:
+    def __init__(self, pool: Dict[str, str]) -> None:
+        self.pool = pool
+
+    def get(self, ids: List[str], include: List[str]) -> dict:
+        return {"ids": ids, "documents": [self.pool[id_] for id_ in ids], "metadatas": [{"chunk_id": id_} for id_ in ids]}
+
+
+class StubChain:
+    def __init__(self, pool: Dict[str, str], top_k: int) -> None:
+        self.ids = list(pool)
+        self.pool = pool
+        self.top_k = top_k
+
+    def invoke(self, inputs: dict) -> dict:
+        ids = random.sample(self.ids, self.top_k)
+        context = [Document(page_content=self.pool[id_], metadata={"source": "stub", "chunk_id": id_}) for id_ in ids]
+        return {"input": inputs["input"], "context": context, "answer": "resposta " * 50}
+
+
+class UnboundedStore(dict):
+    resolver = None
+
+    def put(self, documents: List[Document]) -> str:
+        request_id = str(len(self))
+        self[request_id] = documents
+        return request_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--chunks", type=int, default=2_000)
+    parser.add_argument("--unbounded", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(0)
+    pool = {f"chunk-{i}": f"Trecho {i} sobre as enchentes no Rio Grande do Sul. " * 40 for i in range(args.chunks)}
+    store = UnboundedStore() if args.unbounded else ContextStore()
+    rag = RAG(embedding_cache_path=None, context_store=store)
+    rag.db = StubDB(pool)
+    rag.rag_chain = StubChain(pool, args.top_k)
+
+    print(f"{'queries':>8} {'rss MB':>8} {'stored':>8} {'q/s':>8}")
+    start = time.perf_counter()
+    for i in range(1, args.queries + 1):
+        _, request_id = rag.query_with_request_id(f"Pergunta número {i}?")
+        if i % (args.queries // 10) == 0:
+            assert len(rag.get_context(request_id)) == args.top_k
+            print(f"{i:>8} {rss_megabytes():>8.1f} {len(store):>8} {i / (time.perf_counter() - start):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmarks Fetcher against a local stand-in server serving fixture pages with injected latency.
+
+Usage: python -m benchmarks.bench_fetch [--pages 20] [--latency 0.3] [--workers 1 4 8 16]
+"""
+from benchmarks.server import FixtureServer
+from fetcher import Fetcher
+import argparse
+import time
+
+
+def make_pages(count: int) -> dict:
+    paragraph = "A enchente atingiu bairros de Porto Alegre e o nível do Guaíba seguiu acima da cota de inundação. "
+    return {
+        f"/page-{i}": f"<html lang='pt-BR'><head><title>Página {i}</title></head><body><p>{paragraph * 40}</p></body></html>"
+        for i in range(count)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    with FixtureServer(pages, latency=args.latency) as server:
+        urls = [server.url(path) for path in pages] + [server.url("/missing")]
+        print(f"{'workers':>8} {'seconds':>8} {'pages/s':>8} {'ok':>4} {'failed':>6} {'conns':>6}")
+        for workers in args.workers:
+            server.connections = 0
+            start = time.perf_counter()
+            with Fetcher(max_workers=workers, requests_per_second_per_host=None) as fetcher:
+                result = fetcher.fetch(urls)
+            elapsed = time.perf_counter() - start
+
+            assert [doc.metadata["source"] for doc in result.documents] == urls[:-1], "documents out of order"
+            print(f"{workers:>8} {elapsed:>8.2f} {len(urls) / elapsed:>8.1f} {len(result.documents):>4} {len(result.failed):>6} {server.connections:>6}")
+
+
+if __name__ == "__main__":
+    main()
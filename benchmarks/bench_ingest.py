@@ -0,0 +1,77 @@
+"""
+Benchmarks ingestion throughput and peak memory against local stand-ins for the websites and a rate-limited
+embedding endpoint.
+
+Compares loading every page and embedding all chunks in one call (the previous ingestion path) with the
+streaming IngestionPipeline at several embedding concurrency limits. Peak memory is the peak of Python
+allocations measured by tracemalloc.
+
+Usage: python -m benchmarks.bench_ingest [--pages 100] [--latency 0.05] [--embedding-rps 20] [--concurrency 1 4 8]
+"""
+from benchmarks.bench_fetch import make_pages
+from benchmarks.fakes import openai_routes
+from benchmarks.server import FixtureServer
+from langchain_openai import OpenAIEmbeddings
+from pipeline import IngestionPipeline
+from chroma_store import ChromaVectorStore
+from indexer import Indexer
+from loader import Loader
+from typing import Callable
+import tracemalloc
+import argparse
+import time
+import uuid
+
+
+def make_db(server: FixtureServer) -> Chroma:
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", base_url=server.url("/v1"), api_key="stand-in", max_retries=0)
+    return ChromaVectorStore(collection_name=f"bench_ingest_{uuid.uuid4().hex}", embedding_function=embeddings)
+
+
+def measure(name: str, ingest: Callable[[Chroma], None], server: FixtureServer) -> None:
+    db = make_db(server)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        ingest(db)
+        outcome = "ok"
+    except Exception as error:
+        outcome = f"{type(error).__name__}"
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    chunks = len(db.get(include=[])["ids"])
+    print(f"{name:>16} {elapsed:>8.2f} {chunks / elapsed:>9.1f} {peak / 1e6:>8.1f} {chunks:>7} {outcome:>16}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--embedding-rps", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    routes = openai_routes(embedding_requests_per_second=args.embedding_rps)
+    with FixtureServer(pages, latency=args.latency, routes=routes) as server:
+        urls = [server.url(path) for path in pages]
+        print(f"{'path':>16} {'seconds':>8} {'chunks/s':>9} {'peak MB':>8} {'chunks':>7} {'outcome':>16}")
+
+        def one_shot(db: Chroma) -> None:
+            documents = Loader.load_documents(urls, requests_per_second_per_host=None)
+            Indexer.upsert_documents(documents, db, batch_size=len(documents))
+
+        measure("one-shot", one_shot, server)
+        for concurrency in args.concurrency:
+            def streaming(db: Chroma) -> None:
+                pipeline = IngestionPipeline(db, requests_per_second_per_host=None, max_concurrency=concurrency, batch_size=16, backoff=0.1)
+                pipeline.run(urls)
+                print(f"{'':>16} {pipeline.stats}")
+
+            measure(f"pipeline x{concurrency}", streaming, server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures queries running while the fixture corpus is re-ingested: inline, with `RAG.add_documents` writing into the
+index being queried, and in the background, with an `IngestionQueue` building a new index version and swapping it
+in when complete.
+
+Every page changes between the two ingests, so each one deletes and rewrites all chunks. A query is "mixed" when
+its retrieved chunks come from both the old and the new version of the corpus, i.e. it ran on a half-updated
+index. Model calls are answered by in-process fakes and pages by a local fixture server.
+
+Usage: python -m benchmarks.bench_ingestion_queue [--paragraphs 30] [--embedding-latency 0.02] [--backend chroma|numpy]
+"""
+from benchmarks.corpus import make_corpus, make_questions
+from benchmarks.fakes import FakeClientRegistry
+from benchmarks.server import FixtureServer
+from ingestion_queue import IngestionQueue
+from statistics import median, quantiles
+from typing import Callable, List, Set
+from sources import SEED_URLS
+from tracing import Tracer
+from rag import RAG
+import threading
+import argparse
+import tempfile
+import time
+
+
+def make_rag(args: argparse.Namespace, directory: str) -> RAG:
+    clients = FakeClientRegistry(first_token_delay=0.0, embedding_latency=args.embedding_latency)
+    return RAG(
+        embedding_cache_path=None,
+        persist_directory=directory,
+        retrieval_mode="similarity",
+        context_budget=None,
+        clients=clients,
+        tracer=Tracer(max_traces=1),
+        vector_backend=args.backend
+    )
+
+
+def query_during(rag: RAG, questions: List[str], old_ids: Set[str], running: Callable[[], bool]) -> dict:
+    latencies, mixed = [], 0
+    while running() or not latencies:
+        question = questions[len(latencies) % len(questions)]
+        start = time.perf_counter()
+        documents = rag._get_chain().invoke({"input": question})["context"]
+        latencies.append(time.perf_counter() - start)
+        versions = {document.metadata.get("chunk_id") in old_ids for document in documents}
+        mixed += len(versions) == 2
+    cuts = quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    return {"queries": len(latencies), "p50_ms": median(latencies) * 1000, "p95_ms": cuts[-1] * 1000, "mixed": mixed}
+
+
+def measure(name: str, args: argparse.Namespace, server: FixtureServer, urls: List[str], questions: List[str]) -> None:
+    server.pages.update(make_corpus(SEED_URLS, paragraphs=args.paragraphs, seed=0))
+    with tempfile.TemporaryDirectory() as directory:
+        rag = make_rag(args, directory)
+        rag.add_documents(urls)
+        old_ids = set(rag.db.get(include=[])["ids"])
+        idle = query_during(rag, questions, old_ids, lambda: False)
+        server.pages.update(make_corpus(SEED_URLS, paragraphs=args.paragraphs, seed=1))
+
+        start = time.perf_counter()
+        if name == "inline":
+            ingest = threading.Thread(target=rag.add_documents, args=(urls,))
+            ingest.start()
+            during = query_during(rag, questions, old_ids, ingest.is_alive)
+            ingest.join()
+        else:
+            queue = IngestionQueue(rag)
+            job = queue.submit(urls)
+            during = query_during(rag, questions, old_ids, lambda: not job.finished)
+            queue.close()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<10} {elapsed:>8.2f} {idle['p50_ms']:>11.2f} {during['queries']:>8} {during['p50_ms']:>8.2f} "
+            f"{during['p95_ms']:>8.2f} {during['mixed']:>6}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--page-latency", type=float, default=0.02)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"])
+    args = parser.parse_args()
+
+    with FixtureServer({}, latency=args.page_latency) as server:
+        urls = [server.url(path) for path in make_corpus(SEED_URLS, paragraphs=1)]
+        questions = [question.question for question in make_questions(SEED_URLS)]
+        print(f"{'ingest':<10} {'seconds':>8} {'idle p50 ms':>11} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8} {'mixed':>6}")
+        for name in ("inline", "background"):
+            measure(name, args, server, urls, questions)
+
+
+if __name__ == "__main__":
+    main()
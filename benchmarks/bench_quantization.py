@@ -0,0 +1,81 @@
+"""
+Measures the quantized storage modes of `NumpyVectorStore` on synthetic vectors: the bytes scanned by the first
+pass of a search, the recall@k of the rescored results against the exact full-precision search, and the query
+latency.
+
+The corpus has a decaying variance per dimension, like the leading-dimension ordering of Matryoshka-trained
+models, so truncating the codes to the leading dimensions keeps most of the signal. Queries are corpus vectors
+plus noise. Every configuration embeds nothing: vectors are written and searched directly.
+
+Usage: python -m benchmarks.bench_quantization [--size 100000] [--dimensions 384] [--k 10] [--rescore-factor 4]
+"""
+from local_embeddings import HashingEmbeddings
+from vector_store import NumpyVectorStore
+from statistics import median
+import numpy as np
+import argparse
+import time
+
+
+def make_vectors(size: int, dimensions: int, queries: int) -> tuple:
+    rng = np.random.default_rng(0)
+    scale = np.exp(-np.arange(dimensions) / (dimensions / 4)).astype(np.float32)
+    corpus = rng.standard_normal((size, dimensions), dtype=np.float32) * scale
+    picks = rng.choice(size, queries, replace=False)
+    probes = corpus[picks] + rng.standard_normal((queries, dimensions), dtype=np.float32) * scale * 0.5
+    return corpus, probes
+
+
+def build(corpus: np.ndarray, quantization, search_dimensions, rescore_factor: int) -> NumpyVectorStore:
+    store = NumpyVectorStore(None, HashingEmbeddings(corpus.shape[1]), quantization, search_dimensions, rescore_factor)
+    for first in range(0, len(corpus), 10_000):
+        vectors = corpus[first:first + 10_000]
+        ids = [f"chunk-{i}" for i in range(first, first + len(vectors))]
+        store.upsert_vectors(ids, vectors, [f"Trecho {i}" for i in range(first, first + len(vectors))], [{"source": f"https://example.com/{i}"} for i in range(first, first + len(vectors))])
+    return store
+
+
+def search(store: NumpyVectorStore, probes: np.ndarray, k: int) -> tuple:
+    results, latencies = [], []
+    for probe in probes.tolist():
+        start = time.perf_counter()
+        hits = store.search_by_vectors([probe], k)[0]
+        latencies.append(time.perf_counter() - start)
+        results.append({document.page_content for document in hits})
+    return results, median(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    corpus, probes = make_vectors(args.size, args.dimensions, args.queries)
+    configs = [
+        ("exact", None, None),
+        ("float16", "float16", None),
+        ("int8", "int8", None),
+        (f"int8@{args.dimensions // 2}", "int8", args.dimensions // 2),
+        (f"int8@{args.dimensions // 4}", "int8", args.dimensions // 4),
+    ]
+
+    exact = None
+    print(f"{'config':<10} {'scan MB':>8} {'saved %':>8} {'recall@k':>8} {'p50 ms':>7}")
+    for name, quantization, search_dimensions in configs:
+        store = build(corpus, quantization, search_dimensions, args.rescore_factor)
+        results, p50 = search(store, probes, args.k)
+        exact = exact or results
+        recall = sum(len(found & expected) for found, expected in zip(results, exact)) / sum(len(expected) for expected in exact)
+        stats = store.stats()
+        print(
+            f"{name:<10} {stats['scan_bytes'] / 1e6:>8.1f} {(1 - stats['scan_bytes'] / stats['full_bytes']) * 100:>8.1f} "
+            f"{recall:>8.3f} {p50:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
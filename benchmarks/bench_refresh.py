@@ -0,0 +1,84 @@
+"""
+Measures a refresh of an ingested corpus after a few pages changed: re-ingesting every page in full, versus
+conditional requests against the page cache that re-chunk and re-index only the changed pages.
+
+The fixture pages (articles in site chrome plus tag pages) are ingested once, then a share of the articles is
+rewritten and the corpus refreshed. "conditional" runs against a server sending ETag and Last-Modified, which
+answers unchanged pages with 304; "hash only" against one without validators, where unchanged pages are
+downloaded but recognized by the hash of their text. Chunks are embedded offline by the local hashing model
+into a NumPy index.
+
+Usage: python -m benchmarks.bench_refresh [--paragraphs 30] [--changed 0.1] [--latency 0.05]
+"""
+from benchmarks.corpus import fixture_path, make_corpus, make_tag_pages
+from local_embeddings import LOCAL_EMBEDDING_MODEL
+from benchmarks.server import FixtureServer
+from pipeline import IngestionPipeline
+from page_cache import PageCache
+from sources import SEED_URLS
+from indexer import Indexer
+import argparse
+import tempfile
+import time
+import os
+
+MODES = [("full", False, False), ("conditional", True, True), ("hash only", True, False)]
+
+
+def make_pages(args: argparse.Namespace, changed: bool) -> dict:
+    pages = {**make_corpus(SEED_URLS, paragraphs=args.paragraphs, boilerplate=True), **make_tag_pages()}
+    if changed:
+        rewritten = make_corpus(SEED_URLS, paragraphs=args.paragraphs, seed=1, boilerplate=True)
+        count = max(1, round(len(SEED_URLS) * args.changed))
+        pages.update({fixture_path(url): rewritten[fixture_path(url)] for url in SEED_URLS[:count]})
+    return pages
+
+
+def measure(name: str, cached: bool, validators: bool, args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory, FixtureServer(make_pages(args, False), latency=args.latency, validators=validators) as server:
+        urls = [server.url(path) for path in server.pages]
+        db = Indexer.load_db(os.path.join(directory, "db"), embedding_model=LOCAL_EMBEDDING_MODEL, backend="numpy")
+        with PageCache(os.path.join(directory, "pages.db")) as page_cache:
+            pipeline = IngestionPipeline(db, requests_per_second_per_host=None, embedding_model=LOCAL_EMBEDDING_MODEL, page_cache=page_cache)
+            pipeline.run(urls)
+            page_cache.put(pipeline.pages)
+
+            server.pages.update(make_pages(args, True))
+            requests, bytes_sent = server.requests, server.bytes_sent
+            pipeline = IngestionPipeline(
+                db,
+                requests_per_second_per_host=None,
+                embedding_model=LOCAL_EMBEDDING_MODEL,
+                page_cache=page_cache if cached else None,
+                changed_only=cached
+            )
+            start = time.perf_counter()
+            summary = pipeline.run(urls)
+            elapsed = time.perf_counter() - start
+            page_cache.put(pipeline.pages)
+
+        stats = pipeline.stats
+        print(
+            f"{name:<12} {elapsed:>8.2f} {server.requests - requests:>8} {stats['not_modified']:>5} "
+            f"{(server.bytes_sent - bytes_sent) / 1e3:>9.1f} {stats['pages']:>7} {stats['chunks']:>7} {stats['embedded']:>8} "
+            f"{summary['added'] + summary['updated']:>8} {summary['deleted']:>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--changed", type=float, default=0.1, help="the share of the articles rewritten before the refresh")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(
+        f"{'refresh':<12} {'seconds':>8} {'requests':>8} {'304s':>5} {'KB down':>9} {'chunked':>7} {'planned':>7} "
+        f"{'embedded':>8} {'written':>8} {'deleted':>8}"
+    )
+    for name, cached, validators in MODES:
+        measure(name, cached, validators, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Runs the retrieval evaluation sweep of `evaluation.Evaluator` on the fixture corpus, fully offline: the pages are
+parsed from the generated HTML, the index is embedded with the local hashing model, and every question is scored
+against the page its fact was taken from. The second sweep reuses the cached indices, which shows the build cost
+the cache saves.
+
+Usage: python -m benchmarks.bench_retrieval_quality [--paragraphs 30] [--chunk-sizes 100 250 500] [--top-k 1 3 5 10]
+"""
+from benchmarks.corpus import make_corpus, make_questions
+from evaluation import EvalQuestion, Evaluator
+from sources import SEED_URLS
+from fetcher import Fetcher
+import argparse
+import tempfile
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 50])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--modes", nargs="+", default=["similarity", "mmr"])
+    args = parser.parse_args()
+
+    pages = make_corpus(SEED_URLS, paragraphs=args.paragraphs)
+    urls = {path: url for path, url in zip(pages, SEED_URLS)}
+    documents = [Fetcher.parse(html, urls[path]) for path, html in pages.items()]
+    questions = [EvalQuestion(question.question, [urls[question.path]]) for question in make_questions(SEED_URLS)]
+
+    with tempfile.TemporaryDirectory() as root:
+        for run in ("cold", "cached"):
+            evaluator = Evaluator(documents, questions, root=root)
+            start = time.perf_counter()
+            results = evaluator.sweep(args.chunk_sizes, args.chunk_overlaps, args.top_k, args.modes, hybrid=(False, True))
+            print(f"{run} sweep: {len(results)} configurations in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'size':>5} {'overlap':>7} {'top_k':>5} {'mode':>10} {'hybrid':>6} {'recall':>6} {'MRR':>6} {'tokens':>7} {'ms':>6} {'recall/1k tok':>13}")
+    for result in results:
+        config = result.config
+        print(
+            f"{config.chunk_size:>5} {config.chunk_overlap:>7} {config.top_k:>5} {config.mode:>10} {str(config.hybrid):>6} "
+            f"{result.recall:>6.3f} {result.mrr:>6.3f} {result.prompt_tokens:>7.0f} {result.latency_ms:>6.2f} "
+            f"{result.recall / max(result.prompt_tokens, 1) * 1000:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Load test of `serve.WorkerPool`: query throughput and latency with 1, 2 and 4 worker processes serving one
+read-only, memory-mapped index, with every model call answered by in-process fakes, and the memory of each worker.
+
+The index is the fixture corpus ingested by a writer RAG, padded with random vectors (`--padding`) so the matrix
+is large enough for its sharing to show: RSS counts the mapped pages in every worker, PSS splits shared pages
+among the processes mapping them, and USS is what each worker holds alone. Halfway through each run the writer
+publishes a new index version with a rewritten page; "pickup" is the time from its publication until every
+worker has answered from it, sending further queries after the run if needed.
+
+Throughput can only scale with workers up to the number of cores; the load is CPU-bound with the default zero
+model latency.
+
+Usage: python -m benchmarks.bench_serve [--workers 1 2 4] [--queries 400] [--concurrency 16] [--padding 200000] [--llm-latency 0.0]
+"""
+from benchmarks.corpus import fixture_path, make_corpus, make_questions
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fakes import FakeClientRegistry
+from benchmarks.server import FixtureServer
+from statistics import median, quantiles
+from serve import WorkerPool
+from sources import SEED_URLS
+from typing import Dict, List
+from indexer import Indexer
+from rag import RAG
+import numpy as np
+import functools
+import threading
+import argparse
+import tempfile
+import time
+import os
+
+
+def memory_megabytes(pid: int) -> Dict[str, float]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1e3
+    return {"rss": fields["Rss"], "pss": fields["Pss"], "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def pad(rag: RAG, rows: int, dimensions: int) -> None:
+    rng = np.random.default_rng(0)
+    for first in range(0, rows, 20_000):
+        count = min(20_000, rows - first)
+        ids = [f"padding-{i}" for i in range(first, first + count)]
+        vectors = rng.standard_normal((count, dimensions), dtype=np.float32)
+        rag.db.upsert_vectors(ids, vectors, ["Trecho de preenchimento"] * count, [{"source": "padding"}] * count)
+    # the workers open the index read-only, so the BM25 index must be current on disk
+    Indexer.load_bm25_index(rag.db, rag._bm25_path())
+
+
+def measure(workers: int, writer: RAG, server: FixtureServer, variants: List[Dict[str, str]], args: argparse.Namespace) -> None:
+    questions = [question.question for question in make_questions(SEED_URLS)]
+    clients_factory = functools.partial(FakeClientRegistry, first_token_delay=args.llm_latency)
+    with WorkerPool.from_rag(writer, workers=workers, threads=args.threads, poll_interval=args.poll_interval, clients_factory=clients_factory) as pool:
+        pool.wait_ready()
+        for future in [pool.submit(questions[i % len(questions)], mode=args.mode) for i in range(workers * args.threads * 2)]:
+            future.result()
+
+        half = threading.Event()
+        published: Dict[str, float] = {}
+        picked_up: Dict[int, float] = {}
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def publish() -> None:
+            half.wait()
+            # alternate between two versions of the page, so every run publishes a change
+            path = fixture_path(SEED_URLS[0])
+            server.pages[path] = variants[1][path] if server.pages[path] == variants[0][path] else variants[0][path]
+            writer.add_documents_isolated([server.url(path)])
+            published[writer.index_directory] = time.perf_counter()
+
+        def ask(i: int, timed: bool = True) -> None:
+            start = time.perf_counter()
+            answer = pool.query(questions[i % len(questions)], mode=args.mode)
+            end = time.perf_counter()
+            with lock:
+                if timed:
+                    latencies.append(end - start)
+                if len(latencies) == args.queries // 2:
+                    half.set()
+                if answer.index_directory in published and answer.worker not in picked_up:
+                    picked_up[answer.worker] = end - published[answer.index_directory]
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            list(executor.map(ask, range(args.queries)))
+        elapsed = time.perf_counter() - start
+        publisher.join()
+        deadline = time.perf_counter() + 30
+        while len(picked_up) < workers and time.perf_counter() < deadline:
+            with ThreadPoolExecutor(args.concurrency) as executor:
+                list(executor.map(functools.partial(ask, timed=False), range(args.concurrency)))
+        memory = [memory_megabytes(pid) for pid in pool.pids()]
+
+    cuts = quantiles(latencies, n=100)
+    pickup = f"{max(picked_up.values()):.2f}" if len(picked_up) == workers else "-"
+    print(
+        f"{workers:>7} {args.queries / elapsed:>8.1f} {median(latencies) * 1000:>8.1f} {cuts[94] * 1000:>8.1f} "
+        f"{sum(m['rss'] for m in memory) / workers:>8.1f} {sum(m['pss'] for m in memory) / workers:>8.1f} "
+        f"{sum(m['uss'] for m in memory) / workers:>8.1f} {pickup:>8}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=4, help="the queries each worker runs concurrently")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--padding", type=int, default=200_000, help="random vectors added to the fixture index")
+    parser.add_argument("--paragraphs", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--mode", default="similarity")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    pages = make_corpus(SEED_URLS, paragraphs=args.paragraphs)
+    rewritten = make_corpus(SEED_URLS, paragraphs=args.paragraphs, seed=1)
+    with tempfile.TemporaryDirectory() as directory, FixtureServer(dict(pages)) as server:
+        clients = FakeClientRegistry()
+        writer = RAG(
+            persist_directory=os.path.join(directory, "db"),
+            embedding_cache_path=None,
+            clients=clients,
+            vector_backend="numpy"
+        )
+        writer.add_documents_isolated([server.url(path) for path in pages])
+        pad(writer, args.padding, writer.db.dimensions)
+        stats = writer.db.stats()
+        print(f"{os.cpu_count()} CPU(s), index of {stats['rows']} rows, {stats['full_bytes'] / 1e6:.0f} MB of vectors, mode {args.mode}")
+        print(f"{'workers':>7} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8} {'pickup s':>8}")
+        for workers in args.workers:
+            measure(workers, writer, server, [pages, rewritten], args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures the overhead of the Tracer: the cost of one timed stage and one counter increment with tracing enabled,
+disabled and inside a traced request, and the end-to-end latency of RAG.query with a local fake chat model with
+tracing on and off. Prints the stage breakdown of the last traced query.
+
+Usage: python -m benchmarks.bench_tracing [--iterations 200000] [--queries 200]
+"""
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from benchmarks.fakes import FakeChatModel
+from langchain_chroma import Chroma
+from statistics import median
+from tracing import Tracer
+from rag import RAG
+import argparse
+import json
+import time
+
+
+def per_call(tracer: Tracer, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with tracer.time("stage"):
+            pass
+        tracer.count("counter")
+    return (time.perf_counter() - start) / iterations
+
+
+def query_latency(tracer: Tracer, queries: int) -> tuple:
+    db = Chroma(collection_name=f"bench_tracing_{tracer.enabled}", embedding_function=DeterministicFakeEmbedding(size=256))
+    db.add_texts([f"Trecho {i} sobre as enchentes em Porto Alegre e a cheia do Guaíba." for i in range(500)])
+    rag = RAG(db=db, llm=FakeChatModel(first_token_delay=0.0, token_delay=0.0), embedding_cache_path=None, hybrid=False, tracer=tracer)
+    latencies = []
+    request_id = None
+    for i in range(queries):
+        start = time.perf_counter()
+        _, request_id = rag.query_with_request_id(f"Quais bairros alagaram? ({i})")
+        latencies.append(time.perf_counter() - start)
+    return median(latencies), rag.trace(request_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    tracer = Tracer()
+    print(f"disabled:          {per_call(Tracer(enabled=False), args.iterations) * 1e9:8.0f} ns per stage + counter")
+    print(f"enabled:           {per_call(tracer, args.iterations) * 1e9:8.0f} ns per stage + counter")
+    with tracer.request("bench"):
+        print(f"enabled, traced:   {per_call(tracer, args.iterations) * 1e9:8.0f} ns per stage + counter")
+
+    off, _ = query_latency(Tracer(enabled=False), args.queries)
+    on, trace = query_latency(Tracer(), args.queries)
+    print(f"RAG.query p50: {off * 1000:.2f} ms untraced, {on * 1000:.2f} ms traced ({(on - off) / off * 100:+.1f}%)")
+    print(json.dumps(trace, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compares the vector store backends of `Indexer.load_db` on synthetic vectors: build time, load time (reopening
+the persisted store), single-query and batched-query latency, and resident memory after loading and querying.
+
+Every (backend, size) pair runs in its own process so the memory figures do not include the other runs. Queries
+are searched by vector, so the numbers measure the stores and not the embedding model.
+
+Usage: python -m benchmarks.bench_vector_store [--sizes 10000 100000 1000000] [--backends numpy chroma] [--dimensions 384]
+"""
+from local_embeddings import LOCAL_EMBEDDING_MODEL
+from statistics import median, quantiles
+from indexer import Indexer
+import numpy as np
+import subprocess
+import argparse
+import tempfile
+import json
+import time
+import sys
+import os
+
+
+def rss_megabytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def open_store(backend: str, directory: str):
+    # queries are searched by vector, so the embedding model is never called
+    return Indexer.load_db(directory, embedding_model=LOCAL_EMBEDDING_MODEL, backend=backend)
+
+
+def worker(backend: str, size: int, dimensions: int, queries: int, batch: int, k: int) -> dict:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(backend, directory)
+        start = time.perf_counter()
+        for first in range(0, size, 5000):
+            vectors = rng.standard_normal((min(5000, size - first), dimensions), dtype=np.float32)
+            ids = [f"chunk-{i}" for i in range(first, first + len(vectors))]
+            texts = [f"Trecho {i}" for i in range(first, first + len(vectors))]
+            store.upsert_vectors(ids, vectors.tolist(), texts, [{"source": f"https://example.com/{i % 1000}"} for i in range(first, first + len(vectors))])
+        build = time.perf_counter() - start
+        del store
+
+        baseline = rss_megabytes()
+        start = time.perf_counter()
+        store = open_store(backend, directory)
+        load = time.perf_counter() - start
+
+        probes = rng.standard_normal((queries, dimensions), dtype=np.float32).tolist()
+        store.search_by_vectors(probes[:1], k)
+        latencies = []
+        for probe in probes:
+            start = time.perf_counter()
+            store.search_by_vectors([probe], k)
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for first in range(0, queries, batch):
+            store.search_by_vectors(probes[first:first + batch], k)
+        batched = (time.perf_counter() - start) / queries
+
+        return {
+            "backend": backend,
+            "size": size,
+            "build_s": build,
+            "load_s": load,
+            "p50_ms": median(latencies) * 1000,
+            "p95_ms": quantiles(latencies, n=20)[-1] * 1000,
+            "batched_ms_per_query": batched * 1000,
+            "rss_mb": rss_megabytes(),
+            "rss_growth_mb": rss_megabytes() - baseline,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"])
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, size = args.worker
+        print(json.dumps(worker(backend, int(size), args.dimensions, args.queries, args.batch, args.k)))
+        return
+
+    print(f"{'backend':<8} {'vectors':>9} {'build s':>8} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'batched ms/q':>12} {'RSS MB':>8} {'RSS +MB':>8}")
+    for size in args.sizes:
+        for backend in args.backends:
+            command = [
+                sys.executable, "-m", "benchmarks.bench_vector_store", "--worker", backend, str(size),
+                "--dimensions", str(args.dimensions), "--queries", str(args.queries), "--batch", str(args.batch), "--k", str(args.k)
+            ]
+            result = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+            print(
+                f"{backend:<8} {size:>9} {result['build_s']:>8.2f} {result['load_s']:>7.3f} {result['p50_ms']:>7.2f} "
+                f"{result['p95_ms']:>7.2f} {result['batched_ms_per_query']:>12.3f} {result['rss_mb']:>8.0f} {result['rss_growth_mb']:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+A deterministic fixture corpus mirroring the seed URLs, served by `benchmarks.server.FixtureServer`.
+
+Every seed URL gets a local page under the same host and path, with a generated article about the 2024 floods
+in Rio Grande do Sul. Each page carries a few facts unique to it (a neighborhood, an agency and a figure), and
+`make_questions` asks about those facts, so retrieval quality can be checked against the page each question was
+built from.
+
+With `boilerplate=True` the articles are wrapped in the chrome of a news site (navigation, cookie banner,
+related-article list, footer and scripts), and `make_tag_pages` generates tag pages listing overlapping windows
+of the same teasers, like the tag pages among the seed URLs.
+"""
+from typing import Dict, List, NamedTuple
+from urllib.parse import urlparse
+from sources import SEED_URLS
+import random
+
+NEIGHBORHOODS = [
+    "Sarandi", "Humaitá", "Navegantes", "São Geraldo", "Floresta", "Menino Deus", "Cidade Baixa", "Centro Histórico",
+    "Ilhas", "Farrapos", "Anchieta", "Restinga", "Arquipélago", "Cristal", "Ipanema", "Vila Nova", "Partenon",
+    "Santana", "Azenha", "Petrópolis",
+]
+AGENCIES = ["DMAE", "Defesa Civil", "Metsul", "Ministério da Integração", "IBGE", "Ipea", "Sema", "Corsan", "Trensurb", "Brigada Militar"]
+FILLER = [
+    "O nível do Guaíba permaneceu acima da cota de inundação durante vários dias.",
+    "Moradores foram levados para abrigos montados em escolas e ginásios.",
+    "As comportas do sistema de proteção contra cheias não funcionaram como previsto.",
+    "Voluntários organizaram resgates com barcos e jet skis nas ruas alagadas.",
+    "O abastecimento de água e energia foi interrompido em parte da cidade.",
+    "Especialistas apontam falta de manutenção nas casas de bombas.",
+    "O aeroporto Salgado Filho ficou fechado por causa da água na pista.",
+    "A chuva acumulada em poucos dias superou a média de meses inteiros.",
+    "Pequenos negócios calculam os prejuízos e aguardam linhas de crédito.",
+    "O governo estadual anunciou a construção de cidades provisórias.",
+]
+
+
+class Question(NamedTuple):
+    """
+    A question about a fact of one fixture page.
+    """
+    question: str
+    path: str
+    answer: str
+
+
+def fixture_path(url: str) -> str:
+    """
+    Returns the local path of the fixture page mirroring a URL: its host followed by its path.
+
+    Parameters
+    ----------
+    url : str
+        A seed URL.
+
+    Returns
+    -------
+    str
+        The path of the page on the fixture server, e.g. "/www.bbc.com/portuguese/articles/cw00d51k5rlo".
+    """
+    parsed = urlparse(url)
+    return f"/{parsed.netloc}{parsed.path or '/'}"
+
+
+def _facts(index: int) -> Dict[str, str]:
+    rng = random.Random(index)
+    return {
+        "neighborhood": NEIGHBORHOODS[index % len(NEIGHBORHOODS)],
+        "agency": AGENCIES[index % len(AGENCIES)],
+        "figure": str(rng.randint(120, 9_800)),
+    }
+
+
+SECTIONS = ["Últimas", "Porto Alegre", "Rio Grande do Sul", "Política", "Economia", "Esportes", "Clima", "Opinião", "Vídeos", "Podcasts"]
+COOKIE_NOTICE = (
+    "Utilizamos cookies e tecnologias semelhantes para personalizar conteúdo e anúncios e analisar nosso tráfego. "
+    "Ao continuar navegando, você concorda com nossa Política de Privacidade e os Termos de Uso."
+)
+
+
+def _teasers(count: int = 60) -> List[str]:
+    teasers = []
+    for index in range(count):
+        facts = _facts(index)
+        teasers.append(
+            f"{facts['agency']} atualiza a situação no bairro {facts['neighborhood']} após a enchente|"
+            f"{FILLER[index % len(FILLER)]} {FILLER[(index * 7 + 3) % len(FILLER)]}"
+        )
+    return teasers
+
+
+def _chrome(title: str, article: str, index: int) -> str:
+    teasers = _teasers()
+    nav = "".join(f"<li><a href='/{section.lower()}'>{section}</a></li>" for section in SECTIONS)
+    related = "".join(
+        f"<li><a href='/noticia/{index + offset}'>{teasers[(index + offset) % len(teasers)].split('|')[0]}</a></li>"
+        for offset in range(1, 7)
+    )
+    return (
+        f"<html lang='pt-BR'><head><title>{title}</title>"
+        f"<script>window.dataLayer = window.dataLayer || []; dataLayer.push({{'page': {index}, 'section': 'rs'}});</script>"
+        f"<style>.cookie-consent {{ position: fixed; bottom: 0; }}</style></head>"
+        f"<body><header class='site-header'><a href='/'>Portal de Notícias</a><nav><ul>{nav}</ul></nav></header>"
+        f"<div class='cookie-consent'><p>{COOKIE_NOTICE}</p><button>Aceitar</button></div>"
+        f"<main><article>{article}</article>"
+        f"<aside class='related'><h2>Leia também</h2><ul>{related}</ul></aside></main>"
+        f"<footer><ul>{nav}</ul><p>© 2024 Portal de Notícias. Todos os direitos reservados. "
+        f"Proibida a reprodução do conteúdo sem autorização.</p></footer></body></html>"
+    )
+
+
+def make_corpus(urls: List[str] = SEED_URLS, paragraphs: int = 30, seed: int = 0, boilerplate: bool = False) -> Dict[str, str]:
+    """
+    Generates the HTML of one fixture page per URL.
+
+    Parameters
+    ----------
+    urls : List[str], optional
+        The URLs to mirror (default is SEED_URLS).
+    paragraphs : int, optional
+        The number of paragraphs of every page, which sets the number of chunks per page (default is 30).
+    seed : int, optional
+        The seed of the filler text; the same seed always produces the same corpus (default is 0).
+    boilerplate : bool, optional
+        Whether to wrap every article in the chrome of a news site (default is False).
+
+    Returns
+    -------
+    Dict[str, str]
+        The HTML of every page, keyed by its path on the fixture server.
+    """
+    pages: Dict[str, str] = {}
+    for index, url in enumerate(urls):
+        rng = random.Random(seed * 1_000_003 + index)
+        facts = _facts(index)
+        fact = (
+            f"No bairro {facts['neighborhood']}, o {facts['agency']} contabilizou {facts['figure']} "
+            f"famílias desalojadas pela enchente."
+        )
+        body = []
+        for paragraph in range(paragraphs):
+            sentences = rng.sample(FILLER, 4)
+            if paragraph == paragraphs // 2:
+                sentences.insert(2, fact)
+            body.append(f"<p>{' '.join(sentences)}</p>")
+        title = f"Enchentes no RS: reportagem {index}"
+        if boilerplate:
+            pages[fixture_path(url)] = _chrome(title, f"<h1>{title}</h1>{''.join(body)}", index)
+        else:
+            pages[fixture_path(url)] = (
+                f"<html lang='pt-BR'><head><title>{title}</title></head>"
+                f"<body><h1>{title}</h1>{''.join(body)}</body></html>"
+            )
+    return pages
+
+
+def make_tag_pages(count: int = 6, teasers: int = 30, shift: int = 2) -> Dict[str, str]:
+    """
+    Generates tag pages listing overlapping windows of the same teasers, with the chrome of a news site.
+
+    Page i lists `teasers` teasers starting at the i * shift-th, each with a headline link, a summary and a
+    timestamp that differs between pages, so consecutive pages share most of their text but are not identical.
+
+    Parameters
+    ----------
+    count : int, optional
+        The number of tag pages (default is 6).
+    teasers : int, optional
+        The number of teasers per page (default is 30).
+    shift : int, optional
+        The number of teasers each page is shifted by from the previous one (default is 2).
+
+    Returns
+    -------
+    Dict[str, str]
+        The HTML of every page, keyed by its path on the fixture server, e.g. "/tag/enchente-0".
+    """
+    pool = _teasers()
+    pages: Dict[str, str] = {}
+    for page in range(count):
+        items = []
+        for offset in range(teasers):
+            position = page * shift + offset
+            headline, summary = pool[position % len(pool)].split("|")
+            items.append(
+                f"<div class='teaser'><h3><a href='/noticia/{position}'>{headline}</a></h3>"
+                f"<p>{summary}</p><span class='time'>há {page + offset + 1} horas</span></div>"
+            )
+        title = f"Enchentes no RS: notícias da tag {page}"
+        pages[f"/tag/enchente-{page}"] = _chrome(title, f"<h1>{title}</h1><div class='teasers'>{''.join(items)}</div>", page)
+    return pages
+
+
+def make_questions(urls: List[str] = SEED_URLS) -> List[Question]:
+    """
+    Returns one question per fixture page, about the fact unique to that page.
+
+    Parameters
+    ----------
+    urls : List[str], optional
+        The URLs the corpus was generated from (default is SEED_URLS).
+
+    Returns
+    -------
+    List[Question]
+        The questions, the path of the page holding the answer, and the answer.
+    """
+    questions = []
+    for index, url in enumerate(urls):
+        facts = _facts(index)
+        questions.append(Question(
+            question=f"Quantas famílias o {facts['agency']} contabilizou como desalojadas no bairro {facts['neighborhood']}?",
+            path=fixture_path(url),
+            answer=facts["figure"],
+        ))
+    return questions
@@ -0,0 +1,341 @@
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryMemo
+from langchain_core.embeddings import Embeddings
+from local_embeddings import HashingEmbeddings
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+from collections import deque
+from clients import ClientRegistry
+from hashing import content_hash
+import threading
+import asyncio
+import base64
+import struct
+import json
+import time
+import re
+
+FAKE_RESPONSE = (
+    "Quais bairros de Porto Alegre foram inundados?\n"
+    "Quais foram as causas da enchente em Porto Alegre?\n"
+    "Como o sistema de proteção contra cheias falhou?"
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic stand-in for ChatOpenAI that emits a fixed response token by token with configurable delays.
+
+    Attributes
+    ----------
+    response : str
+        The text returned for every prompt. Each line is also a rewritten question for MultiQueryRetriever.
+    first_token_delay : float
+        The delay in seconds before the first token, simulating time to first token.
+    token_delay : float
+        The delay in seconds between tokens.
+    """
+
+    response: str = FAKE_RESPONSE
+    first_token_delay: float = 0.2
+    token_delay: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _tokens(self) -> List[str]:
+        return re.findall(r"\s*\S+|\s+", self.response)
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any
+        ) -> ChatResult:
+        time.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any
+        ) -> ChatResult:
+        await asyncio.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any
+        ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_delay)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.token_delay)
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any
+        ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_delay)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.token_delay)
+
+
+class FakeEmbeddings(HashingEmbeddings):
+    """
+    A deterministic, offline stand-in for OpenAIEmbeddings with a configurable latency.
+
+    Vectors come from `HashingEmbeddings`, so texts sharing terms get similar vectors and retrieval over a fixture
+    corpus behaves like retrieval over real embeddings, only coarser. Every call simulates one request.
+
+    Methods
+    -------
+    embed_documents(texts: List[str]) -> List[List[float]]
+        Embeds a list of texts in one simulated request.
+    embed_query(text: str) -> List[float]
+        Embeds a single text in one simulated request.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0, latency_per_text: float = 0.0) -> None:
+        """
+        Initializes the fake embedding model.
+
+        Parameters
+        ----------
+        dimensions : int, optional
+            The size of the vectors (default is 256).
+        latency : float, optional
+            The delay in seconds of every request, simulating the round trip to the provider (default is 0.0).
+        latency_per_text : float, optional
+            The additional delay in seconds per embedded text (default is 0.0).
+        """
+        super().__init__(dimensions)
+        self.latency: float = latency
+        self.latency_per_text: float = latency_per_text
+        self.requests: int = 0
+        self.texts: int = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts in one simulated request.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The texts to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One unit vector per text, in order.
+        """
+        with self._lock:
+            self.requests += 1
+            self.texts += len(texts)
+        delay = self.latency + self.latency_per_text * len(texts)
+        if delay:
+            time.sleep(delay)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single text in one simulated request.
+
+        Parameters
+        ----------
+        text : str
+            The text to embed.
+
+        Returns
+        -------
+        List[float]
+            The unit vector of the text.
+        """
+        return self.embed_documents([text])[0]
+
+
+class FakeClientRegistry(ClientRegistry):
+    """
+    A ClientRegistry handing out FakeChatModel and FakeEmbeddings instead of OpenAI clients, for fully offline runs.
+
+    Pass it as `clients` to `RAG` (or `Indexer.load_db`) and every model call stays in-process, with the given
+    latencies. Like the real registry, each model gets one shared instance.
+
+    Methods
+    -------
+    chat_model(model: str, temperature: Optional[float] = None) -> FakeChatModel
+        Returns the shared fake chat model.
+    embeddings(model: str, embedding_cache_path: Optional[str] = None) -> Embeddings
+        Returns the shared fake embedding model, optionally backed by a persistent cache.
+    """
+
+    def __init__(
+            self,
+            first_token_delay: float = 0.0,
+            token_delay: float = 0.0,
+            embedding_latency: float = 0.0,
+            embedding_latency_per_text: float = 0.0,
+            dimensions: int = 256,
+            response: str = FAKE_RESPONSE
+        ) -> None:
+        """
+        Initializes the registry.
+
+        Parameters
+        ----------
+        first_token_delay : float, optional
+            The delay in seconds before the first token of every chat completion (default is 0.0).
+        token_delay : float, optional
+            The delay in seconds between tokens of every chat completion (default is 0.0).
+        embedding_latency : float, optional
+            The delay in seconds of every embedding request (default is 0.0).
+        embedding_latency_per_text : float, optional
+            The additional delay in seconds per embedded text (default is 0.0).
+        dimensions : int, optional
+            The size of the embedding vectors (default is 256).
+        response : str, optional
+            The text of every chat completion (default is FAKE_RESPONSE).
+        """
+        super().__init__(api_key="stand-in")
+        self.first_token_delay: float = first_token_delay
+        self.token_delay: float = token_delay
+        self.response: str = response
+        self.fake_embeddings = FakeEmbeddings(dimensions, embedding_latency, embedding_latency_per_text)
+        self._query_memo = QueryMemo(self.fake_embeddings)
+
+    def chat_model(self, model: str, temperature: Optional[float] = None) -> FakeChatModel:
+        """
+        Returns the shared fake chat model.
+
+        Parameters
+        ----------
+        model : str
+            The name of the model. Every name gets the same behaviour.
+        temperature : Optional[float], optional
+            Ignored, the fake model is deterministic (default is None).
+
+        Returns
+        -------
+        FakeChatModel
+            The fake chat model of that name.
+        """
+        with self._lock:
+            key = (model, temperature)
+            if key not in self._chat_models:
+                self._chat_models[key] = FakeChatModel(
+                    response=self.response, 
+                    first_token_delay=self.first_token_delay, 
+                    token_delay=self.token_delay
+                )
+            return self._chat_models[key]
+
+    def embeddings(self, model: str, embedding_cache_path: Optional[str] = None) -> Embeddings:
+        """
+        Returns the shared fake embedding model, optionally backed by a persistent cache.
+
+        Parameters
+        ----------
+        model : str
+            The name of the model. Every name gets the same fake model.
+        embedding_cache_path : Optional[str], optional
+            The path of the SQLite embedding cache, None disables caching (default is None).
+
+        Returns
+        -------
+        Embeddings
+            The fake embedding model behind a `QueryMemo`, like the real registry's, wrapped in a CachedEmbeddings
+            when a cache path is given.
+        """
+        if embedding_cache_path is None:
+            return self._query_memo
+        with self._lock:
+            key = (model, embedding_cache_path)
+            if key not in self._embeddings:
+                self._embeddings[key] = CachedEmbeddings(self._query_memo, EmbeddingCache(embedding_cache_path), model_name=model)
+            return self._embeddings[key]
+
+
+def openai_routes(
+        dimensions: int = 256, 
+        response: str = FAKE_RESPONSE, 
+        embedding_requests_per_second: Optional[float] = None
+    ) -> Dict[str, Callable[[dict], dict]]:
+    """
+    Returns routes for `benchmarks.server.FixtureServer` that answer like the OpenAI chat and embedding endpoints.
+
+    Parameters
+    ----------
+    dimensions : int, optional
+        The size of the returned embedding vectors (default is 256).
+    response : str, optional
+        The content of every chat completion (default is the FakeChatModel response).
+    embedding_requests_per_second : Optional[float], optional
+        The embedding request rate above which requests are answered with 429, simulating the provider's rate
+        limit over a sliding one-second window. None disables the limit (default is None).
+
+    Returns
+    -------
+    Dict[str, Callable[[dict], dict]]
+        The routes of "/v1/chat/completions" and "/v1/embeddings". Embeddings are deterministic in the input.
+    """
+    def embedding(item: Any, encoding_format: Optional[str]) -> Any:
+        seed = bytes.fromhex(content_hash(json.dumps(item)))
+        vector = [(seed[i % len(seed)] - 127.5) / 127.5 for i in range(dimensions)]
+        if encoding_format == "base64":
+            return base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode("ascii")
+        return vector
+
+    recent: Deque[float] = deque()
+    lock = threading.Lock()
+
+    def rate_limited() -> bool:
+        if embedding_requests_per_second is None:
+            return False
+        with lock:
+            now = time.monotonic()
+            while recent and now - recent[0] > 1.0:
+                recent.popleft()
+            if len(recent) >= embedding_requests_per_second:
+                return True
+            recent.append(now)
+            return False
+
+    def embeddings(payload: dict) -> Union[dict, Tuple[int, dict]]:
+        if rate_limited():
+            return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        return {
+            "object": "list",
+            "model": payload["model"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embedding(item, payload.get("encoding_format"))}
+                for i, item in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def chat_completions(payload: dict) -> dict:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": response}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return {"/v1/chat/completions": chat_completions, "/v1/embeddings": embeddings}
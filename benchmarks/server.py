@@ -0,0 +1,202 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from email.utils import formatdate
+import threading
+import hashlib
+import json
+import time
+
+
+class FixtureServer:
+    """
+    A local HTTP stand-in that serves fixture pages and JSON routes with injected latency.
+
+    The server speaks HTTP/1.1 with keep-alive, so it can be used to observe connection reuse. It counts the
+    requests it answered, the TCP connections it accepted and the bytes of page bodies it sent.
+
+    With validators, pages are served with an ETag (the hash of the body) and a Last-Modified date (when the
+    server first served the current body), and conditional requests for a page whose body did not change are
+    answered 304 Not Modified without a body. Pages can be changed while the server runs by updating `pages`.
+
+    Methods
+    -------
+    url(path: str) -> str
+        Returns the absolute URL of a path served by this server.
+    start() -> FixtureServer
+        Starts serving in a background thread.
+    stop() -> None
+        Stops the server.
+    """
+
+    def __init__(
+            self, 
+            pages: Dict[str, str], 
+            latency: float = 0.0, 
+            host: str = "127.0.0.1", 
+            port: int = 0, 
+            routes: Optional[Dict[str, Callable[[dict], dict]]] = None,
+            validators: bool = False
+        ) -> None:
+        """
+        Initializes the server.
+
+        Parameters
+        ----------
+        pages : Dict[str, str]
+            A mapping from request path (e.g. "/page-1") to the HTML served for it.
+        latency : float, optional
+            The delay in seconds added before answering each request (default is 0.0).
+        host : str, optional
+            The interface to bind to (default is "127.0.0.1").
+        port : int, optional
+            The port to bind to, 0 picks a free port (default is 0).
+        routes : Optional[Dict[str, Callable[[dict], dict]]], optional
+            A mapping from request path to a function answering the JSON body of a POST request with a JSON
+            response, or with a (status code, JSON response) pair, e.g. `benchmarks.fakes.openai_routes()`
+            (default is None).
+        validators : bool, optional
+            Whether to serve pages with ETag and Last-Modified headers and answer conditional requests with 304
+            (default is False).
+        """
+        self.pages: Dict[str, str] = pages
+        self.routes: Dict[str, Callable[[dict], dict]] = routes or {}
+        self.latency: float = latency
+        self.validators: bool = validators
+        self.requests: int = 0
+        self.connections: int = 0
+        self.not_modified: int = 0
+        self.bytes_sent: int = 0
+        self._versions: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        """
+        Returns the absolute URL of a path served by this server.
+
+        Parameters
+        ----------
+        path : str
+            The request path.
+
+        Returns
+        -------
+        str
+            The absolute URL.
+        """
+        return self.base_url + path
+
+    def start(self) -> "FixtureServer":
+        """
+        Starts serving in a background thread.
+
+        Returns
+        -------
+        FixtureServer
+            The running server.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _count(self, attribute: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + amount)
+
+    def _validators(self, path: str, body: bytes) -> Tuple[str, str]:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            if self._versions.get(path, ("", ""))[0] != etag:
+                self._versions[path] = (etag, formatdate(time.time(), usegmt=True))
+            return self._versions[path]
+
+    def _make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                server._count("connections")
+
+            def do_GET(self) -> None:
+                server._count("requests")
+                if server.latency:
+                    time.sleep(server.latency)
+
+                page = server.pages.get(self.path.split("#")[0])
+                if page is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = page.encode("utf-8")
+                if server.validators:
+                    etag, last_modified = server._validators(self.path.split("#")[0], body)
+                    if_none_match, if_modified_since = self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")
+                    if if_none_match == etag or (if_none_match is None and if_modified_since == last_modified):
+                        server._count("not_modified")
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if server.validators:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count("bytes_sent", len(body))
+
+            def do_POST(self) -> None:
+                server._count("requests")
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+
+                route = server.routes.get(self.path.split("?")[0])
+                if route is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                result = route(payload)
+                status, response = result if isinstance(result, tuple) else (200, result)
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
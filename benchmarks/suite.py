@@ -0,0 +1,262 @@
+"""
+Offline benchmark suite: ingestion throughput, query latency by top_k, concurrency scaling and memory growth,
+with every model call answered in-process by deterministic fakes and every page by a local fixture server.
+
+Results are written as JSON (one record per scenario and parameter set) so runs on two commits can be compared:
+
+    python -m benchmarks.suite --output base.json
+    git checkout other-branch
+    python -m benchmarks.suite --output head.json --compare base.json
+
+With --compare, metrics that got worse by more than --tolerance are reported as regressions and the exit code is 1.
+
+Usage: python -m benchmarks.suite [--scenarios ingest query concurrency memory] [--quick] [--output FILE] [--compare FILE]
+"""
+from benchmarks.corpus import make_corpus, make_questions
+from benchmarks.fakes import FakeClientRegistry
+from benchmarks.server import FixtureServer
+from typing import Any, Dict, List
+from statistics import median, quantiles
+from sources import SEED_URLS
+from indexer import Indexer
+from tracing import Tracer
+from rag import RAG
+import subprocess
+import tracemalloc
+import platform
+import argparse
+import tempfile
+import asyncio
+import json
+import time
+import sys
+import os
+
+# metrics where a higher value is better; every other numeric metric is a cost
+HIGHER_IS_BETTER = {"pages_per_s", "chunks_per_s", "queries_per_s", "hit_rate"}
+
+
+def rss_megabytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) < 2:
+        return {"p50_ms": latencies[0] * 1000, "p95_ms": latencies[0] * 1000, "p99_ms": latencies[0] * 1000}
+    cuts = quantiles(latencies, n=100)
+    return {"p50_ms": median(latencies) * 1000, "p95_ms": cuts[94] * 1000, "p99_ms": cuts[98] * 1000}
+
+
+def make_rag(args: argparse.Namespace, directory: str, open_db: bool = True, **kwargs: Any) -> RAG:
+    clients = FakeClientRegistry(
+        first_token_delay=args.llm_latency,
+        embedding_latency=args.embedding_latency,
+        embedding_latency_per_text=args.embedding_latency_per_text
+    )
+    return RAG(
+        db=Indexer.load_db(directory, embedding_model="text-embedding-3-small", embedding_cache_path=None, clients=clients) if open_db else None,
+        embedding_cache_path=None,
+        persist_directory=directory,
+        retrieval_mode=args.mode,
+        clients=clients,
+        tracer=Tracer(max_traces=1),
+        **kwargs
+    )
+
+
+def ingest(args: argparse.Namespace, urls: List[str], directory: str) -> Dict[str, Any]:
+    rag = make_rag(args, directory, open_db=False)
+    tracemalloc.start()
+    start = time.perf_counter()
+    summary = rag.add_documents(urls)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    rag.add_documents(urls)
+    unchanged = time.perf_counter() - start
+    return {
+        "scenario": "ingest",
+        "params": {"pages": len(urls)},
+        "metrics": {
+            "seconds": elapsed,
+            "pages_per_s": len(urls) / elapsed,
+            "chunks_per_s": summary["added"] / elapsed,
+            "chunks": summary["added"],
+            "peak_mb": peak / 1e6,
+            "reingest_seconds": unchanged,
+        },
+        "stages": rag.latency_report(),
+    }
+
+
+def query_latency(args: argparse.Namespace, directory: str, top_k: int) -> Dict[str, Any]:
+    rag = make_rag(args, directory, top_k=top_k)
+    questions = make_questions(SEED_URLS)
+    latencies, hits = [], 0
+    for i in range(args.queries):
+        question = questions[i % len(questions)]
+        start = time.perf_counter()
+        _, request_id = rag.query_with_request_id(question.question)
+        latencies.append(time.perf_counter() - start)
+        hits += any(question.answer in document.page_content for document in rag.get_context(request_id))
+    return {
+        "scenario": "query",
+        "params": {"top_k": top_k, "mode": args.mode},
+        "metrics": {**percentiles(latencies), "hit_rate": hits / args.queries},
+        "stages": rag.latency_report(),
+    }
+
+
+def concurrency(args: argparse.Namespace, directory: str, level: int) -> Dict[str, Any]:
+    rag = make_rag(args, directory)
+    questions = [question.question for question in make_questions(SEED_URLS)]
+
+    async def run() -> List[float]:
+        semaphore = asyncio.Semaphore(level)
+        latencies: List[float] = []
+
+        async def one(question: str) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                await rag.aquery(question)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(questions[i % len(questions)]) for i in range(args.queries)))
+        return latencies
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": "concurrency",
+        "params": {"concurrency": level, "mode": args.mode},
+        "metrics": {**percentiles(latencies), "queries_per_s": args.queries / elapsed},
+    }
+
+
+def memory(args: argparse.Namespace, directory: str) -> Dict[str, Any]:
+    rag = make_rag(args, directory)
+    questions = make_questions(SEED_URLS)
+    warmup = max(1, args.memory_queries // 10)
+    for i in range(warmup):
+        rag.query(questions[i % len(questions)].question)
+
+    tracemalloc.start()
+    baseline_rss = rss_megabytes()
+    for i in range(args.memory_queries):
+        # distinct questions, so nothing is answered from a cache
+        rag.query(f"{questions[i % len(questions)].question} ({i})")
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "scenario": "memory",
+        "params": {"queries": args.memory_queries},
+        "metrics": {
+            "rss_growth_mb": rss_megabytes() - baseline_rss,
+            "retained_mb": current / 1e6,
+            "peak_mb": peak / 1e6,
+            "retained_bytes_per_query": current / args.memory_queries,
+        },
+    }
+
+
+def metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> int:
+    """
+    Prints the relative change of every metric against a baseline run and returns the number of regressions.
+    """
+    previous = {(record["scenario"], json.dumps(record["params"], sort_keys=True)): record for record in baseline}
+    regressions = 0
+    print(f"\n{'scenario':<12} {'params':<36} {'metric':<26} {'base':>10} {'head':>10} {'change':>8}")
+    for record in results:
+        base = previous.get((record["scenario"], json.dumps(record["params"], sort_keys=True)))
+        if base is None:
+            continue
+        for metric, value in record["metrics"].items():
+            before = base["metrics"].get(metric)
+            if not isinstance(before, (int, float)) or not before:
+                continue
+            change = (value - before) / abs(before)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = " REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            params = ", ".join(f"{key}={value}" for key, value in record["params"].items())
+            print(f"{record['scenario']:<12} {params:<36} {metric:<26} {before:>10.2f} {value:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["ingest", "query", "concurrency", "memory"])
+    parser.add_argument("--mode", default="multi_query")
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--page-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    parser.add_argument("--embedding-latency", type=float, default=0.005)
+    parser.add_argument("--embedding-latency-per-text", type=float, default=0.0)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--memory-queries", type=int, default=2000)
+    parser.add_argument("--quick", action="store_true", help="run a small configuration, e.g. as a smoke test")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="compare against the JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    if args.quick:
+        args.paragraphs, args.queries, args.memory_queries = 5, 20, 200
+        args.top_k, args.concurrency = [5], [1, 8]
+
+    results: List[Dict[str, Any]] = []
+    pages = make_corpus(SEED_URLS, paragraphs=args.paragraphs)
+    with tempfile.TemporaryDirectory() as directory, FixtureServer(pages, latency=args.page_latency) as server:
+        urls = [server.url(path) for path in pages]
+        # the other scenarios query the index built by the ingest
+        record = ingest(args, urls, directory)
+        if "ingest" in args.scenarios:
+            results.append(record)
+        if "query" in args.scenarios:
+            results.extend(query_latency(args, directory, top_k) for top_k in args.top_k)
+        if "concurrency" in args.scenarios:
+            results.extend(concurrency(args, directory, level) for level in args.concurrency)
+        if "memory" in args.scenarios:
+            results.append(memory(args, directory))
+
+    for record in results:
+        params = ", ".join(f"{key}={value}" for key, value in record["params"].items())
+        metrics = ", ".join(f"{key}={value:.2f}" for key, value in record["metrics"].items())
+        print(f"{record['scenario']:<12} {params:<36} {metrics}")
+
+    report = {"meta": metadata(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        print(f"\n{regressions} regression(s) beyond {args.tolerance:.0%} against {baseline['meta'].get('commit')}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+from langchain_core.documents.base import Document
+from typing import Dict, Iterable, List, Optional, Tuple
+from array import array
+import unicodedata
+import threading
+import struct
+import heapq
+import json
+import math
+import mmap
+import re
+import os
+
+MAGIC = b"BM25IDX1"
+
+STOPWORDS = frozenset(
+    "a ao aos as com como da das de do dos e em entre era foi for ha isso ja mais mas na nas no nos o os ou para "
+    "pela pelas pelo pelos por que se sem ser sua suas seu seus so sobre tambem te tem um uma umas uns the of and".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into normalized terms for lexical search.
+
+    Parameters
+    ----------
+    text : str
+        The text to tokenize.
+
+    Returns
+    -------
+    List[str]
+        The lower-cased, accent-stripped words of the text, without Portuguese stopwords and single characters,
+        so "São Geraldo" and "sao geraldo" produce the same terms.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return [term for term in re.findall(r"\w+", without_accents) if len(term) > 1 and term not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    An in-process inverted index scoring chunks with Okapi BM25.
+
+    A saved index is a single file holding the vocabulary and the document table as JSON followed by the postings
+    as packed int32 (document, term frequency) pairs. Loading maps the postings into memory instead of reading
+    them, so startup only pays for the vocabulary. Chunks added or removed after loading are kept in an in-memory
+    overlay on top of the mapped postings until the next `save`, which compacts both into a new file atomically.
+    Removed chunks are never returned, but keep counting towards document frequencies until that compaction.
+
+    Methods
+    -------
+    add(documents: List[Document]) -> int
+        Indexes chunks that are not indexed yet and returns how many were added.
+    remove(chunk_ids: Iterable[str]) -> int
+        Removes chunks from the index and returns how many were removed.
+    search(query: str, k: int = 10) -> List[Tuple[str, float]]
+        Returns the chunk IDs of the best matches for a query, with their BM25 scores.
+    save(path: str) -> None
+        Writes the index to a file atomically and continues from the written file.
+    load(path: str) -> BM25Index
+        Loads an index written by `save`, memory-mapping its postings.
+    close() -> None
+        Unmaps the postings of the loaded file.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        Initializes an empty index.
+
+        Parameters
+        ----------
+        k1 : float, optional
+            The BM25 term frequency saturation parameter (default is 1.5).
+        b : float, optional
+            The BM25 document length normalization parameter (default is 0.75).
+        """
+        self.k1: float = k1
+        self.b: float = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths = array("i")
+        self.deleted: set = set()
+        self.total_length: int = 0
+        self._positions: Dict[str, int] = {}
+        self._base_vocab: Dict[str, Tuple[int, int]] = {}
+        self._base_postings: Optional[memoryview] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._delta: Dict[str, List[Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) - len(self.deleted)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        position = self._positions.get(chunk_id)
+        return position is not None and position not in self.deleted
+
+    def add(self, documents: List[Document]) -> int:
+        """
+        Indexes chunks that are not indexed yet and returns how many were added.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The chunks to index. Each must carry a "chunk_id" metadata entry.
+
+        Returns
+        -------
+        int
+            The number of chunks added; chunks whose ID is already indexed are skipped.
+        """
+        added = 0
+        with self._lock:
+            for document in documents:
+                chunk_id = document.metadata["chunk_id"]
+                if chunk_id in self:
+                    continue
+
+                terms = tokenize(document.page_content)
+                position = len(self.doc_ids)
+                self.doc_ids.append(chunk_id)
+                self.doc_lengths.append(len(terms))
+                self._positions[chunk_id] = position
+                self.total_length += len(terms)
+                frequencies: Dict[str, int] = {}
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0) + 1
+                for term, frequency in frequencies.items():
+                    self._delta.setdefault(term, []).append((position, frequency))
+                added += 1
+
+        return added
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        """
+        Removes chunks from the index and returns how many were removed.
+
+        Parameters
+        ----------
+        chunk_ids : Iterable[str]
+            The IDs of the chunks to remove.
+
+        Returns
+        -------
+        int
+            The number of chunks removed; unknown IDs are ignored.
+        """
+        removed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                if chunk_id not in self:
+                    continue
+                position = self._positions[chunk_id]
+                self.deleted.add(position)
+                self.total_length -= self.doc_lengths[position]
+                removed += 1
+
+        return removed
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns the chunk IDs of the best matches for a query, with their BM25 scores.
+
+        Parameters
+        ----------
+        query : str
+            The search query.
+        k : int, optional
+            The maximum number of results (default is 10).
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Up to k (chunk ID, score) pairs, best first. Chunks sharing no term with the query are left out.
+        """
+        with self._lock:
+            count = len(self)
+            if not count:
+                return []
+
+            average_length = self.total_length / count
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                # removed chunks stay in the postings until the next save, but must not count in the document frequency
+                postings = [(position, frequency) for position, frequency in self._postings(term) if position not in self.deleted]
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for position, frequency in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / average_length)
+                    scores[position] = scores.get(position, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self.doc_ids[position], score) for position, score in best]
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index to a file atomically and continues from the written file.
+
+        Removed chunks are dropped and the in-memory overlay is merged into the postings.
+
+        Parameters
+        ----------
+        path : str
+            The path of the index file.
+        """
+        with self._lock:
+            live = [position for position in range(len(self.doc_ids)) if position not in self.deleted]
+            renumber = {old: new for new, old in enumerate(live)}
+            vocabulary: Dict[str, Tuple[int, int]] = {}
+            postings = array("i")
+            for term in sorted(set(self._base_vocab) | set(self._delta)):
+                pairs = [(renumber[position], frequency) for position, frequency in self._postings(term) if position in renumber]
+                if not pairs:
+                    continue
+                vocabulary[term] = (len(postings) // 2, len(pairs))
+                for pair in pairs:
+                    postings.extend(pair)
+
+            header = json.dumps({
+                "k1": self.k1,
+                "b": self.b,
+                "doc_ids": [self.doc_ids[position] for position in live],
+                "doc_lengths": [self.doc_lengths[position] for position in live],
+                "vocabulary": vocabulary,
+            }, ensure_ascii=False).encode("utf-8")
+            header += b" " * (-len(header) % 4)
+
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<Q", len(header)))
+                f.write(header)
+                f.write(postings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, path)
+            self._open(path)
+
+    @staticmethod
+    def load(path: str) -> "BM25Index":
+        """
+        Loads an index written by `save`, memory-mapping its postings.
+
+        Parameters
+        ----------
+        path : str
+            The path of the index file.
+
+        Returns
+        -------
+        BM25Index
+            The loaded index.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a BM25 index.
+        """
+        index = BM25Index()
+        index._open(path)
+        return index
+
+    def close(self) -> None:
+        """
+        Unmaps the postings of the loaded file, closing its descriptor. The index must not be searched afterwards.
+        """
+        with self._lock:
+            self._unmap()
+            self._base_vocab = {}
+
+    @staticmethod
+    def from_documents(documents: Iterable[Document], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Builds an index from chunks.
+
+        Parameters
+        ----------
+        documents : Iterable[Document]
+            The chunks to index. Each must carry a "chunk_id" metadata entry.
+        k1 : float, optional
+            The BM25 term frequency saturation parameter (default is 1.5).
+        b : float, optional
+            The BM25 document length normalization parameter (default is 0.75).
+
+        Returns
+        -------
+        BM25Index
+            The built index.
+        """
+        index = BM25Index(k1=k1, b=b)
+        index.add(list(documents))
+        return index
+
+    def _postings(self, term: str) -> List[Tuple[int, int]]:
+        postings: List[Tuple[int, int]] = []
+        if term in self._base_vocab:
+            offset, length = self._base_vocab[term]
+            flat = self._base_postings[offset * 2:(offset + length) * 2]
+            postings.extend(zip(flat[0::2], flat[1::2]))
+        postings.extend(self._delta.get(term, ()))
+        return postings
+
+    def _open(self, path: str) -> None:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a BM25 index")
+
+        header_length, = struct.unpack("<Q", mapped[len(MAGIC):len(MAGIC) + 8])
+        postings_offset = len(MAGIC) + 8 + header_length
+        header = json.loads(mapped[len(MAGIC) + 8:postings_offset])
+
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self.doc_ids = header["doc_ids"]
+        self.doc_lengths = array("i", header["doc_lengths"])
+        self.deleted = set()
+        self.total_length = sum(self.doc_lengths)
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self.doc_ids)}
+        self._base_vocab = {term: tuple(entry) for term, entry in header["vocabulary"].items()}
+        self._unmap()
+        self._base_postings = memoryview(mapped)[postings_offset:].cast("i")
+        self._mmap = mapped
+        self._delta = {}
+
+    def _unmap(self) -> None:
+        if self._base_postings is not None:
+            self._base_postings.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._base_postings = None
+        self._mmap = None
@@ -0,0 +1,62 @@
+from langchain_core.documents.base import Document
+from typing import List, Sequence
+from langchain_chroma import Chroma
+
+
+class ChromaVectorStore(Chroma):
+    """
+    A Chroma database implementing `vector_store.VectorIndex`, so it can be written to and searched with vectors
+    embedded ahead of time, like a `NumpyVectorStore`.
+
+    LangChain's Chroma wrapper only writes and searches texts it embeds itself, so these two methods go through
+    the underlying Chroma collection; this class is the only place that touches it. Everything else is Chroma's.
+
+    Methods
+    -------
+    upsert_vectors(ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[dict]) -> None
+        Stores already embedded texts, replacing the ones stored under the same IDs.
+    search_by_vectors(vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]
+        Returns the k chunks most similar to each of several query vectors, in one Chroma query.
+    """
+
+    def upsert_vectors(self, ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[dict]) -> None:
+        """
+        Stores already embedded texts, replacing the ones stored under the same IDs.
+
+        Parameters
+        ----------
+        ids : List[str]
+            The ID of each text.
+        vectors : Sequence[Sequence[float]]
+            The embedding of each text.
+        texts : List[str]
+            The texts.
+        metadatas : List[dict]
+            The metadata of each text.
+        """
+        if ids:
+            self._collection.upsert(ids=ids, embeddings=[list(vector) for vector in vectors], documents=texts, metadatas=metadatas)
+
+    def search_by_vectors(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]:
+        """
+        Returns the k chunks most similar to each of several query vectors, in one Chroma query.
+
+        Parameters
+        ----------
+        vectors : Sequence[Sequence[float]]
+            The query vectors.
+        k : int
+            The number of chunks per query.
+
+        Returns
+        -------
+        List[List[Document]]
+            The chunks of each query, most similar first.
+        """
+        if not vectors:
+            return []
+        results = self._collection.query(query_embeddings=[list(vector) for vector in vectors], n_results=k, include=["documents", "metadatas"])
+        return [
+            [Document(page_content=page_content, metadata=metadata or {}) for page_content, metadata in zip(documents, metadatas)]
+            for documents, metadatas in zip(results["documents"], results["metadatas"])
+        ]
@@ -0,0 +1,234 @@
+from langchain_core.documents.base import Document
+from bs4 import BeautifulSoup, Tag
+from typing import Dict, List, Tuple
+import numpy as np
+import hashlib
+import re
+
+# removed wherever they are: never part of the article text
+STRIPPED_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "form", "button", "select", "input")
+# page chrome: navigation, banners, related-article lists, share bars, ads and footers
+BOILERPLATE_TAGS = ("nav", "aside", "footer", "dialog")
+# class and ID names of page chrome, matched as whole words of a name ("share-bar", not "shared-content")
+BOILERPLATE_PATTERN = re.compile(
+    r"(?<![a-z0-9])(?:cookies?|consent|lgpd|gdpr|banner|newsletter|subscribe|subscription|assine|paywall|related|"
+    r"relacionad[ao]s?|recomendad[ao]s?|recommended|leia-tambem|veja-tambem|mais-lidas|most-read|share|sharing|"
+    r"compartilh[a-z]*|social|comments?|comentarios?|breadcrumbs?|advert[a-z]*|publicidade|ads?|sponsor[a-z]*|"
+    r"patrocin[a-z]*|promo|sidebar|menu|navbar|footer|rodape|modal|popup)(?![a-z0-9])",
+    re.IGNORECASE
+)
+BLOCK_TAGS = ("div", "section", "ul", "ol", "table", "header")
+MIN_PARAGRAPH_CHARS = 25
+MAX_LINK_DENSITY = 0.5
+# an element named like boilerplate that holds more of the main content's text is kept, as it is the article
+MAX_BOILERPLATE_SHARE = 0.5
+
+
+def extract_main_content(soup: BeautifulSoup) -> Tuple[str, int]:
+    """
+    Extracts the article text of a page, without navigation, cookie banners, related-article lists and footers.
+
+    Scripts, styles and forms are dropped, then the element holding most of the paragraph text is taken as the
+    main content, scoring every paragraph towards its parent and, at half weight, its grandparent. Inside it,
+    page chrome is dropped: nav, aside and footer elements, elements whose class or ID names boilerplate (cookie,
+    related, share, newsletter, ads, ...) as a whole word, unless they hold more than MAX_BOILERPLATE_SHARE of the
+    main text, and link lists, i.e. blocks where most of the text is link text. The page's h1 is kept when it lies
+    outside the main content.
+
+    Parameters
+    ----------
+    soup : BeautifulSoup
+        The parsed page. Its tree is modified.
+
+    Returns
+    -------
+    Tuple[str, int]
+        The main text, one block per line, and the number of characters left out of the plain text of the page
+        (which includes scripts and styles).
+    """
+    full_length = len(_normalize(soup.get_text(separator="\n")))
+    for element in soup.find_all(STRIPPED_TAGS):
+        element.decompose()
+
+    main = _main_element(soup.body or soup)
+    heading = soup.find("h1")
+    title = heading.get_text(" ", strip=True) if heading is not None and main not in heading.parents else None
+
+    main_length = len(main.get_text(" ", strip=True))
+    for element in main.find_all(BOILERPLATE_TAGS):
+        if not element.decomposed:
+            element.decompose()
+    for element in main.find_all(_is_boilerplate):
+        if not element.decomposed and len(element.get_text(" ", strip=True)) <= MAX_BOILERPLATE_SHARE * main_length:
+            element.decompose()
+    for element in main.find_all(BLOCK_TAGS):
+        if not element.decomposed and _link_density(element) > MAX_LINK_DENSITY:
+            element.decompose()
+
+    text = _normalize(main.get_text(separator="\n"))
+    if title and not text.startswith(title):
+        text = f"{title}\n{text}"
+    return text, max(0, full_length - len(text))
+
+
+class NearDuplicateFilter:
+    """
+    Drops chunks whose text nearly repeats a chunk seen before, e.g. teasers repeated across tag pages.
+
+    Every chunk gets a MinHash signature of its word shingles; signatures are bucketed by bands (locality
+    sensitive hashing), and a chunk sharing a bucket with an earlier one is a duplicate if the share of equal
+    signature values, an estimate of the Jaccard similarity of their shingle sets, reaches the threshold. The
+    first chunk of a group is kept, so results depend on the order chunks are seen in.
+
+    Attributes
+    ----------
+    seen : int
+        The number of chunks checked.
+    duplicates : int
+        The number of chunks found to be near-duplicates.
+    duplicate_chars : int
+        The number of characters of those chunks.
+
+    Methods
+    -------
+    is_duplicate(text: str) -> bool
+        Returns whether the text nearly repeats a text seen before, remembering it otherwise.
+    filter(documents: List[Document]) -> Tuple[List[Document], List[Document]]
+        Splits chunks into those to keep and the near-duplicates of chunks seen before.
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, shingle_size: int = 5, seed: int = 0) -> None:
+        """
+        Initializes an empty filter.
+
+        Parameters
+        ----------
+        threshold : float, optional
+            The estimated Jaccard similarity of shingle sets from which a chunk is a duplicate (default is 0.8).
+        num_perm : int, optional
+            The number of hash functions of a signature (default is 64).
+        bands : int, optional
+            The number of LSH bands, which must divide num_perm. More bands find less similar candidates, at
+            the cost of more comparisons (default is 16).
+        shingle_size : int, optional
+            The number of consecutive words of a shingle (default is 5).
+        seed : int, optional
+            The seed of the hash functions (default is 0).
+
+        Raises
+        ------
+        ValueError
+            If bands does not divide num_perm.
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+        self.threshold: float = threshold
+        self.num_perm: int = num_perm
+        self.bands: int = bands
+        self.shingle_size: int = shingle_size
+        rng = np.random.default_rng(seed)
+        # a * x + b with 32-bit a and x stays below 2 ** 64, so the products do not overflow
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self._signatures: List[np.ndarray] = []
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.seen: int = 0
+        self.duplicates: int = 0
+        self.duplicate_chars: int = 0
+
+    def is_duplicate(self, text: str) -> bool:
+        """
+        Returns whether the text nearly repeats a text seen before, remembering it otherwise.
+
+        Parameters
+        ----------
+        text : str
+            The text of a chunk.
+
+        Returns
+        -------
+        bool
+            True if the text is a near-duplicate; it is then not remembered.
+        """
+        self.seen += 1
+        signature = self._signature(text)
+        rows = self.num_perm // self.bands
+        keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+        candidates = {index for key in keys for index in self._buckets.get(key, ())}
+        for index in candidates:
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                self.duplicates += 1
+                self.duplicate_chars += len(text)
+                return True
+
+        for key in keys:
+            self._buckets.setdefault(key, []).append(len(self._signatures))
+        self._signatures.append(signature)
+        return False
+
+    def filter(self, documents: List[Document]) -> Tuple[List[Document], List[Document]]:
+        """
+        Splits chunks into those to keep and the near-duplicates of chunks seen before, in this call or earlier.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The chunks, in order.
+
+        Returns
+        -------
+        Tuple[List[Document], List[Document]]
+            The chunks to keep and the dropped duplicates, both in input order.
+        """
+        kept: List[Document] = []
+        dropped: List[Document] = []
+        for document in documents:
+            (dropped if self.is_duplicate(document.page_content) else kept).append(document)
+        return kept, dropped
+
+    def _signature(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.casefold())
+        shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(max(1, len(words) - self.shingle_size + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(self.PRIME)).min(axis=1)
+
+
+def _main_element(root: Tag) -> Tag:
+    scores: Dict[int, float] = {}
+    elements: Dict[int, Tag] = {}
+    for paragraph in root.find_all(["p", "pre", "blockquote"]):
+        length = len(paragraph.get_text(" ", strip=True))
+        if length < MIN_PARAGRAPH_CHARS:
+            continue
+        for weight, parent in zip((1.0, 0.5), (paragraph.parent, getattr(paragraph.parent, "parent", None))):
+            if isinstance(parent, Tag):
+                scores[id(parent)] = scores.get(id(parent), 0.0) + weight * length
+                elements[id(parent)] = parent
+    if not scores:
+        return root
+    return elements[max(scores, key=scores.get)]
+
+
+def _is_boilerplate(element: Tag) -> bool:
+    if element.attrs is None or element.name in ("html", "body", "main", "article"):
+        return False
+    names = " ".join(element.get("class") or []) + " " + (element.get("id") or "")
+    return element.get("role") in ("navigation", "banner", "contentinfo", "complementary") or bool(BOILERPLATE_PATTERN.search(names))
+
+
+def _link_density(element: Tag) -> float:
+    length = len(element.get_text(" ", strip=True))
+    if not length:
+        return 0.0
+    return sum(len(link.get_text(" ", strip=True)) for link in element.find_all("a")) / length
+
+
+def _normalize(text: str) -> str:
+    lines = (re.sub(r"\s+", " ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
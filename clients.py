@@ -0,0 +1,191 @@
+from local_embeddings import HashingEmbeddings, LOCAL_EMBEDDING_MODEL, SENTENCE_TRANSFORMERS_PREFIX, sentence_transformer_embeddings
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryMemo
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, Optional, Tuple
+import threading
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    A shared registry of model clients, keyed by model name, that all use one pooled HTTP client.
+
+    Building a `ChatOpenAI` or `OpenAIEmbeddings` per call throws away its connection pool, so every request pays
+    for a new TCP and TLS handshake. The registry builds each client once and hands the same instance to every
+    caller; all of them share a keep-alive `httpx.Client` and `httpx.AsyncClient`.
+
+    Methods
+    -------
+    chat_model(model: str, temperature: Optional[float] = None) -> ChatOpenAI
+        Returns the shared chat client of a model.
+    embeddings(model: str, embedding_cache_path: Optional[str] = None) -> Embeddings
+        Returns the shared embedding client of a model, optionally backed by a persistent cache.
+    close() -> None
+        Closes the pooled HTTP connections and the embedding caches.
+    aclose() -> None
+        Closes the pooled HTTP connections and the embedding caches from a coroutine.
+    """
+
+    def __init__(
+            self,
+            base_url: Optional[str] = None,
+            api_key: Optional[str] = None,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            timeout: float = 60.0
+        ) -> None:
+        """
+        Initializes an empty registry.
+
+        Parameters
+        ----------
+        base_url : Optional[str], optional
+            The API base URL, e.g. a local stand-in for benchmarks (default is None, meaning OpenAI's).
+        api_key : Optional[str], optional
+            The API key (default is None, meaning the OPENAI_API_KEY environment variable).
+        max_connections : int, optional
+            The maximum number of concurrent connections of the pool (default is 100).
+        max_keepalive_connections : int, optional
+            The maximum number of idle connections kept open (default is 20).
+        timeout : float, optional
+            The request timeout in seconds (default is 60.0).
+        """
+        self.base_url: Optional[str] = base_url
+        self.api_key: Optional[str] = api_key
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self._chat_models: Dict[Tuple[str, Optional[float]], ChatOpenAI] = {}
+        self._embeddings: Dict[Tuple[str, Optional[str]], Embeddings] = {}
+        self._lock = threading.Lock()
+        self._closing: Optional[asyncio.Task] = None
+
+    def chat_model(self, model: str, temperature: Optional[float] = None) -> ChatOpenAI:
+        """
+        Returns the shared chat client of a model.
+
+        Parameters
+        ----------
+        model : str
+            The name of the completion model.
+        temperature : Optional[float], optional
+            The sampling temperature (default is None, meaning the ChatOpenAI default).
+
+        Returns
+        -------
+        ChatOpenAI
+            The client, built on first use.
+        """
+        key = (model, temperature)
+        with self._lock:
+            if key not in self._chat_models:
+                kwargs = {} if temperature is None else {"temperature": temperature}
+                self._chat_models[key] = ChatOpenAI(model=model, **kwargs, **self._client_kwargs())
+            return self._chat_models[key]
+
+    def embeddings(self, model: str, embedding_cache_path: Optional[str] = None) -> Embeddings:
+        """
+        Returns the shared embedding client of a model, optionally backed by a persistent cache.
+
+        Parameters
+        ----------
+        model : str
+            The name of the embedding model. LOCAL_EMBEDDING_MODEL ("local-hashing") returns the offline
+            `HashingEmbeddings`, and a name prefixed with "local:" a local sentence-transformers model (see
+            `sentence_transformer_embeddings`).
+        embedding_cache_path : Optional[str], optional
+            The path of the embedding cache, None disables caching (default is None).
+
+        Returns
+        -------
+        Embeddings
+            The embedding function, built on first use, remembering the vectors of recent queries (see
+            `QueryMemo`). When a cache path is given, only texts that are not cached are sent to the API.
+        """
+        key = (model, embedding_cache_path)
+        with self._lock:
+            if key not in self._embeddings:
+                embeddings = self._embeddings.get((model, None))
+                if embeddings is None:
+                    if model == LOCAL_EMBEDDING_MODEL:
+                        embeddings = HashingEmbeddings()
+                    elif model.startswith(SENTENCE_TRANSFORMERS_PREFIX):
+                        embeddings = sentence_transformer_embeddings(model)
+                    else:
+                        embeddings = OpenAIEmbeddings(model=model, **self._client_kwargs())
+                    # a question is embedded once for the answer cache, the retriever and caching its answer
+                    embeddings = QueryMemo(embeddings)
+                    self._embeddings[(model, None)] = embeddings
+                if embedding_cache_path is not None:
+                    self._embeddings[key] = CachedEmbeddings(embeddings, EmbeddingCache(embedding_cache_path), model_name=model)
+            return self._embeddings[key]
+
+    def close(self) -> None:
+        """
+        Closes the pooled HTTP connections and the embedding caches.
+
+        The `httpx.AsyncClient` can only be closed by a coroutine: without a running event loop it is closed in a
+        new one, and from inside a running loop the closing is scheduled on it, so prefer `aclose` there.
+        """
+        self.http_client.close()
+        self._close_caches()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                asyncio.run(self.http_async_client.aclose())
+            except RuntimeError:
+                # connections opened on an event loop that is already closed went away with it
+                logger.debug("Async HTTP connections of %r were bound to a closed event loop", self, exc_info=True)
+        else:
+            self._closing = loop.create_task(self.http_async_client.aclose())
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled HTTP connections and the embedding caches from a coroutine.
+        """
+        self.http_client.close()
+        self._close_caches()
+        await self.http_async_client.aclose()
+
+    def _close_caches(self) -> None:
+        with self._lock:
+            for embeddings in self._embeddings.values():
+                if isinstance(embeddings, CachedEmbeddings):
+                    embeddings.cache.close()
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"http_client": self.http_client, "http_async_client": self.http_async_client}
+        if self.base_url is not None:
+            kwargs["base_url"] = self.base_url
+        if self.api_key is not None:
+            kwargs["api_key"] = self.api_key
+        return kwargs
+
+
+_default_registry: Optional[ClientRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry() -> ClientRegistry:
+    """
+    Returns the registry shared by every `Indexer`, `Retriever` and `RAG` that is not given one.
+
+    It is built on first use rather than at import, so importing a module opens no HTTP pools, and tests or
+    benchmarks passing their own registry never build it.
+
+    Returns
+    -------
+    ClientRegistry
+        The default registry, pointed at the OpenAI API.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry()
+        return _default_registry
@@ -0,0 +1,201 @@
+from langchain_core.documents.base import Document
+from typing import Dict, List, Optional, Tuple
+from tracing import Tracer
+from hashing import content_hash
+from bm25 import tokenize
+from loader import Chunker
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+class ContextAssembler:
+    """
+    Turns the documents returned by a retriever into the context of the prompt, within a hard token budget.
+
+    The documents are deduplicated by content hash, overlapping or touching chunks of the same URL are merged
+    into one passage using their "start_index", passages are optionally compressed to the sentences sharing a term
+    with the question, and finally passages are kept in retrieval order until the budget is spent. The passage that
+    crosses the budget is truncated on a token boundary. Passages whose text differs from a stored chunk lose their
+    "chunk_id" and list the chunks they were built from in "chunk_ids" instead.
+
+    Methods
+    -------
+    assemble(question: str, documents: List[Document]) -> List[Document]
+        Returns the passages to put in the prompt for a question.
+    count_tokens(text: str) -> int
+        Returns the number of tokens of a text for the completion model.
+    """
+
+    def __init__(
+            self,
+            model_name: str = "gpt-3.5-turbo",
+            max_tokens: int = 3000,
+            compress: bool = False,
+            min_truncated_tokens: int = 50,
+            tracer: Optional[Tracer] = None
+        ) -> None:
+        """
+        Initializes the assembler.
+
+        Parameters
+        ----------
+        model_name : str, optional
+            The completion model, whose tiktoken encoding is used to count tokens (default is "gpt-3.5-turbo").
+        max_tokens : int, optional
+            The maximum number of context tokens put in the prompt (default is 3000).
+        compress : bool, optional
+            Whether to keep only the sentences of each passage that share a term with the question. Passages with
+            no such sentence are kept whole (default is False).
+        min_truncated_tokens : int, optional
+            The smallest remainder of the budget worth filling with a truncated passage (default is 50).
+        tracer : Optional[Tracer], optional
+            Where the latency of the assembly is recorded, as "context.assembly", and the context tokens before and
+            after it, as "tokens.context_in" and "tokens.context_out" (default is None).
+        """
+        self.model_name: str = model_name
+        self.max_tokens: int = max_tokens
+        self.compress: bool = compress
+        self.min_truncated_tokens: int = min_truncated_tokens
+        self.tracer: Optional[Tracer] = tracer
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Returns the number of tokens of a text for the completion model.
+
+        Parameters
+        ----------
+        text : str
+            The text to count.
+
+        Returns
+        -------
+        int
+            The number of tokens.
+        """
+        return Chunker._tiktoken_len(text, self.model_name)
+
+    def assemble(self, question: str, documents: List[Document]) -> List[Document]:
+        """
+        Returns the passages to put in the prompt for a question.
+
+        Parameters
+        ----------
+        question : str
+            The user question, used for compression.
+        documents : List[Document]
+            The retrieved documents, best first.
+
+        Returns
+        -------
+        List[Document]
+            The deduplicated, merged and optionally compressed passages, best first, totalling at most
+            max_tokens tokens.
+        """
+        if self.tracer is None:
+            return self._assemble(question, documents)
+        with self.tracer.time("context.assembly"):
+            return self._assemble(question, documents)
+
+    def _assemble(self, question: str, documents: List[Document]) -> List[Document]:
+        tokens_in = sum(self.count_tokens(document.page_content) for document in documents)
+        passages = self._merge_adjacent(self._deduplicate(documents))
+        if self.compress:
+            passages = [self._compress(question, passage) for passage in passages]
+        context = self._fit_budget(passages)
+        tokens_out = sum(self.count_tokens(passage.page_content) for passage in context)
+        logger.info(
+            "Context assembled: %d documents/%d tokens in, %d passages/%d tokens out (budget %d)",
+            len(documents), tokens_in, len(context), tokens_out, self.max_tokens
+        )
+        if self.tracer is not None:
+            self.tracer.count("tokens.context_in", tokens_in)
+            self.tracer.count("tokens.context_out", tokens_out)
+        return context
+
+    def _deduplicate(self, documents: List[Document]) -> List[Document]:
+        seen = set()
+        unique: List[Document] = []
+        for document in documents:
+            key = document.metadata.get("content_hash") or content_hash(document.page_content)
+            if key not in seen:
+                seen.add(key)
+                unique.append(document)
+        return unique
+
+    def _merge_adjacent(self, documents: List[Document]) -> List[Document]:
+        """
+        Merges overlapping or touching chunks of the same URL, keeping each passage at the rank of its best chunk.
+        """
+        by_source: Dict[str, List[Tuple[int, Document]]] = {}
+        unmergeable: List[Tuple[int, Document]] = []
+        for rank, document in enumerate(documents):
+            if "source" in document.metadata and "start_index" in document.metadata:
+                by_source.setdefault(document.metadata["source"], []).append((rank, document))
+            else:
+                unmergeable.append((rank, document))
+
+        passages = unmergeable
+        for chunks in by_source.values():
+            chunks.sort(key=lambda item: item[1].metadata["start_index"])
+            best_rank, current = chunks[0]
+            members = [current]
+            text = current.page_content
+            end = current.metadata["start_index"] + len(text)
+            for rank, chunk in chunks[1:]:
+                start = chunk.metadata["start_index"]
+                if start > end:
+                    passages.append((best_rank, self._passage(members, text)))
+                    best_rank, members, text = rank, [chunk], chunk.page_content
+                else:
+                    text += chunk.page_content[end - start:]
+                    members.append(chunk)
+                    best_rank = min(best_rank, rank)
+                end = max(end, start + len(chunk.page_content))
+            passages.append((best_rank, self._passage(members, text)))
+
+        return [passage for _, passage in sorted(passages, key=lambda item: item[0])]
+
+    def _compress(self, question: str, passage: Document) -> Document:
+        terms = set(tokenize(question))
+        sentences = [sentence for sentence in SENTENCE_BOUNDARY.split(passage.page_content) if sentence.strip()]
+        kept = [sentence for sentence in sentences if terms.intersection(tokenize(sentence))]
+        if not kept or len(kept) == len(sentences):
+            return passage
+        return self._derived(passage, " ".join(kept))
+
+    def _fit_budget(self, passages: List[Document]) -> List[Document]:
+        encoding = Chunker._get_encoding(self.model_name)
+        context: List[Document] = []
+        remaining = self.max_tokens
+        for passage in passages:
+            tokens = encoding.encode(passage.page_content, disallowed_special=())
+            if len(tokens) <= remaining:
+                context.append(passage)
+                remaining -= len(tokens)
+                continue
+            if remaining >= self.min_truncated_tokens:
+                context.append(self._derived(passage, encoding.decode(tokens[:remaining])))
+            break
+        return context
+
+    @staticmethod
+    def _passage(members: List[Document], text: str) -> Document:
+        if len(members) == 1:
+            return members[0]
+        passage = ContextAssembler._derived(members[0], text)
+        passage.metadata["chunk_ids"] = [
+            chunk_id for member in members for chunk_id in member.metadata.get("chunk_ids", [member.metadata.get("chunk_id")]) if chunk_id
+        ]
+        return passage
+
+    @staticmethod
+    def _derived(document: Document, text: str) -> Document:
+        metadata = dict(document.metadata)
+        if "chunk_id" in metadata:
+            metadata.setdefault("chunk_ids", [metadata.pop("chunk_id")])
+        metadata.pop("content_hash", None)
+        return Document(page_content=text, metadata=metadata)
@@ -0,0 +1,153 @@
+from langchain_core.documents.base import Document
+from typing import Callable, List, NamedTuple, Optional, Union
+from collections import OrderedDict
+import threading
+import time
+import uuid
+import sys
+
+
+class _Entry(NamedTuple):
+    contents: Union[List[str], List[Document]]
+    size: int
+    created_at: float
+
+
+class ContextStore:
+    """
+    A bounded store of the contexts retrieved for each query, keyed by a request ID.
+
+    When every retrieved document carries a "chunk_id" metadata entry and a resolver is available, only the chunk
+    IDs are stored and the documents are read back from the database on demand; otherwise the documents
+    themselves are kept. Entries expire after `ttl` seconds, and the least recently used entries are evicted when
+    the store holds more than `max_entries` entries or more than `max_bytes` estimated bytes.
+
+    Methods
+    -------
+    put(documents: List[Document], request_id: Optional[str] = None) -> str
+        Stores the context of a request and returns its request ID.
+    get(request_id: str, default: Optional[List[Document]] = None) -> Optional[List[Document]]
+        Returns the context of a request, or the default if it is unknown or was evicted.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 10_000,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl: Optional[float] = 24 * 3600.0,
+            resolver: Optional[Callable[[List[str]], List[Document]]] = None
+        ) -> None:
+        """
+        Initializes the store.
+
+        Parameters
+        ----------
+        max_entries : int, optional
+            The maximum number of stored contexts (default is 10_000).
+        max_bytes : int, optional
+            The memory budget of the stored contexts, in estimated bytes (default is 64 MiB).
+        ttl : Optional[float], optional
+            The number of seconds a context is kept, None keeps contexts until evicted (default is one day).
+        resolver : Optional[Callable[[List[str]], List[Document]]], optional
+            A function returning the documents for a list of chunk IDs, in the same order. Without it the
+            documents themselves are stored (default is None).
+        """
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.ttl: Optional[float] = ttl
+        self.resolver: Optional[Callable[[List[str]], List[Document]]] = resolver
+        self.size_bytes: int = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, request_id: str) -> bool:
+        return request_id in self._entries
+
+    def put(self, documents: List[Document], request_id: Optional[str] = None) -> str:
+        """
+        Stores the context of a request and returns its request ID.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The documents retrieved for the request.
+        request_id : Optional[str], optional
+            The ID to store the context under (default is None, meaning a new random ID is generated).
+
+        Returns
+        -------
+        str
+            The request ID.
+        """
+        request_id = request_id or uuid.uuid4().hex
+        if self.resolver is not None and all("chunk_id" in document.metadata for document in documents):
+            contents = [document.metadata["chunk_id"] for document in documents]
+            size = sum(sys.getsizeof(chunk_id) for chunk_id in contents)
+        else:
+            contents = list(documents)
+            size = sum(ContextStore._document_size(document) for document in contents)
+        size += sys.getsizeof(request_id) + sys.getsizeof(contents)
+
+        with self._lock:
+            if request_id in self._entries:
+                self.size_bytes -= self._entries.pop(request_id).size
+            self._entries[request_id] = _Entry(contents=contents, size=size, created_at=time.monotonic())
+            self.size_bytes += size
+            self._evict()
+
+        return request_id
+
+    def get(self, request_id: str, default: Optional[List[Document]] = None) -> Optional[List[Document]]:
+        """
+        Returns the context of a request, or the default if it is unknown or was evicted.
+
+        Parameters
+        ----------
+        request_id : str
+            The request ID returned by `put`.
+        default : Optional[List[Document]], optional
+            The value returned when the context is not available (default is None).
+
+        Returns
+        -------
+        Optional[List[Document]]
+            The documents retrieved for the request. Chunks deleted from the database since are left out.
+        """
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(request_id)
+            if entry is not None and self.ttl is not None and entry.created_at < time.monotonic() - self.ttl:
+                self.size_bytes -= self._entries.pop(request_id).size
+                entry = None
+            if entry is None:
+                return default
+            self._entries.move_to_end(request_id)
+
+        if entry.contents and isinstance(entry.contents[0], str):
+            return self.resolver(entry.contents)
+        return list(entry.contents)
+
+    def clear(self) -> None:
+        """
+        Removes every stored context.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            deadline = time.monotonic() - self.ttl
+            while self._entries and next(iter(self._entries.values())).created_at < deadline:
+                self.size_bytes -= self._entries.popitem(last=False)[1].size
+        while self._entries and (len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            self.size_bytes -= self._entries.popitem(last=False)[1].size
+
+    @staticmethod
+    def _document_size(document: Document) -> int:
+        return sys.getsizeof(document.page_content) + sum(
+            sys.getsizeof(key) + sys.getsizeof(value) for key, value in document.metadata.items()
+        )
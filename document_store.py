@@ -0,0 +1,253 @@
+from langchain_core.documents.base import Document
+from typing import Iterator, List, Optional
+from hashing import chunk_id
+import threading
+import sqlite3
+import pickle
+import json
+import os
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+class DocumentStore:
+    """
+    An append-only document store backed by SQLite, indexed by chunk ID and source URL.
+
+    Each document is one row, so saving N documents costs O(N) regardless of the size of the store, and every
+    append runs in a single transaction: a crash mid-write leaves the previously saved documents intact.
+    Documents are keyed by their stable chunk ID; appending a chunk that is already stored is a no-op.
+
+    Methods
+    -------
+    append(documents: List[Document]) -> int
+        Appends documents to the store and returns how many were new.
+    get(chunk_id: str) -> Optional[Document]
+        Returns the document with the given chunk ID, if any.
+    get_by_source(source: str) -> List[Document]
+        Returns the documents loaded from the given URL, in insertion order.
+    iter_documents(batch_size: int = 1000) -> Iterator[Document]
+        Streams every document in insertion order without loading the whole store into memory.
+    sources() -> List[str]
+        Returns the distinct source URLs in the store.
+    is_store_file(path: str) -> bool
+        Checks whether a file is a DocumentStore (as opposed to a legacy pickle file).
+    migrate_from_pickle(pickle_path: str, store_path: str) -> DocumentStore
+        Converts a legacy pickle file written by Loader into a DocumentStore.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens the store, creating the SQLite file if needed.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite file.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path: str = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, chunk_id TEXT NOT NULL UNIQUE, source TEXT NOT NULL, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS documents_source ON documents (source)")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def __iter__(self) -> Iterator[Document]:
+        return self.iter_documents()
+
+    def __enter__(self) -> "DocumentStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(self, documents: List[Document]) -> int:
+        """
+        Appends documents to the store and returns how many were new.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The documents to append. Documents without a "chunk_id" metadata entry get one derived from their
+            source URL, start index and content.
+
+        Returns
+        -------
+        int
+            The number of documents written; documents whose chunk ID is already stored are skipped.
+        """
+        rows = [
+            (
+                document.metadata.get("chunk_id") or chunk_id(document),
+                document.metadata.get("source", ""),
+                document.page_content,
+                json.dumps(document.metadata, ensure_ascii=False, default=str),
+            )
+            for document in documents
+        ]
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO documents (chunk_id, source, page_content, metadata) VALUES (?, ?, ?, ?)", rows
+            )
+            return self._connection.total_changes - before
+
+    def get(self, chunk_id: str) -> Optional[Document]:
+        """
+        Returns the document with the given chunk ID, if any.
+
+        Parameters
+        ----------
+        chunk_id : str
+            The chunk ID to look up.
+
+        Returns
+        -------
+        Optional[Document]
+            The stored document, or None if no document has that ID.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_content, metadata FROM documents WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+        return DocumentStore._to_document(row) if row else None
+
+    def get_by_source(self, source: str) -> List[Document]:
+        """
+        Returns the documents loaded from the given URL, in insertion order.
+
+        Parameters
+        ----------
+        source : str
+            The source URL.
+
+        Returns
+        -------
+        List[Document]
+            The stored documents of that URL.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT page_content, metadata FROM documents WHERE source = ? ORDER BY seq", (source,)
+            ).fetchall()
+        return [DocumentStore._to_document(row) for row in rows]
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Document]:
+        """
+        Streams every document in insertion order without loading the whole store into memory.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            The number of rows read from SQLite at a time (default is 1000).
+
+        Yields
+        ------
+        Document
+            The stored documents.
+        """
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT seq, page_content, metadata FROM documents WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (last_seq, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for seq, page_content, metadata in rows:
+                last_seq = seq
+                yield DocumentStore._to_document((page_content, metadata))
+
+    def sources(self) -> List[str]:
+        """
+        Returns the distinct source URLs in the store.
+
+        Returns
+        -------
+        List[str]
+            The source URLs, in order of first insertion.
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT source FROM documents GROUP BY source ORDER BY MIN(seq)").fetchall()
+        return [source for source, in rows]
+
+    def close(self) -> None:
+        """
+        Closes the SQLite connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def is_store_file(path: str) -> bool:
+        """
+        Checks whether a file is a DocumentStore (as opposed to a legacy pickle file).
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+
+        Returns
+        -------
+        bool
+            True if the file exists and is a SQLite database.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+    @staticmethod
+    def migrate_from_pickle(pickle_path: str, store_path: Optional[str] = None) -> "DocumentStore":
+        """
+        Converts a legacy pickle file written by Loader into a DocumentStore.
+
+        The store is written to a temporary file and moved into place atomically. When the store replaces the
+        pickle file (the default), the pickle is kept next to it with a ".bak" suffix.
+
+        Parameters
+        ----------
+        pickle_path : str
+            The path of the pickle file holding a list of Documents.
+        store_path : Optional[str], optional
+            The path of the new store (default is None, meaning the pickle file is replaced in place).
+
+        Returns
+        -------
+        DocumentStore
+            The migrated store.
+        """
+        store_path = store_path or pickle_path
+        with open(pickle_path, "rb") as f:
+            documents = pickle.load(f)
+
+        temporary_path = store_path + ".migrating"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        with DocumentStore(temporary_path) as store:
+            store.append(documents)
+            store._connection.execute("PRAGMA journal_mode=DELETE")
+
+        if store_path == pickle_path:
+            os.replace(pickle_path, pickle_path + ".bak")
+        os.replace(temporary_path, store_path)
+        return DocumentStore(store_path)
+
+    @staticmethod
+    def _to_document(row: tuple) -> Document:
+        page_content, metadata = row
+        return Document(page_content=page_content, metadata=json.loads(metadata))
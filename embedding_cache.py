@@ -0,0 +1,387 @@
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from hashing import content_hash
+from array import array
+import threading
+import sqlite3
+import time
+import os
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed store of embedding vectors backed by SQLite.
+
+    Vectors are keyed by (embedding model, hash of the text) and stored as float32. The cache holds at most
+    `max_entries` vectors; when it grows past that, the least recently used entries are evicted. The last use of
+    an entry is only rewritten once it is older than a minute, so repeated lookups of the same texts do not each
+    cost a write and a commit.
+
+    Attributes
+    ----------
+    hits : int
+        The number of lookups answered from the cache.
+    misses : int
+        The number of lookups that were not in the cache.
+
+    Methods
+    -------
+    get_many(model: str, hashes: List[str]) -> Dict[str, List[float]]
+        Looks up several vectors at once and returns the ones that are cached.
+    put_many(model: str, vectors: Dict[str, List[float]]) -> None
+        Stores several vectors at once and evicts old entries if the cache is over its size cap.
+    clear() -> None
+        Removes every cached vector.
+    """
+
+    _LOOKUP_BATCH_SIZE = 500
+    _TOUCH_INTERVAL_NS = 60 * 10**9
+
+    def __init__(self, path: str = "./embedding_cache.sqlite", max_entries: Optional[int] = 100_000) -> None:
+        """
+        Initializes the cache, creating the SQLite file if needed.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path of the SQLite file, ":memory:" keeps the cache in memory (default is "./embedding_cache.sqlite").
+        max_entries : Optional[int], optional
+            The maximum number of vectors kept, None disables eviction (default is 100_000).
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path: str = path
+        self.max_entries: Optional[int] = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, last_used INTEGER NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Looks up several vectors at once and returns the ones that are cached.
+
+        Parameters
+        ----------
+        model : str
+            The name of the embedding model the vectors belong to.
+        hashes : List[str]
+            The content hashes to look up.
+
+        Returns
+        -------
+        Dict[str, List[float]]
+            A mapping from each cached hash to its vector. Hashes that are not cached are left out.
+        """
+        unique_hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        stale: List[str] = []
+        now = time.time_ns()
+        with self._lock:
+            for start in range(0, len(unique_hashes), self._LOOKUP_BATCH_SIZE):
+                batch = unique_hashes[start:start + self._LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT hash, vector, last_used FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for hash_, blob, last_used in rows:
+                    found[hash_] = array("f", blob).tolist()
+                    if last_used < now - self._TOUCH_INTERVAL_NS:
+                        stale.append(hash_)
+
+            if stale:
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, hash_) for hash_ in stale],
+                )
+                self._connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """
+        Stores several vectors at once and evicts old entries if the cache is over its size cap.
+
+        Parameters
+        ----------
+        model : str
+            The name of the embedding model the vectors belong to.
+        vectors : Dict[str, List[float]]
+            A mapping from content hash to vector.
+        """
+        if not vectors:
+            return
+
+        now = time.time_ns()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, hash_, array("f", vector).tobytes(), now) for hash_, vector in vectors.items()],
+            )
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN ("
+                    "SELECT rowid FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        """
+        Removes every cached vector.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+
+    def close(self) -> None:
+        """
+        Closes the SQLite connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    An embedding function that answers from an EmbeddingCache and only sends uncached texts to the wrapped model.
+
+    Any `Embeddings` implementation can be wrapped, e.g. `OpenAIEmbeddings` in production or
+    `langchain_core.embeddings.DeterministicFakeEmbedding` for offline tests.
+
+    Methods
+    -------
+    embed_documents(texts: List[str]) -> List[List[float]]
+        Embeds a list of texts, calling the wrapped model only for the texts that are not cached.
+    embed_query(text: str) -> List[float]
+        Embeds a search query with the wrapped model, bypassing the cache.
+    embed_queries(texts: List[str]) -> List[List[float]]
+        Embeds several search queries with the wrapped model, bypassing the cache.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str) -> None:
+        """
+        Initializes the cached embedding function.
+
+        Parameters
+        ----------
+        embeddings : Embeddings
+            The embedding model used for texts that are not cached.
+        cache : EmbeddingCache
+            The cache to read from and write to.
+        model_name : str
+            The name of the embedding model, used as part of the cache key.
+        """
+        self.embeddings: Embeddings = embeddings
+        self.cache: EmbeddingCache = cache
+        self.model_name: str = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts, calling the wrapped model only for the texts that are not cached.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The texts to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One vector per input text, in input order.
+        """
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+
+        missing = {hash_: text for hash_, text in zip(hashes, texts) if hash_ not in vectors}
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.cache.put_many(self.model_name, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[hash_] for hash_ in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a search query with the wrapped model, bypassing the cache.
+
+        Questions rarely repeat verbatim, and the answer cache already serves the ones that do, so caching them
+        would only add a write to every query and grow the cache with vectors that are never read again.
+
+        Parameters
+        ----------
+        text : str
+            The query to embed.
+
+        Returns
+        -------
+        List[float]
+            The vector of the query.
+        """
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several search queries with the wrapped model, bypassing the cache, see `embed_queries`.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The queries to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One vector per query, in input order.
+        """
+        return embed_queries(self.embeddings, texts)
+
+
+class QueryMemo(Embeddings):
+    """
+    An embedding function that remembers the vectors of the most recent queries, in memory.
+
+    Answering a question embeds it up to three times: the similarity tier of the `AnswerCache` looks it up, the
+    retriever searches with it and the answer is cached under it. `ClientRegistry` wraps every model in a memo, so
+    the retriever and the answer cache reuse the vector of the lookup instead of sending the question again.
+    Documents are not memoized.
+
+    Methods
+    -------
+    embed_documents(texts: List[str]) -> List[List[float]]
+        Embeds a list of texts with the wrapped model.
+    embed_query(text: str) -> List[float]
+        Embeds a search query, reusing its vector if it was embedded recently.
+    embed_queries(texts: List[str]) -> List[List[float]]
+        Embeds several search queries, sending only the ones not embedded recently to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, capacity: int = 256) -> None:
+        """
+        Initializes the memo.
+
+        Parameters
+        ----------
+        embeddings : Embeddings
+            The embedding model.
+        capacity : int, optional
+            The number of recent queries remembered (default is 256).
+        """
+        self.embeddings: Embeddings = embeddings
+        self.capacity: int = capacity
+        self._vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts with the wrapped model.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The texts to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One vector per input text, in input order.
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a search query, reusing its vector if it was embedded recently.
+
+        Parameters
+        ----------
+        text : str
+            The query to embed.
+
+        Returns
+        -------
+        List[float]
+            The vector of the query.
+        """
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several search queries, sending only the ones not embedded recently to the wrapped model.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The queries to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One vector per query, in input order.
+        """
+        with self._lock:
+            vectors = {text: self._vectors[text] for text in texts if text in self._vectors}
+            for text in vectors:
+                self._vectors.move_to_end(text)
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            new_vectors = [self.embeddings.embed_query(missing[0])] if len(missing) == 1 else embed_queries(self.embeddings, missing)
+            vectors.update(zip(missing, new_vectors))
+            with self._lock:
+                for text, vector in zip(missing, new_vectors):
+                    self._vectors[text] = vector
+                    self._vectors.move_to_end(text)
+                while len(self._vectors) > self.capacity:
+                    self._vectors.popitem(last=False)
+        return [vectors[text] for text in texts]
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeds several search queries, e.g. a batch of the `QueryBatcher`, without caching them.
+
+    Models with an `embed_queries` method (`CachedEmbeddings`, `QueryMemo`, `HashingEmbeddings`) use it. OpenAI models embed a
+    query like a document, so the queries are sent in one `embed_documents` request. Other models, which may embed
+    queries differently (e.g. with an instruction prefix), get one `embed_query` call per query.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        The embedding model.
+    texts : List[str]
+        The queries to embed.
+
+    Returns
+    -------
+    List[List[float]]
+        One vector per query, in input order.
+    """
+    batched = getattr(embeddings, "embed_queries", None)
+    if batched is not None:
+        return batched(texts)
+    if isinstance(embeddings, OpenAIEmbeddings):
+        return embeddings.embed_documents(texts)
+    return [embeddings.embed_query(text) for text in texts]
@@ -0,0 +1,411 @@
+"""
+Retrieval evaluation: sweeps chunking and retrieval settings over a local index and reports quality and cost.
+
+Given a set of questions with their expected source URLs, every combination of chunk size, chunk overlap, top_k
+and retrieval mode is scored by recall@k, MRR, the prompt tokens of the retrieved context and the retrieval
+latency. Indices are built once per chunking configuration and cached on disk, so a sweep (or a rerun) never
+rebuilds an identical one. With the default local embedding model and a saved page store, it runs fully offline:
+
+    python evaluation.py --pages ./eval/pages.db --questions questions.jsonl --chunk-sizes 250 500 1000
+
+The page store is fetched from the seed URLs on the first run if it does not exist. Each line of the questions
+file is a JSON object with a "question" and the list of "sources" that answer it.
+"""
+from langchain_core.language_models.chat_models import BaseChatModel
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from langchain_core.documents.base import Document
+from local_embeddings import LOCAL_EMBEDDING_MODEL
+from vector_store import BACKENDS
+from context_assembler import ContextAssembler
+from clients import ClientRegistry
+from langchain_core.vectorstores import VectorStore
+from hashing import content_hash
+from retriever import Retriever
+from sources import SEED_URLS
+from loader import Chunker, Loader
+from indexer import Indexer
+from bm25 import BM25Index
+import statistics
+import argparse
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+LLM_MODES = ("multi_query", "auto")
+
+
+class EvalQuestion(NamedTuple):
+    """
+    A question and the source URLs of the pages that answer it.
+    """
+    question: str
+    sources: List[str]
+
+
+class EvalConfig(NamedTuple):
+    """
+    One point of a sweep: a chunking configuration and a retrieval configuration.
+    """
+    chunk_size: int
+    chunk_overlap: int
+    top_k: int
+    mode: str
+    hybrid: bool
+
+
+class EvalResult(NamedTuple):
+    """
+    The scores of one configuration, averaged over the questions.
+    """
+    config: EvalConfig
+    recall: float
+    mrr: float
+    prompt_tokens: float
+    latency_ms: float
+    p95_ms: float
+    chunks: int
+    index_cached: bool
+
+
+class Evaluator:
+    """
+    Scores retrieval configurations against a question set over locally built, cached indices.
+
+    Methods
+    -------
+    index(chunk_size: int, chunk_overlap: int) -> Tuple[VectorStore, BM25Index, bool]
+        Returns the index of a chunking configuration, building it only if no identical one is cached.
+    evaluate(config: EvalConfig) -> EvalResult
+        Scores one configuration.
+    sweep(chunk_sizes: Iterable[int], chunk_overlaps: Iterable[int], top_ks: Iterable[int], modes: Iterable[str], hybrid: Iterable[bool] = (False,)) -> List[EvalResult]
+        Scores every valid combination of the settings.
+    load_questions(path: str) -> List[EvalQuestion]
+        Loads a question set from a JSON lines file.
+    save_results(results: List[EvalResult], path: str) -> None
+        Writes results to a JSON file.
+    """
+
+    def __init__(
+            self,
+            documents: List[Document],
+            questions: List[EvalQuestion],
+            root: str = "./eval_cache",
+            embedding_model: str = LOCAL_EMBEDDING_MODEL,
+            chunk_model_name: str = "gpt-3.5-turbo",
+            chunk_engine: str = "recursive",
+            context_budget: Optional[int] = None,
+            llm: Optional[BaseChatModel] = None,
+            clients: Optional[ClientRegistry] = None,
+            vector_backend: str = "chroma"
+        ) -> None:
+        """
+        Initializes the evaluator.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The unchunked pages of the corpus, with their URL in the "source" metadata.
+        questions : List[EvalQuestion]
+            The questions and their expected sources.
+        root : str, optional
+            The directory the indices are cached in (default is "./eval_cache").
+        embedding_model : str, optional
+            The embedding model of the indices (default is LOCAL_EMBEDDING_MODEL, which runs offline but ranks
+            lexically; a "local:" sentence-transformers model or an API model measures semantic retrieval).
+        chunk_model_name : str, optional
+            The model whose tokenizer is used for chunking and for counting prompt tokens (default is "gpt-3.5-turbo").
+        chunk_engine : str, optional
+            The chunking engine, see `Chunker` (default is "recursive").
+        context_budget : Optional[int], optional
+            The context token budget applied by the RAG before prompting, see `ContextAssembler`. Prompt tokens
+            are counted after assembly; None counts every retrieved chunk (default is None).
+        llm : Optional[BaseChatModel], optional
+            The chat model rewriting questions in the "multi_query" and "auto" modes. Those modes are rejected
+            without one, so a sweep never calls a remote model implicitly (default is None).
+        clients : Optional[ClientRegistry], optional
+            The registry the embedding model is taken from (default is None, meaning the default registry).
+        vector_backend : str, optional
+            The vector store implementation of the indices, see `Indexer.load_db` (default is "chroma").
+        """
+        self.documents: List[Document] = documents
+        self.questions: List[EvalQuestion] = questions
+        self.root: str = root
+        self.embedding_model: str = embedding_model
+        self.chunk_model_name: str = chunk_model_name
+        self.chunk_engine: str = chunk_engine
+        self.llm: Optional[BaseChatModel] = llm
+        self.clients: Optional[ClientRegistry] = clients
+        self.vector_backend: str = vector_backend
+        self.assembler = ContextAssembler(model_name=chunk_model_name, max_tokens=context_budget or 10 ** 9)
+        self.context_budget: Optional[int] = context_budget
+        self._corpus_hash: str = content_hash("\n".join(sorted(
+            content_hash(document.metadata.get("source", "") + "\n" + document.page_content) for document in documents
+        )))
+        self._indices: Dict[Tuple[int, int], Tuple[VectorStore, BM25Index, int, bool]] = {}
+
+    def index(self, chunk_size: int, chunk_overlap: int) -> Tuple[VectorStore, BM25Index, bool]:
+        """
+        Returns the index of a chunking configuration, building it only if no identical one is cached.
+
+        An index is identified by the corpus, the chunking settings, the embedding model and the vector backend. It
+        is written to its own directory under root, with an "index.json" marker written last, so an interrupted
+        build is rebuilt.
+
+        Parameters
+        ----------
+        chunk_size : int
+            The maximum number of tokens per chunk.
+        chunk_overlap : int
+            The number of tokens overlapping between chunks.
+
+        Returns
+        -------
+        Tuple[VectorStore, BM25Index, bool]
+            The vector database, the BM25 index of the same chunks, and whether they were read from the cache.
+        """
+        key = (chunk_size, chunk_overlap)
+        if key not in self._indices:
+            self._indices[key] = self._load_or_build(chunk_size, chunk_overlap)
+        db, bm25_index, _, cached = self._indices[key]
+        return db, bm25_index, cached
+
+    def evaluate(self, config: EvalConfig) -> EvalResult:
+        """
+        Scores one configuration.
+
+        Parameters
+        ----------
+        config : EvalConfig
+            The configuration to score.
+
+        Returns
+        -------
+        EvalResult
+            The mean recall@k, MRR, prompt tokens and retrieval latency (including context assembly when a budget
+            is set) over the questions.
+
+        Raises
+        ------
+        ValueError
+            If the mode rewrites questions and no llm was given.
+        """
+        if config.mode in LLM_MODES and self.llm is None:
+            raise ValueError(f"Retrieval mode {config.mode!r} needs an llm to rewrite questions")
+        db, bm25_index, cached = self.index(config.chunk_size, config.chunk_overlap)
+        retriever = Retriever.create_retriever_from_db(
+            db,
+            model=self.chunk_model_name,
+            top_k=config.top_k,
+            llm=self.llm,
+            mode=config.mode,
+            bm25_index=bm25_index if config.hybrid else None
+        )
+
+        recalls, reciprocal_ranks, tokens, latencies = [], [], [], []
+        for question in self.questions:
+            start = time.perf_counter()
+            documents = retriever.invoke(question.question)
+            if self.context_budget is not None:
+                documents = self.assembler.assemble(question.question, documents)
+            latencies.append(time.perf_counter() - start)
+
+            expected = {_normalize(source) for source in question.sources}
+            ranked = [_normalize(document.metadata.get("source", "")) for document in documents]
+            recalls.append(len(expected & set(ranked)) / len(expected) if expected else 0.0)
+            reciprocal_ranks.append(next((1 / rank for rank, source in enumerate(ranked, 1) if source in expected), 0.0))
+            tokens.append(sum(self.assembler.count_tokens(document.page_content) for document in documents))
+
+        return EvalResult(
+            config=config,
+            recall=statistics.fmean(recalls),
+            mrr=statistics.fmean(reciprocal_ranks),
+            prompt_tokens=statistics.fmean(tokens),
+            latency_ms=statistics.fmean(latencies) * 1000,
+            p95_ms=(statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]) * 1000,
+            chunks=self._indices[(config.chunk_size, config.chunk_overlap)][2],
+            index_cached=cached
+        )
+
+    def sweep(
+            self,
+            chunk_sizes: Iterable[int],
+            chunk_overlaps: Iterable[int],
+            top_ks: Iterable[int],
+            modes: Iterable[str],
+            hybrid: Iterable[bool] = (False,)
+        ) -> List[EvalResult]:
+        """
+        Scores every valid combination of the settings.
+
+        Combinations whose overlap is not smaller than the chunk size are skipped. Configurations sharing a
+        chunking configuration share its index.
+
+        Parameters
+        ----------
+        chunk_sizes : Iterable[int]
+            The chunk sizes to try, in tokens.
+        chunk_overlaps : Iterable[int]
+            The chunk overlaps to try, in tokens.
+        top_ks : Iterable[int]
+            The numbers of retrieved documents to try.
+        modes : Iterable[str]
+            The retrieval modes to try, see `Retriever.create_retriever_from_db`.
+        hybrid : Iterable[bool], optional
+            Whether to fuse BM25 into the retrieval, or both (default is (False,)).
+
+        Returns
+        -------
+        List[EvalResult]
+            The result of every configuration, in sweep order.
+        """
+        results = []
+        top_ks, modes, hybrid = list(top_ks), list(modes), list(hybrid)
+        for chunk_size in chunk_sizes:
+            for chunk_overlap in chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    logger.info("Skipping chunk_size=%d with chunk_overlap=%d", chunk_size, chunk_overlap)
+                    continue
+                for mode in modes:
+                    for fused in hybrid:
+                        for top_k in top_ks:
+                            result = self.evaluate(EvalConfig(chunk_size, chunk_overlap, top_k, mode, fused))
+                            logger.info("%s: recall %.3f, MRR %.3f", result.config, result.recall, result.mrr)
+                            results.append(result)
+        return results
+
+    @staticmethod
+    def load_questions(path: str) -> List[EvalQuestion]:
+        """
+        Loads a question set from a JSON lines file.
+
+        Parameters
+        ----------
+        path : str
+            A file with one JSON object per line, with a "question" and its "sources" (a list of URLs, or a
+            single URL under "source").
+
+        Returns
+        -------
+        List[EvalQuestion]
+            The questions, in file order.
+        """
+        questions = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    sources = record.get("sources") or [record["source"]]
+                    questions.append(EvalQuestion(record["question"], list(sources)))
+        return questions
+
+    @staticmethod
+    def save_results(results: List[EvalResult], path: str) -> None:
+        """
+        Writes results to a JSON file.
+
+        Parameters
+        ----------
+        results : List[EvalResult]
+            The results of a sweep.
+        path : str
+            The file to write, one object per configuration with its settings and scores.
+        """
+        records = [{**result.config._asdict(), **result._replace(config=None)._asdict()} for result in results]
+        for record in records:
+            del record["config"]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2)
+
+    def _load_or_build(self, chunk_size: int, chunk_overlap: int) -> Tuple[VectorStore, BM25Index, int, bool]:
+        key = content_hash(json.dumps([
+            self._corpus_hash, chunk_size, chunk_overlap, self.chunk_engine, self.chunk_model_name, self.embedding_model,
+            self.vector_backend
+        ]))[:16]
+        path = os.path.join(self.root, f"{chunk_size}-{chunk_overlap}-{key}")
+        marker = os.path.join(path, "index.json")
+        bm25_path = os.path.join(path, "bm25.idx")
+        db = Indexer.load_db(path, embedding_model=self.embedding_model, clients=self.clients, backend=self.vector_backend)
+
+        if os.path.exists(marker):
+            with open(marker, encoding="utf-8") as f:
+                chunks = json.load(f)["chunks"]
+            return db, Indexer.load_bm25_index(db, bm25_path), chunks, True
+
+        start = time.perf_counter()
+        documents = Chunker.chunk(
+            self.documents,
+            model_name=self.chunk_model_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            engine=self.chunk_engine
+        )
+        bm25_index = BM25Index()
+        Indexer.upsert_documents(documents, db, bm25_index=bm25_index)
+        bm25_index.save(bm25_path)
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump({"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "chunks": len(documents)}, f)
+        logger.info("Built index %s (%d chunks) in %.1fs", path, len(documents), time.perf_counter() - start)
+        return db, bm25_index, len(documents), False
+
+
+def _normalize(url: str) -> str:
+    return url.split("#")[0].rstrip("/")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="./eval_cache/pages.db", help="the page store, fetched from the seed URLs if missing")
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--root", default="./eval_cache")
+    parser.add_argument("--embedding-model", default=LOCAL_EMBEDDING_MODEL)
+    parser.add_argument("--vector-backend", default="chroma", choices=BACKENDS)
+    parser.add_argument("--chunk-model", default="gpt-3.5-turbo")
+    parser.add_argument("--chunk-engine", default="recursive", choices=Chunker.ENGINES)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[250, 500, 1000])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 50, 100])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 5, 10, 20])
+    parser.add_argument("--modes", nargs="+", default=["similarity", "mmr"])
+    parser.add_argument("--hybrid", choices=["off", "on", "both"], default="both")
+    parser.add_argument("--context-budget", type=int, default=None)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.exists(args.pages):
+        os.makedirs(os.path.dirname(os.path.abspath(args.pages)), exist_ok=True)
+        Loader.load_documents(SEED_URLS, save_path=args.pages, chunk=False)
+    evaluator = Evaluator(
+        Loader.load_from_file(args.pages),
+        Evaluator.load_questions(args.questions),
+        root=args.root,
+        embedding_model=args.embedding_model,
+        chunk_model_name=args.chunk_model,
+        chunk_engine=args.chunk_engine,
+        context_budget=args.context_budget,
+        vector_backend=args.vector_backend
+    )
+    results = evaluator.sweep(
+        args.chunk_sizes,
+        args.chunk_overlaps,
+        args.top_k,
+        args.modes,
+        hybrid={"off": (False,), "on": (True,), "both": (False, True)}[args.hybrid]
+    )
+
+    print(f"{'size':>5} {'overlap':>7} {'top_k':>5} {'mode':>12} {'hybrid':>6} {'recall':>6} {'MRR':>6} {'tokens':>7} {'ms':>7} {'p95 ms':>7} {'recall/1k tok':>13}")
+    for result in sorted(results, key=lambda result: (-result.recall, result.prompt_tokens)):
+        config = result.config
+        print(
+            f"{config.chunk_size:>5} {config.chunk_overlap:>7} {config.top_k:>5} {config.mode:>12} {str(config.hybrid):>6} "
+            f"{result.recall:>6.3f} {result.mrr:>6.3f} {result.prompt_tokens:>7.0f} {result.latency_ms:>7.2f} {result.p95_ms:>7.2f} "
+            f"{result.recall / max(result.prompt_tokens, 1) * 1000:>13.3f}"
+        )
+    if args.output:
+        Evaluator.save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from langchain_core.documents.base import Document
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from page_cache import CachedPage, PageCache
+from cleaning import extract_main_content
+from hashing import content_hash
+from bs4 import BeautifulSoup
+from tracing import Tracer
+import contextvars
+import threading
+import requests
+import time
+import os
+
+DEFAULT_HEADERS = {
+    "User-Agent": os.environ.get("USER_AGENT", "Mozilla/5.0 (compatible; RAG-EnchentesRS)"),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "pt-BR,pt;q=0.9,en;q=0.8",
+}
+
+
+class FetchResult(NamedTuple):
+    """
+    The outcome of fetching a batch of URLs.
+
+    Attributes
+    ----------
+    documents : List[Document]
+        The documents that were fetched successfully, in the same order as the input URLs.
+    failed : Dict[str, str]
+        A mapping from each URL that could not be fetched to a description of the error.
+    unchanged : List[str]
+        The URLs left out because their content did not change since they were cached, when the fetcher skips
+        unchanged pages.
+    """
+    documents: List[Document]
+    failed: Dict[str, str]
+    unchanged: List[str]
+
+
+class HostRateLimiter:
+    """
+    A thread-safe limiter that spaces out requests made to the same host.
+
+    Methods
+    -------
+    wait(url: str) -> None
+        Blocks until a request to the host of the given URL is allowed.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None) -> None:
+        """
+        Initializes the limiter.
+
+        Parameters
+        ----------
+        requests_per_second : Optional[float], optional
+            The maximum number of requests per second sent to a single host (default is None, meaning no limit).
+        """
+        self.interval: float = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """
+        Blocks until a request to the host of the given URL is allowed.
+
+        Parameters
+        ----------
+        url : str
+            The URL about to be requested.
+        """
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    A class used for fetching web pages concurrently and turning them into documents.
+
+    Pages are downloaded by a bounded thread pool sharing one pooled, keep-alive HTTP session. Requests to the
+    same host are spaced out by a per-host rate limit, every request has its own timeout and a total deadline,
+    and a URL that fails is reported in the result instead of aborting the whole batch.
+
+    With a page cache, pages are requested conditionally with the validators they were last served with, and a
+    304 Not Modified answer reuses the cached HTML. Pages whose text hashes the same as the cached version are
+    unchanged and can be skipped. The fetched versions are collected in `pages`; the caller stores them in the
+    cache once they are indexed, so a failed ingest never marks a page as up to date.
+
+    Attributes
+    ----------
+    pages : List[CachedPage]
+        The versions of the pages fetched so far, to be stored in the page cache.
+    boilerplate_chars : int
+        The number of characters left out of pages by cleaning.
+    not_modified : int
+        The number of pages answered with 304 Not Modified.
+    unchanged : int
+        The number of pages whose text did not change since they were cached.
+
+    Methods
+    -------
+    fetch(urls: Union[str, List[str]]) -> FetchResult
+        Fetches the given URLs and returns the documents in input order along with the failed URLs.
+    iter_fetch(urls: Union[str, List[str]]) -> Iterator[Tuple[str, Optional[Union[Document, str]]]]
+        Fetches the given URLs and yields each one with its document or error as soon as it completes.
+    fetch_html(url: str) -> str
+        Downloads a single page and returns its decoded HTML.
+    parse(html: str, url: str, clean: bool = True) -> Document
+        Converts the HTML of a page into a Document.
+    close() -> None
+        Closes the underlying HTTP session.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 8,
+            requests_per_second_per_host: Optional[float] = 2.0,
+            timeout: float = 15.0,
+            deadline: Optional[float] = 60.0,
+            headers: Optional[Dict[str, str]] = None,
+            tracer: Optional[Tracer] = None,
+            clean: bool = True,
+            page_cache: Optional[PageCache] = None,
+            skip_unchanged: bool = False
+        ) -> None:
+        """
+        Initializes the fetcher.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            The maximum number of pages fetched at the same time (default is 8).
+        requests_per_second_per_host : Optional[float], optional
+            The maximum request rate towards a single host, None disables the limit (default is 2.0).
+        timeout : float, optional
+            The timeout in seconds of each socket operation of a request, i.e. connecting and every read (default
+            is 15.0).
+        deadline : Optional[float], optional
+            The total time in seconds a page may take to download. `timeout` alone does not bound it, since a
+            server trickling bytes resets it on every read. None disables the deadline (default is 60.0).
+        headers : Optional[Dict[str, str]], optional
+            Extra HTTP headers sent with every request (default is None).
+        tracer : Optional[Tracer], optional
+            Where the latency of each page fetch is recorded, as "ingest.fetch" (default is None).
+        clean : bool, optional
+            Whether to keep only the main content of pages, see `Fetcher.parse`. The number of characters left out
+            is added up in `boilerplate_chars` (default is True).
+        page_cache : Optional[PageCache], optional
+            The cache pages are validated against with conditional requests. It is only read; the fetched
+            versions are collected in `pages` (default is None).
+        skip_unchanged : bool, optional
+            Whether to leave out pages whose text did not change since they were cached (default is False).
+        """
+        self.max_workers: int = max(1, max_workers)
+        self.timeout: float = timeout
+        self.deadline: Optional[float] = deadline
+        self.tracer: Optional[Tracer] = tracer
+        self.clean: bool = clean
+        self.page_cache: Optional[PageCache] = page_cache
+        self.skip_unchanged: bool = skip_unchanged
+        self.pages: List[CachedPage] = []
+        self.boilerplate_chars: int = 0
+        self.not_modified: int = 0
+        self.unchanged: int = 0
+        self._lock = threading.Lock()
+        self.rate_limiter = HostRateLimiter(requests_per_second_per_host)
+        self.session = requests.Session()
+        self.session.headers.update({**DEFAULT_HEADERS, **(headers or {})})
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self) -> "Fetcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def fetch(self, urls: Union[str, List[str]]) -> FetchResult:
+        """
+        Fetches the given URLs and returns the documents in input order along with the failed URLs.
+
+        Parameters
+        ----------
+        urls : Union[str, List[str]]
+            A single URL or a list of URLs to fetch.
+
+        Returns
+        -------
+        FetchResult
+            The fetched documents, in input order, a mapping of failed URLs to their errors, and the URLs left out
+            as unchanged.
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(urls)))) as executor:
+            outcomes = list(executor.map(self._fetch_one, urls))
+
+        documents: List[Document] = []
+        failed: Dict[str, str] = {}
+        unchanged: List[str] = []
+        for url, outcome in zip(urls, outcomes):
+            if isinstance(outcome, Document):
+                documents.append(outcome)
+            elif outcome is None:
+                unchanged.append(url)
+            else:
+                failed[url] = outcome
+
+        return FetchResult(documents=documents, failed=failed, unchanged=unchanged)
+
+    def iter_fetch(self, urls: Union[str, List[str]], ordered: bool = False) -> Iterator[Tuple[str, Optional[Union[Document, str]]]]:
+        """
+        Fetches the given URLs and yields each one with its document or error as soon as it completes.
+
+        Parameters
+        ----------
+        urls : Union[str, List[str]]
+            A single URL or a list of URLs to fetch.
+        ordered : bool, optional
+            Whether to yield the URLs in input order, each once it and every URL before it completed, e.g. so
+            that what is derived from the pages does not depend on which one was faster. The later URLs keep
+            being fetched meanwhile (default is False, meaning in completion order).
+
+        Yields
+        ------
+        Tuple[str, Optional[Union[Document, str]]]
+            The URL and its parsed Document, a description of the error if it could not be fetched, or None if
+            it was left out as unchanged.
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(urls)))) as executor:
+            futures = {executor.submit(contextvars.copy_context().run, self._fetch_one, url): url for url in urls}
+            for future in (futures if ordered else as_completed(futures)):
+                yield futures[future], future.result()
+
+    def fetch_html(self, url: str) -> str:
+        """
+        Downloads a single page and returns its decoded HTML.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page.
+
+        Returns
+        -------
+        str
+            The HTML of the page.
+
+        Raises
+        ------
+        requests.RequestException
+            If the request fails or the server answers with an error status.
+        """
+        response = self._get(url)
+        response.raise_for_status()
+        return Fetcher._decode(response)
+
+    @staticmethod
+    def parse(html: str, url: str, clean: bool = True) -> Document:
+        """
+        Converts the HTML of a page into a Document, using the same metadata as WebBaseLoader.
+
+        Parameters
+        ----------
+        html : str
+            The HTML of the page.
+        url : str
+            The URL the page was fetched from.
+        clean : bool, optional
+            Whether to keep only the main content of the page, without navigation, cookie banners, related
+            articles and footers, see `cleaning.extract_main_content`. Otherwise the text of the whole page is
+            kept, as WebBaseLoader does (default is True).
+
+        Returns
+        -------
+        Document
+            A Document holding the page text, with source, title, description and language metadata.
+        """
+        return Fetcher._parse(html, url, clean)[0]
+
+    @staticmethod
+    def _parse(html: str, url: str, clean: bool) -> Tuple[Document, int]:
+        """
+        Converts the HTML of a page into a Document and counts the characters of boilerplate left out.
+        """
+        soup = BeautifulSoup(html, "html.parser")
+        metadata = {"source": url}
+        if title := soup.find("title"):
+            metadata["title"] = title.get_text()
+        if description := soup.find("meta", attrs={"name": "description"}):
+            metadata["description"] = description.get("content", "No description found.")
+        if html_tag := soup.find("html"):
+            metadata["language"] = html_tag.get("lang", "No language found.")
+
+        if not clean:
+            return Document(page_content=soup.get_text(), metadata=metadata), 0
+        text, boilerplate_chars = extract_main_content(soup)
+        return Document(page_content=text, metadata=metadata), boilerplate_chars
+
+    def close(self) -> None:
+        """
+        Closes the underlying HTTP session.
+        """
+        self.session.close()
+
+    def _record(self, page: CachedPage, boilerplate_chars: int, not_modified: bool, unchanged: bool) -> None:
+        """
+        Collects the fetched version of a page and updates the counters.
+        """
+        with self._lock:
+            self.pages.append(page)
+            self.boilerplate_chars += boilerplate_chars
+            self.not_modified += not_modified
+            self.unchanged += unchanged
+
+    def _get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """
+        Sends a GET request once the rate limit allows it and reads the body, raising `requests.Timeout` once the
+        download takes longer than the deadline.
+        """
+        self.rate_limiter.wait(url)
+        deadline = time.monotonic() + self.deadline if self.deadline is not None else None
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        with response:
+            # read1 returns whatever arrived, so a trickling server cannot hold a read open until a block is full
+            read1 = getattr(response.raw, "read1", None)
+            parts = iter(lambda: read1(64 << 10, decode_content=True), b"") if read1 is not None else response.iter_content(64 << 10)
+            chunks = []
+            for chunk in parts:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise requests.Timeout(f"Downloading {url} took longer than {self.deadline:g} s")
+                chunks.append(chunk)
+            response._content = b"".join(chunks)
+        return response
+
+    @staticmethod
+    def _decode(response: requests.Response) -> str:
+        """
+        Decodes the body of a page with the charset of its Content-Type header, guessing the encoding from the bytes
+        only when no charset is declared.
+        """
+        if "charset" not in response.headers.get("Content-Type", "").lower():
+            response.encoding = response.apparent_encoding
+        return response.text
+
+    def _fetch_one(self, url: str) -> Optional[Union[Document, str]]:
+        """
+        Fetches and parses a single URL, returning the error message instead of raising.
+
+        Parameters
+        ----------
+        url : str
+            The URL to fetch.
+
+        Returns
+        -------
+        Optional[Union[Document, str]]
+            The parsed Document, a description of the error if the URL could not be fetched, or None if its
+            text did not change since it was cached and unchanged pages are skipped.
+        """
+        start = time.perf_counter()
+        try:
+            cached = self.page_cache.get(url) if self.page_cache is not None else None
+            response = self._get(url, PageCache.conditional_headers(cached))
+            now = time.time()
+            if response.status_code == 304 and cached is not None:
+                # the cached HTML is still current: skipped pages are not even parsed again
+                page = cached._replace(
+                    etag=response.headers.get("ETag") or cached.etag,
+                    last_modified=response.headers.get("Last-Modified") or cached.last_modified,
+                    checked_at=now
+                )
+                document, boilerplate_chars = (None, 0) if self.skip_unchanged else Fetcher._parse(page.html, url, self.clean)
+                self._record(page, boilerplate_chars, not_modified=True, unchanged=True)
+                return document
+
+            response.raise_for_status()
+            html = Fetcher._decode(response)
+            document, boilerplate_chars = Fetcher._parse(html, url, self.clean)
+            page = CachedPage(
+                url=url,
+                html=html,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                content_hash=content_hash(document.page_content),
+                fetched_at=now,
+                checked_at=now
+            )
+            unchanged = cached is not None and cached.content_hash == page.content_hash
+            self._record(page, boilerplate_chars, not_modified=False, unchanged=unchanged)
+            return None if unchanged and self.skip_unchanged else document
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        finally:
+            if self.tracer is not None:
+                self.tracer.record("ingest.fetch", time.perf_counter() - start)
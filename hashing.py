@@ -0,0 +1,38 @@
+from langchain_core.documents.base import Document
+import hashlib
+
+
+def content_hash(text: str) -> str:
+    """
+    Returns a stable hash of a piece of text, used to address chunks and cached embeddings by their content.
+
+    Parameters
+    ----------
+    text : str
+        The text to hash.
+
+    Returns
+    -------
+    str
+        The hex-encoded SHA-256 digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(document: Document) -> str:
+    """
+    Returns a stable identifier for a chunk, derived from its source URL, start index and content hash.
+
+    Parameters
+    ----------
+    document : Document
+        The chunk to identify.
+
+    Returns
+    -------
+    str
+        The hex-encoded SHA-256 digest identifying the chunk. Re-chunking an unchanged page yields the same IDs.
+    """
+    source = document.metadata.get("source", "")
+    start_index = document.metadata.get("start_index", 0)
+    return hashlib.sha256(f"{source}\x00{start_index}\x00{content_hash(document.page_content)}".encode("utf-8")).hexdigest()
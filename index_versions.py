@@ -0,0 +1,198 @@
+from vector_store import CODES_FILE, SCALES_FILE, VECTORS_FILE
+from typing import List, Optional
+import logging
+import shutil
+import os
+
+logger = logging.getLogger(__name__)
+
+CURRENT_NAME = "CURRENT"
+VERSIONS_NAME = "versions"
+PAGE_CACHE_NAME = "pages.db"
+# entries of the base directory shared by every version, never copied into one (prefixes, to match
+# CURRENT.tmp and the SQLite journal files of the page cache)
+SHARED_NAMES = (CURRENT_NAME, VERSIONS_NAME, PAGE_CACHE_NAME)
+# files never modified in place, only replaced with os.replace or, for the matrices of a NumpyVectorStore,
+# copied before they are appended to, so a new version hard-links them instead of copying them
+LINKED_NAMES = (VECTORS_FILE, CODES_FILE, SCALES_FILE, "bm25.idx")
+
+
+class IndexVersions:
+    """
+    Copy-on-write versions of an index directory (the vector database and the BM25 index), so an index can be
+    rebuilt while readers keep using the previous one.
+
+    A new version is a copy of the current one under "<base>/versions/<number>". It is written while readers keep
+    the current version open, then published by atomically replacing the "<base>/CURRENT" file with its name.
+    Files that are never modified in place (the BM25 index and the matrices of a `NumpyVectorStore`) are
+    hard-linked rather than copied, so only the record table of a `NumpyVectorStore` is copied up front, and its
+    matrices only once vectors are appended to them. A Chroma database modifies its files in place, so it is copied
+    in full for every version.
+    Until a version is published, the base directory itself is the current version, so existing databases and
+    snapshots need no migration. The page cache ("<base>/pages.db") is shared by every version.
+
+    Methods
+    -------
+    current(base: str) -> str
+        Returns the directory of the current version.
+    version(base: str) -> Optional[str]
+        Returns the name of the current version, or None while the base directory is current.
+    create(base: str) -> str
+        Copies the current version into a new, unpublished version directory.
+    publish(base: str, path: str) -> None
+        Makes a version directory the current one.
+    discard(path: str) -> None
+        Deletes an unpublished version directory.
+    prune(base: str, keep: int = 2) -> List[str]
+        Deletes all but the most recent versions, never the current one.
+    """
+
+    @staticmethod
+    def current(base: str) -> str:
+        """
+        Returns the directory of the current version.
+
+        Parameters
+        ----------
+        base : str
+            The index directory.
+
+        Returns
+        -------
+        str
+            The published version directory, or base if none was published.
+        """
+        name = IndexVersions.version(base)
+        return os.path.join(base, VERSIONS_NAME, name) if name is not None else base
+
+    @staticmethod
+    def version(base: str) -> Optional[str]:
+        """
+        Returns the name of the current version.
+
+        Parameters
+        ----------
+        base : str
+            The index directory.
+
+        Returns
+        -------
+        Optional[str]
+            The name of the published version, or None while the base directory is current.
+        """
+        try:
+            with open(os.path.join(base, CURRENT_NAME), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def create(base: str) -> str:
+        """
+        Copies the current version into a new, unpublished version directory, hard-linking the files in
+        LINKED_NAMES (or copying them on a file system without hard links).
+
+        Nothing must write to the current version during the copy.
+
+        Parameters
+        ----------
+        base : str
+            The index directory.
+
+        Returns
+        -------
+        str
+            The new version directory, numbered after every existing version. It is empty if there is no current
+            version yet.
+        """
+        source = IndexVersions.current(base)
+        copy = os.path.isdir(source)
+        versions = os.path.join(base, VERSIONS_NAME)
+        os.makedirs(versions, exist_ok=True)
+        path = os.path.join(versions, f"{max(IndexVersions._numbers(base), default=0) + 1:06d}")
+        if not copy:
+            os.makedirs(path)
+        else:
+            ignore = lambda directory, names: [name for name in names if name.startswith(SHARED_NAMES)] if directory == base else []
+            shutil.copytree(source, path, ignore=ignore, copy_function=IndexVersions._link_or_copy)
+        return path
+
+    @staticmethod
+    def publish(base: str, path: str) -> None:
+        """
+        Makes a version directory the current one.
+
+        Parameters
+        ----------
+        base : str
+            The index directory.
+        path : str
+            A directory returned by `create`.
+        """
+        temporary_path = os.path.join(base, CURRENT_NAME + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, os.path.join(base, CURRENT_NAME))
+
+    @staticmethod
+    def discard(path: str) -> None:
+        """
+        Deletes an unpublished version directory.
+
+        Parameters
+        ----------
+        path : str
+            A directory returned by `create`.
+        """
+        shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def prune(base: str, keep: int = 2) -> List[str]:
+        """
+        Deletes all but the most recent versions, never the current one.
+
+        Keeping the previous version lets queries that started before the last publish finish on it.
+
+        Parameters
+        ----------
+        base : str
+            The index directory.
+        keep : int, optional
+            The number of most recent versions to keep (default is 2).
+
+        Returns
+        -------
+        List[str]
+            The deleted version directories.
+        """
+        current = IndexVersions.version(base)
+        deleted = []
+        for number in sorted(IndexVersions._numbers(base))[:-keep or None]:
+            name = f"{number:06d}"
+            if name != current:
+                path = os.path.join(base, VERSIONS_NAME, name)
+                shutil.rmtree(path, ignore_errors=True)
+                deleted.append(path)
+        if deleted:
+            logger.info("Pruned %d index version(s) of %s", len(deleted), base)
+        return deleted
+
+    @staticmethod
+    def _link_or_copy(source: str, destination: str) -> None:
+        if os.path.basename(source) in LINKED_NAMES:
+            try:
+                os.link(source, destination)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, destination)
+
+    @staticmethod
+    def _numbers(base: str) -> List[int]:
+        try:
+            names = os.listdir(os.path.join(base, VERSIONS_NAME))
+        except FileNotFoundError:
+            return []
+        return [int(name) for name in names if name.isdigit()]
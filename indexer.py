@@ -1,28 +1,78 @@
+from clients import ClientRegistry, default_registry
 from langchain_core.documents.base import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from typing import List, Optional
+from vector_store import BACKENDS, NumpyVectorStore
+from langchain_core.vectorstores import VectorStore
+from langchain_core.embeddings import Embeddings
+from typing import Dict, List, NamedTuple, Optional
+from hashing import chunk_id, content_hash
+from bm25 import BM25Index
+from chroma_store import ChromaVectorStore
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class UpsertPlan(NamedTuple):
+    """
+    The changes needed to synchronize the chunks of some URLs with the database.
+
+    Attributes
+    ----------
+    new_documents : List[Document]
+        The chunks to add, with their "chunk_id" metadata set.
+    stale_ids : List[str]
+        The IDs of the stored chunks to delete.
+    summary : Dict[str, int]
+        The number of chunks "added", "updated", "skipped" and "deleted".
+    """
+    new_documents: List[Document]
+    stale_ids: List[str]
+    summary: Dict[str, int]
 
 class Indexer:
     """
-    A class used for creating and managing a Chroma vector database using documents and embeddings.
+    A class used for creating and managing a vector database using documents and embeddings.
+
+    The database is a Chroma database or, with backend="numpy", a `NumpyVectorStore`; every method accepts either.
 
     Methods
     -------
-    create_new_db(documents: List[Document], embedding_model: str = "text-embedding-3-small", persist_directory: str = "./vector_db") -> Chroma
-        Creates a new Chroma vector database from the provided documents.
+    create_new_db(documents: List[Document], embedding_model: str = "text-embedding-3-small", persist_directory: str = "./vector_db", embedding_cache_path: Optional[str] = None, backend: str = "chroma") -> VectorStore
+        Creates a new vector database from the provided documents.
         
-    add_documents_to_db(documents: List[Document], vector_db: Optional[Chroma] = None, path: Optional[str] = None) -> Chroma
-        Adds documents to an existing Chroma vector database.
+    add_documents_to_db(documents: List[Document], vector_db: Optional[VectorStore] = None, path: Optional[str] = None, upsert: bool = True, bm25_index: Optional[BM25Index] = None) -> VectorStore
+        Adds documents to an existing vector database.
+
+    upsert_documents(documents: List[Document], vector_db: VectorStore, bm25_index: Optional[BM25Index] = None, batch_size: int = 256) -> Dict[str, int]
+        Synchronizes the chunks of the documents' source URLs with the database and returns a summary of the changes.
+
+    plan_upsert(documents: List[Document], vector_db: VectorStore) -> UpsertPlan
+        Compares the chunks of the documents' source URLs with the database without changing it.
         
-    load_db(path: str, embedding_model: str = "text-embedding-3-small") -> Chroma
-        Loads a Chroma vector database from the specified path.
+    load_db(path: str, embedding_model: str = "text-embedding-3-small", embedding_cache_path: Optional[str] = None, clients: Optional[ClientRegistry] = None, backend: str = "chroma", quantization: Optional[str] = None, search_dimensions: Optional[int] = None) -> VectorStore
+        Loads a vector database from the specified path.
+
+    get_documents(vector_db: VectorStore, ids: List[str]) -> List[Document]
+        Returns the stored chunks with the given IDs.
+
+    load_bm25_index(vector_db: VectorStore, path: str) -> BM25Index
+        Loads the lexical index of the database, rebuilding it if it is missing or out of date.
+
+    get_embeddings(embedding_model: str = "text-embedding-3-small", embedding_cache_path: Optional[str] = None, clients: Optional[ClientRegistry] = None) -> Embeddings
+        Returns the shared embedding function for the specified model, optionally backed by a persistent cache.
     """
 
     @staticmethod
-    def create_new_db(documents: List[Document], embedding_model: str = "text-embedding-3-small", persist_directory: str = "./vector_db") -> Chroma:
+    def create_new_db(
+            documents: List[Document], 
+            embedding_model: str = "text-embedding-3-small", 
+            persist_directory: str = "./vector_db", 
+            embedding_cache_path: Optional[str] = None,
+            backend: str = "chroma"
+        ) -> VectorStore:
         """
-        Creates a new Chroma vector database from the provided documents.
+        Creates a new vector database from the provided documents.
 
         Parameters
         ----------
@@ -32,39 +82,50 @@ class Indexer:
             The name of the embedding model to use (default is "text-embedding-3-small").
         persist_directory : str, optional
             The directory to save the persisted vector database (default is "./vector_db").
+        embedding_cache_path : Optional[str], optional
+            The path of the embedding cache, None disables caching (default is None).
+        backend : str, optional
+            The vector store implementation, see `load_db` (default is "chroma").
 
         Returns
         -------
-        Chroma
-            The created Chroma vector database.
-        """
-        embeddings = OpenAIEmbeddings(model=embedding_model)
-        vector_db = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            persist_directory=persist_directory if persist_directory is not None else None,
-        )
+        VectorStore
+            The created vector database.
+        """
+        vector_db = Indexer.load_db(persist_directory, embedding_model, embedding_cache_path, backend=backend)
+        Indexer.upsert_documents(documents, vector_db)
         
         return vector_db
     
     @staticmethod
-    def add_documents_to_db(documents: List[Document], vector_db: Optional[Chroma] = None, path: Optional[str] = None) -> Chroma:
+    def add_documents_to_db(
+            documents: List[Document], 
+            vector_db: Optional[VectorStore] = None, 
+            path: Optional[str] = None, 
+            upsert: bool = True, 
+            bm25_index: Optional[BM25Index] = None
+        ) -> VectorStore:
         """
-        Adds documents to an existing Chroma vector database.
+        Adds documents to an existing vector database.
 
         Parameters
         ----------
         documents : List[Document]
             A list of Document objects to be added.
-        vector_db : Optional[Chroma], optional
-            An existing Chroma vector database instance (default is None).
+        vector_db : Optional[VectorStore], optional
+            An existing vector database instance (default is None).
         path : Optional[str], optional
-            The path to load the Chroma vector database from if vector_db is not provided (default is None).
+            The path to load a Chroma vector database from if vector_db is not provided (default is None).
+        upsert : bool, optional
+            Whether to deduplicate against the chunks already stored for the same URLs (see `upsert_documents`)
+            instead of adding every document blindly (default is True).
+        bm25_index : Optional[BM25Index], optional
+            A lexical index of the same chunks, kept in sync with the database when upserting (default is None).
 
         Returns
         -------
-        Chroma
-            The updated Chroma vector database with the new documents added.
+        VectorStore
+            The updated vector database with the new documents added.
 
         Raises
         ------
@@ -76,13 +137,118 @@ class Indexer:
         elif vector_db is None and path is None:
             raise ValueError("Either vector_db or path must be provided")
         
-        vector_db.add_documents(documents)
+        if upsert:
+            Indexer.upsert_documents(documents, vector_db, bm25_index=bm25_index)
+        else:
+            vector_db.add_documents(documents)
         return vector_db
+
+    @staticmethod
+    def upsert_documents(
+            documents: List[Document], 
+            vector_db: VectorStore, 
+            bm25_index: Optional[BM25Index] = None, 
+            batch_size: int = 256
+        ) -> Dict[str, int]:
+        """
+        Synchronizes the chunks of the documents' source URLs with the database and returns a summary of the changes.
+
+        Every chunk gets a stable ID derived from its source URL, start index and content hash. The documents are
+        treated as the complete, freshly fetched set of chunks for each of their source URLs: chunks already stored
+        under the same ID are skipped, new chunks are added, and stored chunks of those URLs that no longer exist
+        are deleted. A new chunk that takes the place (same URL and start index) of a deleted one counts as updated.
+        URLs that do not appear in the documents are left untouched.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The chunks to synchronize. Their metadata is extended with "chunk_id" and "content_hash".
+        vector_db : VectorStore
+            The vector database to update.
+        bm25_index : Optional[BM25Index], optional
+            A lexical index of the same chunks, kept in sync with the database (default is None).
+        batch_size : int, optional
+            The number of chunks embedded and written per call, so a large ingest never holds every vector in
+            memory at once (default is 256).
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+        """
+        plan = Indexer.plan_upsert(documents, vector_db)
+        if plan.stale_ids:
+            vector_db.delete(ids=plan.stale_ids)
+        for start in range(0, len(plan.new_documents), batch_size):
+            batch = plan.new_documents[start:start + batch_size]
+            vector_db.add_documents(batch, ids=[document.metadata["chunk_id"] for document in batch])
+        if bm25_index is not None:
+            bm25_index.remove(plan.stale_ids)
+            bm25_index.add(plan.new_documents)
+
+        logger.info("Upserted %d chunk(s): %s", len(documents), plan.summary)
+        return plan.summary
+
+    @staticmethod
+    def plan_upsert(documents: List[Document], vector_db: VectorStore) -> UpsertPlan:
+        """
+        Compares the chunks of the documents' source URLs with the database without changing it.
+
+        Parameters
+        ----------
+        documents : List[Document]
+            The freshly loaded chunks of one or more URLs. Their metadata is extended with "chunk_id" and
+            "content_hash".
+        vector_db : VectorStore
+            The vector database to compare with.
+
+        Returns
+        -------
+        UpsertPlan
+            The chunks to add, the stored chunk IDs to delete and the summary of the changes, see `upsert_documents`.
+        """
+        incoming: Dict[str, Document] = {}
+        for document in documents:
+            document.metadata["content_hash"] = content_hash(document.page_content)
+            document.metadata["chunk_id"] = chunk_id(document)
+            incoming.setdefault(document.metadata["chunk_id"], document)
+
+        sources = list({document.metadata.get("source", "") for document in incoming.values()})
+        stored = vector_db.get(where={"source": {"$in": sources}}, include=["metadatas"]) if sources else {"ids": [], "metadatas": []}
+        stored_positions = {
+            id_: (metadata.get("source", ""), metadata.get("start_index", 0))
+            for id_, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+
+        new_ids = [id_ for id_ in incoming if id_ not in stored_positions]
+        stale_ids = [id_ for id_ in stored_positions if id_ not in incoming]
+        stale_positions = {stored_positions[id_] for id_ in stale_ids}
+        updated = sum(
+            (incoming[id_].metadata.get("source", ""), incoming[id_].metadata.get("start_index", 0)) in stale_positions
+            for id_ in new_ids
+        )
+
+        summary = {
+            "added": len(new_ids) - updated,
+            "updated": updated,
+            "skipped": len(incoming) - len(new_ids),
+            "deleted": len(stale_ids) - updated,
+        }
+        return UpsertPlan(new_documents=[incoming[id_] for id_ in new_ids], stale_ids=stale_ids, summary=summary)
     
     @staticmethod
-    def load_db(path: str, embedding_model: str = "text-embedding-3-small") -> Chroma:
+    def load_db(
+            path: str, 
+            embedding_model: str = "text-embedding-3-small", 
+            embedding_cache_path: Optional[str] = None, 
+            clients: Optional[ClientRegistry] = None,
+            backend: str = "chroma",
+            quantization: Optional[str] = None,
+            search_dimensions: Optional[int] = None,
+            read_only: bool = False
+        ) -> VectorStore:
         """
-        Loads a Chroma vector database from the specified path.
+        Loads a vector database from the specified path.
 
         Parameters
         ----------
@@ -90,10 +256,131 @@ class Indexer:
             The directory to load the persisted vector database from.
         embedding_model : str, optional
             The name of the embedding model to use (default is "text-embedding-3-small").
+        embedding_cache_path : Optional[str], optional
+            The path of the embedding cache, None disables caching (default is None).
+        clients : Optional[ClientRegistry], optional
+            The registry the embedding client is taken from (default is None, meaning the default registry).
+        backend : str, optional
+            The vector store implementation (default is "chroma"): "chroma" opens a Chroma database, "numpy" a
+            `NumpyVectorStore`, which memory-maps the embeddings and searches them with in-process matrix products.
+        quantization : Optional[str], optional
+            With the "numpy" backend, scan "float16" or "int8" codes of the embeddings and rescore a shortlist at
+            full precision, see `NumpyVectorStore` (default is None, meaning the full-precision embeddings are scanned).
+        search_dimensions : Optional[int], optional
+            With a quantization, the number of leading dimensions the codes keep (default is None, meaning all).
+        read_only : bool, optional
+            With the "numpy" backend, open an existing database without ever writing to it, e.g. from the worker
+            processes of `serve.WorkerPool` (default is False).
+
+        Returns
+        -------
+        VectorStore
+            The loaded vector database. An empty one is created if nothing is persisted at the path yet, unless
+            it is opened read-only.
+
+        Raises
+        ------
+        ValueError
+            If the backend is unknown, or a quantization or read-only access is requested from Chroma.
+        FileNotFoundError
+            If a database opened read-only does not exist.
+        """
+        embeddings = Indexer.get_embeddings(embedding_model, embedding_cache_path, clients)
+        if backend == "numpy":
+            return NumpyVectorStore(path, embeddings, quantization=quantization, search_dimensions=search_dimensions, read_only=read_only)
+        if quantization is not None or search_dimensions is not None:
+            raise ValueError(f"Quantized storage needs the numpy backend, not {backend!r}")
+        if read_only:
+            raise ValueError(f"Read-only access needs the numpy backend, not {backend!r}")
+        if backend == "chroma":
+            return ChromaVectorStore(persist_directory=path, embedding_function=embeddings)
+        raise ValueError(f"Unknown vector store backend {backend!r}, expected one of {BACKENDS}")
+
+    @staticmethod
+    def get_documents(vector_db: VectorStore, ids: List[str]) -> List[Document]:
+        """
+        Returns the stored chunks with the given IDs.
+
+        Parameters
+        ----------
+        vector_db : VectorStore
+            The vector database to read from.
+        ids : List[str]
+            The chunk IDs to read.
+
+        Returns
+        -------
+        List[Document]
+            The chunks, in the order of the IDs. IDs that are not stored are left out.
+        """
+        if not ids:
+            return []
+        
+        stored = vector_db.get(ids=list(dict.fromkeys(ids)), include=["documents", "metadatas"])
+        documents = {
+            id_: Document(page_content=page_content, metadata=metadata or {})
+            for id_, page_content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        return [documents[id_] for id_ in ids if id_ in documents]
+
+    @staticmethod
+    def load_bm25_index(vector_db: VectorStore, path: str, save: bool = True) -> BM25Index:
+        """
+        Loads the lexical index of the database, rebuilding it if it is missing or out of date.
+
+        Parameters
+        ----------
+        vector_db : VectorStore
+            The vector database the index mirrors.
+        path : str
+            The path of the index file.
+        save : bool, optional
+            Whether to write a rebuilt index to the path; a read-only database keeps it in memory only
+            (default is True).
+
+        Returns
+        -------
+        BM25Index
+            The lexical index, holding the same chunks as the database.
+        """
+        stored_ids = vector_db.get(include=[])["ids"]
+        if os.path.exists(path):
+            bm25_index = BM25Index.load(path)
+            if len(bm25_index) == len(stored_ids) and all(id_ in bm25_index for id_ in stored_ids):
+                return bm25_index
+            logger.info("BM25 index at %s is out of date, rebuilding it", path)
+
+        stored = vector_db.get(include=["documents"])
+        bm25_index = BM25Index.from_documents(
+            Document(page_content=page_content, metadata={"chunk_id": id_}) 
+            for id_, page_content in zip(stored["ids"], stored["documents"])
+        )
+        if save:
+            bm25_index.save(path)
+        return bm25_index
+
+    @staticmethod
+    def get_embeddings(
+            embedding_model: str = "text-embedding-3-small", 
+            embedding_cache_path: Optional[str] = None, 
+            clients: Optional[ClientRegistry] = None
+        ) -> Embeddings:
+        """
+        Returns the shared embedding function for the specified model, optionally backed by a persistent cache.
+
+        Parameters
+        ----------
+        embedding_model : str, optional
+            The name of the embedding model to use (default is "text-embedding-3-small").
+        embedding_cache_path : Optional[str], optional
+            The path of the embedding cache, None disables caching (default is None).
+        clients : Optional[ClientRegistry], optional
+            The registry the client is taken from (default is None, meaning the process-wide default registry).
 
         Returns
         -------
-        Chroma
-            The loaded Chroma vector database.
+        Embeddings
+            The embedding function. When a cache path is given, only texts that are not cached are sent to OpenAI.
         """
-        return Chroma(persist_directory=path, embedding_function=OpenAIEmbeddings(model=embedding_model))
+        clients = clients if clients is not None else default_registry()
+        return clients.embeddings(embedding_model, embedding_cache_path)
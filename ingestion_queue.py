@@ -0,0 +1,336 @@
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+from collections import OrderedDict, deque
+from rag import RAG
+import threading
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJob:
+    """
+    The status and progress of a batch of URLs submitted to an `IngestionQueue`.
+
+    Attributes
+    ----------
+    job_id : str
+        The ID of the job.
+    urls : List[str]
+        The URLs ingested by the job.
+    duplicates : List[str]
+        The submitted URLs left out because another job had already queued them.
+    refresh : bool
+        Whether the job refreshes the URLs with `RAG.refresh`, re-indexing only the pages that changed.
+    status : str
+        "queued", "running", "done", "failed" or "cancelled".
+    progress : Dict[str, int]
+        The latest pipeline counters of the running ingest, see `IngestionPipeline.stats`.
+    summary : Optional[Dict[str, int]]
+        The number of chunks "added", "updated", "skipped" and "deleted", once the job is done.
+    error : Optional[str]
+        The error that failed the job.
+    """
+
+    def __init__(self, job_id: str, urls: List[str], duplicates: List[str], refresh: bool = False) -> None:
+        self.job_id: str = job_id
+        self.urls: List[str] = urls
+        self.duplicates: List[str] = duplicates
+        self.refresh: bool = refresh
+        self.status: str = "queued"
+        self.progress: Dict[str, int] = {}
+        self.summary: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+        self.created_at: float = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the job as a JSON-serializable dict.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The job ID, URLs, duplicates, kind, status, progress, summary, error and timestamps.
+        """
+        return {
+            "job_id": self.job_id,
+            "urls": list(self.urls),
+            "duplicates": list(self.duplicates),
+            "refresh": self.refresh,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "summary": dict(self.summary) if self.summary is not None else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueue:
+    """
+    A background worker ingesting submitted URLs into a RAG, one job at a time, so request handlers return at once.
+
+    Jobs run `RAG.add_documents_isolated`: each is ingested into a new version of the index that is swapped in
+    when complete, so queries keep running on the last consistent index meanwhile. URLs already queued or being
+    ingested are left out of new submissions. Finished jobs are kept for status reporting, up to `history`.
+    Refresh jobs, submitted by hand or on a schedule, re-fetch the URLs conditionally and re-index only the pages
+    whose content changed.
+
+    Methods
+    -------
+    submit(urls: Union[str, List[str]], on_done: Optional[Callable[[IngestionJob], None]] = None, refresh: bool = False) -> Optional[IngestionJob]
+        Queues the URLs that are not already queued or being ingested.
+    schedule_refresh(interval: float, urls: Optional[List[str]] = None) -> None
+        Submits a refresh job every interval seconds.
+    job(job_id: str) -> Optional[IngestionJob]
+        Returns a job by ID.
+    jobs() -> List[IngestionJob]
+        Returns the queued, running and recently finished jobs, oldest first.
+    pending() -> int
+        Returns the number of queued and running jobs.
+    wait(job: Optional[IngestionJob] = None, timeout: Optional[float] = None) -> bool
+        Waits for a job, or for every submitted job, to finish.
+    close(wait: bool = True) -> None
+        Stops the worker, after the queued jobs if wait is True, or cancels them and returns at once.
+    """
+
+    def __init__(self, rag: RAG, history: int = 50) -> None:
+        """
+        Starts the worker.
+
+        Parameters
+        ----------
+        rag : RAG
+            The RAG instance the URLs are added to.
+        history : int, optional
+            The maximum number of finished jobs kept for status reporting (default is 50).
+        """
+        self.rag: RAG = rag
+        self.history: int = history
+        self._condition = threading.Condition()
+        self._queue: Deque[Tuple[IngestionJob, Optional[Callable[[IngestionJob], None]]]] = deque()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._active_urls: Set[str] = set()
+        self._running: Optional[IngestionJob] = None
+        self._closed = False
+        self._stop_refresh = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self._worker = threading.Thread(target=self._run, name="ingestion-queue", daemon=True)
+        self._worker.start()
+
+    def submit(
+            self, 
+            urls: Union[str, List[str]], 
+            on_done: Optional[Callable[[IngestionJob], None]] = None, 
+            refresh: bool = False
+        ) -> Optional[IngestionJob]:
+        """
+        Queues the URLs that are not already queued or being ingested.
+
+        Parameters
+        ----------
+        urls : Union[str, List[str]]
+            A single URL or a list of URLs. Blank entries are ignored.
+        on_done : Optional[Callable[[IngestionJob], None]], optional
+            Called from the worker thread with the job once its ingest is over, whatever its status, before the job
+            counts as finished (default is None).
+        refresh : bool, optional
+            Whether to refresh the URLs, re-indexing only the pages whose content changed since they were last
+            fetched, see `RAG.refresh` (default is False).
+
+        Returns
+        -------
+        Optional[IngestionJob]
+            The queued job, or None if every URL was already queued or being ingested.
+
+        Raises
+        ------
+        RuntimeError
+            If the queue is closed.
+        """
+        urls = [urls] if isinstance(urls, str) else urls
+        urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("IngestionQueue is closed")
+            duplicates = [url for url in urls if url in self._active_urls]
+            urls = [url for url in urls if url not in self._active_urls]
+            if not urls:
+                return None
+            job = IngestionJob(uuid.uuid4().hex, urls, duplicates, refresh=refresh)
+            self._active_urls.update(urls)
+            self._jobs[job.job_id] = job
+            self._queue.append((job, on_done))
+            self._trim()
+            self._condition.notify_all()
+        logger.info(
+            "Queued %s job %s: %d URL(s), %d already queued", 
+            "refresh" if refresh else "ingestion", job.job_id, len(urls), len(duplicates)
+        )
+        return job
+
+    def schedule_refresh(self, interval: float, urls: Optional[List[str]] = None) -> None:
+        """
+        Submits a refresh job every interval seconds, from a background thread, until the queue is closed.
+
+        URLs whose previous refresh is still queued or running are left out, so refreshes never pile up behind a
+        slow one.
+
+        Parameters
+        ----------
+        interval : float
+            The number of seconds between refreshes, the first one included.
+        urls : Optional[List[str]], optional
+            The URLs to refresh (default is None, meaning every source URL in the index at the time of each
+            refresh, see `RAG.sources`).
+
+        Raises
+        ------
+        RuntimeError
+            If a refresh is already scheduled.
+        """
+        if self._refresher is not None:
+            raise RuntimeError("A refresh is already scheduled")
+
+        def refresh() -> None:
+            while not self._stop_refresh.wait(interval):
+                try:
+                    self.submit(urls if urls is not None else self.rag.sources(), refresh=True)
+                except Exception:
+                    logger.exception("Scheduling a refresh failed")
+
+        self._refresher = threading.Thread(target=refresh, name="ingestion-refresh", daemon=True)
+        self._refresher.start()
+
+    def job(self, job_id: str) -> Optional[IngestionJob]:
+        """
+        Returns a job by ID.
+
+        Parameters
+        ----------
+        job_id : str
+            The ID of the job.
+
+        Returns
+        -------
+        Optional[IngestionJob]
+            The job, or None if it is unknown or was dropped from the history.
+        """
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[IngestionJob]:
+        """
+        Returns the queued, running and recently finished jobs, oldest first.
+
+        Returns
+        -------
+        List[IngestionJob]
+            The jobs.
+        """
+        with self._condition:
+            return list(self._jobs.values())
+
+    def pending(self) -> int:
+        """
+        Returns the number of queued and running jobs.
+
+        Returns
+        -------
+        int
+            The number of jobs that have not finished.
+        """
+        with self._condition:
+            return len(self._queue) + (self._running is not None)
+
+    def wait(self, job: Optional[IngestionJob] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for a job, or for every submitted job, to finish.
+
+        Parameters
+        ----------
+        job : Optional[IngestionJob], optional
+            The job to wait for (default is None, meaning every queued and running job).
+        timeout : Optional[float], optional
+            The maximum number of seconds to wait (default is None, meaning no limit).
+
+        Returns
+        -------
+        bool
+            Whether the job, or every job, finished before the timeout.
+        """
+        with self._condition:
+            if job is not None:
+                return self._condition.wait_for(lambda: job.finished, timeout)
+            return self._condition.wait_for(lambda: not self._queue and self._running is None, timeout)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stops the worker.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Whether to ingest the queued jobs first and wait for the worker to stop. Otherwise the queued jobs are
+            cancelled and the method returns at once: the running job finishes in the background, on a RAG that
+            `RAG.close` may already have closed (default is True).
+        """
+        self._stop_refresh.set()
+        with self._condition:
+            self._closed = True
+            if not wait:
+                while self._queue:
+                    job, _ = self._queue.popleft()
+                    job.status, job.finished_at = "cancelled", time.time()
+                    self._active_urls.difference_update(job.urls)
+            self._condition.notify_all()
+        if not wait:
+            return
+        if self._refresher is not None:
+            self._refresher.join()
+        self._worker.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                job, on_done = self._queue.popleft()
+                job.status, job.started_at = "running", time.time()
+                self._running = job
+
+            try:
+                if job.refresh:
+                    job.summary = self.rag.refresh(job.urls, on_progress=job.progress.update)
+                else:
+                    job.summary = self.rag.add_documents_isolated(job.urls, on_progress=job.progress.update)
+                job.status = "done"
+            except Exception as error:
+                logger.exception("Ingestion job %s failed", job.job_id)
+                job.status, job.error = "failed", f"{type(error).__name__}: {error}"
+
+            if on_done is not None:
+                try:
+                    on_done(job)
+                except Exception:
+                    logger.exception("Completion callback of ingestion job %s failed", job.job_id)
+            with self._condition:
+                job.finished_at = time.time()
+                self._running = None
+                self._active_urls.difference_update(job.urls)
+                self._trim()
+                self._condition.notify_all()
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
@@ -0,0 +1,132 @@
+from langchain_core.embeddings import Embeddings
+from bm25 import tokenize
+from typing import List
+import hashlib
+import math
+
+LOCAL_EMBEDDING_MODEL = "local-hashing"
+SENTENCE_TRANSFORMERS_PREFIX = "local:"
+DEFAULT_SENTENCE_TRANSFORMERS_MODEL = SENTENCE_TRANSFORMERS_PREFIX + "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    A local, deterministic embedding model that needs no network or model download.
+
+    Texts are embedded with the hashing trick: every term (case-folded, accent-stripped and without stopwords, see
+    `bm25.tokenize`) adds a signed unit to a dimension chosen by its hash, and the vector is L2-normalized. Texts
+    sharing terms get similar vectors, so it ranks like a lexical model rather than a semantic one: paraphrases
+    and synonyms are missed. It is the offline stand-in of the tests and benchmarks, which need deterministic
+    vectors without a download; `ClientRegistry.embeddings` returns it for LOCAL_EMBEDDING_MODEL. A real local
+    model is `sentence_transformer_embeddings`.
+
+    Methods
+    -------
+    embed_documents(texts: List[str]) -> List[List[float]]
+        Embeds a list of texts.
+    embed_query(text: str) -> List[float]
+        Embeds a single text.
+    embed_queries(texts: List[str]) -> List[List[float]]
+        Embeds several queries, exactly like documents.
+    """
+
+    def __init__(self, dimensions: int = 256) -> None:
+        """
+        Initializes the embedding model.
+
+        Parameters
+        ----------
+        dimensions : int, optional
+            The size of the vectors (default is 256).
+        """
+        self.dimensions: int = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The texts to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One unit vector per text, in order. Texts without any term get the zero vector.
+        """
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single text.
+
+        Parameters
+        ----------
+        text : str
+            The text to embed.
+
+        Returns
+        -------
+        List[float]
+            The unit vector of the text.
+        """
+        return self._embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, exactly like documents.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The queries to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One unit vector per query, in order.
+        """
+        return self.embed_documents(texts)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for term in tokenize(text):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+def sentence_transformer_embeddings(model: str) -> Embeddings:
+    """
+    Returns a local sentence-transformers model, run in process by LangChain's `HuggingFaceEmbeddings`.
+
+    Unlike `HashingEmbeddings` it embeds meaning, so it can stand in for an API model in evaluations and offline
+    deployments. It needs the optional `langchain-huggingface` and `sentence-transformers` packages, and the model
+    is downloaded from the Hugging Face Hub on first use.
+
+    Parameters
+    ----------
+    model : str
+        The name of the model prefixed with SENTENCE_TRANSFORMERS_PREFIX, e.g. DEFAULT_SENTENCE_TRANSFORMERS_MODEL
+        ("local:sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", which covers Portuguese).
+
+    Returns
+    -------
+    Embeddings
+        The model, returning unit vectors.
+
+    Raises
+    ------
+    ImportError
+        If the optional packages are not installed.
+    """
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError as e:
+        raise ImportError(
+            f"The local embedding model {model!r} needs the optional packages: pip install langchain-huggingface sentence-transformers"
+        ) from e
+    return HuggingFaceEmbeddings(model_name=model[len(SENTENCE_TRANSFORMERS_PREFIX):], encode_kwargs={"normalize_embeddings": True})
@@ -0,0 +1,203 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional
+import threading
+import sqlite3
+import os
+
+
+class CachedPage(NamedTuple):
+    """
+    The last fetched version of a page.
+
+    Attributes
+    ----------
+    url : str
+        The URL of the page.
+    html : str
+        The raw HTML of the page.
+    etag : Optional[str]
+        The ETag header the page was served with, sent back as If-None-Match.
+    last_modified : Optional[str]
+        The Last-Modified header the page was served with, sent back as If-Modified-Since.
+    content_hash : str
+        The hash of the text parsed from the page, see `hashing.content_hash`. Pages served again with the same
+        text are unchanged even if their HTML differs, e.g. by a timestamp or an ad slot.
+    fetched_at : float
+        When the HTML was last downloaded, as a UNIX timestamp.
+    checked_at : float
+        When the page was last validated against the server, as a UNIX timestamp.
+    """
+    url: str
+    html: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    fetched_at: float
+    checked_at: float
+
+
+class PageCache:
+    """
+    A persistent cache of fetched pages backed by SQLite, keyed by URL.
+
+    It keeps the raw HTML of every page with its validators (ETag, Last-Modified) and the hash of its text, so a
+    refresh can send conditional requests, reuse the cached HTML when the server answers 304 Not Modified, and
+    tell pages whose content changed from pages that were only served again.
+
+    Methods
+    -------
+    get(url: str) -> Optional[CachedPage]
+        Returns the cached version of a page, if any.
+    put(pages: List[CachedPage]) -> int
+        Stores pages, replacing their previous versions.
+    remove(urls: List[str]) -> int
+        Removes pages from the cache.
+    urls() -> List[str]
+        Returns the cached URLs, in order of first caching.
+    conditional_headers(page: Optional[CachedPage]) -> Dict[str, str]
+        Returns the headers of a conditional request for a cached page.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens the cache, creating the SQLite file if needed.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite file.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path: str = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, html TEXT NOT NULL, etag TEXT, "
+            "last_modified TEXT, content_hash TEXT NOT NULL, fetched_at REAL NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.urls())
+
+    def __enter__(self) -> "PageCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Returns the cached version of a page, if any.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page.
+
+        Returns
+        -------
+        Optional[CachedPage]
+            The cached page, or None if the URL was never cached.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, html, etag, last_modified, content_hash, fetched_at, checked_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return CachedPage(*row) if row else None
+
+    def put(self, pages: List[CachedPage]) -> int:
+        """
+        Stores pages, replacing their previous versions, in one transaction.
+
+        Parameters
+        ----------
+        pages : List[CachedPage]
+            The pages to store.
+
+        Returns
+        -------
+        int
+            The number of pages stored.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO pages (url, html, etag, last_modified, content_hash, fetched_at, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET html = excluded.html, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, content_hash = excluded.content_hash, "
+                "fetched_at = excluded.fetched_at, checked_at = excluded.checked_at",
+                [tuple(page) for page in pages]
+            )
+        return len(pages)
+
+    def remove(self, urls: List[str]) -> int:
+        """
+        Removes pages from the cache, so they are downloaded in full the next time.
+
+        Parameters
+        ----------
+        urls : List[str]
+            The URLs of the pages.
+
+        Returns
+        -------
+        int
+            The number of pages removed.
+        """
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany("DELETE FROM pages WHERE url = ?", [(url,) for url in urls])
+            return self._connection.total_changes - before
+
+    def urls(self) -> List[str]:
+        """
+        Returns the cached URLs.
+
+        Returns
+        -------
+        List[str]
+            The URLs, in order of first caching.
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT url FROM pages ORDER BY seq").fetchall()
+        return [url for url, in rows]
+
+    def close(self) -> None:
+        """
+        Closes the SQLite connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def conditional_headers(page: Optional[CachedPage]) -> Dict[str, str]:
+        """
+        Returns the headers of a conditional request for a cached page.
+
+        Parameters
+        ----------
+        page : Optional[CachedPage]
+            The cached page, or None.
+
+        Returns
+        -------
+        Dict[str, str]
+            If-None-Match and If-Modified-Since headers for the validators the page was served with; empty if
+            there is no cached page or it was served without validators.
+        """
+        headers: Dict[str, str] = {}
+        if page is not None and page.etag:
+            headers["If-None-Match"] = page.etag
+        if page is not None and page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+        return headers
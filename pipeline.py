@@ -0,0 +1,404 @@
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents.base import Document
+from langchain_core.vectorstores import VectorStore
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from cleaning import NearDuplicateFilter
+from page_cache import CachedPage, PageCache
+from indexer import Indexer
+from loader import Chunker
+from fetcher import Fetcher
+from tracing import Tracer
+from bm25 import BM25Index
+import contextvars
+import threading
+import logging
+import random
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class IngestionPipeline:
+    """
+    A streaming ingestion pipeline: fetch -> chunk -> embed -> write, with a bounded queue between stages.
+
+    Pages are reduced to their main content as they are parsed, and chunks that nearly repeat a chunk seen
+    earlier in the same run (e.g. teasers shared by several tag pages) are dropped before anything is embedded.
+    Pages are then chunked in input order rather than as they arrive, so which of two near-duplicate chunks is kept
+    only depends on the order of the URLs.
+    With a page cache, pages are requested conditionally and, with `changed_only`, pages whose text did not change
+    since they were cached are not chunked or planned at all; the fetched versions are left in `pages` for the
+    caller to store in the cache once the run succeeded.
+
+    Each stage runs in its own thread and blocks when the next stage falls behind, so memory stays bounded by the
+    queue sizes instead of growing with the size of the ingest. Chunks are deduplicated against the database as in
+    `Indexer.upsert_documents`, so only new or changed chunks are embedded. Embedding requests are batched by token
+    count, run concurrently up to a limit, and retried with exponential backoff (honouring Retry-After) when the
+    provider answers 429. Vectors are written to the database batch by batch as they arrive; chunks that disappeared from
+    a URL are deleted once all new chunks are written. With `open_target`, changes are planned against `vector_db`
+    but written to a database opened only once there is something to write, e.g. a new index version.
+
+    Methods
+    -------
+    run(urls: Union[str, List[str]]) -> Dict[str, int]
+        Ingests the URLs and returns the number of chunks "added", "updated", "skipped" and "deleted".
+    """
+
+    def __init__(
+            self,
+            vector_db: VectorStore,
+            bm25_index: Optional[BM25Index] = None,
+            chunk_model_name: str = "gpt-3.5-turbo",
+            chunk_size: int = 500,
+            chunk_overlap: int = 50,
+            chunk_engine: str = "recursive",
+            fetch_workers: int = 8,
+            requests_per_second_per_host: Optional[float] = 2.0,
+            timeout: float = 15.0,
+            embedding_model: str = "text-embedding-3-small",
+            batch_tokens: int = 8_000,
+            batch_size: int = 256,
+            max_concurrency: int = 4,
+            max_retries: int = 6,
+            backoff: float = 1.0,
+            max_backoff: float = 60.0,
+            queue_size: int = 64,
+            clean: bool = True,
+            deduplicate: bool = True,
+            duplicate_threshold: float = 0.8,
+            page_cache: Optional[PageCache] = None,
+            changed_only: bool = False,
+            tracer: Optional[Tracer] = None,
+            on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+            open_target: Optional[Callable[[], Tuple[VectorStore, Optional[BM25Index]]]] = None
+        ) -> None:
+        """
+        Initializes the pipeline.
+
+        Parameters
+        ----------
+        vector_db : VectorStore
+            The database to write to, a `vector_store.VectorIndex`, or only to compare with when there is an
+            open_target. Its embedding function
+            is used to embed the chunks.
+        bm25_index : Optional[BM25Index], optional
+            A lexical index of the same chunks, kept in sync with the database (default is None).
+        chunk_model_name : str, optional
+            The model whose tokenizer is used for chunking (default is "gpt-3.5-turbo").
+        chunk_size : int, optional
+            The maximum number of tokens per chunk (default is 500).
+        chunk_overlap : int, optional
+            The number of tokens overlapping between chunks (default is 50).
+        chunk_engine : str, optional
+            The chunking engine, see `Chunker` (default is "recursive").
+        fetch_workers : int, optional
+            The maximum number of pages fetched at the same time (default is 8).
+        requests_per_second_per_host : Optional[float], optional
+            The maximum request rate towards a single host, None disables the limit (default is 2.0).
+        timeout : float, optional
+            The timeout in seconds applied to each page request (default is 15.0).
+        embedding_model : str, optional
+            The embedding model, whose tokenizer is used to size the batches (default is "text-embedding-3-small").
+        batch_tokens : int, optional
+            The maximum number of tokens sent in one embedding request (default is 8_000).
+        batch_size : int, optional
+            The maximum number of chunks sent in one embedding request (default is 256).
+        max_concurrency : int, optional
+            The maximum number of embedding requests in flight (default is 4).
+        max_retries : int, optional
+            The number of times a rate-limited embedding request is retried before giving up (default is 6).
+        backoff : float, optional
+            The delay in seconds before the first retry, doubled on every further retry (default is 1.0).
+        max_backoff : float, optional
+            The maximum delay in seconds between retries (default is 60.0).
+        queue_size : int, optional
+            The capacity of each queue between stages (default is 64).
+        clean : bool, optional
+            Whether to drop navigation, cookie banners, related articles and footers from pages, see
+            `Fetcher.parse` (default is True).
+        deduplicate : bool, optional
+            Whether to drop chunks that nearly repeat a chunk seen earlier in the run, see `NearDuplicateFilter`
+            (default is True).
+        duplicate_threshold : float, optional
+            The estimated Jaccard similarity from which a chunk is a near-duplicate (default is 0.8).
+        page_cache : Optional[PageCache], optional
+            The cache pages are validated against with conditional requests, see `Fetcher`. It is only read
+            (default is None).
+        changed_only : bool, optional
+            Whether to leave out pages whose text did not change since they were cached, so their chunks are
+            neither re-chunked nor compared with the database (default is False).
+        tracer : Optional[Tracer], optional
+            Where the latency of the fetch, chunk, plan, embed and write stages and the page, chunk, embedding
+            token and retry counts are recorded (default is None).
+        on_progress : Optional[Callable[[Dict[str, int]], None]], optional
+            Called with a copy of `stats` whenever a page is fetched or fails and whenever chunks are planned,
+            embedded or written, e.g. to report the progress of a background ingest (default is None).
+        open_target : Optional[Callable[[], Tuple[VectorStore, Optional[BM25Index]]]], optional
+            Called before the first write to open the database and BM25 index to write to instead, holding the same
+            chunks as vector_db, e.g. a copy of it; it is not called if nothing changes (default is None, meaning
+            vector_db and bm25_index are written to).
+        """
+        self.vector_db: VectorStore = vector_db
+        self.bm25_index: Optional[BM25Index] = bm25_index
+        self.chunk_model_name: str = chunk_model_name
+        self.chunk_size: int = chunk_size
+        self.chunk_overlap: int = chunk_overlap
+        self.chunk_engine: str = chunk_engine
+        self.fetch_workers: int = fetch_workers
+        self.requests_per_second_per_host: Optional[float] = requests_per_second_per_host
+        self.timeout: float = timeout
+        self.embedding_model: str = embedding_model
+        self.batch_tokens: int = batch_tokens
+        self.batch_size: int = batch_size
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.max_retries: int = max_retries
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.queue_size: int = queue_size
+        self.clean: bool = clean
+        self.deduplicate: bool = deduplicate
+        self.duplicate_threshold: float = duplicate_threshold
+        self.page_cache: Optional[PageCache] = page_cache
+        self.changed_only: bool = changed_only
+        self.tracer: Tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.on_progress: Optional[Callable[[Dict[str, int]], None]] = on_progress
+        self.open_target: Optional[Callable[[], Tuple[VectorStore, Optional[BM25Index]]]] = open_target
+        self.target: Optional[Tuple[VectorStore, Optional[BM25Index]]] = None
+        self.stats: Dict[str, int] = {}
+        self.pages: List[CachedPage] = []
+
+    def run(self, urls: Union[str, List[str]]) -> Dict[str, int]:
+        """
+        Ingests the URLs and returns the number of chunks "added", "updated", "skipped" and "deleted".
+
+        URLs that cannot be fetched are logged and skipped. Pipeline counters (pages, batches, retries, ...) are
+        available in `stats` afterwards, including the text dropped by cleaning: "boilerplate_chars" left out of
+        pages, and "duplicate_chunks" and "duplicate_chars" of the near-duplicate chunks, and the outcome of
+        conditional requests: "not_modified" pages answered 304 and "unchanged_pages" left out by `changed_only`.
+        The fetched versions of the pages are left in `pages`, and the database and BM25 index written to in
+        `target` (None if nothing was written).
+
+        Parameters
+        ----------
+        urls : Union[str, List[str]]
+            A single URL or a list of URLs to ingest.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+
+        Raises
+        ------
+        Exception
+            The first error raised by a stage, e.g. an embedding request still rate limited after max_retries.
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        self.stats = {
+            "pages": 0, "failed_pages": 0, "chunks": 0, "embedded": 0, "batches": 0, "retries": 0, "written": 0,
+            "boilerplate_chars": 0, "duplicate_chunks": 0, "duplicate_chars": 0, "not_modified": 0, "unchanged_pages": 0
+        }
+        self.pages = []
+        self._duplicates = NearDuplicateFilter(self.duplicate_threshold) if self.deduplicate else None
+        self._summary = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+        self._stale_ids: List[str] = []
+        self.target = None
+        self._lock = threading.Lock()
+        self._target_lock = threading.Lock()
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+
+        pages: queue.Queue = queue.Queue(self.queue_size)
+        chunks: queue.Queue = queue.Queue(self.queue_size)
+        vectors: queue.Queue = queue.Queue(self.queue_size)
+        stages = [
+            threading.Thread(target=contextvars.copy_context().run, args=(self._stage, self._fetch, urls, pages), name="ingest-fetch"),
+            threading.Thread(target=contextvars.copy_context().run, args=(self._stage, self._chunk, pages, chunks), name="ingest-chunk"),
+            threading.Thread(target=contextvars.copy_context().run, args=(self._stage, self._embed, chunks, vectors), name="ingest-embed"),
+            threading.Thread(target=contextvars.copy_context().run, args=(self._stage, self._write, vectors, None), name="ingest-write"),
+        ]
+        start = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+        if self._errors:
+            raise self._errors[0]
+
+        if self._stale_ids:
+            vector_db, bm25_index = self._target()
+            vector_db.delete(ids=self._stale_ids)
+            if bm25_index is not None:
+                bm25_index.remove(self._stale_ids)
+
+        logger.info("Ingested %d URL(s) in %.1fs: %s, %s", len(urls), time.perf_counter() - start, self._summary, self.stats)
+        return dict(self._summary)
+
+    def _stage(self, target: Callable[[Any, Optional[queue.Queue]], None], source: Any, sink: Optional[queue.Queue]) -> None:
+        try:
+            target(source, sink)
+        except BaseException as error:
+            self._errors.append(error)
+            self._abort.set()
+        finally:
+            if sink is not None:
+                self._put(sink, _DONE, force=True)
+
+    def _put(self, sink: queue.Queue, item: Any, force: bool = False) -> None:
+        while not self._abort.is_set() or force:
+            try:
+                sink.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if force and self._abort.is_set():
+                    return
+        raise RuntimeError("ingestion aborted")
+
+    def _get(self, source: queue.Queue) -> Any:
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if self._abort.is_set():
+                    return _DONE
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[counter] += amount
+            stats = dict(self.stats)
+        self.tracer.count(f"ingest.{counter}", amount)
+        if self.on_progress is not None:
+            self.on_progress(stats)
+
+    def _target(self) -> Tuple[VectorStore, Optional[BM25Index]]:
+        with self._target_lock:
+            if self.target is None:
+                self.target = self.open_target() if self.open_target is not None else (self.vector_db, self.bm25_index)
+            return self.target
+
+    def _fetch(self, urls: List[str], sink: queue.Queue) -> None:
+        fetcher = Fetcher(
+            max_workers=self.fetch_workers, 
+            requests_per_second_per_host=self.requests_per_second_per_host, 
+            timeout=self.timeout, 
+            tracer=self.tracer,
+            clean=self.clean,
+            page_cache=self.page_cache,
+            skip_unchanged=self.changed_only
+        )
+        with fetcher:
+            # near-duplicates are dropped in favour of the earlier page, so pages are chunked in input order
+            for url, outcome in fetcher.iter_fetch(urls, ordered=self._duplicates is not None):
+                for counter in ("boilerplate_chars", "not_modified"):
+                    if getattr(fetcher, counter) > self.stats[counter]:
+                        self._count(counter, getattr(fetcher, counter) - self.stats[counter])
+                if isinstance(outcome, Document):
+                    self._count("pages")
+                    self._put(sink, outcome)
+                elif outcome is None:
+                    self._count("unchanged_pages")
+                else:
+                    self._count("failed_pages")
+                    logger.warning("Failed to load %s: %s", url, outcome)
+        self.pages = list(fetcher.pages)
+
+    def _chunk(self, source: queue.Queue, sink: queue.Queue) -> None:
+        while (page := self._get(source)) is not _DONE:
+            with self.tracer.time("ingest.chunk"):
+                documents = Chunker.chunk(
+                    [page],
+                    model_name=self.chunk_model_name,
+                    chunk_size=self.chunk_size,
+                    chunk_overlap=self.chunk_overlap,
+                    engine=self.chunk_engine
+                )
+            if self._duplicates is not None:
+                with self.tracer.time("ingest.deduplicate"):
+                    documents, duplicates = self._duplicates.filter(documents)
+                if duplicates:
+                    self._count("duplicate_chunks", len(duplicates))
+                    self._count("duplicate_chars", sum(len(document.page_content) for document in duplicates))
+            with self.tracer.time("ingest.plan"):
+                plan = Indexer.plan_upsert(documents, self.vector_db)
+            self._count("chunks", len(documents))
+            with self._lock:
+                self._stale_ids.extend(plan.stale_ids)
+                for key, value in plan.summary.items():
+                    self._summary[key] += value
+            for document in plan.new_documents:
+                self._put(sink, document)
+
+    def _embed(self, source: queue.Queue, sink: queue.Queue) -> None:
+        in_flight = threading.BoundedSemaphore(self.max_concurrency)
+        batch: List[Document] = []
+        tokens = 0
+
+        def submit(executor: ThreadPoolExecutor, documents: List[Document]) -> None:
+            in_flight.acquire()
+            future = executor.submit(contextvars.copy_context().run, self._embed_batch, documents, sink)
+            future.add_done_callback(lambda _: in_flight.release())
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ingest-embed") as executor:
+            while (document := self._get(source)) is not _DONE:
+                length = Chunker._tiktoken_len(document.page_content, self.embedding_model)
+                if batch and (tokens + length > self.batch_tokens or len(batch) >= self.batch_size):
+                    submit(executor, batch)
+                    batch, tokens = [], 0
+                batch.append(document)
+                tokens += length
+                self.tracer.count("tokens.embedding", length)
+            if batch and not self._abort.is_set():
+                submit(executor, batch)
+
+    def _embed_batch(self, documents: List[Document], sink: queue.Queue) -> None:
+        try:
+            texts = [document.page_content for document in documents]
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with self.tracer.time("ingest.embed"):
+                        vectors = self.vector_db.embeddings.embed_documents(texts)
+                    break
+                except Exception as error:
+                    if not _is_rate_limited(error) or attempt == self.max_retries or self._abort.is_set():
+                        raise
+                    delay = _retry_after(error) or min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    self._count("retries")
+                    logger.info("Embedding request rate limited, retrying in %.1fs", delay)
+                    time.sleep(delay)
+
+            self._count("batches")
+            self._count("embedded", len(documents))
+            self._put(sink, (documents, vectors))
+        except BaseException as error:
+            self._errors.append(error)
+            self._abort.set()
+
+    def _write(self, source: queue.Queue, sink: None) -> None:
+        while (item := self._get(source)) is not _DONE:
+            documents, vectors = item
+            vector_db, bm25_index = self._target()
+            with self.tracer.time("ingest.write"):
+                vector_db.upsert_vectors(
+                    [document.metadata["chunk_id"] for document in documents], 
+                    vectors, 
+                    [document.page_content for document in documents], 
+                    [document.metadata for document in documents]
+                )
+                if bm25_index is not None:
+                    bm25_index.add(documents)
+            self._count("written", len(documents))
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -1,12 +1,31 @@
+from typing import Any, AsyncIterator, Callable, Iterator, List, Union, Optional, Dict, Tuple
+from langchain_core.vectorstores import VectorStore
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain.prompts.chat import ChatPromptTemplate
 from langchain.chains import create_retrieval_chain
 from langchain_core.documents.base import Document
-from typing import List, Union, Optional, Dict
-from langchain_openai import ChatOpenAI
-from retriever import Retriever
+from answer_cache import AnswerCache, CachedAnswer
+from context_store import ContextStore
+from clients import ClientRegistry, default_registry
+from retriever import ExpansionCache, Retriever
+from tracing import Tracer, TracingCallbackHandler
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
+from context_assembler import ContextAssembler
+from langchain_core.retrievers import BaseRetriever
+from operator import itemgetter
 from indexer import Indexer
-from loader import Loader
+from pipeline import IngestionPipeline
+from batching import Coalescer, QueryBatcher
+from index_versions import IndexVersions, PAGE_CACHE_NAME
+from page_cache import PageCache
+from contextlib import contextmanager
+from bm25 import BM25Index
+import threading
+import asyncio
+import time
+import uuid
+import os
 
 class RAG:
     """
@@ -18,24 +37,119 @@ class RAG:
         The model to use for language generation.
     embedding_model : str
         The model to use for generating embeddings.
-    db : Indexer
-        The database indexer for document storage and retrieval.
+    db : Optional[VectorStore]
+        The database for document storage and retrieval, or None until it is opened.
     top_k : int
         The number of top documents to retrieve.
-    retrieved_contexts : Dict[str, List[Document]]
-        A dictionary storing the contexts retrieved for each query.
+    retrieved_contexts : ContextStore
+        A bounded store of the contexts retrieved for each query, keyed by request ID.
+    embedding_cache_path : Optional[str]
+        The path of the persistent embedding cache, or None to disable caching.
+    answer_cache : Optional[AnswerCache]
+        The cache of previous answers, or None to disable answer caching.
+    clients : ClientRegistry
+        The registry of shared model clients.
+    retrieval_mode : str
+        The default retrieval mode: "similarity", "mmr", "multi_query" or "auto".
+    tracer : Tracer
+        The per-stage latencies, counters and per-request traces of queries and ingests.
+    persist_directory : str
+        The directory of the vector database and the BM25 index.
+    index_directory : str
+        The directory of the index version in use, see `IndexVersions`: persist_directory itself until
+        `add_documents_isolated` publishes a new version.
+    vector_backend : str
+        The vector store implementation of the database opened in persist_directory: "chroma" or "numpy".
+    vector_quantization : Optional[str]
+        The type of the codes the "numpy" backend scans before rescoring, "float16" or "int8", or None.
+    search_dimensions : Optional[int]
+        The number of leading dimensions of those codes, or None for all of them.
+    bm25_index : Optional[BM25Index]
+        The lexical index fused with vector retrieval, or None when hybrid retrieval is disabled.
+    context_assembler : Optional[ContextAssembler]
+        The stage fitting the retrieved documents into the context token budget, or None to stuff them all.
+    batcher : Optional[QueryBatcher]
+        The scheduler batching the vector searches of concurrent queries, or None when batching is disabled.
+    read_only : bool
+        Whether the index is opened without ever being written to, so documents cannot be added.
 
     Methods
     -------
-    query(question: str) -> str
+    query(question: str, mode: Optional[str] = None) -> str
         Queries the RAG chain with the given question and returns the response.
-    add_documents(urls: Union[str, List[str]]) -> None
+    query_with_request_id(question: str, mode: Optional[str] = None) -> Tuple[str, str]
+        Queries the RAG chain and returns the response along with the request ID of its context.
+    aquery(question: str, mode: Optional[str] = None) -> str
+        Asynchronously queries the RAG chain, running the multi-query searches concurrently.
+    aquery_with_request_id(question: str, mode: Optional[str] = None) -> Tuple[str, str]
+        Asynchronously queries the RAG chain and returns the response along with the request ID of its context.
+    stream(question: str, request_id: Optional[str] = None, mode: Optional[str] = None) -> Iterator[str]
+        Queries the RAG chain and yields the response as it is generated.
+    astream(question: str, request_id: Optional[str] = None, mode: Optional[str] = None) -> AsyncIterator[str]
+        Asynchronously queries the RAG chain and yields the response as it is generated.
+    get_context(request_id: str) -> List[Document]
+        Returns the documents retrieved for a previous query.
+    latency_report() -> Dict[str, Dict[str, float]]
+        Returns the count, mean and total latency of each query stage.
+    trace(request_id: str) -> Optional[Dict[str, Any]]
+        Returns the stages and counters recorded for a recent query.
+    _resolve_chunks(chunk_ids: List[str]) -> List[Document]
+        Reads chunks back from the database by chunk ID.
+    _check_ready() -> None
+        Checks that documents have been added to the RAG.
+    _check_writable() -> None
+        Checks that the RAG is not read-only.
+    _get_cached_answer(question: str) -> Optional[CachedAnswer]
+        Looks the question up in the answer cache, if there is one.
+    _cache_answer(question: str, answer: str, context: List[Document], latency: float, generation: Optional[int]) -> None
+        Stores a generated answer in the answer cache, if there is one.
+    add_documents(urls: Union[str, List[str]]) -> Dict[str, int]
         Adds documents from the specified URLs to the RAG.
-    _add_documents_to_db(documents: List[Document]) -> None
-        Adds documents to the database and updates the retriever.
-    _create_retriever(db: Indexer, top_k: int = 10) -> Retriever
+    add_documents_isolated(urls: Union[str, List[str]], on_progress: Optional[Callable[[Dict[str, int]], None]] = None, changed_only: bool = False) -> Dict[str, int]
+        Adds documents to a new version of the index and swaps it in once it is complete.
+    refresh(urls: Optional[List[str]] = None, on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]
+        Re-fetches indexed pages conditionally and re-indexes only the pages whose content changed.
+    sources() -> List[str]
+        Returns the source URLs of the chunks in the index.
+    reload() -> bool
+        Switches to the current index version if another process published a newer one.
+    close() -> None
+        Closes the index version in use, once the queries running on it are done.
+    _swap(db: VectorStore, bm25_index: Optional[BM25Index], directory: str) -> None
+        Replaces the database, the BM25 index and the chains queries run on, atomically for queries.
+    _add_documents_to_db(documents: List[Document]) -> Dict[str, int]
+        Adds already loaded documents to the database and the BM25 index.
+    _open_db() -> None
+        Opens the database in the persist directory, and its BM25 index, if no database was given.
+    _on_ingested(summary: Dict[str, int]) -> Dict[str, int]
+        Persists the BM25 index, invalidates the answer cache if the corpus changed, and builds the chain once.
+    _create_retriever(db: VectorStore, top_k: int = 10) -> Retriever
         Creates a retriever from the database.
-    from_db(db_path: str, completion_model: Optional[str] = "gpt-3.5-turbo", embedding_model: Optional[str] = "text-embedding-3-small") -> "RAG"
+    _rewrite_llm() -> BaseChatModel
+        Returns the chat model used to rewrite questions.
+    _bm25_path() -> str
+        Returns the path of the BM25 index file.
+    _page_cache_path() -> str
+        Returns the path of the page cache.
+    _query_batcher() -> Optional[QueryBatcher]
+        Returns the search batcher of the database, creating it on first use, if batching is enabled.
+    _get_chain(mode: Optional[str] = None) -> Runnable
+        Returns the RAG chain for the specified retrieval mode.
+    _checkout(mode: Optional[str] = None) -> Iterator[Runnable]
+        Leases the index version in use for the duration of a query and yields its RAG chain.
+    _lease() -> Iterator[Optional[VectorStore]]
+        Leases the index version in use and yields its database.
+    _acquire() -> str
+        Counts a lease on the index version in use.
+    _release(directory: str) -> None
+        Ends a lease, closing the version if it was replaced and this was its last lease.
+    _close_version(db: VectorStore, bm25_index: Optional[BM25Index], batcher: Optional[QueryBatcher]) -> None
+        Closes the search batcher, the database and the BM25 index of a replaced index version.
+    _mode_chain(mode: Optional[str] = None) -> Runnable
+        Returns the RAG chain for the specified retrieval mode, building it on first use.
+    _assembled(retriever: BaseRetriever) -> Runnable
+        Wraps a retriever with the context assembly stage, if there is one.
+    from_db(db_path: str, completion_model: Optional[str] = "gpt-3.5-turbo", embedding_model: Optional[str] = "text-embedding-3-small", embedding_cache_path: Optional[str] = "./embedding_cache.sqlite", hybrid: bool = True, answer_cache: Optional[AnswerCache] = None, clients: Optional[ClientRegistry] = None, batch_window: Optional[float] = None, max_batch: int = 32, tracer: Optional[Tracer] = None, vector_backend: str = "chroma", vector_quantization: Optional[str] = None, search_dimensions: Optional[int] = None, chunk_size: int = 500, chunk_overlap: int = 50, chunk_engine: str = "recursive", read_only: bool = False) -> "RAG"
         Creates a RAG instance from an existing database.
     _create_rag_chain() -> None
         Creates the RAG chain combining document retrieval and language generation.
@@ -45,8 +159,28 @@ class RAG:
             self, 
             completion_model: Optional[str] = "gpt-3.5-turbo", 
             embedding_model: Optional[str] = "text-embedding-3-small", 
-            db: Optional[Indexer] = None, 
-            top_k: Optional[int] = 10
+            db: Optional[VectorStore] = None, 
+            top_k: Optional[int] = 10,
+            embedding_cache_path: Optional[str] = "./embedding_cache.sqlite",
+            answer_cache: Optional[AnswerCache] = None,
+            context_store: Optional[ContextStore] = None,
+            llm: Optional[BaseChatModel] = None,
+            retrieval_mode: str = "multi_query",
+            persist_directory: str = "./db",
+            hybrid: bool = True,
+            context_budget: Optional[int] = 3000,
+            compress_context: bool = False,
+            clients: Optional[ClientRegistry] = None,
+            batch_window: Optional[float] = None,
+            max_batch: int = 32,
+            tracer: Optional[Tracer] = None,
+            vector_backend: str = "chroma",
+            vector_quantization: Optional[str] = None,
+            search_dimensions: Optional[int] = None,
+            chunk_size: int = 500,
+            chunk_overlap: int = 50,
+            chunk_engine: str = "recursive",
+            read_only: bool = False
         ) -> None:
         """
         Initializes the RAG instance with the specified models and database.
@@ -57,31 +191,377 @@ class RAG:
             The model to use for language generation (default is "gpt-3.5-turbo").
         embedding_model : Optional[str], optional
             The model to use for generating embeddings (default is "text-embedding-3-small").
-        db : Optional[Indexer], optional
-            The database indexer for document storage and retrieval (default is None).
+        db : Optional[VectorStore], optional
+            The database for document storage and retrieval (default is None, meaning it is opened in persist_directory).
         top_k : Optional[int], optional
             The number of top documents to retrieve (default is 10).
+        embedding_cache_path : Optional[str], optional
+            The path of the persistent embedding cache, None disables caching (default is "./embedding_cache.sqlite").
+        answer_cache : Optional[AnswerCache], optional
+            The cache of previous answers. It is invalidated whenever the corpus changes (default is None, meaning
+            answers are not cached).
+        context_store : Optional[ContextStore], optional
+            The store of retrieved contexts (default is None, meaning a ContextStore with default limits that
+            resolves chunk IDs from the database).
+        llm : Optional[BaseChatModel], optional
+            The chat model used for query rewriting and answering instead of the shared ChatOpenAI clients, e.g. a
+            local fake model for load tests (default is None).
+        retrieval_mode : str, optional
+            The default retrieval mode, see `Retriever.create_retriever_from_db`. Each query can override it
+            (default is "multi_query").
+        persist_directory : str, optional
+            The directory of the vector database created on the first `add_documents` when no db is given, and of
+            the BM25 index. If `add_documents_isolated` published index versions in it, the current one is used
+            (default is "./db").
+        hybrid : bool, optional
+            Whether to fuse vector retrieval with BM25 lexical search over the same chunks. The index is stored as
+            "bm25.idx" in persist_directory and rebuilt from the database if it is missing or stale (default is True).
+        context_budget : Optional[int], optional
+            The maximum number of context tokens in the prompt, counted with the completion model's encoding.
+            Retrieved documents are deduplicated and adjacent chunks merged before the budget is applied. None
+            stuffs every retrieved document into the prompt (default is 3000).
+        compress_context : bool, optional
+            Whether to keep only the sentences of the retrieved passages that share a term with the question
+            (default is False).
+        clients : Optional[ClientRegistry], optional
+            The registry of shared model clients (default is None, meaning the process-wide default registry).
+        batch_window : Optional[float], optional
+            The number of seconds the vector searches of concurrent queries are collected for before being embedded
+            and searched together, see `QueryBatcher`. Identical questions in flight are also answered once. None
+            disables batching (default is None).
+        max_batch : int, optional
+            The maximum number of searches in a batch (default is 32).
+        tracer : Optional[Tracer], optional
+            Where the latency, token counts, cache hits and document counts of every query and ingest stage are
+            recorded. Pass `Tracer(enabled=False)` to turn instrumentation off (default is None, meaning a new
+            enabled Tracer).
+        vector_backend : str, optional
+            The vector store implementation of the database opened in persist_directory when no db is given, see
+            `Indexer.load_db` (default is "chroma").
+        vector_quantization : Optional[str], optional
+            With the "numpy" backend, search "float16" or "int8" codes of the embeddings and rescore a shortlist
+            at full precision (default is None, meaning the full-precision embeddings are searched).
+        search_dimensions : Optional[int], optional
+            With a quantization, the number of leading embedding dimensions kept in the codes (default is None,
+            meaning all of them).
+        chunk_size : int, optional
+            The size of the chunks ingested pages are split into, in tokens. It must match the chunks already in the
+            index, since a page chunked differently gets other chunk IDs and is re-embedded (default is 500).
+        chunk_overlap : int, optional
+            The overlap between consecutive chunks, in tokens (default is 50).
+        chunk_engine : str, optional
+            The chunking engine, see `Chunker` (default is "recursive").
+        read_only : bool, optional
+            Whether to open the index without ever writing to it, as the query workers of `serve.WorkerPool` do:
+            a stale BM25 index is rebuilt in memory only, and adding documents raises. `reload` picks up the
+            versions a writer publishes (default is False).
         """
         self.completion_model: str = completion_model
         self.embedding_model: str = embedding_model
-        self.db: Indexer = db
+        self.db: Optional[VectorStore] = db
         self.top_k = top_k
-        self.retrieved_contexts: Dict[str, List[Document]] = {}
+        self.retrieved_contexts: ContextStore = context_store if context_store is not None else ContextStore()
+        if self.retrieved_contexts.resolver is None:
+            self.retrieved_contexts.resolver = self._resolve_chunks
+        self.embedding_cache_path: Optional[str] = embedding_cache_path
+        self.answer_cache: Optional[AnswerCache] = answer_cache
+        if answer_cache is not None and answer_cache.embeddings is None and db is not None:
+            answer_cache.embeddings = db.embeddings
+        self.llm: Optional[BaseChatModel] = llm
+        self.clients: ClientRegistry = clients if clients is not None else default_registry()
+        self.retrieval_mode: str = retrieval_mode
+        self.tracer: Tracer = tracer if tracer is not None else Tracer()
+        self._run_config: Optional[Dict] = {"callbacks": [TracingCallbackHandler(self.tracer)]} if self.tracer.enabled else None
+        self.expansion_cache = ExpansionCache()
+        self.retriever = None
+        self.rag_chain = None
+        self._mode_chains: Dict[str, Runnable] = {}
+        self.persist_directory: str = persist_directory
+        self.index_directory: str = IndexVersions.current(persist_directory)
+        self._swap_lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self._leases: Dict[str, int] = {}
+        self._retired: Dict[str, Tuple[VectorStore, Optional[BM25Index], Optional[QueryBatcher]]] = {}
+        self._closed = False
+        self.vector_backend: str = vector_backend
+        self.vector_quantization: Optional[str] = vector_quantization
+        self.search_dimensions: Optional[int] = search_dimensions
+        self.chunk_size: int = chunk_size
+        self.chunk_overlap: int = chunk_overlap
+        self.chunk_engine: str = chunk_engine
+        self.read_only: bool = read_only
+        self.hybrid: bool = hybrid
+        self.bm25_index: Optional[BM25Index] = None
+        self.context_assembler: Optional[ContextAssembler] = None
+        if context_budget is not None:
+            self.context_assembler = ContextAssembler(
+                model_name=completion_model, 
+                max_tokens=context_budget, 
+                compress=compress_context, 
+                tracer=self.tracer
+            )
+        self.batch_window: Optional[float] = batch_window
+        self.max_batch: int = max_batch
+        self.batcher: Optional[QueryBatcher] = None
+        self._coalescer: Optional[Coalescer] = Coalescer() if batch_window is not None else None
+        if db is not None:
+            if hybrid:
+                self.bm25_index = Indexer.load_bm25_index(db, self._bm25_path(), save=not read_only)
+            self._create_retriever(db, top_k=top_k)
+            self._create_rag_chain()
 
-    def query(self, question: str) -> str:
+    def query(self, question: str, mode: Optional[str] = None) -> str:
         """
         Queries the RAG chain with the given question and returns the response.
 
+        When an answer cache is configured, repeated or (with the similarity tier) near-identical questions are
+        answered from the cache without running the chain.
+
         Parameters
         ----------
         question : str
             The question to query the RAG chain with.
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
 
         Returns
         -------
         str
             The response generated by the RAG chain.
         
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        answer, _ = self.query_with_request_id(question, mode=mode)
+        return answer
+
+    def query_with_request_id(self, question: str, mode: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Queries the RAG chain and returns the response along with the request ID of its context.
+
+        Parameters
+        ----------
+        question : str
+            The question to query the RAG chain with.
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
+
+        Returns
+        -------
+        Tuple[str, str]
+            The response generated by the RAG chain and the request ID to pass to `get_context`.
+        
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        self._check_ready()
+        request_id = uuid.uuid4().hex
+        with self.tracer.request("query", request_id, mode=mode or self.retrieval_mode):
+            cached = self._get_cached_answer(question)
+            if cached is not None:
+                return cached.answer, self.retrieved_contexts.put(cached.context, request_id)
+            
+            generation = self.answer_cache.generation if self.answer_cache is not None else None
+            start = time.perf_counter()
+            with self._checkout(mode) as chain:
+                if self._coalescer is not None:
+                    response = self._coalescer.run(
+                        (question, mode or self.retrieval_mode), 
+                        lambda: chain.invoke({"input": question}, config=self._run_config)
+                    )
+                else:
+                    response = chain.invoke({"input": question}, config=self._run_config)
+            self.tracer.record("query.total", time.perf_counter() - start)
+            self.tracer.count("retrieval.documents", len(response["context"]))
+            self._cache_answer(question, response["answer"], response["context"], time.perf_counter() - start, generation)
+            return response["answer"], self.retrieved_contexts.put(response["context"], request_id)
+
+    async def aquery(self, question: str, mode: Optional[str] = None) -> str:
+        """
+        Asynchronously queries the RAG chain, running the multi-query searches concurrently.
+
+        Parameters
+        ----------
+        question : str
+            The question to query the RAG chain with.
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
+
+        Returns
+        -------
+        str
+            The response generated by the RAG chain.
+
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        answer, _ = await self.aquery_with_request_id(question, mode=mode)
+        return answer
+
+    async def aquery_with_request_id(self, question: str, mode: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Asynchronously queries the RAG chain and returns the response along with the request ID of its context.
+
+        The rewritten questions of the multi-query retriever are searched concurrently, and the event loop is
+        free to serve other requests while waiting on the models.
+
+        Parameters
+        ----------
+        question : str
+            The question to query the RAG chain with.
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
+
+        Returns
+        -------
+        Tuple[str, str]
+            The response generated by the RAG chain and the request ID to pass to `get_context`.
+
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        self._check_ready()
+        request_id = uuid.uuid4().hex
+        with self.tracer.request("query", request_id, mode=mode or self.retrieval_mode):
+            cached = await asyncio.to_thread(self._get_cached_answer, question)
+            if cached is not None:
+                return cached.answer, self.retrieved_contexts.put(cached.context, request_id)
+            
+            generation = self.answer_cache.generation if self.answer_cache is not None else None
+            start = time.perf_counter()
+            with self._checkout(mode) as chain:
+                if self._coalescer is not None:
+                    response = await self._coalescer.arun(
+                        (question, mode or self.retrieval_mode), 
+                        lambda: chain.ainvoke({"input": question}, config=self._run_config)
+                    )
+                else:
+                    response = await chain.ainvoke({"input": question}, config=self._run_config)
+            self.tracer.record("query.total", time.perf_counter() - start)
+            self.tracer.count("retrieval.documents", len(response["context"]))
+            await asyncio.to_thread(self._cache_answer, question, response["answer"], response["context"], time.perf_counter() - start, generation)
+            return response["answer"], self.retrieved_contexts.put(response["context"], request_id)
+
+    def stream(self, question: str, request_id: Optional[str] = None, mode: Optional[str] = None) -> Iterator[str]:
+        """
+        Queries the RAG chain and yields the response as it is generated.
+
+        Parameters
+        ----------
+        question : str
+            The question to query the RAG chain with.
+        request_id : Optional[str], optional
+            The request ID to store the retrieved context under. The context is stored as soon as it is retrieved,
+            before the first token is yielded (default is None, meaning the context is stored under a new ID).
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
+
+        Yields
+        ------
+        str
+            The pieces of the response, in order. A cached answer is yielded in one piece.
+
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        self._check_ready()
+        request_id = request_id or uuid.uuid4().hex
+        trace = self.tracer.start("query", request_id, mode=mode or self.retrieval_mode, stream=True)
+        try:
+            with self.tracer.activate(trace):
+                cached = self._get_cached_answer(question)
+            if cached is not None:
+                self.retrieved_contexts.put(cached.context, request_id)
+                yield cached.answer
+                return
+            
+            generation = self.answer_cache.generation if self.answer_cache is not None else None
+            start = time.perf_counter()
+            context: List[Document] = []
+            answer: List[str] = []
+            with self._checkout(mode) as chain:
+                for chunk in self.tracer.iterate(trace, chain.stream({"input": question}, config=self._run_config)):
+                    if "context" in chunk:
+                        context = chunk["context"]
+                        request_id = self.retrieved_contexts.put(context, request_id)
+                    if chunk.get("answer"):
+                        answer.append(chunk["answer"])
+                        yield chunk["answer"]
+            with self.tracer.activate(trace):
+                self.tracer.record("query.total", time.perf_counter() - start)
+                self.tracer.count("retrieval.documents", len(context))
+            self._cache_answer(question, "".join(answer), context, time.perf_counter() - start, generation)
+        finally:
+            self.tracer.finish(trace)
+
+    async def astream(self, question: str, request_id: Optional[str] = None, mode: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Asynchronously queries the RAG chain and yields the response as it is generated.
+
+        Parameters
+        ----------
+        question : str
+            The question to query the RAG chain with.
+        request_id : Optional[str], optional
+            The request ID to store the retrieved context under. The context is stored as soon as it is retrieved,
+            before the first token is yielded (default is None, meaning the context is stored under a new ID).
+        mode : Optional[str], optional
+            The retrieval mode for this query (default is None, meaning the RAG's retrieval_mode).
+
+        Yields
+        ------
+        str
+            The pieces of the response, in order. A cached answer is yielded in one piece.
+
+        Raises
+        ------
+        ValueError
+            If no documents have been added to the RAG.
+        """
+        self._check_ready()
+        request_id = request_id or uuid.uuid4().hex
+        trace = self.tracer.start("query", request_id, mode=mode or self.retrieval_mode, stream=True)
+        try:
+            with self.tracer.activate(trace):
+                cached = await asyncio.to_thread(self._get_cached_answer, question)
+            if cached is not None:
+                self.retrieved_contexts.put(cached.context, request_id)
+                yield cached.answer
+                return
+            
+            generation = self.answer_cache.generation if self.answer_cache is not None else None
+            start = time.perf_counter()
+            context: List[Document] = []
+            answer: List[str] = []
+            with self._checkout(mode) as chain:
+                async for chunk in self.tracer.aiterate(trace, chain.astream({"input": question}, config=self._run_config)):
+                    if "context" in chunk:
+                        context = chunk["context"]
+                        request_id = self.retrieved_contexts.put(context, request_id)
+                    if chunk.get("answer"):
+                        answer.append(chunk["answer"])
+                        yield chunk["answer"]
+            with self.tracer.activate(trace):
+                self.tracer.record("query.total", time.perf_counter() - start)
+                self.tracer.count("retrieval.documents", len(context))
+            await asyncio.to_thread(self._cache_answer, question, "".join(answer), context, time.perf_counter() - start, generation)
+        finally:
+            self.tracer.finish(trace)
+
+    def _check_ready(self) -> None:
+        """
+        Checks that documents have been added to the RAG.
+
         Raises
         ------
         ValueError
@@ -89,48 +569,491 @@ class RAG:
         """
         if self.rag_chain is None:
             raise ValueError("No documents have been added to the RAG. Please add documents before querying.")
-        
-        response = self.rag_chain.invoke({"input": question})
-        self.retrieved_contexts[question] = response["context"]
-        return response["answer"]
 
-    def add_documents(self, urls: Union[str, List[str]]) -> None:
+    def _check_writable(self) -> None:
+        """
+        Checks that the RAG is not read-only.
+
+        Raises
+        ------
+        RuntimeError
+            If the RAG was opened read-only.
+        """
+        if self.read_only:
+            raise RuntimeError("This RAG is read-only; documents are added by the process writing the index.")
+
+    def _get_cached_answer(self, question: str) -> Optional[CachedAnswer]:
+        """
+        Looks the question up in the answer cache, if there is one.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+
+        Returns
+        -------
+        Optional[CachedAnswer]
+            The cached answer, or None on a miss or when answers are not cached.
+        """
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get(question)
+        self.tracer.count("cache.answer.hits" if cached is not None else "cache.answer.misses")
+        return cached
+
+    def _cache_answer(self, question: str, answer: str, context: List[Document], latency: float, generation: Optional[int]) -> None:
+        """
+        Stores a generated answer in the answer cache, if there is one.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+        answer : str
+            The generated answer.
+        context : List[Document]
+            The documents the answer was generated from.
+        latency : float
+            The time in seconds it took to generate the answer.
+        generation : Optional[int]
+            The generation of the answer cache read before the answer was generated.
+        """
+        if self.answer_cache is not None:
+            self.answer_cache.put(question, answer, context, latency, generation=generation)
+
+    def get_context(self, request_id: str) -> List[Document]:
+        """
+        Returns the documents retrieved for a previous query.
+
+        Parameters
+        ----------
+        request_id : str
+            The request ID returned by `query_with_request_id`.
+
+        Returns
+        -------
+        List[Document]
+            The retrieved documents, or an empty list if the context is unknown or was evicted.
+        """
+        return self.retrieved_contexts.get(request_id, [])
+
+    def latency_report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the count, mean and total latency of each query stage.
+
+        The stages are "retrieval.expansion" (the LLM rewrite of the question), "retrieval.search" (the vector
+        searches), "retrieval.bm25" (the lexical search), "context.assembly", "llm" (every chat model call) and
+        "query.total" (retrieval plus answer generation), plus the "ingest.*" stages of `add_documents`. Counters
+        and per-request traces are available from `tracer`.
+
+        Returns
+        -------
+        Dict[str, Dict[str, float]]
+            A mapping from stage name to its "count", "mean_ms" and "total_ms".
+        """
+        return self.tracer.report()
+
+    def trace(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stages and counters recorded for a recent query.
+
+        Parameters
+        ----------
+        request_id : str
+            The request ID of the query, as returned by `query_with_request_id` or passed to `stream`.
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The trace of the query, see `Trace.to_dict`, or None if it is unknown or was evicted from the tracer.
+        """
+        return self.tracer.trace(request_id)
+
+    def _resolve_chunks(self, chunk_ids: List[str]) -> List[Document]:
+        """
+        Reads chunks back from the database by chunk ID.
+
+        Parameters
+        ----------
+        chunk_ids : List[str]
+            The chunk IDs to read.
+
+        Returns
+        -------
+        List[Document]
+            The chunks that still exist, in the order of the IDs.
+        """
+        with self._lease() as db:
+            return Indexer.get_documents(db, chunk_ids) if db is not None else []
+
+    def add_documents(self, urls: Union[str, List[str]]) -> Dict[str, int]:
         """
         Adds documents from the specified URLs to the RAG.
 
+        The URLs go through a streaming `IngestionPipeline`: pages are chunked as they arrive, only new or changed
+        chunks are embedded, in batches, and vectors are written as they come back, so re-adding a URL only touches
+        the chunks whose content changed since it was last added. Pages are requested conditionally against the
+        page cache, which records them once they are indexed.
+
+        Parameters
+        ----------
+        urls : Union[str, List[str]]
+            The URLs to load documents from.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+
+        Raises
+        ------
+        RuntimeError
+            If the RAG is read-only.
+        """
+        self._check_writable()
+        with self._ingest_lock, PageCache(self._page_cache_path()) as page_cache:
+            self._open_db()
+            pipeline = IngestionPipeline(
+                self.db, 
+                bm25_index=self.bm25_index, 
+                chunk_model_name=self.completion_model, 
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                chunk_engine=self.chunk_engine,
+                embedding_model=self.embedding_model,
+                page_cache=page_cache,
+                tracer=self.tracer
+            )
+            with self.tracer.request("ingest", urls=1 if isinstance(urls, str) else len(urls)):
+                summary = self._on_ingested(pipeline.run(urls))
+            page_cache.put(pipeline.pages)
+            return summary
+
+    def add_documents_isolated(
+            self, 
+            urls: Union[str, List[str]], 
+            on_progress: Optional[Callable[[Dict[str, int]], None]] = None, 
+            changed_only: bool = False
+        ) -> Dict[str, int]:
+        """
+        Adds documents from the specified URLs to a new version of the index and swaps it in once it is complete.
+
+        Unlike `add_documents`, which writes into the database queries are reading, the URLs are ingested into a
+        copy of the current index version (see `IndexVersions`), so queries keep running at full speed on the
+        last consistent index and never see a URL whose old chunks are deleted and new ones not yet written. The
+        chunks are compared with the current version first, and the copy is only made, published and swapped in if
+        the corpus changed; the two most recent versions are kept.
+        The page cache is shared by every version and records the fetched pages once the ingest is complete.
+
         Parameters
         ----------
         urls : Union[str, List[str]]
             The URLs to load documents from.
+        on_progress : Optional[Callable[[Dict[str, int]], None]], optional
+            Called with the pipeline counters as the ingest progresses, see `IngestionPipeline` (default is None).
+        changed_only : bool, optional
+            Whether to leave out the pages whose text did not change since they were cached (default is False).
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+
+        Raises
+        ------
+        RuntimeError
+            If the RAG is read-only.
         """
-        documents = Loader.load_documents(urls, chunk_model_name=self.completion_model)
-        self._add_documents_to_db(documents)
+        self._check_writable()
+        with self._ingest_lock, PageCache(self._page_cache_path()) as page_cache, self._lease() as current:
+            with self.tracer.request("ingest", urls=1 if isinstance(urls, str) else len(urls)):
+                created: List[str] = []
+
+                def open_version() -> Tuple[VectorStore, Optional[BM25Index]]:
+                    with self.tracer.time("ingest.copy"):
+                        directory = IndexVersions.create(self.persist_directory)
+                    created.append(directory)
+                    db = Indexer.load_db(
+                        directory, 
+                        embedding_model=self.embedding_model, 
+                        embedding_cache_path=self.embedding_cache_path, 
+                        clients=self.clients,
+                        backend=self.vector_backend,
+                        quantization=self.vector_quantization,
+                        search_dimensions=self.search_dimensions
+                    )
+                    return db, Indexer.load_bm25_index(db, os.path.join(directory, "bm25.idx")) if self.hybrid else None
+
+                try:
+                    if current is None:
+                        # nothing to compare with yet: the chunks are planned against the new version itself
+                        pipeline_options = dict(zip(("vector_db", "bm25_index"), open_version()))
+                    else:
+                        # the new version is only created once there is something to write to it
+                        pipeline_options = {"vector_db": current, "open_target": open_version}
+                    pipeline = IngestionPipeline(
+                        chunk_model_name=self.completion_model, 
+                        chunk_size=self.chunk_size,
+                        chunk_overlap=self.chunk_overlap,
+                        chunk_engine=self.chunk_engine,
+                        embedding_model=self.embedding_model,
+                        page_cache=page_cache,
+                        changed_only=changed_only,
+                        tracer=self.tracer,
+                        on_progress=on_progress,
+                        **pipeline_options
+                    )
+                    summary = pipeline.run(urls)
+                    changed = summary["added"] or summary["updated"] or summary["deleted"]
+                    db, bm25_index = pipeline.target or (pipeline.vector_db, pipeline.bm25_index)
+                    if bm25_index is not None and changed:
+                        with self.tracer.time("ingest.bm25_save"):
+                            bm25_index.save(os.path.join(created[0], "bm25.idx"))
+                except BaseException:
+                    for directory in created:
+                        IndexVersions.discard(directory)
+                    raise
+                for key, value in summary.items():
+                    self.tracer.count(f"ingest.chunks.{key}", value)
 
-    def _add_documents_to_db(self, documents: List[Document]) -> None:
+                if not created:
+                    with self._swap_lock:
+                        if self.rag_chain is None and not self._closed:
+                            self._create_retriever(self.db, top_k=self.top_k)
+                            self._create_rag_chain()
+                    page_cache.put(pipeline.pages)
+                    return summary
+                if not changed and self.rag_chain is not None:
+                    RAG._close_version(db, bm25_index, None)
+                    IndexVersions.discard(created[0])
+                    page_cache.put(pipeline.pages)
+                    return summary
+                IndexVersions.publish(self.persist_directory, created[0])
+                self._swap(db, bm25_index, created[0])
+                page_cache.put(pipeline.pages)
+                if self.answer_cache is not None and changed:
+                    self.answer_cache.invalidate()
+                IndexVersions.prune(self.persist_directory)
+                return summary
+
+    def refresh(self, urls: Optional[List[str]] = None, on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
         """
-        Adds documents to the database and updates the retriever.
+        Re-fetches indexed pages and re-indexes only the pages whose content changed, e.g. on a schedule.
+
+        Pages are requested conditionally with the validators of their cached version (If-None-Match,
+        If-Modified-Since), so unchanged pages are answered 304 without a body, and pages served again with the
+        same text are left out too: only changed pages are chunked, embedded and written, into a new index version
+        as in `add_documents_isolated`. Pages that are not cached yet are downloaded and indexed in full.
+
+        Parameters
+        ----------
+        urls : Optional[List[str]], optional
+            The URLs to refresh (default is None, meaning every source URL in the index).
+        on_progress : Optional[Callable[[Dict[str, int]], None]], optional
+            Called with the pipeline counters as the refresh progresses, see `IngestionPipeline` (default is None).
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+        """
+        urls = self.sources() if urls is None else urls
+        if not urls:
+            return {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+        return self.add_documents_isolated(urls, on_progress=on_progress, changed_only=True)
+
+    def sources(self) -> List[str]:
+        """
+        Returns the source URLs of the chunks in the index.
+
+        Returns
+        -------
+        List[str]
+            The URLs, in the order the database returns their first chunk.
+        """
+        self._open_db()
+        with self._lease() as db:
+            sources = [metadata.get("source") for metadata in db.get(include=["metadatas"])["metadatas"]]
+        return list(dict.fromkeys(source for source in sources if source))
+
+    def reload(self) -> bool:
+        """
+        Switches to the current index version if another process published a newer one, e.g. the writer of a
+        read-only query worker.
+
+        The new version is opened next to the old one and swapped in atomically for queries, as in
+        `add_documents_isolated`; queries already running finish on the old version, whose files stay mapped
+        until they are done even if the writer prunes it, and which is closed after the last of them. The answer
+        cache is invalidated.
+
+        Returns
+        -------
+        bool
+            True if a newer version was swapped in, False if the RAG already uses the current one.
+        """
+        directory = IndexVersions.current(self.persist_directory)
+        if directory == self.index_directory:
+            return False
+        db = Indexer.load_db(
+            directory, 
+            embedding_model=self.embedding_model, 
+            embedding_cache_path=self.embedding_cache_path, 
+            clients=self.clients,
+            backend=self.vector_backend,
+            quantization=self.vector_quantization,
+            search_dimensions=self.search_dimensions,
+            read_only=self.read_only
+        )
+        bm25_index = Indexer.load_bm25_index(db, os.path.join(directory, "bm25.idx"), save=not self.read_only) if self.hybrid else None
+        self._swap(db, bm25_index, directory)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        return True
+
+    def close(self) -> None:
+        """
+        Closes the search batcher, the database and the BM25 index of the index version in use, once the queries
+        running on it are done, e.g. before the RAG is replaced. The RAG must not be used afterwards.
+
+        An ingest still running on the RAG, e.g. the job an `IngestionQueue` closed without waiting was running,
+        finishes and publishes its version, but the version is closed instead of swapped in.
+        """
+        with self._swap_lock:
+            self._closed = True
+            version = (self.db, self.bm25_index, self.batcher) if self.db is not None else None
+            if version is not None and self._leases.get(self.index_directory):
+                self._retired[self.index_directory] = version
+                version = None
+            self.db, self.bm25_index, self.batcher = None, None, None
+            self.retriever, self.rag_chain, self._mode_chains = None, None, {}
+        if version is not None:
+            RAG._close_version(*version)
+
+    def _swap(self, db: VectorStore, bm25_index: Optional[BM25Index], directory: str) -> None:
+        """
+        Replaces the database, the BM25 index and the chains queries run on, atomically for queries.
+
+        Queries take their chain under the same lock, so each runs entirely on either the old or the new index.
+        The replaced database, BM25 index and search batcher are closed once the last query leasing them is done.
+
+        Parameters
+        ----------
+        db : VectorStore
+            The database of the new index version.
+        bm25_index : Optional[BM25Index]
+            The BM25 index of the new index version, or None when hybrid retrieval is disabled.
+        directory : str
+            The directory of the new index version.
+        """
+        with self._swap_lock:
+            if self._closed:
+                # the RAG was closed while the version was being ingested: nothing will query it
+                replaced = (db, bm25_index, None)
+            else:
+                replaced = (self.db, self.bm25_index, self.batcher) if self.db is not None and self.db is not db else None
+                if replaced is not None and self._leases.get(self.index_directory):
+                    self._retired[self.index_directory] = replaced
+                    replaced = None
+                self.db, self.bm25_index, self.index_directory = db, bm25_index, directory
+                if self.answer_cache is not None and self.answer_cache.embeddings is None:
+                    self.answer_cache.embeddings = db.embeddings
+                # each version gets its own batcher, so searches pending in the old one still run on the old version
+                self.batcher = None
+                self._create_retriever(db, top_k=self.top_k)
+                self._create_rag_chain()
+        if replaced is not None:
+            RAG._close_version(*replaced)
+
+    def _add_documents_to_db(self, documents: List[Document]) -> Dict[str, int]:
+        """
+        Adds documents to the database and the BM25 index.
 
         Parameters
         ----------
         documents : List[Document]
             The documents to be added to the database.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of chunks "added", "updated", "skipped" and "deleted".
+
+        Raises
+        ------
+        RuntimeError
+            If the RAG is read-only.
+        """
+        self._check_writable()
+        with self._ingest_lock:
+            self._open_db()
+            with self.tracer.request("ingest", documents=len(documents)):
+                with self.tracer.time("ingest.write"):
+                    summary = Indexer.upsert_documents(documents, self.db, bm25_index=self.bm25_index)
+                return self._on_ingested(summary)
+
+    def _open_db(self) -> None:
+        """
+        Opens the database in the persist directory, and its BM25 index, if no database was given.
         """
         if self.db is not None:
-            Indexer.add_documents_to_db(documents, self.db)
-        else:
-            self.db = Indexer.create_new_db(documents, embedding_model=self.embedding_model, persist_directory="./db")
+            return
+        self.db = Indexer.load_db(
+            self.index_directory, 
+            embedding_model=self.embedding_model, 
+            embedding_cache_path=self.embedding_cache_path, 
+            clients=self.clients,
+            backend=self.vector_backend,
+            quantization=self.vector_quantization,
+            search_dimensions=self.search_dimensions,
+            read_only=self.read_only
+        )
+        if self.hybrid:
+            self.bm25_index = Indexer.load_bm25_index(self.db, self._bm25_path(), save=not self.read_only)
+
+    def _on_ingested(self, summary: Dict[str, int]) -> Dict[str, int]:
+        """
+        Persists the BM25 index, invalidates the answer cache if the corpus changed, and builds the chain once.
+
+        The retriever and the chain are built on the first ingest only: they query the database and the BM25 index
+        in place, so later ingests are visible to them without rebuilding anything.
+
+        Parameters
+        ----------
+        summary : Dict[str, int]
+            The ingestion summary.
+
+        Returns
+        -------
+        Dict[str, int]
+            The same summary.
+        """
+        changed = summary["added"] or summary["updated"] or summary["deleted"]
+        if self.bm25_index is not None and changed:
+            with self.tracer.time("ingest.bm25_save"):
+                self.bm25_index.save(self._bm25_path())
+        for key, value in summary.items():
+            self.tracer.count(f"ingest.chunks.{key}", value)
+        if self.answer_cache is not None:
+            if self.answer_cache.embeddings is None:
+                self.answer_cache.embeddings = self.db.embeddings
+            if changed:
+                self.answer_cache.invalidate()
         
-        self._create_retriever(self.db, top_k=self.top_k)
-        self._create_rag_chain()
+        if self.rag_chain is None:
+            with self._swap_lock:
+                self._create_retriever(self.db, top_k=self.top_k)
+                self._create_rag_chain()
+        return summary
 
-    def _create_retriever(self, db: Indexer, top_k: int = 10) -> Retriever:
+    def _create_retriever(self, db: VectorStore, top_k: int = 10) -> Retriever:
         """
         Creates a retriever from the database.
 
         Parameters
         ----------
-        db : Indexer
-            The database indexer for document storage and retrieval.
+        db : VectorStore
+            The database for document storage and retrieval.
         top_k : int, optional
             The number of top documents to retrieve (default is 10).
 
@@ -139,29 +1062,167 @@ class RAG:
         Retriever
             The created retriever.
         """
-        self.retriever = Retriever.create_retriever_from_db(db, model=self.completion_model, top_k=top_k)
+        self.retriever = Retriever.create_retriever_from_db(
+            db, 
+            model=self.completion_model, 
+            top_k=top_k, 
+            llm=self._rewrite_llm(), 
+            mode=self.retrieval_mode, 
+            expansion_cache=self.expansion_cache, 
+            tracer=self.tracer,
+            bm25_index=self.bm25_index,
+            batcher=self._query_batcher()
+        )
+
+    def _rewrite_llm(self) -> BaseChatModel:
+        """
+        Returns the chat model used to rewrite questions.
+
+        Returns
+        -------
+        BaseChatModel
+            The RAG's llm, or the shared deterministic client of the completion model.
+        """
+        return self.llm if self.llm is not None else self.clients.chat_model(self.completion_model, temperature=0)
+
+    def _bm25_path(self) -> str:
+        """
+        Returns the path of the BM25 index file.
+
+        Returns
+        -------
+        str
+            The path of "bm25.idx" in the directory of the index version in use.
+        """
+        return os.path.join(self.index_directory, "bm25.idx")
+
+    def _page_cache_path(self) -> str:
+        """
+        Returns the path of the page cache.
+
+        Returns
+        -------
+        str
+            The path of "pages.db" in the persist directory, shared by every index version.
+        """
+        return os.path.join(self.persist_directory, PAGE_CACHE_NAME)
+
+    def _query_batcher(self) -> Optional[QueryBatcher]:
+        """
+        Returns the search batcher of the database, creating it on first use, if batching is enabled.
+
+        Returns
+        -------
+        Optional[QueryBatcher]
+            The batcher shared by the retrievers of every mode, or None if batch_window is None.
+        """
+        if self.batch_window is not None and self.batcher is None:
+            self.batcher = QueryBatcher(self.db, window=self.batch_window, max_batch=self.max_batch)
+        return self.batcher
 
     @staticmethod
-    def from_db(db_path: str, completion_model: Optional[str] = "gpt-3.5-turbo", embedding_model: Optional[str] = "text-embedding-3-small") -> "RAG":
+    def from_db(
+            db_path: str, 
+            completion_model: Optional[str] = "gpt-3.5-turbo", 
+            embedding_model: Optional[str] = "text-embedding-3-small", 
+            embedding_cache_path: Optional[str] = "./embedding_cache.sqlite",
+            hybrid: bool = True,
+            answer_cache: Optional[AnswerCache] = None,
+            clients: Optional[ClientRegistry] = None,
+            batch_window: Optional[float] = None,
+            max_batch: int = 32,
+            tracer: Optional[Tracer] = None,
+            vector_backend: str = "chroma",
+            vector_quantization: Optional[str] = None,
+            search_dimensions: Optional[int] = None,
+            chunk_size: int = 500,
+            chunk_overlap: int = 50,
+            chunk_engine: str = "recursive",
+            read_only: bool = False
+        ) -> "RAG":
         """
         Creates a RAG instance from an existing database.
 
         Parameters
         ----------
         db_path : str
-            The path to the database.
+            The path to the database. Its current version is opened, see `IndexVersions`.
         completion_model : Optional[str], optional
             The model to use for language generation (default is "gpt-3.5-turbo").
         embedding_model : Optional[str], optional
             The model to use for generating embeddings (default is "text-embedding-3-small").
+        embedding_cache_path : Optional[str], optional
+            The path of the persistent embedding cache, None disables caching (default is "./embedding_cache.sqlite").
+        hybrid : bool, optional
+            Whether to fuse vector retrieval with BM25 lexical search, using the index stored in db_path
+            (default is True).
+        answer_cache : Optional[AnswerCache], optional
+            The cache of previous answers (default is None, meaning answers are not cached).
+        clients : Optional[ClientRegistry], optional
+            The registry of shared model clients (default is None, meaning the process-wide default registry).
+        batch_window : Optional[float], optional
+            The number of seconds concurrent vector searches are collected for before being run together, None
+            disables batching (default is None).
+        max_batch : int, optional
+            The maximum number of searches in a batch (default is 32).
+        tracer : Optional[Tracer], optional
+            The tracer of the RAG instance (default is None, meaning a new enabled Tracer).
+        vector_backend : str, optional
+            The vector store implementation of the database, see `Indexer.load_db` (default is "chroma").
+        vector_quantization : Optional[str], optional
+            The quantized storage mode of the "numpy" backend, see `RAG` (default is None).
+        search_dimensions : Optional[int], optional
+            The number of leading dimensions of the quantized codes (default is None, meaning all of them).
+        chunk_size : int, optional
+            The size of the chunks ingested pages are split into, the one the database was built with, see `RAG`
+            (default is 500).
+        chunk_overlap : int, optional
+            The overlap between consecutive chunks (default is 50).
+        chunk_engine : str, optional
+            The chunking engine (default is "recursive").
+        read_only : bool, optional
+            Whether to open the database without ever writing to it, see `RAG` (default is False).
 
         Returns
         -------
         RAG
             The created RAG instance.
+
+        Raises
+        ------
+        FileNotFoundError
+            If a database opened read-only does not exist.
         """
-        db = Indexer.load_db(db_path, embedding_model=embedding_model)
-        return RAG(db=db, completion_model=completion_model, embedding_model=embedding_model)
+        db = Indexer.load_db(
+            IndexVersions.current(db_path), 
+            embedding_model=embedding_model, 
+            embedding_cache_path=embedding_cache_path, 
+            clients=clients, 
+            backend=vector_backend,
+            quantization=vector_quantization,
+            search_dimensions=search_dimensions,
+            read_only=read_only
+        )
+        return RAG(
+            db=db, 
+            completion_model=completion_model, 
+            embedding_model=embedding_model, 
+            embedding_cache_path=embedding_cache_path, 
+            persist_directory=db_path, 
+            hybrid=hybrid,
+            answer_cache=answer_cache,
+            clients=clients,
+            batch_window=batch_window,
+            max_batch=max_batch,
+            tracer=tracer,
+            vector_backend=vector_backend,
+            vector_quantization=vector_quantization,
+            search_dimensions=search_dimensions,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            chunk_engine=chunk_engine,
+            read_only=read_only
+        )
 
     def _create_rag_chain(self) -> None:
         """
@@ -188,5 +1249,170 @@ class RAG:
         Contexto fornecido: {context}
         """
         prompt = ChatPromptTemplate.from_messages([("system", system_prompt),("human", "{input}")])
-        question_answer_chain = create_stuff_documents_chain(ChatOpenAI(model=self.completion_model), prompt)
-        self.rag_chain = create_retrieval_chain(self.retriever, question_answer_chain)
+        llm = self.llm if self.llm is not None else self.clients.chat_model(self.completion_model)
+        self.question_answer_chain = create_stuff_documents_chain(llm, prompt)
+        self.rag_chain = create_retrieval_chain(self._assembled(self.retriever), self.question_answer_chain)
+        self._mode_chains = {self.retrieval_mode: self.rag_chain}
+
+    def _get_chain(self, mode: Optional[str] = None) -> Runnable:
+        """
+        Returns the RAG chain for the specified retrieval mode, building it on first use.
+
+        The chain is not leased: a swap may close its index version while it runs, so queries use `_checkout`.
+
+        Parameters
+        ----------
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the RAG's retrieval_mode).
+
+        Returns
+        -------
+        Runnable
+            The RAG chain using a retriever of that mode.
+        """
+        with self._swap_lock:
+            return self._mode_chain(mode)
+
+    @contextmanager
+    def _checkout(self, mode: Optional[str] = None) -> Iterator[Runnable]:
+        """
+        Leases the index version in use for the duration of a query and yields its RAG chain.
+
+        Parameters
+        ----------
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the RAG's retrieval_mode).
+
+        Yields
+        ------
+        Runnable
+            The RAG chain using a retriever of that mode, on the leased version.
+        """
+        with self._swap_lock:
+            chain = self._mode_chain(mode)
+            directory = self._acquire()
+        try:
+            yield chain
+        finally:
+            self._release(directory)
+
+    @contextmanager
+    def _lease(self) -> Iterator[Optional[VectorStore]]:
+        """
+        Leases the index version in use and yields its database, which stays open until the lease ends.
+
+        Yields
+        ------
+        Optional[VectorStore]
+            The database, or None if none is open yet.
+        """
+        with self._swap_lock:
+            db = self.db
+            directory = self._acquire()
+        try:
+            yield db
+        finally:
+            self._release(directory)
+
+    def _acquire(self) -> str:
+        """
+        Counts a lease on the index version in use. The swap lock must be held.
+
+        Returns
+        -------
+        str
+            The directory of the leased version, to pass to `_release`.
+        """
+        self._leases[self.index_directory] = self._leases.get(self.index_directory, 0) + 1
+        return self.index_directory
+
+    def _release(self, directory: str) -> None:
+        """
+        Ends a lease, closing the version if it was replaced and this was its last lease.
+
+        Parameters
+        ----------
+        directory : str
+            The directory returned by `_acquire`.
+        """
+        with self._swap_lock:
+            self._leases[directory] -= 1
+            if self._leases[directory]:
+                return
+            del self._leases[directory]
+            retired = self._retired.pop(directory, None)
+        if retired is not None:
+            RAG._close_version(*retired)
+
+    @staticmethod
+    def _close_version(db: VectorStore, bm25_index: Optional[BM25Index], batcher: Optional[QueryBatcher]) -> None:
+        """
+        Closes the search batcher, the database and the BM25 index of a replaced index version, releasing their
+        thread and files.
+
+        Parameters
+        ----------
+        db : VectorStore
+            The database. Chroma databases are left to the garbage collector.
+        bm25_index : Optional[BM25Index]
+            The BM25 index, or None.
+        batcher : Optional[QueryBatcher]
+            The search batcher, or None. Its pending searches finish first.
+        """
+        if batcher is not None:
+            batcher.close()
+        close = getattr(db, "close", None)
+        if close is not None:
+            close()
+        if bm25_index is not None:
+            bm25_index.close()
+
+    def _mode_chain(self, mode: Optional[str] = None) -> Runnable:
+        """
+        Returns the RAG chain for the specified retrieval mode, building it on first use. The swap lock must be held.
+
+        Parameters
+        ----------
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the RAG's retrieval_mode).
+
+        Returns
+        -------
+        Runnable
+            The RAG chain using a retriever of that mode.
+        """
+        mode = mode or self.retrieval_mode
+        if mode not in self._mode_chains:
+            retriever = Retriever.create_retriever_from_db(
+                self.db, 
+                model=self.completion_model, 
+                top_k=self.top_k, 
+                llm=self._rewrite_llm(), 
+                mode=mode, 
+                expansion_cache=self.expansion_cache, 
+                tracer=self.tracer,
+                bm25_index=self.bm25_index,
+                batcher=self._query_batcher()
+            )
+            self._mode_chains[mode] = create_retrieval_chain(self._assembled(retriever), self.question_answer_chain)
+        return self._mode_chains[mode]
+
+    def _assembled(self, retriever: BaseRetriever) -> Runnable:
+        """
+        Wraps a retriever with the context assembly stage, if there is one.
+
+        Parameters
+        ----------
+        retriever : BaseRetriever
+            The retriever of a RAG chain.
+
+        Returns
+        -------
+        Runnable
+            A runnable taking the chain input and returning the documents to stuff into the prompt.
+        """
+        if self.context_assembler is None:
+            return retriever
+        return RunnablePassthrough.assign(documents=itemgetter("input") | retriever) | RunnableLambda(
+            lambda inputs: self.context_assembler.assemble(inputs["input"], inputs["documents"])
+        )
@@ -1,38 +1,368 @@
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain_openai import ChatOpenAI
-from langchain_chroma import Chroma
-from typing import Optional
+from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT, LineListOutputParser
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models import BaseLanguageModel
+from typing import Callable, Dict, Iterator, List, Optional
+from langchain_core.documents.base import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.retrievers import BaseRetriever
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict
+from clients import default_registry
+from hashing import content_hash
+from indexer import Indexer
+from batching import QueryBatcher
+from tracing import Tracer
+from bm25 import BM25Index
+import threading
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODES = ("similarity", "mmr", "multi_query", "auto")
+
+
+class ExpansionCache:
+    """
+    A bounded LRU cache of the rewritten questions generated for each question.
+
+    Methods
+    -------
+    get(question: str) -> Optional[List[str]]
+        Returns the cached rewrites of a question, if any.
+    put(question: str, queries: List[str]) -> None
+        Caches the rewrites of a question.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.capacity: int = capacity
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, question: str) -> bool:
+        return question in self._entries
+
+    def get(self, question: str) -> Optional[List[str]]:
+        with self._lock:
+            queries = self._entries.get(question)
+            if queries is not None:
+                self._entries.move_to_end(question)
+            return queries
+
+    def put(self, question: str, queries: List[str]) -> None:
+        with self._lock:
+            self._entries[question] = queries
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = 60, top_n: Optional[int] = None) -> List[Document]:
+    """
+    Merges several ranked lists of documents with reciprocal rank fusion, removing duplicates.
+
+    Parameters
+    ----------
+    result_lists : List[List[Document]]
+        The ranked lists to merge, best result first.
+    k : int, optional
+        The RRF constant; larger values flatten the contribution of the top ranks (default is 60).
+    top_n : Optional[int], optional
+        The number of documents to return, None returns all of them (default is None).
+
+    Returns
+    -------
+    List[Document]
+        The unique documents ordered by their fused score, best first.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, document)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:top_n]]
+
+
+def document_key(document: Document) -> str:
+    """
+    Returns the key used to recognize the same chunk in different result lists.
+
+    Parameters
+    ----------
+    document : Document
+        The retrieved chunk.
+
+    Returns
+    -------
+    str
+        The chunk ID when available, otherwise a hash of the source URL, start index and content.
+    """
+    if "chunk_id" in document.metadata:
+        return document.metadata["chunk_id"]
+    return content_hash(f"{document.metadata.get('source', '')}\x00{document.metadata.get('start_index', '')}\x00{document.page_content}")
+
+
+class FusionRetriever(BaseRetriever):
+    """
+    A retriever that optionally expands the question with an LLM and searches the rewrites in parallel.
+
+    In "multi_query" mode the LLM generates alternative phrasings of the question; the original question and its
+    rewrites are searched concurrently and the results are merged with reciprocal rank fusion. In "auto" mode the
+    expansion is skipped for short, keyword-like questions, which are searched directly. Rewrites are cached per
+    question, so repeated questions never pay for the expansion call twice.
+
+    Attributes
+    ----------
+    vectorstore : VectorStore
+        The vector store to search.
+    llm : Optional[BaseLanguageModel]
+        The model used to rewrite the question.
+    top_k : int
+        The number of documents returned, and searched per rewrite.
+    mode : str
+        "multi_query", "auto", or "similarity" to never expand.
+    auto_max_words : int
+        In "auto" mode, questions with at most this many words are not expanded.
+    expansion_cache : Optional[ExpansionCache]
+        The cache of rewrites, None disables it.
+    tracer : Optional[Tracer]
+        Where the latency of the expansion and search stages, and expansion cache hits, are recorded.
+    batcher : Optional[QueryBatcher]
+        The scheduler batching the searches with those of concurrent questions, None searches directly.
+    """
+
+    vectorstore: VectorStore
+    llm: Optional[BaseLanguageModel] = None
+    top_k: int = 10
+    mode: str = "multi_query"
+    auto_max_words: int = 4
+    expansion_cache: Optional[ExpansionCache] = None
+    tracer: Optional[Tracer] = None
+    batcher: Optional[QueryBatcher] = None
+
+    def should_expand(self, question: str) -> bool:
+        """
+        Decides whether the question is rewritten by the LLM before searching.
+
+        Parameters
+        ----------
+        question : str
+            The question asked by the user.
+
+        Returns
+        -------
+        bool
+            False in "similarity" mode and in "auto" mode for questions of at most `auto_max_words` words, True
+            otherwise.
+        """
+        if self.llm is None or self.mode == "similarity":
+            return False
+        if self.mode == "auto":
+            return len(question.split()) > self.auto_max_words
+        return True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        queries = [query]
+        if self.should_expand(query):
+            with self._time("retrieval.expansion"):
+                queries = self._expand(query, run_manager)
+
+        with self._time("retrieval.search"):
+            if self.batcher is not None:
+                results = [future.result() for future in [self.batcher.submit(q, self.top_k) for q in queries]]
+            else:
+                with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                    results = list(executor.map(lambda q: self.vectorstore.similarity_search(q, k=self.top_k), queries))
+
+        return reciprocal_rank_fusion(results, top_n=self.top_k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        queries = [query]
+        if self.should_expand(query):
+            with self._time("retrieval.expansion"):
+                queries = await self._aexpand(query, run_manager)
+
+        with self._time("retrieval.search"):
+            if self.batcher is not None:
+                results = await asyncio.gather(*(self.batcher.asearch(q, self.top_k) for q in queries))
+            else:
+                results = await asyncio.gather(*(self.vectorstore.asimilarity_search(q, k=self.top_k) for q in queries))
+
+        return reciprocal_rank_fusion(list(results), top_n=self.top_k)
+
+    def _expand(self, query: str, run_manager: CallbackManagerForRetrieverRun) -> List[str]:
+        if self.expansion_cache is not None and (cached := self.expansion_cache.get(query)) is not None:
+            self._count("cache.expansion.hits")
+            return cached
+        rewrites = (DEFAULT_QUERY_PROMPT | self.llm | LineListOutputParser()).invoke(
+            {"question": query}, config={"callbacks": run_manager.get_child()}
+        )
+        return self._remember(query, rewrites)
+
+    async def _aexpand(self, query: str, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[str]:
+        if self.expansion_cache is not None and (cached := self.expansion_cache.get(query)) is not None:
+            self._count("cache.expansion.hits")
+            return cached
+        rewrites = await (DEFAULT_QUERY_PROMPT | self.llm | LineListOutputParser()).ainvoke(
+            {"question": query}, config={"callbacks": run_manager.get_child()}
+        )
+        return self._remember(query, rewrites)
+
+    def _remember(self, query: str, rewrites: List[str]) -> List[str]:
+        queries = list(dict.fromkeys([query, *(rewrite.strip() for rewrite in rewrites if rewrite.strip())]))
+        if self.expansion_cache is not None:
+            self.expansion_cache.put(query, queries)
+        return queries
+
+    def _time(self, stage: str):
+        return self.tracer.time(stage) if self.tracer is not None else _no_timing()
+
+    def _count(self, name: str) -> None:
+        if self.tracer is not None:
+            self.tracer.count(name)
+
+
+@contextmanager
+def _no_timing() -> Iterator[None]:
+    yield
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    A retriever that merges a dense retriever with BM25 lexical search using reciprocal rank fusion.
+
+    Lexical search catches exact proper nouns (neighborhoods, agencies) that dense embeddings rank poorly, while
+    the dense retriever catches paraphrases.
+
+    Attributes
+    ----------
+    dense : BaseRetriever
+        The embedding-based retriever.
+    bm25_index : BM25Index
+        The lexical index built from the same chunks.
+    resolver : Callable[[List[str]], List[Document]]
+        A function returning the chunks for a list of chunk IDs, in the same order.
+    top_k : int
+        The number of documents returned, and requested from each side.
+    tracer : Optional[Tracer]
+        Where the latency of the lexical search is recorded.
+    """
+
+    dense: BaseRetriever
+    bm25_index: BM25Index
+    resolver: Callable[[List[str]], List[Document]]
+    top_k: int = 10
+    tracer: Optional[Tracer] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense_results = self.dense.invoke(query, config={"callbacks": run_manager.get_child()})
+        return reciprocal_rank_fusion([dense_results, self._lexical(query)], top_n=self.top_k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        dense_results, lexical_results = await asyncio.gather(
+            self.dense.ainvoke(query, config={"callbacks": run_manager.get_child()}),
+            asyncio.to_thread(self._lexical, query),
+        )
+        return reciprocal_rank_fusion([dense_results, lexical_results], top_n=self.top_k)
+
+    def _lexical(self, query: str) -> List[Document]:
+        with self.tracer.time("retrieval.bm25") if self.tracer is not None else _no_timing():
+            return self.resolver([chunk_id for chunk_id, _ in self.bm25_index.search(query, k=self.top_k)])
+
 
 class Retriever:
     """
-    A class used for creating a retriever from a Chroma vector database using a specified model.
+    A class used for creating a retriever from a vector database using a specified model.
 
     Methods
     -------
-    create_retriever_from_db(db: Chroma, model: Optional[str] = "gpt-3.5-turbo", top_k: Optional[int] = 10) -> MultiQueryRetriever
-        Creates a MultiQueryRetriever from a Chroma vector database.
+    create_retriever_from_db(db: VectorStore, model: Optional[str] = "gpt-3.5-turbo", top_k: Optional[int] = 10, llm: Optional[BaseChatModel] = None, mode: str = "multi_query", expansion_cache: Optional[ExpansionCache] = None, tracer: Optional[Tracer] = None, bm25_index: Optional[BM25Index] = None, batcher: Optional[QueryBatcher] = None) -> BaseRetriever
+        Creates a retriever from a vector database for the specified retrieval mode, optionally fused with BM25.
     """
 
     @staticmethod
-    def create_retriever_from_db(db: Chroma, model: Optional[str] = "gpt-3.5-turbo", top_k: Optional[int] = 10) -> MultiQueryRetriever:
+    def create_retriever_from_db(
+            db: VectorStore,
+            model: Optional[str] = "gpt-3.5-turbo",
+            top_k: Optional[int] = 10,
+            llm: Optional[BaseChatModel] = None,
+            mode: str = "multi_query",
+            expansion_cache: Optional[ExpansionCache] = None,
+            tracer: Optional[Tracer] = None,
+            bm25_index: Optional[BM25Index] = None,
+            batcher: Optional[QueryBatcher] = None
+        ) -> BaseRetriever:
         """
-        Creates a MultiQueryRetriever from a Chroma vector database.
+        Creates a retriever from a vector database for the specified retrieval mode, optionally fused with BM25.
 
         Parameters
         ----------
-        db : Chroma
-            The Chroma vector database to use as the retriever.
+        db : VectorStore
+            The vector database to use as the retriever, a Chroma database or a `NumpyVectorStore`.
         model : Optional[str], optional
             The name of the model to use for the retriever (default is "gpt-3.5-turbo").
         top_k : Optional[int], optional
             The number of top documents to retrieve (default is 10).
+        llm : Optional[BaseChatModel], optional
+            The chat model used to rewrite the question, instead of the shared ChatOpenAI client of model (default is None).
+        mode : str, optional
+            The retrieval mode (default is "multi_query"):
+            "similarity" searches the question directly,
+            "mmr" searches the question with maximal marginal relevance to diversify the results,
+            "multi_query" rewrites the question with the LLM and searches the rewrites in parallel,
+            "auto" behaves like "multi_query" but skips the rewrite for short questions.
+        expansion_cache : Optional[ExpansionCache], optional
+            The cache of question rewrites shared by the multi-query retrievers (default is None).
+        tracer : Optional[Tracer], optional
+            Where the latency of the retrieval stages is recorded (default is None).
+        bm25_index : Optional[BM25Index], optional
+            A lexical index of the same chunks. When given, the retriever of the selected mode is combined with
+            BM25 search through reciprocal rank fusion (default is None).
+        batcher : Optional[QueryBatcher], optional
+            The scheduler batching the vector searches of concurrent questions, used by every mode except "mmr"
+            (default is None, meaning each question searches on its own).
 
         Returns
         -------
-        MultiQueryRetriever
-            The created MultiQueryRetriever.
+        BaseRetriever
+            The created retriever.
+
+        Raises
+        ------
+        ValueError
+            If the mode is unknown.
         """
-        llm = ChatOpenAI(model=model, temperature=0)
-        retriever = MultiQueryRetriever.from_llm(retriever=db.as_retriever(top_k=top_k), llm=llm)
-        
-        return retriever
+        if mode == "similarity" and batcher is not None:
+            retriever = FusionRetriever(vectorstore=db, top_k=top_k, mode=mode, tracer=tracer, batcher=batcher)
+        elif mode == "similarity":
+            retriever = db.as_retriever(search_kwargs={"k": top_k})
+        elif mode == "mmr":
+            retriever = db.as_retriever(search_type="mmr", search_kwargs={"k": top_k, "fetch_k": top_k * 4})
+        elif mode in MODES:
+            llm = llm if llm is not None else default_registry().chat_model(model, temperature=0)
+            retriever = FusionRetriever(
+                vectorstore=db, 
+                llm=llm, 
+                top_k=top_k, 
+                mode=mode, 
+                expansion_cache=expansion_cache, 
+                tracer=tracer, 
+                batcher=batcher
+            )
+        else:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {MODES}")
+
+        if bm25_index is None:
+            return retriever
+        return HybridRetriever(
+            dense=retriever, 
+            bm25_index=bm25_index, 
+            resolver=lambda ids: Indexer.get_documents(db, ids), 
+            top_k=top_k, 
+            tracer=tracer
+        )
@@ -0,0 +1,640 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from langchain_core.documents.base import Document
+from multiprocessing.connection import Connection, wait
+from concurrent.futures import Future
+from context_store import ContextStore
+from answer_cache import AnswerCache
+from clients import ClientRegistry
+from rag import RAG
+import multiprocessing
+import threading
+import logging
+import asyncio
+import queue
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+NOT_READY_ANSWER = "The index is still being built, check the ingestion jobs and try again shortly."
+# the RAG settings a worker process opens the index with, see `WorkerPool.from_rag`; workers only embed
+# questions, so they run without the writer's embedding cache
+RAG_OPTIONS = (
+    "completion_model", "embedding_model", "hybrid", "batch_window", "max_batch", "vector_backend",
+    "vector_quantization", "search_dimensions"
+)
+
+
+class ServedAnswer(NamedTuple):
+    """
+    The answer of a query worker.
+
+    Attributes
+    ----------
+    request_id : str
+        The request ID of the query, to pass to `WorkerPool.get_context`.
+    answer : str
+        The generated answer.
+    context : List[Document]
+        The documents retrieved for the answer.
+    index_directory : Optional[str]
+        The directory of the index version the query ran on, or None if there was no index yet.
+    worker : int
+        The number of the worker process that answered.
+    """
+    request_id: str
+    answer: str
+    context: List[Document]
+    index_directory: Optional[str]
+    worker: int
+
+
+class WorkerPool:
+    """
+    Serves queries from several worker processes sharing one on-disk index, opened read-only and memory-mapped.
+
+    Each worker opens the current version of the index in persist_directory as a read-only RAG (see
+    `NumpyVectorStore`): the embedding matrix and the BM25 index are memory-mapped, so the operating system keeps
+    one copy of their pages for every worker and the resident memory of the index does not multiply with the
+    number of workers. Queries are taken from a shared queue by a few threads per worker, so a slow model call
+    does not hold a worker, and CPU-bound work (retrieval, context assembly, the chain itself) runs in parallel
+    across processes instead of contending for one interpreter lock.
+
+    Workers never write. A single writer, usually the front-end process through its `IngestionQueue`, ingests
+    with `RAG.add_documents_isolated` and publishes new index versions (see `IndexVersions`); every worker polls
+    the CURRENT pointer and swaps a new version in with `RAG.reload`, so each query runs entirely on one version.
+
+    Each worker has its own request and response pipes, and the pool sends every query to the worker with the
+    fewest queries in flight, so it knows which queries each worker holds: when one exits, the queries it held
+    fail at once instead of waiting forever, and it is restarted. (A queue shared by every worker would also be
+    left locked by a worker killed while reading from it.) A worker that exits before opening the index is not
+    restarted, since it would most likely fail again. Queries that get no answer within `request_timeout` fail
+    too.
+
+    Answers are not streamed across processes: `query` returns them complete, with their context, which the pool
+    keeps for `get_context`.
+
+    Attributes
+    ----------
+    persist_directory : str
+        The directory of the index versions.
+    workers : int
+        The number of worker processes.
+    contexts : ContextStore
+        The contexts of the answered queries, keyed by request ID.
+    versions : Dict[int, Optional[str]]
+        The index version each worker last answered on.
+    request_timeout : Optional[float]
+        The number of seconds after which a query without an answer fails, or None for no limit.
+    restarts : int
+        The number of workers restarted after exiting.
+
+    Methods
+    -------
+    submit(question: str, mode: Optional[str] = None) -> Future
+        Queues a query and returns a future of its ServedAnswer.
+    query(question: str, mode: Optional[str] = None, timeout: Optional[float] = None) -> ServedAnswer
+        Answers a query on one of the workers.
+    aquery(question: str, mode: Optional[str] = None, timeout: Optional[float] = None) -> ServedAnswer
+        Asynchronously answers a query on one of the workers.
+    get_context(request_id: str) -> List[Document]
+        Returns the documents retrieved for a previous query.
+    wait_ready(timeout: Optional[float] = None) -> bool
+        Waits until every worker has opened the index.
+    pids() -> List[int]
+        Returns the process IDs of the workers.
+    close() -> None
+        Stops the workers, failing the queries still queued.
+    from_rag(rag: RAG, workers: int = 2, **kwargs) -> WorkerPool
+        Creates a pool serving the index of a RAG instance with the same settings.
+    """
+
+    CHECK_INTERVAL = 0.5
+
+    def __init__(
+            self,
+            persist_directory: str,
+            workers: int = 2,
+            rag_options: Optional[Dict[str, Any]] = None,
+            threads: int = 4,
+            poll_interval: float = 1.0,
+            clients_factory: Optional[Callable[[], ClientRegistry]] = None,
+            answer_cache_options: Optional[Dict[str, Any]] = None,
+            context_store: Optional[ContextStore] = None,
+            start_method: str = "spawn",
+            request_timeout: Optional[float] = 300.0
+        ) -> None:
+        """
+        Starts the worker processes.
+
+        Parameters
+        ----------
+        persist_directory : str
+            The directory of the index versions, as passed to `RAG`.
+        workers : int, optional
+            The number of worker processes (default is 2).
+        rag_options : Optional[Dict[str, Any]], optional
+            The keyword arguments of `RAG.from_db` each worker opens the index with, e.g. the models and the
+            quantization. The vector backend must be "numpy". Workers open no embedding cache unless
+            "embedding_cache_path" is given, since they only embed questions, which bypass it, and every worker
+            writing to one SQLite file would serialize them (default is None, meaning {"vector_backend": "numpy"}).
+        threads : int, optional
+            The number of queries each worker runs concurrently (default is 4).
+        poll_interval : float, optional
+            The number of seconds between checks of each worker for a new index version (default is 1.0).
+        clients_factory : Optional[Callable[[], ClientRegistry]], optional
+            A picklable callable returning the model clients of a worker, e.g. a class of fake models for load
+            tests (default is None, meaning the default registry of each worker process).
+        answer_cache_options : Optional[Dict[str, Any]], optional
+            The keyword arguments of the `AnswerCache` of each worker, which is invalidated when the worker
+            reloads the index (default is None, meaning answers are not cached).
+        context_store : Optional[ContextStore], optional
+            The store of the contexts of answered queries (default is None, meaning a ContextStore with default
+            limits).
+        start_method : str, optional
+            The multiprocessing start method; "spawn" starts every worker from a fresh interpreter, without the
+            threads and open files of the front end (default is "spawn").
+        request_timeout : Optional[float], optional
+            The number of seconds after which a query that got no answer fails with TimeoutError, e.g. because
+            its worker hung. None waits forever (default is 300.0).
+
+        Raises
+        ------
+        ValueError
+            If workers is not positive, or the vector backend is not "numpy".
+        """
+        rag_options = {"vector_backend": "numpy", "embedding_cache_path": None, **(rag_options or {})}
+        if workers < 1:
+            raise ValueError(f"Expected at least one worker, got {workers}")
+        if rag_options["vector_backend"] != "numpy":
+            raise ValueError(f"Worker processes share the index read-only, which needs the numpy backend, not {rag_options['vector_backend']!r}")
+
+        self.persist_directory: str = persist_directory
+        self.workers: int = workers
+        self.threads: int = max(1, threads)
+        self.contexts: ContextStore = context_store if context_store is not None else ContextStore()
+        self.versions: Dict[int, Optional[str]] = {}
+        self.request_timeout: Optional[float] = request_timeout
+        self.restarts: int = 0
+        self._pending: Dict[str, Tuple[Future, Optional[float]]] = {}
+        self._assigned: List[Set[str]] = [set() for _ in range(workers)]
+        self._opened: List[bool] = [False] * workers
+        self._failed: Set[int] = set()
+        self._next: int = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._closed = False
+
+        self._context = multiprocessing.get_context(start_method)
+        self._arguments = (persist_directory, rag_options, clients_factory, answer_cache_options, self.threads, poll_interval)
+        self._processes: List[multiprocessing.Process] = []
+        self._requests: List[Optional[Connection]] = []
+        self._responses: List[Optional[Connection]] = []
+        for worker in range(workers):
+            self._processes.append(None)
+            self._requests.append(None)
+            self._responses.append(None)
+            self._start(worker)
+        self._collector = threading.Thread(target=self._collect, name="rag-worker-responses", daemon=True)
+        self._collector.start()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, question: str, mode: Optional[str] = None) -> Future:
+        """
+        Sends a query to the worker with the fewest queries in flight.
+
+        Parameters
+        ----------
+        question : str
+            The question.
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the workers' default retrieval mode).
+
+        Returns
+        -------
+        Future
+            A future of the ServedAnswer. It fails with RuntimeError if the worker raised or exited or the pool
+            closed, and with TimeoutError if no answer came within request_timeout.
+
+        Raises
+        ------
+        RuntimeError
+            If the pool is closed, or no worker could open the index.
+        """
+        future: Future = Future()
+        # running futures cannot be cancelled, so a caller giving up never races the collector settling it
+        future.set_running_or_notify_cancel()
+        request_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.request_timeout if self.request_timeout is not None else None
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The worker pool is closed")
+            workers = [worker for worker in range(self.workers) if worker not in self._failed]
+            if not workers:
+                raise RuntimeError(f"Every worker of {self.persist_directory} exited before opening the index")
+            # the least busy worker, taking turns among equally busy ones
+            worker = min(workers, key=lambda worker: (len(self._assigned[worker]), (worker - self._next) % self.workers))
+            self._next = worker + 1
+            self._pending[request_id] = (future, deadline)
+            self._assigned[worker].add(request_id)
+            try:
+                self._requests[worker].send((request_id, question, mode))
+            except OSError:
+                # the worker exited; its queries, this one included, fail when the collector notices
+                pass
+        return future
+
+    def query(self, question: str, mode: Optional[str] = None, timeout: Optional[float] = None) -> ServedAnswer:
+        """
+        Answers a query on one of the workers.
+
+        Parameters
+        ----------
+        question : str
+            The question.
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the workers' default retrieval mode).
+        timeout : Optional[float], optional
+            The number of seconds to wait for the answer (default is None, meaning up to request_timeout).
+
+        Returns
+        -------
+        ServedAnswer
+            The answer, its context and the index version and worker it came from.
+        """
+        return self.submit(question, mode).result(timeout)
+
+    async def aquery(self, question: str, mode: Optional[str] = None, timeout: Optional[float] = None) -> ServedAnswer:
+        """
+        Asynchronously answers a query on one of the workers, without blocking the event loop.
+
+        Parameters
+        ----------
+        question : str
+            The question.
+        mode : Optional[str], optional
+            The retrieval mode (default is None, meaning the workers' default retrieval mode).
+        timeout : Optional[float], optional
+            The number of seconds to wait for the answer before raising asyncio.TimeoutError (default is None,
+            meaning up to request_timeout).
+
+        Returns
+        -------
+        ServedAnswer
+            The answer, its context and the index version and worker it came from.
+        """
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(question, mode)), timeout)
+
+    def get_context(self, request_id: str) -> List[Document]:
+        """
+        Returns the documents retrieved for a previous query.
+
+        Parameters
+        ----------
+        request_id : str
+            The request ID of the ServedAnswer.
+
+        Returns
+        -------
+        List[Document]
+            The retrieved documents, or an empty list if the context is unknown or was evicted.
+        """
+        return self.contexts.get(request_id, [])
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every worker has opened the index, or found there is none yet.
+
+        Parameters
+        ----------
+        timeout : Optional[float], optional
+            The number of seconds to wait (default is None, meaning no limit).
+
+        Returns
+        -------
+        bool
+            True if every worker is ready, False on timeout or if a worker exited before opening the index.
+        """
+        return self._ready.wait(timeout) and not self._failed
+
+    def pids(self) -> List[int]:
+        """
+        Returns the process IDs of the workers.
+
+        Returns
+        -------
+        List[int]
+            The process IDs, in worker order.
+        """
+        return [process.pid for process in self._processes]
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stops the workers once they have answered the queries they were sent.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The number of seconds to wait for each worker before terminating it, failing its queries (default is
+            10.0).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for connection in self._requests:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Terminating worker %s", process.name)
+                process.terminate()
+                process.join()
+        self._stopped.set()
+        self._collector.join()
+        self._fail_pending("The worker pool is closed")
+        for connection in self._requests + self._responses:
+            if connection is not None:
+                connection.close()
+
+    def _start(self, worker: int) -> None:
+        """
+        Starts the process of a worker with new pipes, closing the pipes of its previous process.
+        """
+        for connection in (self._requests[worker], self._responses[worker]):
+            if connection is not None:
+                connection.close()
+        requests_reader, requests_writer = self._context.Pipe(duplex=False)
+        responses_reader, responses_writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_serve,
+            args=(worker, *self._arguments, requests_reader, responses_writer),
+            name=f"rag-worker-{worker}",
+            daemon=True
+        )
+        process.start()
+        # only the worker holds these ends now, so its exit closes them
+        requests_reader.close()
+        responses_writer.close()
+        self._processes[worker] = process
+        self._requests[worker] = requests_writer
+        self._responses[worker] = responses_reader
+
+    def _collect(self) -> None:
+        """
+        Resolves the futures of answered queries, and checks the workers and the deadlines of the queries every
+        CHECK_INTERVAL seconds, until the pool closes.
+        """
+        next_check = time.monotonic() + self.CHECK_INTERVAL
+        while not self._stopped.is_set():
+            self._read(self.CHECK_INTERVAL)
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                self._expire()
+                next_check = time.monotonic() + self.CHECK_INTERVAL
+        self._read(0)
+
+    def _read(self, timeout: float) -> None:
+        """
+        Handles the messages of every worker that sent one, waiting up to timeout seconds for one.
+        """
+        connections = {connection: worker for worker, connection in enumerate(self._responses) if connection is not None}
+        if not connections:
+            time.sleep(timeout)
+            return
+        for connection in wait(list(connections), timeout):
+            worker = connections[connection]
+            try:
+                while connection.poll():
+                    self._receive(*connection.recv())
+            except (EOFError, OSError):
+                # the worker exited; `_check_workers` fails its queries and restarts it
+                connection.close()
+                self._responses[worker] = None
+
+    def _receive(self, kind: str, worker: int, directory: Optional[str], payload: Tuple) -> None:
+        """
+        Handles a message of a worker: its readiness, or an answer or error.
+        """
+        if kind in ("ready", "answer"):
+            self.versions[worker] = directory
+        if kind == "ready":
+            self._opened[worker] = True
+            self._update_ready()
+            return
+        request_id = payload[0]
+        with self._lock:
+            self._assigned[worker].discard(request_id)
+        future = self._pop(request_id)
+        if future is None:
+            return
+        if kind == "error":
+            future.set_exception(RuntimeError(payload[1]))
+        else:
+            _, answer, context = payload
+            self.contexts.put(context, request_id)
+            future.set_result(ServedAnswer(request_id, answer, context, directory, worker))
+
+    def _check_workers(self) -> None:
+        """
+        Fails the queries of the workers that exited and restarts them, unless they exited before opening the
+        index.
+        """
+        for worker, process in enumerate(self._processes):
+            if worker in self._failed or process.is_alive():
+                continue
+            with self._lock:
+                if self._closed:
+                    return
+                assigned, self._assigned[worker] = self._assigned[worker], set()
+                if self._opened[worker]:
+                    logger.error("Worker %d exited with code %s, failing %d queries and restarting it", worker, process.exitcode, len(assigned))
+                    self._opened[worker] = False
+                    self.restarts += 1
+                    self._start(worker)
+                else:
+                    logger.error("Worker %d of %s exited with code %s before opening the index", worker, self.persist_directory, process.exitcode)
+                    self._failed.add(worker)
+            for request_id in assigned:
+                future = self._pop(request_id)
+                if future is not None:
+                    future.set_exception(RuntimeError(f"Worker {worker} exited with code {process.exitcode} before answering"))
+            self._update_ready()
+        if len(self._failed) == self.workers:
+            self._fail_pending(f"Every worker of {self.persist_directory} exited before opening the index")
+
+    def _expire(self) -> None:
+        """
+        Fails the queries that got no answer within request_timeout.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [request_id for request_id, (_, deadline) in self._pending.items() if deadline is not None and deadline <= now]
+            futures = [self._pending.pop(request_id)[0] for request_id in expired]
+            for assigned in self._assigned:
+                assigned.difference_update(expired)
+        for future in futures:
+            future.set_exception(TimeoutError(f"No answer within {self.request_timeout} s"))
+
+    def _update_ready(self) -> None:
+        if all(self._opened[worker] or worker in self._failed for worker in range(self.workers)):
+            self._ready.set()
+
+    def _pop(self, request_id: str) -> Optional[Future]:
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        return entry[0] if entry is not None else None
+
+    def _fail_pending(self, reason: str) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(RuntimeError(reason))
+
+    @staticmethod
+    def from_rag(rag: RAG, workers: int = 2, **kwargs: Any) -> "WorkerPool":
+        """
+        Creates a pool serving the index of a RAG instance, with the same models and storage settings.
+
+        The RAG instance stays the single writer: documents added to it with `add_documents_isolated`, e.g. by an
+        `IngestionQueue`, are published as new index versions the workers pick up.
+
+        Parameters
+        ----------
+        rag : RAG
+            The RAG instance writing the index.
+        workers : int, optional
+            The number of worker processes (default is 2).
+        **kwargs : Any
+            The other arguments of `WorkerPool`.
+
+        Returns
+        -------
+        WorkerPool
+            The started pool.
+        """
+        options = {name: getattr(rag, name) for name in RAG_OPTIONS}
+        return WorkerPool(rag.persist_directory, workers=workers, rag_options=options, **kwargs)
+
+
+class _Worker:
+    """
+    The state of a worker process: a read-only RAG on the current index version, reopened when a new one is
+    published.
+    """
+
+    def __init__(
+            self,
+            number: int,
+            persist_directory: str,
+            rag_options: Dict[str, Any],
+            clients_factory: Optional[Callable[[], ClientRegistry]],
+            answer_cache_options: Optional[Dict[str, Any]]
+        ) -> None:
+        self.number: int = number
+        self.persist_directory: str = persist_directory
+        self.rag_options: Dict[str, Any] = rag_options
+        self.clients: Optional[ClientRegistry] = clients_factory() if clients_factory is not None else None
+        self.answer_cache_options: Optional[Dict[str, Any]] = answer_cache_options
+        self.rag: Optional[RAG] = None
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """
+        Opens the index if it was not opened yet, or swaps in the version published since the last check.
+        """
+        with self._lock:
+            try:
+                if self.rag is None:
+                    self.rag = RAG.from_db(
+                        self.persist_directory,
+                        answer_cache=AnswerCache(**self.answer_cache_options) if self.answer_cache_options is not None else None,
+                        clients=self.clients,
+                        read_only=True,
+                        **self.rag_options
+                    )
+                    logger.info("Worker %d opened %s", self.number, self.rag.index_directory)
+                elif self.rag.reload():
+                    logger.info("Worker %d switched to %s", self.number, self.rag.index_directory)
+            except FileNotFoundError:
+                logger.debug("Worker %d found no index in %s yet", self.number, self.persist_directory)
+            except Exception:
+                logger.exception("Worker %d failed to open the current index of %s", self.number, self.persist_directory)
+
+    def poll(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.check()
+
+    def answer(self, request_id: str, question: str, mode: Optional[str]) -> Tuple[str, Optional[str], Tuple]:
+        rag = self.rag
+        if rag is None or rag.rag_chain is None:
+            return "answer", None, (request_id, NOT_READY_ANSWER, [])
+        directory = rag.index_directory
+        answer, context_id = rag.query_with_request_id(question, mode=mode)
+        return "answer", directory, (request_id, answer, rag.get_context(context_id))
+
+    def handle(self, inbox: "queue.Queue", reply: Callable[[Tuple], None]) -> None:
+        while True:
+            request = inbox.get()
+            if request is None:
+                return
+            request_id, question, mode = request
+            try:
+                kind, directory, payload = self.answer(request_id, question, mode)
+            except Exception as e:
+                kind, directory, payload = "error", None, (request_id, f"{type(e).__name__}: {e}")
+            reply((kind, self.number, directory, payload))
+
+
+def _serve(
+        number: int,
+        persist_directory: str,
+        rag_options: Dict[str, Any],
+        clients_factory: Optional[Callable[[], ClientRegistry]],
+        answer_cache_options: Optional[Dict[str, Any]],
+        threads: int,
+        poll_interval: float,
+        requests: Connection,
+        responses: Connection
+    ) -> None:
+    """
+    The main function of a worker process: opens the index, reports ready and answers the queries it is sent
+    until the pool closes, or exits, its end of the request pipe.
+    """
+    lock = threading.Lock()
+
+    def reply(message: Tuple) -> None:
+        with lock:
+            responses.send(message)
+
+    worker = _Worker(number, persist_directory, rag_options, clients_factory, answer_cache_options)
+    worker.check()
+    reply(("ready", number, worker.rag.index_directory if worker.rag is not None else None, os.getpid()))
+    threading.Thread(target=worker.poll, args=(poll_interval,), name="index-poll", daemon=True).start()
+    inbox: "queue.Queue" = queue.Queue()
+    handlers = [threading.Thread(target=worker.handle, args=(inbox, reply), name=f"query-{i}") for i in range(threads)]
+    for handler in handlers:
+        handler.start()
+    while True:
+        try:
+            request = requests.recv()
+        except EOFError:
+            request = None
+        if request is None:
+            break
+        inbox.put(request)
+    for _ in handlers:
+        inbox.put(None)
+    for handler in handlers:
+        handler.join()
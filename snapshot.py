@@ -0,0 +1,431 @@
+"""
+Builds and opens versioned index snapshots, so the app can start from a prebuilt index instead of re-ingesting.
+
+Usage: python snapshot.py [--root ./snapshots] [--embedding-model text-embedding-3-small] [--chunk-model gpt-3.5-turbo]
+                          [--vector-backend chroma|numpy] [--quantization float16|int8] [--search-dimensions N]
+"""
+from typing import Dict, List, NamedTuple, Optional
+from answer_cache import AnswerCache
+from clients import ClientRegistry
+from vector_store import BACKENDS, QUANTIZATIONS
+from hashing import content_hash
+from sources import SEED_URLS
+from indexer import Indexer
+from pipeline import IngestionPipeline
+from tracing import Tracer
+from bm25 import BM25Index
+from loader import Chunker
+from rag import RAG
+import argparse
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+class SnapshotManifest(NamedTuple):
+    """
+    The description of an index snapshot.
+
+    Attributes
+    ----------
+    version : str
+        The name of the snapshot directory: build time and a hash of the settings and requested URLs.
+    created_at : float
+        The Unix time the snapshot was built at.
+    embedding_model : str
+        The embedding model of the stored vectors.
+    chunk_model_name : str
+        The model whose tokenizer was used for chunking.
+    chunk_size : int
+        The maximum number of tokens per chunk.
+    chunk_overlap : int
+        The number of tokens overlapping between chunks.
+    chunk_engine : str
+        The chunking engine, see `Chunker`.
+    urls : List[str]
+        The URLs whose chunks are in the snapshot.
+    chunk_count : int
+        The number of chunks at build time.
+    vector_backend : str
+        The vector store implementation of the database, see `Indexer.load_db`.
+    vector_quantization : Optional[str]
+        The quantized storage mode of the "numpy" backend, or None.
+    search_dimensions : Optional[int]
+        The number of leading dimensions of the quantized codes, or None for all of them.
+    """
+    version: str
+    created_at: float
+    embedding_model: str
+    chunk_model_name: str
+    chunk_size: int
+    chunk_overlap: int
+    chunk_engine: str
+    urls: List[str]
+    chunk_count: int
+    vector_backend: str = "chroma"
+    vector_quantization: Optional[str] = None
+    search_dimensions: Optional[int] = None
+
+
+class Snapshot:
+    """
+    A versioned, prebuilt index: a vector database with its chunks and embeddings, the BM25 index and a manifest.
+
+    Each build writes a new directory under the snapshot root; the manifest is written last, so directories
+    without one are incomplete builds and are ignored. Opening a snapshot only opens the database files and maps
+    the BM25 postings, nothing is fetched or embedded.
+
+    Methods
+    -------
+    build(urls: List[str], root: str = "./snapshots", embedding_model: str = "text-embedding-3-small", chunk_model_name: str = "gpt-3.5-turbo", chunk_size: int = 500, chunk_overlap: int = 50, chunk_engine: str = "recursive", embedding_cache_path: Optional[str] = "./embedding_cache.sqlite", vector_backend: str = "chroma", vector_quantization: Optional[str] = None, search_dimensions: Optional[int] = None) -> Snapshot
+        Fetches, chunks and embeds the URLs into a new snapshot.
+    latest(root: str = "./snapshots", embedding_model: Optional[str] = None) -> Optional[Snapshot]
+        Returns the most recent complete snapshot, optionally only among those built with an embedding model.
+    matches(embedding_model: str) -> bool
+        Returns whether the snapshot's vectors were computed with the embedding model.
+    missing_urls(urls: List[str]) -> List[str]
+        Returns the URLs that are not in the snapshot.
+    open_rag(completion_model: str = "gpt-3.5-turbo", embedding_model: Optional[str] = None, embedding_cache_path: Optional[str] = "./embedding_cache.sqlite", answer_cache: Optional[AnswerCache] = None, batch_window: Optional[float] = None, max_batch: int = 32, tracer: Optional[Tracer] = None, clients: Optional[ClientRegistry] = None) -> RAG
+        Opens the snapshot as a RAG instance, chunking new documents like the snapshot.
+    ingest_missing(rag: RAG, urls: List[str]) -> Optional[Dict[str, int]]
+        Adds the URLs missing from the snapshot to a RAG opened on it and records them in the manifest.
+    record_urls(rag: RAG, urls: List[str]) -> None
+        Records in the manifest the URLs whose chunks a RAG opened on the snapshot now stores.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens the manifest of a snapshot.
+
+        Parameters
+        ----------
+        path : str
+            The snapshot directory.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the directory has no manifest, i.e. it is not a complete snapshot.
+        """
+        self.path: str = path
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+            self.manifest: SnapshotManifest = SnapshotManifest(**json.load(f))
+
+    @staticmethod
+    def build(
+            urls: List[str],
+            root: str = "./snapshots",
+            embedding_model: str = "text-embedding-3-small",
+            chunk_model_name: str = "gpt-3.5-turbo",
+            chunk_size: int = 500,
+            chunk_overlap: int = 50,
+            chunk_engine: str = "recursive",
+            embedding_cache_path: Optional[str] = "./embedding_cache.sqlite",
+            vector_backend: str = "chroma",
+            vector_quantization: Optional[str] = None,
+            search_dimensions: Optional[int] = None
+        ) -> "Snapshot":
+        """
+        Fetches, chunks and embeds the URLs into a new snapshot, streaming them through an `IngestionPipeline`.
+
+        Parameters
+        ----------
+        urls : List[str]
+            The URLs to ingest. URLs that fail to load are left out of the manifest, so they are retried by
+            `ingest_missing`.
+        root : str, optional
+            The directory holding the snapshots (default is "./snapshots").
+        embedding_model : str, optional
+            The embedding model (default is "text-embedding-3-small").
+        chunk_model_name : str, optional
+            The model whose tokenizer is used for chunking (default is "gpt-3.5-turbo").
+        chunk_size : int, optional
+            The maximum number of tokens per chunk (default is 500).
+        chunk_overlap : int, optional
+            The number of tokens overlapping between chunks (default is 50).
+        chunk_engine : str, optional
+            The chunking engine, see `Chunker` (default is "recursive").
+        embedding_cache_path : Optional[str], optional
+            The path of the embedding cache, so rebuilding unchanged pages costs no embedding calls. None disables
+            caching (default is "./embedding_cache.sqlite").
+        vector_backend : str, optional
+            The vector store implementation, see `Indexer.load_db`. It is recorded in the manifest, so `open_rag`
+            opens the database with the same one (default is "chroma").
+        vector_quantization : Optional[str], optional
+            The quantized storage mode of the "numpy" backend, "float16" or "int8", also recorded in the manifest
+            (default is None).
+        search_dimensions : Optional[int], optional
+            The number of leading dimensions of the quantized codes (default is None, meaning all of them).
+
+        Returns
+        -------
+        Snapshot
+            The new snapshot.
+        """
+        settings = [embedding_model, chunk_model_name, chunk_size, chunk_overlap, chunk_engine, vector_backend, sorted(urls)]
+        version = "{}-{}".format(time.strftime("%Y%m%dT%H%M%S"), content_hash(json.dumps(settings))[:8])
+        path = os.path.join(root, version)
+
+        db = Indexer.load_db(
+            path, 
+            embedding_model=embedding_model, 
+            embedding_cache_path=embedding_cache_path, 
+            backend=vector_backend, 
+            quantization=vector_quantization, 
+            search_dimensions=search_dimensions
+        )
+        bm25_index = BM25Index()
+        pipeline = IngestionPipeline(
+            db,
+            bm25_index=bm25_index,
+            chunk_model_name=chunk_model_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            chunk_engine=chunk_engine,
+            embedding_model=embedding_model
+        )
+        pipeline.run(urls)
+        bm25_index.save(os.path.join(path, "bm25.idx"))
+
+        stored = db.get(include=["metadatas"])
+        loaded = {metadata.get("source") for metadata in stored["metadatas"]}
+        manifest = SnapshotManifest(
+            version=version,
+            created_at=time.time(),
+            embedding_model=embedding_model,
+            chunk_model_name=chunk_model_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            chunk_engine=chunk_engine,
+            urls=[url for url in urls if url in loaded],
+            chunk_count=len(stored["ids"]),
+            vector_backend=vector_backend,
+            vector_quantization=vector_quantization,
+            search_dimensions=search_dimensions
+        )
+        Snapshot._write_manifest(path, manifest)
+        logger.info("Built snapshot %s with %d chunk(s) from %d URL(s)", path, manifest.chunk_count, len(manifest.urls))
+        return Snapshot(path)
+
+    @staticmethod
+    def latest(root: str = "./snapshots", embedding_model: Optional[str] = None) -> Optional["Snapshot"]:
+        """
+        Returns the most recent complete snapshot, optionally only among those built with an embedding model.
+
+        Parameters
+        ----------
+        root : str, optional
+            The directory holding the snapshots (default is "./snapshots").
+        embedding_model : Optional[str], optional
+            The embedding model the snapshot must have been built with (default is None, meaning any).
+
+        Returns
+        -------
+        Optional[Snapshot]
+            The snapshot, or None if there is no matching one.
+        """
+        if not os.path.isdir(root):
+            return None
+        for version in sorted(os.listdir(root), reverse=True):
+            if not os.path.exists(os.path.join(root, version, MANIFEST_NAME)):
+                continue
+            snapshot = Snapshot(os.path.join(root, version))
+            if embedding_model is None or snapshot.matches(embedding_model):
+                return snapshot
+        return None
+
+    def matches(self, embedding_model: str) -> bool:
+        """
+        Returns whether the snapshot's vectors were computed with the embedding model.
+
+        Parameters
+        ----------
+        embedding_model : str
+            The selected embedding model.
+
+        Returns
+        -------
+        bool
+            True if the snapshot can be queried with that model.
+        """
+        return self.manifest.embedding_model == embedding_model
+
+    def missing_urls(self, urls: List[str]) -> List[str]:
+        """
+        Returns the URLs that are not in the snapshot.
+
+        Parameters
+        ----------
+        urls : List[str]
+            The URLs that should be indexed.
+
+        Returns
+        -------
+        List[str]
+            The URLs absent from the manifest, in input order.
+        """
+        indexed = set(self.manifest.urls)
+        return [url for url in urls if url not in indexed]
+
+    def open_rag(
+            self,
+            completion_model: str = "gpt-3.5-turbo",
+            embedding_model: Optional[str] = None,
+            embedding_cache_path: Optional[str] = "./embedding_cache.sqlite",
+            answer_cache: Optional[AnswerCache] = None,
+            batch_window: Optional[float] = None,
+            max_batch: int = 32,
+            tracer: Optional[Tracer] = None,
+            clients: Optional[ClientRegistry] = None
+        ) -> RAG:
+        """
+        Opens the snapshot as a RAG instance.
+
+        Parameters
+        ----------
+        completion_model : str, optional
+            The model to use for language generation (default is "gpt-3.5-turbo").
+        embedding_model : Optional[str], optional
+            The selected embedding model (default is None, meaning the snapshot's).
+        embedding_cache_path : Optional[str], optional
+            The path of the persistent embedding cache, None disables caching (default is "./embedding_cache.sqlite").
+        answer_cache : Optional[AnswerCache], optional
+            The cache of previous answers (default is None).
+        batch_window : Optional[float], optional
+            The query batching window in seconds, see `RAG` (default is None, meaning no batching).
+        max_batch : int, optional
+            The maximum number of searches in a batch (default is 32).
+        tracer : Optional[Tracer], optional
+            The tracer of the RAG instance (default is None, meaning a new enabled Tracer).
+        clients : Optional[ClientRegistry], optional
+            The registry of shared model clients (default is None, meaning the process-wide default registry).
+
+        Returns
+        -------
+        RAG
+            A RAG instance querying the snapshot. Documents added to it are written into the snapshot, chunked with
+            the snapshot's chunk size, overlap and engine.
+
+        Raises
+        ------
+        ValueError
+            If the snapshot was built with a different embedding model.
+        """
+        if embedding_model is not None and not self.matches(embedding_model):
+            raise ValueError(f"Snapshot {self.path} was built with {self.manifest.embedding_model}, not {embedding_model}")
+        if Chunker._get_encoding(completion_model).name != Chunker._get_encoding(self.manifest.chunk_model_name).name:
+            logger.warning(
+                "Snapshot %s was chunked with the tokenizer of %s; new documents will be chunked for %s",
+                self.path, self.manifest.chunk_model_name, completion_model
+            )
+        return RAG.from_db(
+            self.path,
+            completion_model=completion_model,
+            embedding_model=self.manifest.embedding_model,
+            embedding_cache_path=embedding_cache_path,
+            answer_cache=answer_cache,
+            batch_window=batch_window,
+            max_batch=max_batch,
+            tracer=tracer,
+            clients=clients,
+            vector_backend=self.manifest.vector_backend,
+            vector_quantization=self.manifest.vector_quantization,
+            search_dimensions=self.manifest.search_dimensions,
+            chunk_size=self.manifest.chunk_size,
+            chunk_overlap=self.manifest.chunk_overlap,
+            chunk_engine=self.manifest.chunk_engine
+        )
+
+    def ingest_missing(self, rag: RAG, urls: List[str]) -> Optional[Dict[str, int]]:
+        """
+        Adds the URLs missing from the snapshot to a RAG opened on it and records them in the manifest.
+
+        Parameters
+        ----------
+        rag : RAG
+            A RAG instance returned by `open_rag`.
+        urls : List[str]
+            The URLs that should be indexed.
+
+        Returns
+        -------
+        Optional[Dict[str, int]]
+            The ingestion summary, or None if no URL was missing.
+        """
+        missing = self.missing_urls(urls)
+        if not missing:
+            return None
+
+        summary = rag.add_documents(missing)
+        self.record_urls(rag, missing)
+        return summary
+
+    def record_urls(self, rag: RAG, urls: List[str]) -> None:
+        """
+        Records in the manifest the URLs whose chunks a RAG opened on the snapshot now stores.
+
+        Used after ingesting URLs outside `ingest_missing`, e.g. with an `IngestionQueue`. URLs that failed to
+        load are left out, so they are retried on the next start.
+
+        Parameters
+        ----------
+        rag : RAG
+            A RAG instance returned by `open_rag`.
+        urls : List[str]
+            The URLs that were ingested.
+        """
+        recorded = set(self.manifest.urls)
+        urls = [url for url in urls if url not in recorded]
+        stored = rag.db.get(where={"source": {"$in": urls}}, include=["metadatas"]) if urls else {"metadatas": []}
+        loaded = {metadata.get("source") for metadata in stored["metadatas"]}
+        self.manifest = self.manifest._replace(
+            urls=self.manifest.urls + [url for url in urls if url in loaded],
+            chunk_count=len(rag.db.get(include=[])["ids"])
+        )
+        Snapshot._write_manifest(self.path, self.manifest)
+
+    @staticmethod
+    def _write_manifest(path: str, manifest: SnapshotManifest) -> None:
+        temporary_path = os.path.join(path, MANIFEST_NAME + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(manifest._asdict(), f, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, os.path.join(path, MANIFEST_NAME))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default="./snapshots")
+    parser.add_argument("--embedding-model", default="text-embedding-3-small")
+    parser.add_argument("--chunk-model", default="gpt-3.5-turbo")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--chunk-engine", default="recursive", choices=Chunker.ENGINES)
+    parser.add_argument("--vector-backend", default="chroma", choices=BACKENDS)
+    parser.add_argument("--quantization", default=None, choices=QUANTIZATIONS)
+    parser.add_argument("--search-dimensions", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = Snapshot.build(
+        SEED_URLS,
+        root=args.root,
+        embedding_model=args.embedding_model,
+        chunk_model_name=args.chunk_model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        chunk_engine=args.chunk_engine,
+        vector_backend=args.vector_backend,
+        vector_quantization=args.quantization,
+        search_dimensions=args.search_dimensions
+    )
+    missing = snapshot.missing_urls(SEED_URLS)
+    print(f"Snapshot written to {snapshot.path}: {snapshot.manifest.chunk_count} chunks, {len(missing)} URL(s) failed")
+
+
+if __name__ == "__main__":
+    main()
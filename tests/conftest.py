@@ -0,0 +1,49 @@
+"""
+Fixtures of the test suite: an offline RAG on the numpy backend, answered by the fake model clients of
+`benchmarks.fakes`, and a fixture server mirroring a few seed URLs.
+
+Run from the repository root with ``python -m pytest``.
+"""
+from benchmarks.corpus import fixture_path, make_corpus
+from benchmarks.fakes import FakeClientRegistry
+from benchmarks.server import FixtureServer
+from sources import SEED_URLS
+from typing import Dict, Iterator, List
+from rag import RAG
+import pytest
+
+URLS = SEED_URLS[:4]
+
+
+@pytest.fixture
+def clients() -> Iterator[FakeClientRegistry]:
+    registry = FakeClientRegistry()
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def pages() -> Dict[str, str]:
+    return make_corpus(URLS, paragraphs=6)
+
+
+@pytest.fixture
+def server(pages: Dict[str, str]) -> Iterator[FixtureServer]:
+    with FixtureServer(dict(pages), validators=True) as fixture_server:
+        yield fixture_server
+
+
+@pytest.fixture
+def urls(server: FixtureServer) -> List[str]:
+    return [server.url(fixture_path(url)) for url in URLS]
+
+
+@pytest.fixture
+def rag(tmp_path, clients: FakeClientRegistry) -> RAG:
+    return RAG(
+        persist_directory=str(tmp_path / "db"),
+        embedding_cache_path=None,
+        clients=clients,
+        retrieval_mode="similarity",
+        vector_backend="numpy"
+    )
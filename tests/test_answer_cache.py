@@ -0,0 +1,28 @@
+from benchmarks.fakes import FAKE_RESPONSE
+from answer_cache import AnswerCache
+from rag import RAG
+
+
+def test_similar_question_about_another_place_misses(clients):
+    cache = AnswerCache(embeddings=clients.embeddings("fake"), similarity_threshold=0.5)
+    cache.put("Quantas famílias foram desalojadas em Canoas?", "Em Canoas, 10 mil.", [], 1.0)
+    assert cache.get("Quantas famílias desalojadas em Canoas?").answer == "Em Canoas, 10 mil."
+    assert cache.get("Quantas famílias foram desalojadas em Eldorado do Sul?") is None
+    assert cache.get("Quantas famílias foram desalojadas em Canoas em 2024?") is None
+    assert AnswerCache.entities("Quantas famílias em Porto Alegre? Em maio de 2024.") == {"porto", "alegre", "2024"}
+
+
+def test_missed_question_is_embedded_once(tmp_path, clients, server, urls):
+    rag = RAG(
+        persist_directory=str(tmp_path / "db"),
+        embedding_cache_path=None,
+        clients=clients,
+        retrieval_mode="similarity",
+        vector_backend="numpy",
+        answer_cache=AnswerCache(similarity_threshold=0.95)
+    )
+    rag.add_documents(urls)
+    rag.answer_cache.put("Quantas famílias foram desalojadas em Canoas?", "Em Canoas, 10 mil.", [], 1.0)
+    requests = clients.fake_embeddings.requests
+    assert rag.query("Quantas famílias foram desalojadas?") == FAKE_RESPONSE
+    assert clients.fake_embeddings.requests == requests + 1
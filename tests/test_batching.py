@@ -0,0 +1,27 @@
+from rag import RAG
+
+QUESTIONS = ["Quantas famílias foram desalojadas?", "Qual o nível do Guaíba?", "Onde doar?", "Quais cidades foram atingidas?"]
+
+
+def test_batched_questions_are_embedded_in_one_request_without_the_cache(tmp_path, clients, urls):
+    rag = RAG(
+        persist_directory=str(tmp_path / "db"),
+        embedding_cache_path=str(tmp_path / "embedding_cache.sqlite"),
+        clients=clients,
+        retrieval_mode="similarity",
+        vector_backend="numpy",
+        batch_window=0.5
+    )
+    rag.add_documents(urls)
+    cache = rag.db.embeddings.cache
+    cached, requests = len(cache), clients.fake_embeddings.requests
+
+    futures = [rag.batcher.submit(question, 4) for question in QUESTIONS]
+    assert all(future.result(timeout=10) for future in futures)
+    assert rag.batcher.batches == 1
+    assert clients.fake_embeddings.requests == requests + 1
+    assert len(cache) == cached
+
+    batcher = rag.batcher
+    rag.close()
+    assert batcher._closed and not batcher._dispatcher.is_alive()
@@ -0,0 +1,66 @@
+from langchain_core.documents.base import Document
+from local_embeddings import HashingEmbeddings
+from vector_store import NumpyVectorStore
+from indexer import Indexer
+from bm25 import BM25Index
+import pytest
+
+TEXTS = [
+    "Nível do Guaíba sobe em Porto Alegre",
+    "Defesa Civil alerta moradores do Sarandi",
+    "Abrigos de Canoas recebem doações",
+    "DMAE aciona as casas de bombas do Sarandi",
+    "Aeroporto Salgado Filho segue fechado",
+    "Doações chegam a Eldorado do Sul e Canoas",
+]
+QUERIES = ["Sarandi", "doações Canoas", "Guaíba Porto Alegre", "bombas DMAE", "aeroporto fechado"]
+
+
+def documents(indices):
+    return [Document(page_content=TEXTS[i], metadata={"chunk_id": f"c{i}"}) for i in indices]
+
+
+def assert_same_results(index, expected):
+    for query in QUERIES:
+        results, fresh = index.search(query, 10), expected.search(query, 10)
+        assert [id_ for id_, _ in results] == [id_ for id_, _ in fresh]
+        assert [score for _, score in results] == pytest.approx([score for _, score in fresh])
+
+
+def test_saved_index_with_overlay_and_removals_matches_a_fresh_one(tmp_path):
+    path = str(tmp_path / "bm25.idx")
+    index = BM25Index.from_documents(documents([0, 1, 2]))
+    index.save(path)
+    index.close()
+
+    loaded = BM25Index.load(path)
+    assert_same_results(loaded, BM25Index.from_documents(documents([0, 1, 2])))
+    # the overlay holds chunks added after loading, on top of the mapped postings
+    loaded.add(documents([3, 4, 5]))
+    loaded.remove(["c1", "c4"])
+    live = [0, 2, 3, 5]
+    assert_same_results(loaded, BM25Index.from_documents(documents(live)))
+    assert not {"c1", "c4"} & {id_ for query in QUERIES for id_, _ in loaded.search(query, 10)}
+
+    # saving drops the removed chunks and renumbers the rest
+    loaded.save(path)
+    assert_same_results(loaded, BM25Index.from_documents(documents(live)))
+    loaded.close()
+    reloaded = BM25Index.load(path)
+    assert len(reloaded) == len(live) and "c1" not in reloaded
+    assert_same_results(reloaded, BM25Index.from_documents(documents(live)))
+    reloaded.close()
+
+
+def test_stale_index_is_rebuilt_from_the_database(tmp_path):
+    path = str(tmp_path / "bm25.idx")
+    db = NumpyVectorStore(None, HashingEmbeddings())
+    db.add_texts(TEXTS[:3], ids=["c0", "c1", "c2"])
+    Indexer.load_bm25_index(db, path).close()
+
+    db.add_texts(TEXTS[3:], ids=["c3", "c4", "c5"])
+    db.delete(["c1"])
+    index = Indexer.load_bm25_index(db, path)
+    assert_same_results(index, BM25Index.from_documents(documents([0, 2, 3, 4, 5])))
+    index.close()
+    assert "c1" not in BM25Index.load(path) and "c5" in BM25Index.load(path)
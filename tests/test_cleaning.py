@@ -0,0 +1,35 @@
+from cleaning import extract_main_content
+from bs4 import BeautifulSoup
+
+PARAGRAPH = "<p>O nível do Guaíba chegou a 5,35 metros em Porto Alegre, o maior já registrado na cidade.</p>"
+
+
+def extract(html: str) -> str:
+    return extract_main_content(BeautifulSoup(html, "html.parser"))[0]
+
+
+def test_chrome_named_by_whole_words_is_dropped():
+    text = extract(
+        f"<body><div class='content'>{PARAGRAPH * 4}"
+        "<div class='share-bar'><p>Compartilhe esta reportagem com seus amigos</p></div>"
+        "<div id='cookie-banner'><p>Usamos cookies para melhorar a sua experiência</p></div>"
+        "<div class='related_posts'><p>Veja outras notícias sobre as enchentes no estado</p></div></div></body>"
+    )
+    assert "Guaíba" in text
+    assert "Compartilhe" not in text and "cookies" not in text and "outras notícias" not in text
+
+
+def test_article_text_in_elements_named_like_chrome_is_kept():
+    text = extract(
+        f"<body><div class='content'>{PARAGRAPH * 2}"
+        "<div class='subscriber-content'><p>Mais de 600 mil pessoas deixaram suas casas por causa da enchente.</p></div>"
+        "<div class='commentary'><p>Especialistas apontam falhas no sistema de diques da capital gaúcha.</p></div>"
+        "</div></body>"
+    )
+    assert "600 mil pessoas" in text and "sistema de diques" in text
+
+    text = extract(
+        f"<body><div class='content'>{PARAGRAPH * 3}"
+        "<div class='social-issues'>" + PARAGRAPH.replace("Guaíba", "rio Taquari") * 4 + "</div></div></body>"
+    )
+    assert "rio Taquari" in text
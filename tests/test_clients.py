@@ -0,0 +1,18 @@
+from clients import ClientRegistry, default_registry
+import asyncio
+
+
+def test_close_closes_the_async_client_and_the_embedding_caches(tmp_path):
+    registry = ClientRegistry(api_key="test")
+    embeddings = registry.embeddings("local-hashing", embedding_cache_path=str(tmp_path / "cache.sqlite"))
+    assert embeddings.embed_documents(["Nível do Guaíba"])
+    registry.close()
+    assert registry.http_client.is_closed and registry.http_async_client.is_closed
+
+    registry = ClientRegistry(api_key="test")
+    asyncio.run(registry.aclose())
+    assert registry.http_client.is_closed and registry.http_async_client.is_closed
+
+
+def test_default_registry_is_built_once_on_first_use():
+    assert default_registry() is default_registry()
@@ -0,0 +1,14 @@
+from embedding_cache import EmbeddingCache
+
+
+def test_lookups_only_rewrite_the_last_use_of_stale_entries(monkeypatch):
+    cache = EmbeddingCache(":memory:")
+    cache.put_many("model", {"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    changes = cache._connection.total_changes
+    assert cache.get_many("model", ["a", "b", "c"]) == {"a": [1.0, 0.0], "b": [0.0, 1.0]}
+    assert cache._connection.total_changes == changes
+
+    monkeypatch.setattr(EmbeddingCache, "_TOUCH_INTERVAL_NS", -1)
+    cache.get_many("model", ["a"])
+    assert cache._connection.total_changes == changes + 1
+    assert (cache.hits, cache.misses) == (3, 1)
@@ -0,0 +1,54 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fetcher import Fetcher
+import threading
+import requests
+import pytest
+import time
+
+PAGE = "<html><body><p>Previsão de chuva forte em Porto Alegre e na região metropolitana.</p></body></html>"
+
+
+def make_response(body: bytes, content_type: str) -> requests.Response:
+    response = requests.Response()
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def test_declared_charset_is_not_guessed():
+    body = PAGE.encode("cp1252")
+    assert Fetcher._decode(make_response(body, "text/html; charset=cp1252")) == PAGE
+    assert Fetcher._decode(make_response(PAGE.encode("utf-8"), "text/html")) == PAGE
+
+
+class TrickleHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        for _ in range(20):
+            self.wfile.write(b" " * 1024)
+            self.wfile.flush()
+            time.sleep(0.05)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def trickle_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TrickleHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/slow"
+    server.shutdown()
+    server.server_close()
+
+
+def test_slow_download_fails_at_the_deadline(trickle_url):
+    with Fetcher(timeout=1.0, deadline=0.2, requests_per_second_per_host=None) as fetcher:
+        start = time.monotonic()
+        result = fetcher.fetch([trickle_url])
+        assert time.monotonic() - start < 0.8
+    assert "Timeout" in result.failed[trickle_url]
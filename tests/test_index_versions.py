@@ -0,0 +1,26 @@
+from index_versions import IndexVersions, VERSIONS_NAME
+from vector_store import NumpyVectorStore, VECTORS_FILE
+from benchmarks.fakes import FakeEmbeddings
+import os
+
+
+def test_new_version_links_the_matrix_until_it_is_appended_to(tmp_path):
+    base = str(tmp_path / "db")
+    NumpyVectorStore(base, FakeEmbeddings()).add_texts(["Chuvas no Rio Grande do Sul"], ids=["a"])
+
+    path = IndexVersions.create(base)
+    assert os.path.samefile(os.path.join(base, VECTORS_FILE), os.path.join(path, VECTORS_FILE))
+    assert not os.path.samefile(os.path.join(base, "records.sqlite"), os.path.join(path, "records.sqlite"))
+
+    store = NumpyVectorStore(path, FakeEmbeddings())
+    store.add_texts(["Nível do Guaíba em Porto Alegre"], ids=["b"])
+    assert not os.path.samefile(os.path.join(base, VECTORS_FILE), os.path.join(path, VECTORS_FILE))
+    assert len(NumpyVectorStore(base, FakeEmbeddings(), read_only=True)._vectors.array) == 1
+    assert store.get()["ids"] == ["a", "b"]
+
+
+def test_unchanged_ingest_creates_no_version(rag, urls):
+    rag.add_documents_isolated(urls)
+    versions = os.listdir(os.path.join(rag.persist_directory, VERSIONS_NAME))
+    assert rag.add_documents_isolated(urls)["skipped"] > 0
+    assert os.listdir(os.path.join(rag.persist_directory, VERSIONS_NAME)) == versions
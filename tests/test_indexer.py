@@ -0,0 +1,34 @@
+from langchain_core.documents.base import Document
+from local_embeddings import HashingEmbeddings
+from vector_store import NumpyVectorStore
+from indexer import Indexer
+from bm25 import BM25Index
+
+PAGE = "https://example.com/boletim"
+OTHER = "https://example.com/abrigos"
+
+
+def chunks(source, texts):
+    return [Document(page_content=text, metadata={"source": source, "start_index": 100 * i}) for i, text in enumerate(texts) if text]
+
+
+def test_re_adding_a_page_only_touches_its_changed_chunks():
+    db, bm25_index = NumpyVectorStore(None, HashingEmbeddings()), BM25Index()
+    first = chunks(PAGE, ["Nível do Guaíba sobe", "Defesa Civil alerta moradores", "Bairro Sarandi evacuado"])
+    other = chunks(OTHER, ["Abrigos recebem doações"])
+    assert Indexer.upsert_documents(first + other, db, bm25_index) == {"added": 4, "updated": 0, "skipped": 0, "deleted": 0}
+    other_ids = [document.metadata["chunk_id"] for document in other]
+
+    # the second paragraph is edited, the third removed and a fourth added
+    second = chunks(PAGE, ["Nível do Guaíba sobe", "Defesa Civil amplia o alerta", None, "Aeroporto fechado"])
+    summary = Indexer.upsert_documents(second, db, bm25_index)
+    assert summary == {"added": 1, "updated": 1, "skipped": 1, "deleted": 1}
+    assert second[0].metadata["chunk_id"] == first[0].metadata["chunk_id"]
+
+    expected = {document.metadata["chunk_id"] for document in second + other}
+    assert set(db.get()["ids"]) == expected
+    assert not bm25_index.search("Sarandi", 10)
+    assert [id_ for id_, _ in bm25_index.search("Aeroporto", 10)] == [second[2].metadata["chunk_id"]]
+
+    assert Indexer.upsert_documents(second, db, bm25_index) == {"added": 0, "updated": 0, "skipped": 3, "deleted": 0}
+    assert set(db.get()["ids"]) == expected
@@ -0,0 +1,52 @@
+from ingestion_queue import IngestionQueue
+from test_rag import open_files
+import threading
+import pytest
+import time
+import os
+
+
+class SlowRAG:
+    def __init__(self) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def add_documents_isolated(self, urls, on_progress=None):
+        self.started.set()
+        self.release.wait(10)
+        return {"added": len(urls), "updated": 0, "skipped": 0, "deleted": 0}
+
+
+def test_close_without_waiting_returns_while_a_job_runs():
+    rag = SlowRAG()
+    queue = IngestionQueue(rag)
+    running = queue.submit(["http://example.com/a"])
+    queued = queue.submit(["http://example.com/b"])
+    assert rag.started.wait(5)
+
+    start = time.monotonic()
+    queue.close(wait=False)
+    assert time.monotonic() - start < 1
+    assert queued.status == "cancelled"
+    assert running.status == "running"
+
+    rag.release.set()
+    assert queue.wait(running, timeout=5)
+    assert running.status == "done"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_version_ingested_after_close_is_closed_not_swapped_in(rag, urls):
+    rag.add_documents_isolated(urls[:2])
+    first = rag.index_directory
+    closed = []
+
+    def close_once(progress):
+        if not closed:
+            closed.append(True)
+            rag.close()
+
+    rag.add_documents_isolated(urls, on_progress=close_once)
+    assert rag.db is None and rag.rag_chain is None
+    assert rag.index_directory == first
+    assert not [path for path in open_files(os.path.dirname(first)) if "records" in path or "vectors" in path]
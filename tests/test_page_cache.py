@@ -0,0 +1,54 @@
+from benchmarks.corpus import fixture_path, make_corpus
+from page_cache import CachedPage, PageCache
+from fetcher import Fetcher
+from conftest import URLS
+from loader import Loader
+import pytest
+
+
+def test_conditional_headers_carry_the_cached_validators():
+    page = CachedPage("http://example.com/", "<html></html>", '"abc"', "Mon, 06 May 2024 10:00:00 GMT", "hash", 0.0, 0.0)
+    assert PageCache.conditional_headers(page) == {"If-None-Match": '"abc"', "If-Modified-Since": "Mon, 06 May 2024 10:00:00 GMT"}
+    assert PageCache.conditional_headers(None) == {}
+
+
+def test_unchanged_pages_are_answered_304_and_skipped(tmp_path, server, urls):
+    with PageCache(str(tmp_path / "pages.db")) as page_cache:
+        with Fetcher(requests_per_second_per_host=None, page_cache=page_cache) as fetcher:
+            assert len(fetcher.fetch(urls).documents) == len(urls)
+            page_cache.put(fetcher.pages)
+
+        with Fetcher(requests_per_second_per_host=None, page_cache=page_cache, skip_unchanged=True) as fetcher:
+            result = fetcher.fetch(urls)
+        assert result.documents == []
+        assert result.unchanged == urls
+        assert fetcher.not_modified == len(urls)
+        assert server.not_modified == len(urls)
+
+
+def test_refresh_re_indexes_only_changed_pages(rag, server, urls):
+    rag.add_documents_isolated(urls)
+    version = rag.index_directory
+    assert rag.refresh() == {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+    assert rag.index_directory == version
+
+    changed = fixture_path(URLS[0])
+    server.pages[changed] = make_corpus(URLS, paragraphs=6, seed=1)[changed]
+    summary = rag.refresh()
+    assert summary["added"] + summary["updated"] > 0
+    assert rag.index_directory != version
+    assert {document.metadata["source"] for document in rag.db.similarity_search("Guaíba", k=50)} == set(urls)
+
+
+def test_load_documents_closes_the_page_cache_without_storing_pages_when_saving_fails(monkeypatch, tmp_path, urls):
+    closed = []
+    close = PageCache.close
+    monkeypatch.setattr(PageCache, "close", lambda self: closed.append(self.path) or close(self))
+    monkeypatch.setattr(Loader, "_save_documents", lambda documents, save_path: 1 / 0)
+    path = str(tmp_path / "pages.db")
+
+    with pytest.raises(ZeroDivisionError):
+        Loader.load_documents(urls, save_path=str(tmp_path / "documents"), page_cache_path=path, requests_per_second_per_host=None)
+    assert closed == [path]
+    with PageCache(path) as page_cache:
+        assert len(page_cache) == 0
@@ -0,0 +1,88 @@
+from benchmarks.server import FixtureServer
+from benchmarks.corpus import make_corpus
+from vector_store import NumpyVectorStore
+from pipeline import IngestionPipeline
+from fetcher import Fetcher
+from types import SimpleNamespace
+from conftest import URLS
+import pipeline as pipeline_module
+import pytest
+import time
+
+
+def test_near_duplicates_keep_the_chunks_of_the_first_url_whichever_page_arrives_first(monkeypatch, clients):
+    fetch_one = Fetcher._fetch_one
+    kept = []
+    page = next(iter(make_corpus(URLS[:1], paragraphs=6).values()))
+    with FixtureServer({"/copy-0": page, "/copy-1": page}) as server:
+        urls = [server.url("/copy-0"), server.url("/copy-1")]
+        for slow in urls:
+            monkeypatch.setattr(Fetcher, "_fetch_one", lambda self, url, slow=slow: time.sleep(0.3 if url == slow else 0) or fetch_one(self, url))
+            pipeline = IngestionPipeline(NumpyVectorStore(None, clients.fake_embeddings), requests_per_second_per_host=None)
+            pipeline.run(urls)
+            assert pipeline.stats["duplicate_chunks"] > 0
+            kept.append({metadata["source"] for metadata in pipeline.vector_db.get(include=["metadatas"])["metadatas"]})
+    assert kept == [{urls[0]}, {urls[0]}]
+
+
+def test_ordered_fetch_yields_urls_in_input_order(monkeypatch):
+    monkeypatch.setattr(Fetcher, "_fetch_one", lambda self, url: time.sleep(0.3 if url.endswith("/0") else 0) or url)
+    urls = [f"http://example.com/{i}" for i in range(4)]
+    with Fetcher(requests_per_second_per_host=None) as fetcher:
+        assert [url for url, _ in fetcher.iter_fetch(urls, ordered=True)] == urls
+        assert [url for url, _ in fetcher.iter_fetch(urls)][-1] == urls[0]
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after is not None else {})
+
+
+class FlakyEmbeddings:
+    def __init__(self, embeddings, failures):
+        self.embeddings = embeddings
+        self.failures = failures
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls <= len(self.failures):
+            raise self.failures[self.calls - 1]
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+def test_rate_limited_batches_are_retried_honouring_retry_after_and_written_once(monkeypatch, clients, urls):
+    delays = []
+    monkeypatch.setattr(pipeline_module, "time", SimpleNamespace(sleep=delays.append, perf_counter=time.perf_counter))
+    embeddings = FlakyEmbeddings(clients.fake_embeddings, [RateLimitError("3"), RateLimitError(), RateLimitError()])
+    vector_db = NumpyVectorStore(None, embeddings)
+    upserts = []
+    upsert_vectors = vector_db.upsert_vectors
+    monkeypatch.setattr(vector_db, "upsert_vectors", lambda ids, *args: upserts.append(ids) or upsert_vectors(ids, *args))
+
+    pipeline = IngestionPipeline(vector_db, requests_per_second_per_host=None, backoff=1.0, max_retries=3)
+    summary = pipeline.run(urls[:1])
+
+    assert embeddings.calls == 4
+    assert pipeline.stats["retries"] == 3
+    assert pipeline.stats["batches"] == 1
+    assert len(upserts) == 1 and len(upserts[0]) == summary["added"] == pipeline.stats["written"] > 0
+    assert delays[0] == 3.0
+    assert 1.0 <= delays[1] <= 2.0 and 2.0 <= delays[2] <= 4.0
+
+
+def test_a_batch_still_rate_limited_after_max_retries_fails_the_run(monkeypatch, clients, urls):
+    monkeypatch.setattr(pipeline_module, "time", SimpleNamespace(sleep=lambda delay: None, perf_counter=time.perf_counter))
+    embeddings = FlakyEmbeddings(clients.fake_embeddings, [RateLimitError() for _ in range(3)])
+    pipeline = IngestionPipeline(NumpyVectorStore(None, embeddings), requests_per_second_per_host=None, max_retries=2)
+
+    with pytest.raises(RateLimitError):
+        pipeline.run(urls[:1])
+    assert embeddings.calls == 3
+    assert pipeline.stats["retries"] == 2
+    assert pipeline.stats["written"] == 0
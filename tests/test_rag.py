@@ -0,0 +1,94 @@
+from benchmarks.corpus import fixture_path, make_corpus
+from benchmarks.fakes import FAKE_RESPONSE
+from conftest import URLS
+from rag import RAG
+import pytest
+import os
+
+
+def test_query_answers_from_ingested_pages(rag, urls):
+    summary = rag.add_documents(urls)
+    assert summary["added"] > 0
+
+    answer, request_id = rag.query_with_request_id("Quantas famílias foram desalojadas?")
+    assert answer == FAKE_RESPONSE
+    assert {document.metadata["source"] for document in rag.get_context(request_id)} <= set(urls)
+
+
+def test_re_adding_unchanged_pages_skips_every_chunk(rag, urls):
+    first = rag.add_documents(urls)
+    second = rag.add_documents(urls)
+    assert second == {"added": 0, "updated": 0, "skipped": first["added"], "deleted": 0}
+
+
+def open_files(directory):
+    paths = []
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+        except OSError:
+            continue
+    return [path for path in paths if path.startswith(directory + os.sep)]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_replaced_version_is_closed_after_its_last_query(rag, server, urls):
+    rag.add_documents_isolated(urls)
+    first = rag.index_directory
+    assert open_files(first)
+
+    with rag._checkout() as chain:
+        changed = fixture_path(URLS[0])
+        server.pages[changed] = make_corpus(URLS, paragraphs=6, seed=1)[changed]
+        rag.add_documents_isolated(urls)
+        assert rag.index_directory != first
+        assert open_files(first)
+        assert chain.invoke({"input": "Quantas famílias foram desalojadas?"})["context"]
+    assert not open_files(first)
+    assert open_files(rag.index_directory)
+
+
+def test_read_only_rag_reloads_published_versions(rag, server, clients, urls):
+    rag.add_documents_isolated(urls[:2])
+    reader = RAG(
+        persist_directory=rag.persist_directory,
+        embedding_cache_path=None,
+        clients=clients,
+        retrieval_mode="similarity",
+        vector_backend="numpy",
+        read_only=True
+    )
+    assert reader.index_directory == rag.index_directory
+    assert not reader.reload()
+    with pytest.raises(RuntimeError):
+        reader.add_documents(urls)
+
+    rag.add_documents_isolated(urls)
+    assert reader.index_directory != rag.index_directory
+    assert reader.reload()
+    assert reader.index_directory == rag.index_directory
+    assert set(reader.sources()) == set(urls)
+    assert reader.query("Quantas famílias foram desalojadas?") == FAKE_RESPONSE
+
+
+def test_each_version_searches_through_its_own_batcher(tmp_path, clients, server, urls):
+    rag = RAG(
+        persist_directory=str(tmp_path / "db"),
+        embedding_cache_path=None,
+        clients=clients,
+        retrieval_mode="similarity",
+        vector_backend="numpy",
+        batch_window=0.001
+    )
+    rag.add_documents_isolated(urls)
+    first = rag.batcher
+    with rag._checkout() as chain:
+        changed = fixture_path(URLS[0])
+        server.pages[changed] = make_corpus(URLS, paragraphs=6, seed=1)[changed]
+        rag.add_documents_isolated(urls)
+        assert rag.batcher is not first and rag.batcher.vectorstore is rag.db
+        assert chain.invoke({"input": "Quantas famílias foram desalojadas?"})["context"]
+        assert first.searches == 1
+    assert first._closed
+    assert rag.query("Quantas famílias foram desalojadas?") == FAKE_RESPONSE
+    assert rag.batcher.searches == 1
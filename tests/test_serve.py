@@ -0,0 +1,63 @@
+from benchmarks.fakes import FAKE_RESPONSE, FakeClientRegistry
+from serve import NOT_READY_ANSWER, WorkerPool
+import functools
+import asyncio
+import signal
+import pytest
+import time
+import os
+
+QUESTION = "Quantas famílias foram desalojadas?"
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def writer(rag, urls):
+    rag.add_documents_isolated(urls)
+    return rag
+
+
+def test_workers_answer_through_fake_models(writer, urls):
+    with WorkerPool.from_rag(writer, workers=2, threads=2, clients_factory=FakeClientRegistry) as pool:
+        assert pool.wait_ready(60)
+        answers = [future.result(60) for future in [pool.submit(QUESTION, mode="similarity") for _ in range(8)]]
+        assert {answer.answer for answer in answers} == {FAKE_RESPONSE}
+        assert {answer.index_directory for answer in answers} == {writer.index_directory}
+        assert {document.metadata["source"] for document in pool.get_context(answers[0].request_id)} <= set(urls)
+
+
+def test_workers_answer_not_ready_without_an_index(tmp_path):
+    with WorkerPool(str(tmp_path / "db"), workers=1, clients_factory=FakeClientRegistry) as pool:
+        assert pool.wait_ready(60)
+        served = pool.query(QUESTION, timeout=60)
+        assert (served.answer, served.index_directory) == (NOT_READY_ANSWER, None)
+
+
+def test_queries_of_a_killed_worker_fail_and_the_worker_restarts(writer):
+    slow_clients = functools.partial(FakeClientRegistry, first_token_delay=5.0)
+    with WorkerPool.from_rag(writer, workers=1, threads=1, clients_factory=slow_clients) as pool:
+        assert pool.wait_ready(60)
+        future = pool.submit(QUESTION, mode="similarity")
+        wait_until(lambda: pool._assigned[0])
+        os.kill(pool.pids()[0], signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="exited"):
+            future.result(30)
+
+        wait_until(lambda: pool.restarts == 1 and pool._opened[0], timeout=60)
+        assert pool.query(QUESTION, mode="similarity", timeout=60).answer == FAKE_RESPONSE
+
+
+def test_queries_without_an_answer_time_out(writer):
+    slow_clients = functools.partial(FakeClientRegistry, first_token_delay=5.0)
+    with WorkerPool.from_rag(writer, workers=1, threads=1, clients_factory=slow_clients, request_timeout=1.0) as pool:
+        assert pool.wait_ready(60)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(pool.aquery(QUESTION, mode="similarity", timeout=0.1))
+        with pytest.raises(TimeoutError):
+            pool.submit(QUESTION, mode="similarity").result(30)
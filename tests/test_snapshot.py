@@ -0,0 +1,32 @@
+from snapshot import Snapshot, SnapshotManifest
+from rag import RAG
+import time
+import os
+
+
+def test_documents_added_through_open_rag_are_chunked_like_the_snapshot(tmp_path, clients, urls):
+    path = str(tmp_path / "snapshot")
+    os.makedirs(path)
+    Snapshot._write_manifest(path, SnapshotManifest(
+        version="test",
+        created_at=time.time(),
+        embedding_model="text-embedding-3-small",
+        chunk_model_name="gpt-3.5-turbo",
+        chunk_size=100,
+        chunk_overlap=0,
+        chunk_engine="token",
+        urls=[],
+        chunk_count=0,
+        vector_backend="numpy"
+    ))
+    rag = Snapshot(path).open_rag(embedding_cache_path=None, clients=clients)
+    assert (rag.chunk_size, rag.chunk_overlap, rag.chunk_engine) == (100, 0, "token")
+    added = rag.add_documents_isolated(urls[:1])["added"]
+
+    default = RAG(
+        persist_directory=str(tmp_path / "default"),
+        embedding_cache_path=None,
+        clients=clients,
+        vector_backend="numpy"
+    )
+    assert added > default.add_documents_isolated(urls[:1])["added"]
@@ -0,0 +1,59 @@
+from vector_store import NumpyVectorStore, VectorIndex
+from benchmarks.fakes import FakeEmbeddings
+import pytest
+
+TEXTS = ["Chuvas no Rio Grande do Sul", "Nível do Guaíba em Porto Alegre", "Doações para os desabrigados"]
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    store = NumpyVectorStore(str(tmp_path / "store"), FakeEmbeddings())
+    store.add_texts(TEXTS, metadatas=[{"source": f"http://example.com/{i}"} for i in range(len(TEXTS))], ids=["a", "b", "c"])
+    store.close()
+    return str(tmp_path / "store")
+
+
+def test_read_only_store_searches_and_refuses_writes(path):
+    store = NumpyVectorStore(path, FakeEmbeddings(), read_only=True)
+    assert isinstance(store, VectorIndex)
+    assert store.similarity_search("Guaíba", k=1)[0].page_content == TEXTS[1]
+    assert store.get(ids=["c"])["documents"] == [TEXTS[2]]
+
+    with pytest.raises(RuntimeError):
+        store.add_texts(["Boletim da Defesa Civil"])
+    with pytest.raises(RuntimeError):
+        store.upsert_vectors(["d"], [[1.0] * store.dimensions], ["Boletim da Defesa Civil"], [{}])
+    with pytest.raises(RuntimeError):
+        store.delete(["a"])
+    with pytest.raises(RuntimeError):
+        store.compact()
+    store.close()
+    assert NumpyVectorStore(path, FakeEmbeddings()).get()["ids"] == ["a", "b", "c"]
+
+
+def test_read_only_store_must_exist(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        NumpyVectorStore(str(tmp_path / "missing"), FakeEmbeddings(), read_only=True)
+
+
+def test_get_looks_up_long_id_lists_in_batches(path):
+    store = NumpyVectorStore(path, FakeEmbeddings())
+    assert store.get(ids=[]) == {"ids": [], "documents": [], "metadatas": []}
+
+    missing = [f"missing-{i}" for i in range(2 * NumpyVectorStore._LOOKUP_BATCH_SIZE)]
+    result = store.get(ids=["c", *missing, "a", "c"], where={"source": {"$in": ["http://example.com/0", "http://example.com/2"]}})
+    assert result["ids"] == ["a", "c"]
+    assert result["documents"] == [TEXTS[0], TEXTS[2]]
+    store.close()
+
+
+def test_compact_copies_the_kept_rows_block_by_block(path, monkeypatch):
+    monkeypatch.setattr(NumpyVectorStore, "BLOCK_BYTES", 1)
+    store = NumpyVectorStore(path, FakeEmbeddings(), quantization="int8")
+    store.delete(["b"])
+    store.compact()
+    assert store.stats()["rows"] == 2
+    assert store.get()["ids"] == ["a", "c"]
+    assert store.similarity_search("Doações", k=1)[0].page_content == TEXTS[2]
+    store.close()
+    assert NumpyVectorStore(path, FakeEmbeddings()).similarity_search("Chuvas", k=1)[0].page_content == TEXTS[0]
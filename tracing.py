@@ -0,0 +1,547 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.outputs import LLMResult
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from bisect import bisect_left
+from uuid import UUID
+import threading
+import logging
+import json
+import time
+import uuid
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    The stages, counters and attributes recorded for one request.
+
+    Attributes
+    ----------
+    request_id : str
+        The ID of the request.
+    kind : str
+        The kind of request, e.g. "query" or "ingest".
+    attributes : Dict[str, Any]
+        Free-form attributes of the request, e.g. the retrieval mode.
+    spans : List[Tuple[str, float, float]]
+        The stage name, start offset in seconds and duration in seconds of every timed stage, in completion order.
+    counters : Dict[str, float]
+        The counters incremented during the request, e.g. token counts and cache hits.
+    """
+
+    def __init__(self, kind: str, request_id: str, attributes: Dict[str, Any]) -> None:
+        self.request_id: str = request_id
+        self.kind: str = kind
+        self.attributes: Dict[str, Any] = attributes
+        self.spans: List[Tuple[str, float, float]] = []
+        self.counters: Dict[str, float] = {}
+        self.started_at: float = time.time()
+        self.start: float = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the trace as a JSON-serializable dict.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The request ID, kind, attributes, start time, duration in ms, spans (with offsets and durations in ms)
+            and counters.
+        """
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "attributes": self.attributes,
+            "started_at": self.started_at,
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "spans": [
+                {"stage": stage, "offset_ms": offset * 1000, "duration_ms": seconds * 1000}
+                for stage, offset, seconds in self.spans
+            ],
+            "counters": dict(self.counters),
+        }
+
+
+class Tracer:
+    """
+    A thread-safe collector of per-stage latencies, counters and per-request traces.
+
+    Stage timings are aggregated into histograms and counters into totals, both exportable in the Prometheus text
+    format. Inside `request`, they are also attached to a trace of the request, which is kept in a bounded buffer,
+    returned as JSON and handed to the sinks. The current trace follows the request across asyncio tasks and
+    LangChain's thread pools through a context variable. A disabled tracer records nothing, so instrumented code
+    only pays for a flag check.
+
+    Methods
+    -------
+    record(stage: str, seconds: float) -> None
+        Records one measurement of a stage.
+    time(stage: str) -> Iterator[None]
+        Context manager that records the wall time of the enclosed block.
+    count(name: str, amount: float = 1) -> None
+        Increments a counter.
+    request(kind: str, request_id: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Trace]]
+        Context manager that traces the enclosed block as one request.
+    start(kind: str, request_id: Optional[str] = None, **attributes: Any) -> Optional[Trace]
+        Starts the trace of a request that is not confined to one block, e.g. a generator.
+    activate(trace: Optional[Trace]) -> Iterator[None]
+        Context manager that attaches what is recorded in the enclosed block to a started trace.
+    iterate(trace: Optional[Trace], iterator: Iterator[Any]) -> Iterator[Any]
+        Yields the items of an iterator, producing each one with the trace active.
+    aiterate(trace: Optional[Trace], iterator: AsyncIterator[Any]) -> AsyncIterator[Any]
+        Yields the items of an async iterator, producing each one with the trace active.
+    finish(trace: Optional[Trace]) -> None
+        Finishes a started trace, storing it and handing it to the sinks.
+    report() -> Dict[str, Dict[str, float]]
+        Returns the count, mean and total latency of every stage.
+    counters() -> Dict[str, float]
+        Returns the total of every counter.
+    trace(request_id: str) -> Optional[Dict[str, Any]]
+        Returns a recent trace by request ID.
+    traces() -> List[Dict[str, Any]]
+        Returns the recent traces, oldest first.
+    prometheus(prefix: str = "rag") -> str
+        Returns the histograms and counters in the Prometheus text exposition format.
+    to_json() -> str
+        Returns the stage report, counters and recent traces as JSON.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = True,
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+            max_traces: int = 256,
+            sinks: Optional[List[Callable[[Dict[str, Any]], None]]] = None
+        ) -> None:
+        """
+        Initializes the tracer.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            Whether anything is recorded (default is True).
+        buckets : Sequence[float], optional
+            The upper bounds in seconds of the latency histogram buckets (default is DEFAULT_BUCKETS).
+        max_traces : int, optional
+            The number of finished traces kept in memory (default is 256).
+        sinks : Optional[List[Callable[[Dict[str, Any]], None]]], optional
+            Functions called with every finished trace, e.g. a `JsonLinesSink` (default is None).
+        """
+        self.enabled: bool = enabled
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.sinks: List[Callable[[Dict[str, Any]], None]] = list(sinks or [])
+        self._histograms: Dict[str, List[float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._traces: Deque[Trace] = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Records one measurement of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage, e.g. "retrieval.expansion".
+        seconds : float
+            The wall time spent in the stage.
+        """
+        if not self.enabled:
+            return
+        trace = _current_trace.get()
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                # bucket counts, then the +Inf bucket, the count and the sum
+                histogram = self._histograms[stage] = [0] * (len(self.buckets) + 3)
+            histogram[bisect_left(self.buckets, seconds)] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+            if trace is not None:
+                trace.spans.append((stage, time.perf_counter() - seconds - trace.start, seconds))
+        logger.debug("%s took %.1f ms", stage, seconds * 1000)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Context manager that records the wall time of the enclosed block.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, name: str, amount: float = 1) -> None:
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter, e.g. "tokens.prompt" or "cache.answer.hits".
+        amount : float, optional
+            The increment (default is 1).
+        """
+        if not self.enabled:
+            return
+        trace = _current_trace.get()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            if trace is not None:
+                trace.counters[name] = trace.counters.get(name, 0) + amount
+
+    @contextmanager
+    def request(self, kind: str, request_id: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Trace]]:
+        """
+        Context manager that traces the enclosed block as one request.
+
+        Stages and counters recorded inside the block, including in the tasks and LangChain threads it starts,
+        are attached to the trace. Nested requests are attached to the outer trace.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of request, e.g. "query" or "ingest".
+        request_id : Optional[str], optional
+            The ID of the request (default is None, meaning a random ID).
+        **attributes : Any
+            Free-form attributes stored with the trace.
+
+        Yields
+        ------
+        Optional[Trace]
+            The trace, or None if the tracer is disabled or a request is already being traced.
+        """
+        trace = self.start(kind, request_id, **attributes)
+        try:
+            with self.activate(trace):
+                yield trace
+        finally:
+            self.finish(trace)
+
+    def start(self, kind: str, request_id: Optional[str] = None, **attributes: Any) -> Optional[Trace]:
+        """
+        Starts the trace of a request that is not confined to one block, e.g. a generator.
+
+        The trace records nothing until it is activated, and must be finished with `finish`.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of request, e.g. "query" or "ingest".
+        request_id : Optional[str], optional
+            The ID of the request (default is None, meaning a random ID).
+        **attributes : Any
+            Free-form attributes stored with the trace.
+
+        Returns
+        -------
+        Optional[Trace]
+            The trace, or None if the tracer is disabled or a request is already being traced.
+        """
+        if not self.enabled or _current_trace.get() is not None:
+            return None
+        return Trace(kind, request_id or uuid.uuid4().hex, attributes)
+
+    @contextmanager
+    def activate(self, trace: Optional[Trace]) -> Iterator[None]:
+        """
+        Context manager that attaches what is recorded in the enclosed block to a started trace.
+
+        Parameters
+        ----------
+        trace : Optional[Trace]
+            The trace returned by `start`. None leaves the current trace, if any, active.
+        """
+        if trace is None:
+            yield
+            return
+        token = _current_trace.set(trace)
+        try:
+            yield
+        finally:
+            _current_trace.reset(token)
+
+    def iterate(self, trace: Optional[Trace], iterator: Iterator[Any]) -> Iterator[Any]:
+        """
+        Yields the items of an iterator, producing each one with the trace active.
+
+        Unlike activating the trace around a loop in a generator, the trace is not left active in the consumer's
+        context between items.
+
+        Parameters
+        ----------
+        trace : Optional[Trace]
+            The trace returned by `start`.
+        iterator : Iterator[Any]
+            The iterator to consume, e.g. the output of `Runnable.stream`.
+
+        Yields
+        ------
+        Any
+            The items of the iterator.
+        """
+        iterator = iter(iterator)
+        while True:
+            with self.activate(trace):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    async def aiterate(self, trace: Optional[Trace], iterator: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        Yields the items of an async iterator, producing each one with the trace active.
+
+        Parameters
+        ----------
+        trace : Optional[Trace]
+            The trace returned by `start`.
+        iterator : AsyncIterator[Any]
+            The async iterator to consume, e.g. the output of `Runnable.astream`.
+
+        Yields
+        ------
+        Any
+            The items of the iterator.
+        """
+        iterator = iterator.__aiter__()
+        while True:
+            with self.activate(trace):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+
+    def finish(self, trace: Optional[Trace]) -> None:
+        """
+        Finishes a started trace, storing it and handing it to the sinks.
+
+        Parameters
+        ----------
+        trace : Optional[Trace]
+            The trace returned by `start`. None is ignored.
+        """
+        if trace is None or trace.duration is not None:
+            return
+        trace.duration = time.perf_counter() - trace.start
+        with self._lock:
+            self._traces.append(trace)
+        if self.sinks:
+            exported = trace.to_dict()
+            for sink in self.sinks:
+                try:
+                    sink(exported)
+                except Exception as error:
+                    logger.warning("Trace sink %r failed: %s", sink, error)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the count, mean and total latency of every stage.
+
+        Returns
+        -------
+        Dict[str, Dict[str, float]]
+            A mapping from stage name to its "count", "mean_ms" and "total_ms".
+        """
+        with self._lock:
+            return {
+                stage: {"count": histogram[-2], "mean_ms": histogram[-1] * 1000 / histogram[-2], "total_ms": histogram[-1] * 1000}
+                for stage, histogram in sorted(self._histograms.items())
+            }
+
+    def counters(self) -> Dict[str, float]:
+        """
+        Returns the total of every counter.
+
+        Returns
+        -------
+        Dict[str, float]
+            A mapping from counter name to its total.
+        """
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def trace(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a recent trace by request ID.
+
+        Parameters
+        ----------
+        request_id : str
+            The ID of the request.
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The most recent trace of that request, see `Trace.to_dict`, or None if it is unknown or was evicted.
+        """
+        with self._lock:
+            for trace in reversed(self._traces):
+                if trace.request_id == request_id:
+                    return trace.to_dict()
+        return None
+
+    def traces(self) -> List[Dict[str, Any]]:
+        """
+        Returns the recent traces, oldest first.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The traces kept in the buffer, see `Trace.to_dict`.
+        """
+        with self._lock:
+            return [trace.to_dict() for trace in self._traces]
+
+    def prometheus(self, prefix: str = "rag") -> str:
+        """
+        Returns the histograms and counters in the Prometheus text exposition format.
+
+        Stage latencies are exported as one `<prefix>_stage_seconds` histogram labelled by stage, and each counter
+        as `<prefix>_<name>_total` with dots replaced by underscores.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            The prefix of the metric names (default is "rag").
+
+        Returns
+        -------
+        str
+            The metrics, one sample per line.
+        """
+        with self._lock:
+            histograms = sorted((stage, list(histogram)) for stage, histogram in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = [f"# HELP {prefix}_stage_seconds Wall time spent in each stage.", f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage, histogram in histograms:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram[:-2]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram[-1]!r}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram[-2]}')
+        for name, total in counters:
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {total!r}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> str:
+        """
+        Returns the stage report, counters and recent traces as JSON.
+
+        Returns
+        -------
+        str
+            A JSON object with "stages", "counters" and "traces".
+        """
+        return json.dumps({"stages": self.report(), "counters": self.counters(), "traces": self.traces()}, ensure_ascii=False)
+
+
+class JsonLinesSink:
+    """
+    A trace sink appending every finished trace to a file, one JSON object per line.
+
+    Methods
+    -------
+    __call__(trace: Dict[str, Any]) -> None
+        Appends a trace to the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the sink.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file the traces are appended to.
+        """
+        self.path: str = path
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: Dict[str, Any]) -> None:
+        """
+        Appends a trace to the file.
+
+        Parameters
+        ----------
+        trace : Dict[str, Any]
+            The trace, see `Trace.to_dict`.
+        """
+        line = json.dumps(trace, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    A LangChain callback handler recording the latency and token usage of every chat model call into a Tracer.
+
+    Calls are timed as the "llm" stage, and the prompt and completion tokens reported by the provider are counted
+    as "tokens.prompt" and "tokens.completion". Streaming calls report no usage unless the model is configured to.
+    """
+
+    run_inline = True
+
+    def __init__(self, tracer: Tracer) -> None:
+        self.tracer: Tracer = tracer
+        self._starts: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.tracer.record("llm", time.perf_counter() - start)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens:
+            self.tracer.count("tokens.prompt", prompt_tokens)
+        if completion_tokens:
+            self.tracer.count("tokens.completion", completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts.pop(run_id, None)
+        self.tracer.count("llm.errors")
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
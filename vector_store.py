@@ -0,0 +1,779 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Protocol, Sequence, Tuple, runtime_checkable
+from langchain_core.documents.base import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import threading
+import sqlite3
+import shutil
+import logging
+import json
+import uuid
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("chroma", "numpy")
+QUANTIZATIONS = ("float16", "int8")
+VECTORS_FILE = "vectors.f32"
+CODES_FILE = "codes.bin"
+SCALES_FILE = "scales.f32"
+RECORDS_FILE = "records.sqlite"
+
+
+@runtime_checkable
+class VectorIndex(Protocol):
+    """
+    The interface the ingestion pipeline and the query batcher need from a vector store besides LangChain's
+    `VectorStore`: writing already embedded chunks and searching with several query vectors in one request.
+
+    `NumpyVectorStore` implements it, and so does `chroma_store.ChromaVectorStore`, the Chroma database that
+    `Indexer.load_db` opens.
+
+    Methods
+    -------
+    upsert_vectors(ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[dict]) -> None
+        Stores already embedded texts, replacing the ones stored under the same IDs.
+    search_by_vectors(vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]
+        Returns the k chunks most similar to each of several query vectors, most similar first.
+    get(ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, List]
+        Returns stored chunks by ID or metadata filter, in the format of `Chroma.get`.
+    delete(ids: Optional[List[str]] = None) -> Optional[bool]
+        Deletes the chunks with the given IDs.
+    """
+
+    def upsert_vectors(self, ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[dict]) -> None:
+        ...
+
+    def search_by_vectors(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]:
+        ...
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Sequence[str] = ("documents", "metadatas"), **kwargs: Any) -> Dict[str, List]:
+        ...
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        ...
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    An in-process vector store keeping normalized float32 embeddings in one contiguous, memory-mapped matrix.
+
+    Row i of the matrix is the unit vector of one chunk; its ID, text and metadata are kept in a small SQLite table
+    keyed by row, so opening the store maps the matrix without reading it, and a search only reads the records of
+    the rows it returns. Scores are cosine similarities computed with one matrix-vector product per query, or one
+    matrix-matrix product for a batch of queries (`search_by_vectors`).
+
+    New vectors are appended to the end of the matrix file. Deleting or replacing a chunk only drops its record,
+    leaving a dead row that searches skip; once dead rows outnumber live ones the matrix is compacted. Reads never
+    wait for an embedding request, only for the short copy of a write.
+
+    Optionally the first pass of a search scans a compact copy of the matrix instead: float16 or int8 codes (int8
+    with one scale per row), optionally truncated to the first `search_dimensions` dimensions, which suits models
+    trained with Matryoshka representation learning such as text-embedding-3. The shortlist of the best
+    `k * rescore_factor` rows is then rescored against their full-precision vectors, read from the matrix file, so
+    only the compact copy needs to stay in memory. The codes are derived from the matrix, so they are rebuilt when
+    a store is opened with other settings.
+
+    A store opened with `read_only=True` never writes to its directory: the matrix is mapped and the records
+    read as they are on disk, so several processes can serve one index while the operating system keeps a single
+    copy of its pages in memory (see `serve.WorkerPool`). Writes raise instead.
+
+    The store answers the subset of the Chroma API the rest of the code uses (`get`, `delete`, `add_documents`,
+    `as_retriever` with the "similarity" and "mmr" search types), so `Indexer.load_db(path, backend="numpy")`
+    can replace Chroma anywhere.
+
+    Methods
+    -------
+    add_texts(texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]
+        Embeds and stores texts, replacing the ones stored under the same IDs.
+    upsert_vectors(ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[dict]) -> None
+        Stores already embedded texts, replacing the ones stored under the same IDs.
+    delete(ids: Optional[List[str]] = None) -> Optional[bool]
+        Deletes the chunks with the given IDs.
+    get(ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, List]
+        Returns stored chunks by ID or metadata filter, in the format of `Chroma.get`.
+    similarity_search(query: str, k: int = 4) -> List[Document]
+        Returns the k chunks most similar to a query.
+    similarity_search_with_score(query: str, k: int = 4) -> List[Tuple[Document, float]]
+        Returns the k chunks most similar to a query with their cosine similarity.
+    search_by_vectors(vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]
+        Returns the k chunks most similar to each of several query vectors, scored in one matrix product.
+    max_marginal_relevance_search(query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]
+        Returns k chunks similar to the query and diverse among themselves.
+    compact() -> None
+        Rewrites the matrix without its dead rows.
+    stats() -> Dict[str, Any]
+        Returns the number of rows, the storage settings and the size of the scanned and full-precision matrices.
+    close() -> None
+        Closes the record table and unmaps the matrix and the codes.
+    """
+
+    BLOCK_BYTES = 64 << 20
+    CAST_BLOCK_BYTES = 1 << 20
+    _LOOKUP_BATCH_SIZE = 500
+
+    def __init__(
+            self,
+            path: Optional[str],
+            embedding_function: Embeddings,
+            quantization: Optional[str] = None,
+            search_dimensions: Optional[int] = None,
+            rescore_factor: int = 4,
+            read_only: bool = False
+        ) -> None:
+        """
+        Opens the store in a directory, creating it if needed.
+
+        Parameters
+        ----------
+        path : Optional[str]
+            The directory of the matrix ("vectors.f32") and the record table ("records.sqlite"). None keeps the
+            store in memory.
+        embedding_function : Embeddings
+            The model that embeds texts and queries.
+        quantization : Optional[str], optional
+            The type of the codes scanned by the first pass of a search, "float16" or "int8" (default is None,
+            meaning the full-precision matrix is scanned and nothing is rescored).
+        search_dimensions : Optional[int], optional
+            The number of leading dimensions the codes keep, renormalized (default is None, meaning all of them).
+        rescore_factor : int, optional
+            The size of the shortlist rescored at full precision, as a multiple of k (default is 4).
+        read_only : bool, optional
+            Whether to open an existing store without ever writing to it. Codes built with other settings are then
+            not rebuilt: searches scan the full-precision matrix instead (default is False).
+
+        Raises
+        ------
+        ValueError
+            If the quantization is unknown, search_dimensions is set without a quantization, or a store kept in
+            memory is opened read-only.
+        FileNotFoundError
+            If a store opened read-only does not exist.
+        """
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        if search_dimensions is not None and quantization is None:
+            raise ValueError("search_dimensions needs a quantization")
+        if read_only and path is None:
+            raise ValueError("A store kept in memory cannot be opened read-only")
+        self.path: Optional[str] = path
+        self.embedding_function: Embeddings = embedding_function
+        self.quantization: Optional[str] = quantization
+        self.search_dimensions: Optional[int] = search_dimensions
+        self.rescore_factor: int = max(1, rescore_factor)
+        self.read_only: bool = read_only
+        self._lock = threading.RLock()
+        self._generation: int = 0
+        if read_only:
+            if not os.path.exists(self._file(RECORDS_FILE)):
+                raise FileNotFoundError(f"No vector store at {path}")
+            self._connection = sqlite3.connect(f"file:{self._file(RECORDS_FILE)}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+            self._connection = sqlite3.connect(self._file(RECORDS_FILE) or ":memory:", check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, source TEXT, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS records_source ON records (source)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._connection.commit()
+
+        meta = dict(self._connection.execute("SELECT key, value FROM meta").fetchall())
+        self.dimensions: Optional[int] = int(meta["dimensions"]) if "dimensions" in meta else None
+        self._vectors = _MappedArray(self._file(VECTORS_FILE), np.float32, self.dimensions)
+        self._codes: Optional[_MappedArray] = None
+        self._scales: Optional[_MappedArray] = None
+        self._rows: int = self._vectors.rows if self.dimensions is not None else 0
+        if self.dimensions is not None:
+            self._open_codes(meta)
+        self._live: np.ndarray = np.zeros(self._rows, dtype=bool)
+        live_rows = [row for (row,) in self._connection.execute("SELECT row FROM records")]
+        self._live[[row for row in live_rows if row < self._rows]] = True
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    @classmethod
+    def from_texts(
+            cls,
+            texts: List[str],
+            embedding: Embeddings,
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            path: Optional[str] = None,
+            **kwargs: Any
+        ) -> "NumpyVectorStore":
+        store = cls(path, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def add_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            **kwargs: Any
+        ) -> List[str]:
+        """
+        Embeds and stores texts, replacing the ones stored under the same IDs.
+
+        Parameters
+        ----------
+        texts : Iterable[str]
+            The texts to store.
+        metadatas : Optional[List[dict]], optional
+            The metadata of each text (default is None, meaning empty metadata).
+        ids : Optional[List[str]], optional
+            The ID of each text (default is None, meaning random IDs).
+
+        Returns
+        -------
+        List[str]
+            The IDs of the stored texts.
+        """
+        self._check_writable()
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        if texts:
+            self.upsert_vectors(ids, self.embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def upsert_vectors(
+            self,
+            ids: List[str],
+            vectors: Sequence[Sequence[float]],
+            texts: List[str],
+            metadatas: List[dict]
+        ) -> None:
+        """
+        Stores already embedded texts, replacing the ones stored under the same IDs.
+
+        Parameters
+        ----------
+        ids : List[str]
+            The ID of each text. When an ID repeats, the last text wins.
+        vectors : Sequence[Sequence[float]]
+            The embedding of each text. They are normalized before being stored.
+        texts : List[str]
+            The texts.
+        metadatas : List[dict]
+            The metadata of each text.
+
+        Raises
+        ------
+        ValueError
+            If the vectors do not have the dimensions of the vectors already stored.
+        RuntimeError
+            If the store is opened read-only.
+        """
+        self._check_writable()
+        positions = list({id_: position for position, id_ in enumerate(ids)}.values())
+        if not positions:
+            return
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32)[positions])
+        with self._lock:
+            if self.dimensions is None:
+                if self.search_dimensions is not None and self.search_dimensions > matrix.shape[1]:
+                    raise ValueError(f"Cannot search {self.search_dimensions} dimensions of {matrix.shape[1]}-dimensional vectors")
+                self.dimensions = matrix.shape[1]
+                self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dimensions', ?)", (str(self.dimensions),))
+                self._vectors = _MappedArray(self._file(VECTORS_FILE), np.float32, self.dimensions)
+                self._open_codes({})
+            elif matrix.shape[1] != self.dimensions:
+                raise ValueError(f"Expected vectors of {self.dimensions} dimensions, got {matrix.shape[1]}")
+
+            with self._connection:
+                replaced = self._drop([ids[position] for position in positions])
+                first_row = self._rows
+                if self._codes is not None:
+                    codes, scales = _quantize(matrix, self.quantization, self.search_dimensions)
+                    self._codes.append(codes, first_row)
+                    if self._scales is not None:
+                        self._scales.append(scales, first_row)
+                self._vectors.append(matrix, first_row)
+                self._rows = first_row + len(matrix)
+                self._connection.executemany(
+                    "INSERT INTO records (row, id, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (first_row + offset, ids[position], (metadatas[position] or {}).get("source"), texts[position], json.dumps(metadatas[position] or {}, ensure_ascii=False))
+                        for offset, position in enumerate(positions)
+                    ]
+                )
+            live = np.zeros(self._rows, dtype=bool)
+            live[:len(self._live)] = self._live
+            live[replaced] = False
+            live[first_row:] = True
+            self._live = live
+            self._compact_if_sparse()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Deletes the chunks with the given IDs.
+
+        Parameters
+        ----------
+        ids : Optional[List[str]], optional
+            The IDs to delete; IDs that are not stored are ignored (default is None, meaning nothing is deleted).
+
+        Returns
+        -------
+        Optional[bool]
+            True.
+        """
+        if not ids:
+            return True
+        self._check_writable()
+        with self._lock:
+            with self._connection:
+                rows = self._drop(ids)
+            if rows:
+                live = self._live.copy()
+                live[rows] = False
+                self._live = live
+                self._compact_if_sparse()
+        return True
+
+    def get(
+            self,
+            ids: Optional[List[str]] = None,
+            where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"),
+            **kwargs: Any
+        ) -> Dict[str, List]:
+        """
+        Returns stored chunks by ID or metadata filter, in the format of `Chroma.get`.
+
+        Parameters
+        ----------
+        ids : Optional[List[str]], optional
+            The IDs to read (default is None, meaning every chunk).
+        where : Optional[Dict[str, Any]], optional
+            A metadata filter: each key maps to a value, {"$eq": value} or {"$in": [values]} (default is None).
+        include : Sequence[str], optional
+            The fields to return besides "ids": "documents" and/or "metadatas" (default is both).
+
+        Returns
+        -------
+        Dict[str, List]
+            "ids" and the included fields, as parallel lists in storage order.
+        """
+        if ids is not None and not ids:
+            return {"ids": [], **{field: [] for field in ("documents", "metadatas") if field in include}}
+        clauses, parameters = [], []
+        for key, condition in (where or {}).items():
+            if not re.fullmatch(r"\w+", key):
+                raise ValueError(f"Unsupported metadata filter key {key!r}")
+            column = "source" if key == "source" else f"json_extract(metadata, '$.{key}')"
+            values = condition.get("$in", [condition.get("$eq")]) if isinstance(condition, dict) else [condition]
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            parameters.extend(values)
+        # long ID lists are looked up in batches, under SQLite's limit on the number of query parameters
+        unique_ids = list(dict.fromkeys(ids or []))
+        batches = [None] if ids is None else [
+            unique_ids[start:start + self._LOOKUP_BATCH_SIZE] for start in range(0, len(unique_ids), self._LOOKUP_BATCH_SIZE)
+        ]
+        rows = []
+        with self._lock:
+            for batch in batches:
+                batch_clauses = clauses if batch is None else [f"id IN ({', '.join('?' * len(batch))})", *clauses]
+                query = "SELECT row, id, document, metadata FROM records" + (f" WHERE {' AND '.join(batch_clauses)}" if batch_clauses else "")
+                rows.extend(self._connection.execute(query, [*(batch or []), *parameters]).fetchall())
+        rows = [row[1:] for row in sorted(rows)]
+
+        result: Dict[str, List] = {"ids": [id_ for id_, _, _ in rows]}
+        if "documents" in include:
+            result["documents"] = [document for _, document, _ in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(metadata) for _, _, metadata in rows]
+        return result
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.search_by_vectors([embedding], k)[0]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._search([self.embedding_function.embed_query(query)], k)[0]
+
+    def search_by_vectors(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Document]]:
+        """
+        Returns the k chunks most similar to each of several query vectors, scored in one matrix product.
+
+        Parameters
+        ----------
+        vectors : Sequence[Sequence[float]]
+            The query vectors.
+        k : int
+            The number of chunks per query.
+
+        Returns
+        -------
+        List[List[Document]]
+            The chunks of each query, most similar first.
+        """
+        return [[document for document, _ in results] for results in self._search(vectors, k)]
+
+    def max_marginal_relevance_search(
+            self,
+            query: str,
+            k: int = 4,
+            fetch_k: int = 20,
+            lambda_mult: float = 0.5,
+            **kwargs: Any
+        ) -> List[Document]:
+        """
+        Returns k chunks similar to the query and diverse among themselves.
+
+        Parameters
+        ----------
+        query : str
+            The query.
+        k : int, optional
+            The number of chunks to return (default is 4).
+        fetch_k : int, optional
+            The number of most similar chunks the k are selected from (default is 20).
+        lambda_mult : float, optional
+            The weight of the similarity to the query against the dissimilarity to the chunks already selected,
+            from 0 (most diverse) to 1 (most similar) (default is 0.5).
+
+        Returns
+        -------
+        List[Document]
+            The selected chunks, in selection order.
+        """
+        query_vector = _normalize(np.asarray([self.embedding_function.embed_query(query)], dtype=np.float32))[0]
+        while True:
+            state = self._snapshot()
+            rows, scores = self._top_k(state, query_vector[None, :], fetch_k)
+            rows, scores = rows[0], scores[0]
+            candidates = np.asarray(state.matrix[rows], dtype=np.float32)
+            selected: List[int] = []
+            while len(selected) < min(k, len(rows)):
+                redundancy = (candidates @ candidates[selected].T).max(axis=1) if selected else np.zeros(len(rows), dtype=np.float32)
+                objective = lambda_mult * scores - (1 - lambda_mult) * redundancy
+                objective[selected] = -np.inf
+                selected.append(int(np.argmax(objective)))
+            documents = self._records([rows[selected].tolist()], state.generation)
+            if documents is not None:
+                return [document for document, _ in documents[0]]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def compact(self) -> None:
+        """
+        Rewrites the matrix without its dead rows.
+
+        Rows are renumbered in order, so a search running concurrently is retried with the new matrix. The kept rows
+        are copied into a new file in blocks of `BLOCK_BYTES`, so the matrix is never read into memory at once.
+        """
+        self._check_writable()
+        with self._lock:
+            kept = np.flatnonzero(self._live)
+            if len(kept) == self._rows:
+                return
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE records SET row = ? WHERE row = ?",
+                    [(new, int(old)) for new, old in enumerate(kept) if new != old]
+                )
+                for array in (self._vectors, self._codes, self._scales):
+                    if array is not None:
+                        array.keep(kept, NumpyVectorStore.BLOCK_BYTES)
+            logger.info("Compacted vector store %s from %d to %d rows", self.path, self._rows, len(kept))
+            self._rows = len(kept)
+            self._live = np.ones(self._rows, dtype=bool)
+            self._generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of rows, the storage settings and the size of the scanned and full-precision matrices.
+
+        Returns
+        -------
+        Dict[str, Any]
+            "rows" (including dead ones), "live", "dimensions", "quantization", "search_dimensions", "scan_bytes"
+            (the bytes read by the first pass of a search) and "full_bytes" (the bytes of the full-precision matrix).
+        """
+        with self._lock:
+            full_bytes = self._rows * (self.dimensions or 0) * 4
+            scan_bytes = sum(array.array.nbytes for array in (self._codes, self._scales) if array is not None) if self._codes is not None else full_bytes
+            return {
+                "rows": self._rows,
+                "live": int(self._live.sum()),
+                "dimensions": self.dimensions,
+                "quantization": self.quantization,
+                "search_dimensions": self.search_dimensions,
+                "scan_bytes": scan_bytes,
+                "full_bytes": full_bytes,
+            }
+
+    def close(self) -> None:
+        """
+        Closes the record table and unmaps the matrix and the codes, releasing their file descriptors. The store must
+        not be used afterwards, so close a replaced index version only once the queries running on it are done.
+        """
+        with self._lock:
+            self._connection.close()
+            for array in (self._vectors, self._codes, self._scales):
+                if array is not None:
+                    array.close()
+            self._live = np.zeros(0, dtype=bool)
+            self._rows = 0
+
+    def _search(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        while True:
+            state = self._snapshot()
+            rows, scores = self._top_k(state, queries, k)
+            results = self._records(rows.tolist(), state.generation, scores.tolist())
+            if results is not None:
+                return results
+
+    def _top_k(self, state: "_State", queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, int(state.live.sum()))
+        if k <= 0 or not len(state.matrix):
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        if state.codes is None:
+            return _scan(state.matrix, None, state.live, queries, k)
+
+        search_queries = _normalize(queries[:, :self.search_dimensions]) if self.search_dimensions else queries
+        shortlist, _ = _scan(state.codes, state.scales, state.live, search_queries, k * self.rescore_factor)
+        rows = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        for i, candidates in enumerate(shortlist):
+            candidates = np.sort(candidates)
+            exact = np.asarray(state.matrix[candidates], dtype=np.float32) @ queries[i]
+            order = np.argsort(-exact, kind="stable")[:k]
+            rows[i], scores[i] = candidates[order], exact[order]
+        return rows, scores
+
+    def _records(
+            self,
+            rows: List[List[int]],
+            generation: int,
+            scores: Optional[List[List[float]]] = None
+        ) -> Optional[List[List[Tuple[Document, float]]]]:
+        wanted = sorted({row for query_rows in rows for row in query_rows})
+        with self._lock:
+            if generation != self._generation:
+                return None
+            records = {
+                row: Document(page_content=document, metadata=json.loads(metadata))
+                for row, document, metadata in self._connection.execute(
+                    f"SELECT row, document, metadata FROM records WHERE row IN ({', '.join('?' * len(wanted))})", wanted
+                )
+            }
+        scores = scores if scores is not None else [[0.0] * len(query_rows) for query_rows in rows]
+        return [
+            [(records[row], score) for row, score in zip(query_rows, query_scores) if row in records]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def _snapshot(self) -> "_State":
+        with self._lock:
+            return _State(
+                matrix=self._vectors.array,
+                codes=self._codes.array if self._codes is not None else None,
+                scales=self._scales.array if self._scales is not None else None,
+                live=self._live,
+                generation=self._generation
+            )
+
+    def _drop(self, ids: List[str]) -> List[int]:
+        rows = []
+        for start in range(0, len(ids), self._LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + self._LOOKUP_BATCH_SIZE]
+            rows.extend(row for (row,) in self._connection.execute(
+                f"SELECT row FROM records WHERE id IN ({', '.join('?' * len(batch))})", batch
+            ))
+            self._connection.execute(f"DELETE FROM records WHERE id IN ({', '.join('?' * len(batch))})", batch)
+        return rows
+
+    def _file(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name) if self.path is not None else None
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError(f"Vector store {self.path} is opened read-only")
+
+    def _open_codes(self, meta: Dict[str, str]) -> None:
+        """
+        Opens the codes of the first search pass, rebuilding them if they were built with other settings or are
+        missing rows, and deletes them if the store is opened without quantization. A read-only store leaves the
+        files alone and falls back to scanning the full-precision matrix if its codes are not current.
+        """
+        settings = json.dumps([self.quantization, self.search_dimensions])
+        columns = self.search_dimensions or self.dimensions
+        if self.read_only:
+            if self.quantization is not None:
+                self._codes = _MappedArray(self._file(CODES_FILE), np.dtype(self.quantization), columns)
+                self._scales = _MappedArray(self._file(SCALES_FILE), np.float32, None) if self.quantization == "int8" else None
+                if meta.get("quantization") != settings or any(
+                    array.rows != self._rows for array in (self._codes, self._scales) if array is not None
+                ):
+                    logger.warning("The %s codes of %s are not current, scanning full-precision vectors", self.quantization, self.path)
+                    self._codes = self._scales = None
+            return
+        if self.quantization is None:
+            for name in (CODES_FILE, SCALES_FILE):
+                if self.path is not None and os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+        else:
+            self._codes = _MappedArray(self._file(CODES_FILE), np.dtype(self.quantization), columns)
+            self._scales = _MappedArray(self._file(SCALES_FILE), np.float32, None) if self.quantization == "int8" else None
+            current = meta.get("quantization") == settings and all(
+                array.rows == self._rows for array in (self._codes, self._scales) if array is not None
+            )
+            if not current:
+                logger.info("Quantizing %d vector(s) of %s as %s", self._rows, self.path, self.quantization)
+                codes, scales = zip(*(
+                    _quantize(np.asarray(self._vectors.array[start:start + 65_536]), self.quantization, self.search_dimensions)
+                    for start in range(0, self._rows, 65_536)
+                )) if self._rows else ([], [])
+                self._codes.replace(np.concatenate(codes) if codes else np.zeros((0, columns), dtype=self.quantization))
+                if self._scales is not None:
+                    self._scales.replace(np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32))
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('quantization', ?)", (settings,))
+
+    def _compact_if_sparse(self) -> None:
+        dead = self._rows - int(self._live.sum())
+        if dead > max(1024, self._rows - dead):
+            self.compact()
+
+
+class _State(NamedTuple):
+    matrix: np.ndarray
+    codes: Optional[np.ndarray]
+    scales: Optional[np.ndarray]
+    live: np.ndarray
+    generation: int
+
+
+class _MappedArray:
+    """
+    A growable array of fixed-width rows, memory-mapped from a file, or held in memory when there is no file.
+    """
+
+    def __init__(self, path: Optional[str], dtype: np.dtype, columns: Optional[int]) -> None:
+        self.path: Optional[str] = path
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.shape: Tuple[int, ...] = (columns,) if columns is not None else ()
+        self.row_bytes: int = self.dtype.itemsize * (columns or 1)
+        self.array: np.ndarray = np.zeros((0, *self.shape), dtype=self.dtype)
+        self._map()
+
+    @property
+    def rows(self) -> int:
+        return len(self.array)
+
+    def append(self, values: np.ndarray, rows: int) -> None:
+        """
+        Writes values after the first `rows` rows, dropping any row past them (left by an interrupted write). A file
+        hard-linked into several directories is copied first, so the others keep their rows.
+        """
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if self.path is None:
+            self.array = np.concatenate([self.array[:rows], values])
+            return
+        if os.path.exists(self.path) and os.stat(self.path).st_nlink > 1:
+            # the file is shared with another index version (see `IndexVersions`), which must not see the new rows
+            shutil.copyfile(self.path, self.path + ".tmp")
+            os.replace(self.path + ".tmp", self.path)
+        with open(self.path, "ab") as f:
+            f.truncate(rows * self.row_bytes)
+            f.write(values.tobytes())
+        self._map()
+
+    def replace(self, values: np.ndarray) -> None:
+        """
+        Replaces every row, writing a new file and renaming it over the old one.
+        """
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if self.path is None:
+            self.array = values
+            return
+        values.tofile(self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        self._map()
+
+    def keep(self, rows: np.ndarray, block_bytes: int) -> None:
+        """
+        Keeps only the given rows, in order, copying them block by block into a new file renamed over the old one,
+        so compacting never holds more than one block of the array in memory.
+        """
+        if self.path is None:
+            self.array = self.array[rows]
+            return
+        block_rows = max(1, block_bytes // self.row_bytes)
+        with open(self.path + ".tmp", "wb") as f:
+            for start in range(0, len(rows), block_rows):
+                f.write(np.ascontiguousarray(self.array[rows[start:start + block_rows]]).tobytes())
+        os.replace(self.path + ".tmp", self.path)
+        self._map()
+
+    def close(self) -> None:
+        """
+        Drops the mapping; the file is unmapped once no view of it is left.
+        """
+        self.array = np.zeros((0, *self.shape), dtype=self.dtype)
+
+    def _map(self) -> None:
+        if self.path is None or not self.row_bytes:
+            return
+        rows = os.path.getsize(self.path) // self.row_bytes if os.path.exists(self.path) else 0
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(rows, *self.shape)) if rows else np.zeros((0, *self.shape), dtype=self.dtype)
+
+
+def _quantize(matrix: np.ndarray, quantization: str, search_dimensions: Optional[int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if search_dimensions:
+        matrix = _normalize(matrix[:, :search_dimensions])
+    if quantization == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _scan(
+        matrix: np.ndarray,
+        scales: Optional[np.ndarray],
+        live: np.ndarray,
+        queries: np.ndarray,
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    # scored block by block as (rows, queries), the faster orientation of the product, keeping k per block; codes
+    # are cast to float32 in blocks small enough to stay in cache
+    k = min(k, int(live.sum()))
+    block_bytes = NumpyVectorStore.BLOCK_BYTES if matrix.dtype == np.float32 else NumpyVectorStore.CAST_BLOCK_BYTES
+    block_rows = max(1024, block_bytes // (matrix.shape[1] * 4))
+    candidate_rows, candidate_scores = [], []
+    for start in range(0, len(matrix), block_rows):
+        block = matrix[start:start + block_rows]
+        scores = (block if block.dtype == np.float32 else block.astype(np.float32)) @ queries.T
+        if scales is not None:
+            scores *= scales[start:start + block_rows, None]
+        scores[~live[start:start + block_rows]] = -np.inf
+        block_k = min(k, len(scores))
+        top = np.argpartition(-scores, block_k - 1, axis=0)[:block_k]
+        candidate_rows.append(top + start)
+        candidate_scores.append(np.take_along_axis(scores, top, axis=0))
+    rows, scores = np.concatenate(candidate_rows).T, np.concatenate(candidate_scores).T
+
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms